@@ -1,6 +1,7 @@
 """
 Reads and writes .astrom files.
 """
+import codecs
 import math
 
 __author__ = "David Rusk <drusk@uvic.ca>"
@@ -9,6 +10,7 @@ import re
 import sys
 import traceback
 
+import numpy
 from astropy import units
 from astropy.coordinates import SkyCoord
 from astropy.units import Quantity
@@ -34,6 +36,14 @@ OBS_LIST_PATTERN = "#\s+(?P<rawname>(?P<fk>%s)?(?P<expnum>\d{6,7})(?P<ftype>[ops
 
 STATIONARY_LIST_PATTERN = "(?P<rawname>(?P<fk>fk)?(?P<expnum>\d{6,7})(?P<ftype>[ops])).vetting"
 
+SOURCE_LIST_START_PATTERN = "##\s+X\s+Y\s+X_0\s+Y_0\s+R.A.\s+DEC"
+
+# number of bytes read from the file at a time when streaming the sources.
+READ_SIZE = 64 * 1024
+
+# size of the region of sky cutout around a reading, when nothing else sets it.
+MIN_CUTOUT = 0.3 * units.arcminute
+
 # Observation header keys
 MOPVERSION = "MOP_VER"
 
@@ -72,6 +82,58 @@ def parse_sources(filename):
     return parse(filename).get_sources()
 
 
+def stream_sources(filename):
+    """
+    Iterate over the sources of a .astrom file without holding the whole file in memory.
+
+    @param filename: name or VOSpace URI of the file, or a file handle already open on it.
+    @return: generator of Source
+    """
+    with AstromParser().stream(filename) as reader:
+        for source in reader:
+            yield source
+
+
+def _iter_lines(filehandle, size=None):
+    """
+    Yield the lines of a file, without their line ending, reading the file in blocks of size (READ_SIZE) bytes.
+
+    Only read() is used, so this works on VOSpace file handles as well as local files, text or binary.
+    """
+    size = size or READ_SIZE
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    remainder = ""
+    while True:
+        block = filehandle.read(size)
+        if not block:
+            break
+        if isinstance(block, bytes):
+            block = decoder.decode(block)
+        lines = (remainder + block).split("\n")
+        remainder = lines.pop()
+        for line in lines:
+            yield line
+    remainder += decoder.decode(b"", final=True)
+    if len(remainder) > 0:
+        yield remainder
+
+
+def angular_separation(ra1, dec1, ra2, dec2):
+    """
+    Angular distance between two points on the sky, using the same (Vincenty) formula as SkyCoord.separation.
+
+    @param ra1, dec1, ra2, dec2: coordinates in degrees, floats or arrays.
+    @return: separation in degrees.
+    """
+    lon1, lat1, lon2, lat2 = [numpy.radians(value) for value in (ra1, dec1, ra2, dec2)]
+    sdlon = numpy.sin(lon2 - lon1)
+    cdlon = numpy.cos(lon2 - lon1)
+    num1 = numpy.cos(lat2) * sdlon
+    num2 = numpy.cos(lat1) * numpy.sin(lat2) - numpy.sin(lat1) * numpy.cos(lat2) * cdlon
+    denominator = numpy.sin(lat1) * numpy.sin(lat2) + numpy.cos(lat1) * numpy.cos(lat2) * cdlon
+    return numpy.degrees(numpy.arctan2(numpy.hypot(num1, num2), denominator))
+
+
 class AstromFormatError(Exception):
     """Base class for errors in working with Astrom files."""
 
@@ -122,10 +184,7 @@ class AstromParser(object):
             "(?P<AWIDTH>\d+\.\d+)"
         )
 
-        self.source_list_reg = re.compile(
-            "##\s+X\s+Y\s+X_0\s+Y_0\s+R.A.\s+DEC\s+(.*)",
-            re.DOTALL
-        )
+        self.source_list_start_regex = re.compile(SOURCE_LIST_START_PATTERN)
         # Should we only load the discovery images during Candidate vetting?
         self.discovery_only = False
 
@@ -152,61 +211,100 @@ class AstromParser(object):
 
         return sys_header_match.groupdict()
 
-    def _parse_source_data(self, file_str, observations):
-        source_list_match = self.source_list_reg.search(file_str)
+    def _parse_header(self, lines):
+        """
+        Read the header of an .astrom file, up to and including the line that starts the source list.
 
-        assert source_list_match is not None, "Could not find the source list"
+        @param lines: iterator over the lines of the file, left positioned at the first source.
+        @return: observations, sys_header
+        """
+        header = []
+        for line in lines:
+            header.append(line)
+            if self.source_list_start_regex.match(line) is not None:
+                break
+        else:
+            raise AssertionError("Could not find the source list")
+        filestr = "\n".join(header)
 
-        raw_source_list = (source_list_match.group(1)).split("\n\n")
+        observations = self._parse_observation_list(filestr)
+        self._parse_observation_headers(filestr, observations)
+        sys_header = self._parse_system_header(filestr)
+        return observations, sys_header
 
-        sources = []
-        for raw_source in raw_source_list:
-            source = []
-            source_obs = raw_source.strip().split('\n')
-            assert len(source_obs) == len(
-                observations), ("Source doesn't have same number of observations"
-                                " ({0:d}) as in observations list ({1:d}).".format(len(source_obs), len(observations)))
-
-            x_0 = []
-            y_0 = []
-            x_ref = None
-            y_ref = None
-            for i, source_ob in enumerate(source_obs):
-                fields = [float(x) for x in source_ob.split()]
-                x_0.append(fields[2])
-                y_0.append(fields[3])
-                if i == 0:
-                    x_ref = fields[0]
-                    y_ref = fields[1]
-                fields.append(x_ref)
-                fields.append(y_ref)
-                # Find the observation corresponding to this reading
-                fields.append(observations[i])
-
-                source.append(SourceReading(*fields))
-
-            # Add an ra/dec reference to the source.
-            ref_index = int(math.ceil(len(source) / 2.0)) - 1
-            for reading in source:
-                assert isinstance(reading, SourceReading)
-                reading.reference_sky_coord = source[ref_index].sky_coord
-
-            # determine the smallest cutout that will include the reference coordinate and all the readings
-            min_cutout = 30 * units.arcsec
-            for reading in source:
-                sep = reading.reference_sky_coord.separation(reading.sky_coord)
-                if min_cutout < sep:
-                    min_cutout = sep
-            # Overload the 'uncertainty' criterion to ensure we get a large enough cutout.
-            for fields in source:
-                assert isinstance(fields, SourceReading)
-                fields.uncertainty_ellipse.a = sep/2.5
-                fields.uncertainty_ellipse.b = sep/2.5
-                fields.uncertainty_ellipse.pa = 0.0 * units.degree
+    def _iter_source_data(self, lines, observations):
+        """
+        Yield the readings of each source in turn, sources are separated by blank lines.
 
-            sources.append(source)
+        @param lines: iterator over the lines of the file that follow the source list header.
+        @param observations: the observations of the file, one per reading of a source.
+        """
+        for block in self._iter_source_blocks(lines):
+            yield self._parse_source(block, observations)
 
-        return sources
+    @staticmethod
+    def _iter_source_blocks(lines):
+        """
+        Yield the lines of each source in turn, sources are separated by blank lines.
+        """
+        block = []
+        for line in lines:
+            if len(line.strip()) > 0:
+                block.append(line)
+                continue
+            if len(block) > 0:
+                yield block
+                block = []
+        if len(block) > 0:
+            yield block
+
+    @staticmethod
+    def _parse_source(source_obs, observations):
+        """
+        @param source_obs: the lines of one source, one line per observation.
+        @return: list of SourceReading
+        """
+        assert len(source_obs) == len(
+            observations), ("Source doesn't have same number of observations"
+                            " ({0:d}) as in observations list ({1:d}).".format(len(source_obs), len(observations)))
+
+        source = []
+        x_ref = None
+        y_ref = None
+        for i, source_ob in enumerate(source_obs):
+            fields = [float(x) for x in source_ob.split()]
+            if i == 0:
+                x_ref = fields[0]
+                y_ref = fields[1]
+            fields.append(x_ref)
+            fields.append(y_ref)
+            # Find the observation corresponding to this reading
+            fields.append(observations[i])
+
+            source.append(SourceReading(*fields))
+
+        # Add an ra/dec reference to the source, the SkyCoord is only built when first used.
+        ref_index = int(math.ceil(len(source) / 2.0)) - 1
+        reference = source[ref_index]
+        for reading in source:
+            reading.reference_sky_coord = reference.ra, reference.dec
+
+        # Overload the 'uncertainty' criterion to ensure we get a large enough cutout, the size is set by the
+        # separation of the last reading from the reference.
+        sep = angular_separation(reference.ra, reference.dec, source[-1].ra, source[-1].dec) * 3600.0
+        for reading in source:
+            reading.uncertainty_ellipse = sep / 2.5, sep / 2.5, 0.0
+
+        return source
+
+    def stream(self, filename):
+        """
+        Open a .astrom file for reading one source at a time.
+
+        @param filename: name or VOSpace URI of the file, or a file handle already open on it.
+        @return: AstromReader
+        """
+        return AstromReader(self, filename)
 
     def parse(self, filename):
         """
@@ -221,22 +319,64 @@ class AstromParser(object):
             The file contents extracted into a data structure for programmatic
             access.
         """
-        filehandle = storage.open_vos_or_local(filename, "rb")
-        assert filehandle is not None, "Failed to open file {} ".format(filename)
-        filestr = filehandle.read().decode('utf-8')
-        filehandle.close()
+        with self.stream(filename) as reader:
+            sources = list(reader.iter_readings())
 
-        assert filestr is not None, "File contents are None"
+        return AstromData(reader.observations, reader.sys_header, sources, discovery_only=self.discovery_only)
 
-        observations = self._parse_observation_list(str(filestr))
 
-        self._parse_observation_headers(filestr, observations)
+class AstromReader(object):
+    """
+    Reads the sources of an .astrom file one at a time, so that only the current source is held in memory.
 
-        sys_header = self._parse_system_header(filestr)
+    The observations and system header are read when the reader is created.
+    """
+
+    def __init__(self, parser, filename):
+        """
+        @param parser: the AstromParser that knows the layout of the file.
+        @param filename: name or VOSpace URI of the file, or a file handle already open on it.
+        """
+        self.parser = parser
+        if hasattr(filename, 'read'):
+            self.filehandle = filename
+            self._close = False
+        else:
+            self.filehandle = storage.open_vos_or_local(filename, "rb")
+            assert self.filehandle is not None, "Failed to open file {} ".format(filename)
+            self._close = True
+        self._lines = _iter_lines(self.filehandle)
+        self.observations, self.sys_header = parser._parse_header(self._lines)
+
+    def iter_readings(self):
+        """
+        @return: generator of the list of SourceReading of each source.
+        """
+        return self.parser._iter_source_data(self._lines, self.observations)
+
+    def iter_fields(self):
+        """
+        @return: generator of the x, y, x0, y0, ra, dec values of each source, as a list with one row per reading.
+        """
+        for block in self.parser._iter_source_blocks(self._lines):
+            if len(block) != len(self.observations):
+                raise AstromFormatError("Source doesn't have same number of observations ({0:d}) as in observations "
+                                        "list ({1:d}).".format(len(block), len(self.observations)))
+            yield [[float(value) for value in line.split()] for line in block]
+
+    def __iter__(self):
+        for readings in self.iter_readings():
+            yield Source(readings, discovery_only=self.parser.discovery_only)
 
-        sources = self._parse_source_data(filestr, observations)
+    def close(self):
+        if self._close:
+            self.filehandle.close()
+
+    def __enter__(self):
+        return self
 
-        return AstromData(observations, sys_header, sources, discovery_only=self.discovery_only)
+    def __exit__(self, *args):
+        self.close()
 
 
 class StationaryParser(AstromParser):
@@ -275,12 +415,16 @@ class StationaryParser(AstromParser):
         """
         return {'RMIN': 0.01, 'RMAX': 0.2, 'ANGLE': 0, 'AWIDTH': 90}
 
-    def _parse_source_data(self, file_str, observations):
+    def _parse_header(self, lines):
+        """
+        A stationary list has no header block, the image count on its first line is read with the sources.
+        """
+        return self._parse_observation_list(""), self._parse_system_header("")
 
-        sources = []
-        observations = {}
-        raw_source_list = file_str.split("\n")
-        for raw_source in raw_source_list:
+    def _iter_source_data(self, lines, observations):
+        for idx, raw_source in enumerate(lines):
+            if idx == 0:
+                self._parse_observation_headers(raw_source, observations)
             readings = []
             if not len(raw_source) > 0:
                 continue
@@ -309,12 +453,10 @@ class StationaryParser(AstromParser):
                                                observation,
                                                discovery=self.num_of_images_to_display is None or count < self.num_of_images_to_display
                                                )
-                source_reading.reference_sky_coord = source_reading.sky_coord
                 source_reading.object_id = object_id
                 readings.append(source_reading)
                 count += 1
-            sources.append(readings)
-        return sources
+            yield readings
 
 
 class BaseAstromWriter(object):
@@ -510,6 +652,154 @@ class AstromData(object):
     def get_source_count(self):
         return len(self.get_sources())
 
+    def to_columns(self):
+        """
+        @return: AstromColumns view of the sources.
+        """
+        return AstromColumns.from_astrom_data(self)
+
+
+# the columns of AstromColumns, one row per source.
+READING_DTYPE = numpy.dtype([('x', 'f8'), ('y', 'f8'), ('x0', 'f8'), ('y0', 'f8'), ('ra', 'f8'), ('dec', 'f8'),
+                             ('xref', 'f8'), ('yref', 'f8'), ('ref_ra', 'f8'), ('ref_dec', 'f8'),
+                             ('a', 'f8'), ('b', 'f8'), ('pa', 'f8'),
+                             ('ssos', bool), ('from_input_file', bool), ('null_observation', bool),
+                             ('discovery', bool)])
+
+
+class AstromColumns(object):
+    """
+    Columnar view of an .astrom data set: one structured array (READING_DTYPE) per observation, with one row
+    per source, so row i of every array belongs to source i.
+
+    Positions are in pixels and degrees, the uncertainty ellipse axes a, b in arcsec and pa in degrees.
+    """
+
+    def __init__(self, observations, sys_header, readings, provisional_names=None, discovery_only=False):
+        """
+        @param observations: list of Observation, one per array in readings.
+        @param sys_header: dict of the system header values.
+        @param readings: list of READING_DTYPE arrays, all the same length.
+        @param provisional_names: list of the provisional name (or None) of each source.
+        """
+        self.observations = observations
+        self.sys_header = sys_header
+        self.readings = readings
+        nsources = len(readings[0]) if len(readings) > 0 else 0
+        if provisional_names is None:
+            provisional_names = [None] * nsources
+        self.provisional_names = list(provisional_names)
+        self.discovery_only = discovery_only
+
+    def __len__(self):
+        return len(self.provisional_names)
+
+    def column(self, name):
+        """
+        @param name: a field of READING_DTYPE
+        @return: array of shape (number of sources, number of observations)
+        """
+        return numpy.stack([reading[name] for reading in self.readings], axis=1)
+
+    def select(self, mask):
+        """
+        @param mask: boolean array, or indices, of the sources to keep.
+        @return: AstromColumns with just those sources.
+        """
+        index = numpy.arange(len(self))[mask]
+        return AstromColumns(self.observations, self.sys_header, [reading[index] for reading in self.readings],
+                             [self.provisional_names[idx] for idx in index], discovery_only=self.discovery_only)
+
+    @classmethod
+    def from_fields(cls, observations, sys_header, fields, discovery_only=False):
+        """
+        Build the columns from the x, y, x0, y0, ra, dec values of an .astrom file, setting the reference values
+        the same way AstromParser does for each source.
+
+        @param fields: array (or nested lists) of shape (number of sources, number of observations, 6)
+        """
+        fields = numpy.asarray(fields, dtype=numpy.float64).reshape(-1, len(observations), 6)
+        ref_index = int(math.ceil(len(observations) / 2.0)) - 1
+        sep = angular_separation(fields[:, ref_index, 4], fields[:, ref_index, 5],
+                                 fields[:, -1, 4], fields[:, -1, 5]) * 3600.0
+        readings = []
+        for idx in range(len(observations)):
+            reading = numpy.zeros(len(fields), dtype=READING_DTYPE)
+            for column, name in enumerate(('x', 'y', 'x0', 'y0', 'ra', 'dec')):
+                reading[name] = fields[:, idx, column]
+            reading['xref'] = fields[:, 0, 0]
+            reading['yref'] = fields[:, 0, 1]
+            reading['ref_ra'] = fields[:, ref_index, 4]
+            reading['ref_dec'] = fields[:, ref_index, 5]
+            reading['a'] = reading['b'] = sep / 2.5
+            readings.append(reading)
+        return cls(observations, sys_header, readings, discovery_only=discovery_only)
+
+    @classmethod
+    def read(cls, filename, parser=None):
+        """
+        Read an .astrom file straight into columns, without building the reading objects.
+
+        @param filename: name or VOSpace URI of the file, or a file handle already open on it.
+        @param parser: AstromParser used for the header, the default is a new one.
+        @return: AstromColumns
+        """
+        if parser is None:
+            parser = AstromParser()
+        with parser.stream(filename) as reader:
+            fields = [reading for source in reader.iter_fields() for reading in source]
+        return cls.from_fields(reader.observations, reader.sys_header, fields, discovery_only=parser.discovery_only)
+
+    @classmethod
+    def from_astrom_data(cls, astrom_data):
+        """
+        @param astrom_data: AstromData whose sources each have one reading per observation, in order.
+        @return: AstromColumns
+        """
+        observations = astrom_data.observations
+        sources = astrom_data.get_sources()
+        readings = [numpy.zeros(len(sources), dtype=READING_DTYPE) for _ in observations]
+        for row, source in enumerate(sources):
+            if source.num_readings() != len(observations):
+                raise ValueError("Source has {} readings but there are {} observations".format(
+                    source.num_readings(), len(observations)))
+            for reading, columns in zip(source.get_readings(), readings):
+                xref, yref = [value.value if isinstance(value, Quantity) else value
+                              for value in (reading.xref, reading.yref)]
+                columns[row] = ((reading.x, reading.y, reading.x0, reading.y0, reading.ra, reading.dec,
+                                 xref, yref) + reading.reference_position + reading.uncertainty +
+                                (reading.ssos, reading.from_input_file, reading.null_observation,
+                                 reading.discovery))
+        return cls(observations, astrom_data.sys_header, readings,
+                   [source.get_provisional_name() for source in sources],
+                   discovery_only=sources[0].discovery_only if len(sources) > 0 else False)
+
+    def to_astrom_data(self):
+        """
+        @return: AstromData with a Source for each row, the inverse of from_astrom_data.
+        """
+        sources = []
+        for row in range(len(self)):
+            source = []
+            for obs, columns in zip(self.observations, self.readings):
+                values = columns[row]
+                source.append(SourceReading(values['x'], values['y'], values['x0'], values['y0'],
+                                            values['ra'], values['dec'], values['xref'], values['yref'], obs,
+                                            ssos=bool(values['ssos']),
+                                            from_input_file=bool(values['from_input_file']),
+                                            null_observation=bool(values['null_observation']),
+                                            discovery=bool(values['discovery']),
+                                            dx=values['a'], dy=values['b'], pa=values['pa']))
+            for reading, columns in zip(source, self.readings):
+                position = float(columns[row]['ref_ra']), float(columns[row]['ref_dec'])
+                if (reading.ra, reading.dec) != position:
+                    reading.reference_sky_coord = position
+            sources.append(source)
+        astrom_data = AstromData(self.observations, self.sys_header, sources, discovery_only=self.discovery_only)
+        for source, provisional_name in zip(astrom_data.get_sources(), self.provisional_names):
+            source.set_provisional_name(provisional_name)
+        return astrom_data
+
 
 class Source(object):
     """
@@ -625,8 +915,16 @@ class Ellipse(object):
 class SourceReading(object):
     """
     Data for a detected point source (which is a potential moving objects).
+
+    A file holds many readings, so the values are kept as plain floats in slots and the Quantity, SkyCoord and
+    Ellipse views of them are only built when first asked for.
     """
 
+    __slots__ = ('_pix_coord', '_ref_coord', '_ra', '_dec', '_sky_coord', '_reference', 'xref', 'yref',
+                 '_uncertainty', '_uncertainty_ellipse', '_inverted', '_obs', 'ssos', '_from_input_file',
+                 'null_observation', 'discovery', 'mpc_observation', '_mpc_observations', 'min_cutout',
+                 'dx', 'dy', 'pa', 'object_id')
+
     def __init__(self, x, y, x0, y0, ra, dec, xref, yref, obs, ssos=False, from_input_file=False,
                  null_observation=False, discovery=False, dx=0, dy=0, pa=0):
         """
@@ -653,6 +951,10 @@ class SourceReading(object):
         self._ref_coord = None
         if x0 is not None and y0 is not None:
             self.ref_coord = x0, y0
+        # the reference coordinate is this reading's own position until set otherwise.
+        self._reference = None
+        self._ra = None
+        self._dec = None
         self._sky_coord = None
         self.sky_coord = ra, dec
         self.xref = xref
@@ -662,17 +964,14 @@ class SourceReading(object):
         self.uncertainty_ellipse = dx, dy, pa
         self._obs = None
         self.obs = obs
-        self._ssos = None
         self.ssos = ssos
         self._from_input_file = None
         self.from_input_file = from_input_file
         self.null_observation = null_observation
-        self._discovery = None
         self.discovery = discovery
         self.mpc_observation = None
-        self.mpc_observations = {}
-        self.reference_sky_coord = self.sky_coord
-        self.min_cutout = 0.3 * units.arcminute
+        self._mpc_observations = None
+        self.min_cutout = MIN_CUTOUT
 
     def _original_frame(self, x, y):
         """
@@ -721,7 +1020,9 @@ class SourceReading(object):
         :return: The x,y pixel location of the source in the current frame.
         :rtype: (Quantity, Quantity)
         """
-        return self._pix_coord
+        if self._pix_coord is None:
+            return None
+        return self._pix_coord[0] * units.pix, self._pix_coord[1] * units.pix
 
     @pix_coord.setter
     def pix_coord(self, pix_coord):
@@ -729,18 +1030,17 @@ class SourceReading(object):
         :type pix_coord: list
         :param pix_coord: an x,y pixel coordinate, origin = 1
         """
+        self._pix_coord = self._pixel_pair(pix_coord)
+
+    @staticmethod
+    def _pixel_pair(pix_coord):
         try:
             pix_coord = list(pix_coord)
         except:
             pass
         if not isinstance(pix_coord, list) or len(pix_coord) != 2:
             raise ValueError("pix_coord needs to be set with an (x,y) coordinate pair, got {}".format(pix_coord))
-        x, y = pix_coord
-        if not isinstance(x, Quantity):
-            x = float(x) * units.pix
-        if not isinstance(y, Quantity):
-            y = float(y) * units.pix
-        self._pix_coord = x, y
+        return tuple(value.value if isinstance(value, Quantity) else float(value) for value in pix_coord)
 
     @property
     def x(self):
@@ -748,7 +1048,7 @@ class SourceReading(object):
         :return: the x coordinate value
         :rtype: float
         """
-        return self.pix_coord[0].value
+        return self._pix_coord[0]
 
     @property
     def y(self):
@@ -756,7 +1056,7 @@ class SourceReading(object):
         :return: the y coordinate value
         :rtype: float
         """
-        return self.pix_coord[1].value
+        return self._pix_coord[1]
 
     @property
     def ref_coord(self):
@@ -765,7 +1065,9 @@ class SourceReading(object):
         :return: The x,y pixel location of the source in the reference frame.
         :rtype: (Quantity, Quantity)
         """
-        return self._ref_coord
+        if self._ref_coord is None:
+            return None
+        return self._ref_coord[0] * units.pix, self._ref_coord[1] * units.pix
 
     @ref_coord.setter
     def ref_coord(self, pix_coord):
@@ -773,26 +1075,15 @@ class SourceReading(object):
         :type pix_coord: list
         :param pix_coord: an x,y pixel coordinate, origin = 1
         """
-        try:
-            pix_coord = list(pix_coord)
-        except:
-            pass
-        if not isinstance(pix_coord, list) or len(pix_coord) != 2:
-            raise ValueError("pix_coord needs to be set with an (x,y) coordinate pair, got {}".format(pix_coord))
-        x, y = pix_coord
-        if not isinstance(x, Quantity):
-            x = float(x) * units.pix
-        if not isinstance(y, Quantity):
-            y = float(y) * units.pix
-        self._ref_coord = x, y
+        self._ref_coord = self._pixel_pair(pix_coord)
 
     @property
     def x0(self):
-        return self._ref_coord[0].value
+        return self._ref_coord[0]
 
     @property
     def y0(self):
-        return self._ref_coord[1].value
+        return self._ref_coord[1]
 
     @property
     def sky_coord(self):
@@ -801,32 +1092,86 @@ class SourceReading(object):
         :return: the world coordinate longitude location.
         :rtype: SkyCoord
         """
+        if self._sky_coord is None:
+            self._sky_coord = SkyCoord(self._ra * units.degree, self._dec * units.degree, 1)
         return self._sky_coord
 
     @property
     def ra(self):
-        return self.sky_coord.ra.degree
+        if self._ra is None:
+            return self.sky_coord.ra.degree
+        return self._ra
 
     @property
     def dec(self):
-        return self.sky_coord.dec.degree
+        if self._dec is None:
+            return self.sky_coord.dec.degree
+        return self._dec
 
     @sky_coord.setter
     def sky_coord(self, sky_coord):
+        if self._reference is None and (self._ra is not None or self._sky_coord is not None):
+            # keep the reference at the position this reading had before it moved.
+            self._reference = self.ra, self.dec
         try:
             sky_coord = list(sky_coord)
         except:
             pass
         if isinstance(sky_coord, list):
             ra, dec = sky_coord
-            if not isinstance(ra, Quantity):
-                ra = float(ra)*units.degree
-                dec = float(dec)*units.degree
-            sky_coord = SkyCoord(ra, dec, 1)
+            self._ra = ra.to(units.degree).value if isinstance(ra, Quantity) else float(ra)
+            self._dec = dec.to(units.degree).value if isinstance(dec, Quantity) else float(dec)
+            self._sky_coord = None
+            return
         if not isinstance(sky_coord, SkyCoord):
             raise ValueError("Failed to initialize coordinate using {}".format(sky_coord))
+        self._ra = None
+        self._dec = None
         self._sky_coord = sky_coord
 
+    @property
+    def reference_sky_coord(self):
+        """
+        :return: the sky position that cutouts of this reading are centred on.
+        :rtype: SkyCoord
+        """
+        if self._reference is None:
+            return self.sky_coord
+        if isinstance(self._reference, tuple):
+            self._reference = SkyCoord(self._reference[0] * units.degree, self._reference[1] * units.degree, 1)
+        return self._reference
+
+    @property
+    def reference_position(self):
+        """
+        :return: ra, dec in degrees of the reference coordinate, without building a SkyCoord where possible.
+        :rtype: (float, float)
+        """
+        if self._reference is None:
+            return self.ra, self.dec
+        if isinstance(self._reference, tuple):
+            return self._reference
+        return self._reference.ra.degree, self._reference.dec.degree
+
+    @property
+    def uncertainty(self):
+        """
+        :return: semi-major axis, semi-minor axis (arcsec) and position angle (degrees) of the uncertainty ellipse.
+        :rtype: (float, float, float)
+        """
+        return tuple(value.to(unit).value if isinstance(value, Quantity) else float(value)
+                     for value, unit in zip(self._uncertainty, (units.arcsecond, units.arcsecond, units.degree)))
+
+    @reference_sky_coord.setter
+    def reference_sky_coord(self, reference):
+        """
+        :param reference: a SkyCoord, or the ra, dec in degrees of the reference.
+        """
+        if isinstance(reference, (tuple, list)):
+            # a copy, so the reference does not follow the reading it was taken from when that one moves.
+            reference = tuple(float(value) for value in reference)
+        self._reference = reference
+
     @property
     def uncertainty_ellipse(self):
         """
@@ -834,6 +1179,15 @@ class SourceReading(object):
         :return: The semi-major axis, semi-minor axis and position angle of the uncertainty ellipse
         :rtype: Ellipse
         """
+        if self._uncertainty_ellipse is None:
+            a, b, pa = self._uncertainty
+            if not isinstance(a, Quantity):
+                a = float(a) * units.arcsecond
+            if not isinstance(b, Quantity):
+                b = float(b) * units.arcsecond
+            if not isinstance(pa, Quantity):
+                pa = float(pa) * units.degree
+            self._uncertainty_ellipse = Ellipse(a, b, pa)
         return self._uncertainty_ellipse
 
     @uncertainty_ellipse.setter
@@ -844,14 +1198,18 @@ class SourceReading(object):
             pass
         if not isinstance(ellipse, list) or len(ellipse) != 3:
             raise ValueError("Don't know how to set ellipse using: {}".format(ellipse))
-        a, b, pa = ellipse
-        if not isinstance(a, Quantity):
-            a = float(a) * units.arcsecond
-        if not isinstance(b, Quantity):
-            b = float(b) * units.arcsecond
-        if not isinstance(pa, Quantity):
-            pa = float(pa) * units.degree
-        self._uncertainty_ellipse = Ellipse(a, b, pa)
+        self._uncertainty = ellipse
+        self._uncertainty_ellipse = None
+
+    @property
+    def mpc_observations(self):
+        if self._mpc_observations is None:
+            self._mpc_observations = {}
+        return self._mpc_observations
+
+    @mpc_observations.setter
+    def mpc_observations(self, mpc_observations):
+        self._mpc_observations = mpc_observations
 
     @property
     def from_input_file(self):
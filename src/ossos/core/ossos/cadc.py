@@ -3,9 +3,9 @@ import argparse
 from astropy.io import votable
 import warnings
 from astropy.table import Table
-import requests
-from io import StringIO
+from io import BytesIO
 from astropy.time import Time
+from ossos import http_client
 
 
 def cfht_megacam_tap_query(ra_deg=180.0, dec_deg=0.0, width=1, height=1, date=None):
@@ -48,7 +48,7 @@ def cfht_megacam_tap_query(ra_deg=180.0, dec_deg=0.0, width=1, height=1, date=No
     url = "http://www.cadc.hia.nrc.gc.ca/tap/sync"
 
     warnings.simplefilter('ignore')
-    ff = StringIO(requests.get(url, params=data).content)
+    ff = BytesIO(http_client.get(url, params=data).content)
     ff.seek(0)
     table = votable.parse(ff).get_first_table().to_table()
     assert isinstance(table, Table)
@@ -2,10 +2,136 @@ import math
 import Polygon
 import logging
 
+import numpy
 from astropy import units
 from astropy.coordinates import SkyCoord
 
 
+def tangent_plane(ra0, dec0, ra, dec):
+    """
+    Gnomonic projection of positions about a field centre.
+
+    @param ra0: RA of the field centre in degrees, a scalar or an array that broadcasts against ra
+    @param dec0: Dec of the field centre in degrees
+    @param ra: numpy.array of RA in degrees
+    @param dec: numpy.array of Dec in degrees
+    @return: xi (towards East), eta (towards North) in degrees, NaN for positions more than 90 degrees away.
+    """
+    ra0 = numpy.radians(ra0)
+    dec0 = numpy.radians(dec0)
+    ra = numpy.radians(numpy.asarray(ra, dtype=numpy.float64))
+    dec = numpy.radians(numpy.asarray(dec, dtype=numpy.float64))
+    cos_dra = numpy.cos(ra - ra0)
+    cos_c = numpy.sin(dec0) * numpy.sin(dec) + numpy.cos(dec0) * numpy.cos(dec) * cos_dra
+    cos_c = numpy.where(cos_c > 0, cos_c, numpy.nan)
+    xi = numpy.cos(dec) * numpy.sin(ra - ra0) / cos_c
+    eta = (numpy.cos(dec0) * numpy.sin(dec) - numpy.sin(dec0) * numpy.cos(dec) * cos_dra) / cos_c
+    return numpy.degrees(xi), numpy.degrees(eta)
+
+
+class ChipFootprint(object):
+    """
+    The chips of a camera as boxes (or circles) in the tangent plane of the pointing, with a coarse grid that
+    lists the chips overlapping each cell so a position is only tested against the chips near it.
+    """
+
+    def __init__(self, geometry):
+        """
+        @param geometry: list of chip descriptions, as in Camera._geometry
+        """
+        self.centre = numpy.array([[geo["ra"], geo["dec"]] for geo in geometry], dtype=numpy.float64)
+        self.radius = numpy.array([geo.get("rad", numpy.nan) for geo in geometry], dtype=numpy.float64)
+        circle = numpy.isfinite(self.radius)
+        half_size = numpy.array([[geo.get("dra", 0.0) / 2.0, geo.get("ddec", 0.0) / 2.0] for geo in geometry])
+        half_size[circle] = self.radius[circle][:, None]
+        self.lower = self.centre - half_size
+        self.upper = self.centre + half_size
+        self.circle = circle
+        # furthest any part of the camera is from the tangent point.
+        self.extent = numpy.max(numpy.hypot(numpy.maximum(numpy.fabs(self.lower[:, 0]), numpy.fabs(self.upper[:, 0])),
+                                            numpy.maximum(numpy.fabs(self.lower[:, 1]), numpy.fabs(self.upper[:, 1]))))
+
+        # cells half the size of the smallest chip.
+        self.cell = numpy.min(2 * half_size) / 2.0
+        self.origin = self.lower.min(axis=0)
+        self.shape = numpy.ceil((self.upper.max(axis=0) - self.origin) / self.cell).astype(int) + 1
+        columns, rows = numpy.meshgrid(numpy.arange(self.shape[0]), numpy.arange(self.shape[1]))
+        cell_lower = self.origin + numpy.stack([columns.ravel(), rows.ravel()], axis=1) * self.cell
+        cell_upper = cell_lower + self.cell
+        overlap = ((cell_lower[:, None, :] <= self.upper[None, :, :]) &
+                   (cell_upper[:, None, :] >= self.lower[None, :, :])).all(axis=2)
+        depth = max(1, overlap.sum(axis=1).max())
+        # for each cell, the indices of the chips that overlap it, padded with -1.
+        self.index = numpy.full((len(cell_lower), depth), -1, dtype=int)
+        for cell, chips in enumerate(overlap):
+            chips = numpy.nonzero(chips)[0]
+            self.index[cell, :len(chips)] = chips
+
+    def which_ccd(self, xi, eta):
+        """
+        @param xi: numpy.array of tangent plane offsets towards East, in degrees
+        @param eta: numpy.array of tangent plane offsets towards North, in degrees
+        @return: numpy.array of the index of the chip each position is on, -1 if it is not on any chip.
+        """
+        xi = numpy.atleast_1d(numpy.asarray(xi, dtype=numpy.float64))
+        eta = numpy.atleast_1d(numpy.asarray(eta, dtype=numpy.float64))
+        with numpy.errstate(invalid='ignore'):
+            column = numpy.floor((xi - self.origin[0]) / self.cell)
+            row = numpy.floor((eta - self.origin[1]) / self.cell)
+            on_grid = (column >= 0) & (column < self.shape[0]) & (row >= 0) & (row < self.shape[1])
+        result = numpy.full(xi.shape, -1, dtype=int)
+        if not on_grid.any():
+            return result
+        candidates = self.index[row[on_grid].astype(int) * self.shape[0] + column[on_grid].astype(int)]
+        chips = numpy.clip(candidates, 0, None)
+        x = xi[on_grid][:, None]
+        y = eta[on_grid][:, None]
+        inside = ((candidates >= 0) &
+                  (x >= self.lower[chips, 0]) & (x <= self.upper[chips, 0]) &
+                  (y >= self.lower[chips, 1]) & (y <= self.upper[chips, 1]))
+        circle = self.circle[chips]
+        if circle.any():
+            distance = numpy.hypot(x - self.centre[chips, 0], y - self.centre[chips, 1])
+            inside &= ~circle | (distance <= self.radius[chips])
+        # the first chip, in geometry order, that holds the position.
+        first = numpy.argmax(inside, axis=1)
+        result[on_grid] = numpy.where(inside.any(axis=1), candidates[numpy.arange(len(first)), first], -1)
+        return result
+
+    def coverage(self, centre_ra, centre_dec, ra, dec, chunk_size=200):
+        """
+        Find the positions that fall on the chips of each of many pointings.
+
+        @param centre_ra: numpy.array of field centre RA in degrees
+        @param centre_dec: numpy.array of field centre Dec in degrees
+        @param ra: numpy.array of RA in degrees, of shape (positions,) or, when the positions differ between
+                   pointings (eg. moving objects), of shape (pointings, positions).
+        @param dec: numpy.array of Dec in degrees, the shape of ra
+        @param chunk_size: number of pointings tested at once, bounds the memory used.
+        @return: pointing indices, position indices of the positions on a chip.
+        """
+        centre_ra = numpy.asarray(centre_ra, dtype=numpy.float64)
+        centre_dec = numpy.asarray(centre_dec, dtype=numpy.float64)
+        ra = numpy.asarray(ra, dtype=numpy.float64)
+        dec = numpy.asarray(dec, dtype=numpy.float64)
+        pointings = [numpy.zeros(0, dtype=int)]
+        positions = [numpy.zeros(0, dtype=int)]
+        for start in range(0, len(centre_ra), chunk_size):
+            chunk = slice(start, start + chunk_size)
+            if ra.ndim == 2:
+                chunk_ra, chunk_dec = ra[chunk], dec[chunk]
+            else:
+                chunk_ra, chunk_dec = ra[None, :], dec[None, :]
+            xi, eta = tangent_plane(centre_ra[chunk, None], centre_dec[chunk, None], chunk_ra, chunk_dec)
+            # only the positions near the pointing centre are tested against the chips.
+            with numpy.errstate(invalid='ignore'):
+                near_pointing, near_position = numpy.nonzero(numpy.hypot(xi, eta) <= self.extent)
+            on_chip = self.which_ccd(xi[near_pointing, near_position], eta[near_pointing, near_position]) >= 0
+            pointings.append(near_pointing[on_chip] + start)
+            positions.append(near_position[on_chip])
+        return numpy.concatenate(pointings), numpy.concatenate(positions)
+
+
 class Camera:
     """The Field of View of a direct imager"""
 
@@ -181,6 +307,19 @@ class Camera:
         ]
     }
 
+    _footprints = {}
+
+    @classmethod
+    def footprint(cls, camera="MEGACAM_40"):
+        """
+        The chip boxes and grid index of a camera, built once per camera.
+
+        @rtype: ChipFootprint
+        """
+        if camera not in cls._footprints:
+            cls._footprints[camera] = ChipFootprint(cls._geometry[camera])
+        return cls._footprints[camera]
+
     def __init__(self,  ra, dec=None, camera="MEGACAM_40",):
         self._origin = None
         if dec is None:
@@ -304,6 +443,25 @@ class Camera:
                 ccds.append([xcen, ycen, rad])
         return ccds
 
+    def which_ccd(self, ra, dec):
+        """
+        Find the chip each of many positions falls on.
+
+        @param ra: numpy.array of RA in degrees
+        @param dec: numpy.array of Dec in degrees
+        @return: numpy.array of chip indices (the order of the camera geometry), -1 for positions off the chips.
+        """
+        xi, eta = tangent_plane(self.ra.degree, self.dec.degree, ra, dec)
+        return self.footprint(self.camera).which_ccd(xi, eta)
+
+    def contains(self, ra, dec):
+        """
+        @param ra: numpy.array of RA in degrees
+        @param dec: numpy.array of Dec in degrees
+        @return: boolean numpy.array, True for positions that fall on one of the chips.
+        """
+        return self.which_ccd(ra, dec) >= 0
+
     def separation(self, ra, dec):
         """Compute the separation between self and (ra,dec)"""
         if self.coord is None:
@@ -0,0 +1,131 @@
+"""
+Local, size bounded, cache of the cutouts shown by the validation GUI.
+
+Every time a workunit is opened, by the same or by a second reviewer, the GUI
+used to download the cutout of each reading along with its aperture
+correction.  This cache keeps each cutout as a FITS file, with the aperture
+correction and zero point in its primary header, so reopening a workunit only
+reads local files.
+
+Entries are keyed on the observation, the reference sky coordinate and the
+radius of the cutout.  They are stored in an image_cache.ImageCache directory,
+which removes the least recently used entries once the cache grows past its
+size limit.  In offline mode a missing entry is an error rather than a
+download.
+"""
+import errno
+import hashlib
+import io
+import logging
+import os
+import tempfile
+import warnings
+
+from astropy import units
+from astropy.io import fits
+from astropy.wcs import FITSFixedWarning
+
+from .image_cache import DEFAULT_MAX_SIZE, ImageCache
+
+# primary header keywords holding the values cached alongside the cutout.
+APCOR_KEYWORD = 'CC_APCOR'
+ZMAG_KEYWORD = 'CC_ZMAG'
+
+
+def cache_key(observation, sky_coord, radius):
+    """
+    @param observation: the astrom.Observation the cutout is taken from.
+    @param sky_coord: SkyCoord the cutout is centred on.
+    @param radius: Quantity, radius of the cutout.
+    @return: str
+    """
+    text = "{}|{}|{:.6f}|{:.6f}|{:.3f}".format(observation.rawname, observation.ccdnum,
+                                               sky_coord.ra.to(units.degree).value,
+                                               sky_coord.dec.to(units.degree).value,
+                                               radius.to(units.arcsec).value)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class CutoutCache(object):
+    """
+    Cutouts and their photometric calibration, kept on disk between sessions.
+    """
+
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE, offline=False):
+        """
+        @param directory: where the cached cutouts are kept, created if needed.
+        @param max_size: size, in bytes, the cache is trimmed to after each new entry.
+        @param offline: only serve cutouts from the cache, a missing entry raises IOError.
+        """
+        self.files = ImageCache(directory, max_size=max_size)
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        if lookups == 0:
+            return 0.0
+        return float(self.hits) / lookups
+
+    def get(self, key):
+        """
+        Look up a cutout.
+
+        @param key: the entry key, see cache_key.
+        @return: (HDUList, apcor, zmag) with apcor the ApcorData string and apcor/zmag None when not known, or
+        None if the cutout is not in the cache.
+        @raise IOError: when offline and the cutout is not in the cache.
+        """
+        filename = self.files.path(key)
+        try:
+            # the modification time orders entries for eviction.
+            os.utime(filename, None)
+            with open(filename, 'rb') as fobj:
+                content = fobj.read()
+        except (IOError, OSError) as ex:
+            if ex.errno != errno.ENOENT:
+                logging.warning("Cutout cache read of {} failed: {}".format(filename, ex))
+            self.misses += 1
+            if self.offline:
+                raise IOError(errno.ENOENT, "Offline and cutout not in cache", key)
+            return None
+        self.hits += 1
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', FITSFixedWarning)
+            hdulist = fits.open(io.BytesIO(content), lazy_load_hdus=False)
+        header = hdulist[0].header
+        apcor = header.pop(APCOR_KEYWORD, None)
+        zmag = header.pop(ZMAG_KEYWORD, None)
+        return hdulist, apcor, zmag
+
+    def put(self, key, hdulist, apcor=None, zmag=None):
+        """
+        Store a cutout.
+
+        @param key: the entry key, see cache_key.
+        @param hdulist: the cutout.
+        @param apcor: the ApcorData string of the cutout, if known.
+        @param zmag: the photometric zero point of the cutout, if known.
+        """
+        filename = self.files.path(key)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        copy = fits.HDUList([hdu.copy() for hdu in hdulist])
+        if apcor is not None:
+            copy[0].header[APCOR_KEYWORD] = str(apcor)
+        if zmag is not None:
+            copy[0].header[ZMAG_KEYWORD] = float(zmag)
+        fd, partial = tempfile.mkstemp(dir=os.path.dirname(filename), suffix=".partial")
+        try:
+            with os.fdopen(fd, 'wb') as fobj:
+                copy.writeto(fobj, output_verify='silentfix+ignore')
+            os.replace(partial, filename)
+        finally:
+            if os.access(partial, os.F_OK):
+                os.unlink(partial)
+        self.files.trim()
+
+    def __str__(self):
+        return "{}: {} hits {} misses ({:.0%} hit rate)".format(self.files.directory, self.hits, self.misses,
+                                                                self.hit_rate)
@@ -4,23 +4,376 @@ import os
 import tempfile
 import warnings
 
+import numpy
+from astropy.io import fits
+from astropy.io import ascii
+from astropy.table import Table, MaskedColumn
+
 from .gui import logger
 
 warnings.simplefilter("ignore")
-from pyraf import iraf
-from astropy.io import fits
-from astropy.io import ascii
+
+# Some nominal CFHT zeropoints that might be useful
+ZEROPOINTS = {"I": 25.77,
+              "R": 26.07,
+              "V": 26.07,
+              "B": 25.92,
+              "r2": 27.3,
+              "DEFAULT": 26.0,
+              "g.MP9401": 32.0,
+              'r.MP9601': 31.9,
+              'gri.MP9603': 33.520}
+
+# pixels outside this range are excluded from the sky and flag the aperture (IRAF datapars.datamin)
+DATAMIN = -100
+
+# IRAF centerpars used when centroid=True
+CBOX = 5
+MAXSHIFT = 2.0
+CENTER_MAXITER = 10
+
+# IRAF fitskypars used for the 'mode' sky
+SKY_LOCLIP = 5.0
+SKY_HICLIP = 5.0
+SKY_LOREJECT = 3.0
+SKY_HIREJECT = 3.0
+SKY_NREJECT = 50
+
+# IRAF datapars.epadu
+EPADU = 1.0
+
+# apphot error codes reported in the CIER, SIER and PIER columns.
+CTR_NOERROR = 0
+CTR_EDGE_IMAGE = 102
+CTR_NO_SIGNAL = 103
+CTR_BAD_SHIFT = 108
+SKY_NOERROR = 0
+SKY_EDGE_IMAGE = 202
+SKY_NO_PIXELS = 201
+PHOT_NOERROR = 0
+PHOT_OFF_IMAGE = 301
+PHOT_EDGE_IMAGE = 302
+PHOT_NO_SKY = 303
+PHOT_BAD_PIXELS = 304
+PHOT_NO_FLUX = 305
+
+# number of positions measured together, bounds the memory used for the pixel stamps.
+CHUNK_SIZE = 1000
 
 
 class TaskError(Exception):
     """Base task error"""
 
 
+def _zeropoint(hdulist, fits_filename, zmag=None, extno=0):
+    """
+    Choose the zeropoint used for the magnitudes, the same way for the IRAF and NumPy engines.
+    """
+    # get the filter for this image
+    filter_name = hdulist[extno].header.get('FILTER',
+                                            hdulist[0].header.get('FILTER',
+                                                                  'DEFAULT'))
+    if zmag is None:
+        logger.warning("No zmag supplied to daophot, looking for header or default values.")
+        zmag = hdulist[extno].header.get('PHOTZP', ZEROPOINTS[filter_name])
+        logger.warning("Setting zmag to: {}".format(zmag))
+        # check for magic 'zeropoint.used' files
+        for zpu_file in ["{}.zeropoint.used".format(os.path.splitext(fits_filename)[0]), "zeropoint.used"]:
+            if os.access(zpu_file, os.R_OK):
+                with open(zpu_file) as zpu_fh:
+                    zmag = float(zpu_fh.read())
+                    logger.warning("Using file {} to set zmag to: {}".format(zpu_file, zmag))
+                    break
+    photzp = hdulist[extno].header.get('PHOTZP', ZEROPOINTS.get(filter_name, ZEROPOINTS["DEFAULT"]))
+    if zmag != photzp:
+        logger.warning(("zmag sent to daophot: ({}) "
+                        "doesn't match PHOTZP value in image header: ({})".format(zmag, photzp)))
+    return zmag
+
+
+def _open(fits_filename):
+    if (not os.path.exists(fits_filename) and
+            not fits_filename.endswith(".fits")):
+        # For convenience, see if we just forgot to provide the extension
+        fits_filename += ".fits"
+
+    try:
+        return fits_filename, fits.open(fits_filename)
+    except Exception as err:
+        logger.error(f'Failed trying to open {fits_filename}')
+        logger.error(str(err))
+        raise FileNotFoundError(fits_filename)
+
+
+def _stamps(data, x, y, half_width):
+    """
+    Extract the square of pixels around each position, pixels off the image are NaN.
+
+    @param data: the image, indexed [row, column]
+    @param x: column positions (IRAF convention, the first pixel is centred on 1.0)
+    @param y: row positions
+    @param half_width: the stamps are 2*half_width+1 pixels on a side, centred on the pixel holding x,y
+    @return: stamps (n, size, size), the x coordinate of each column (n, size) and of each row (n, size)
+    """
+    offsets = numpy.arange(-half_width, half_width + 1)
+    columns = numpy.rint(x).astype(int)[:, None] - 1 + offsets
+    rows = numpy.rint(y).astype(int)[:, None] - 1 + offsets
+    on_image = (((rows >= 0) & (rows < data.shape[0]))[:, :, None] &
+                ((columns >= 0) & (columns < data.shape[1]))[:, None, :])
+    stamps = data[numpy.clip(rows, 0, data.shape[0] - 1)[:, :, None],
+                  numpy.clip(columns, 0, data.shape[1] - 1)[:, None, :]].astype(numpy.float64)
+    stamps[~on_image] = numpy.nan
+    return stamps, columns + 1.0, rows + 1.0
+
+
+def _marginal_center(marginal, coordinates):
+    """
+    Intensity weighted mean of a marginal distribution, above its mean (IRAF centroid with cthreshold=0).
+    """
+    signal = numpy.clip(marginal - marginal.mean(axis=1)[:, None], 0, None)
+    total = signal.sum(axis=1)
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        return numpy.where(total > 0, (signal * coordinates).sum(axis=1) / total, numpy.nan)
+
+
+def center(data, x, y, cbox=CBOX, maxshift=MAXSHIFT, maxiter=CENTER_MAXITER):
+    """
+    Refine positions using the marginal centroid of the pixels in a cbox by cbox box.
+
+    Positions are iterated until the box stops moving.  Positions that shift more than maxshift, or that
+    have no signal or a box that runs off the image, keep their input value and get a non-zero error code.
+
+    @param data: the image, indexed [row, column]
+    @param x: numpy.array of column positions (IRAF convention)
+    @param y: numpy.array of row positions
+    @return: xcenter, ycenter, cier
+    """
+    half_width = int(cbox / 2)
+    xcenter = numpy.array(x, dtype=numpy.float64)
+    ycenter = numpy.array(y, dtype=numpy.float64)
+    cier = numpy.zeros(len(xcenter), dtype=int)
+    active = numpy.arange(len(xcenter))
+    for iteration in range(maxiter):
+        if len(active) == 0:
+            break
+        stamps, columns, rows = _stamps(data, xcenter[active], ycenter[active], half_width)
+        edge = numpy.isnan(stamps).any(axis=(1, 2))
+        stamps = numpy.nan_to_num(stamps)
+        new_x = _marginal_center(stamps.sum(axis=1), columns)
+        new_y = _marginal_center(stamps.sum(axis=2), rows)
+        failed = numpy.isnan(new_x) | numpy.isnan(new_y)
+        cier[active[edge]] = CTR_EDGE_IMAGE
+        cier[active[failed]] = CTR_NO_SIGNAL
+        moved = ((numpy.rint(new_x) != numpy.rint(xcenter[active])) |
+                 (numpy.rint(new_y) != numpy.rint(ycenter[active])))
+        xcenter[active[~failed]] = new_x[~failed]
+        ycenter[active[~failed]] = new_y[~failed]
+        active = active[moved & ~failed]
+
+    shifted = (numpy.abs(xcenter - x) > maxshift) | (numpy.abs(ycenter - y) > maxshift)
+    cier[shifted] = CTR_BAD_SHIFT
+    reset = (cier == CTR_BAD_SHIFT) | (cier == CTR_NO_SIGNAL)
+    xcenter[reset] = numpy.asarray(x, dtype=numpy.float64)[reset]
+    ycenter[reset] = numpy.asarray(y, dtype=numpy.float64)[reset]
+    return xcenter, ycenter, cier
+
+
+def sky_mode(data, x, y, annulus, dannulus, datamin=DATAMIN, datamax=None,
+             loclip=SKY_LOCLIP, hiclip=SKY_HICLIP, loreject=SKY_LOREJECT, hireject=SKY_HIREJECT,
+             nreject=SKY_NREJECT):
+    """
+    Estimate the sky as the mode of the pixels in an annulus, as IRAF fitsky with salgorithm='mode' does.
+
+    The sorted annulus pixels are clipped by loclip/hiclip percent at each end, the mode is taken as
+    3*median - 2*mean (or the mean when that is below the median) and pixels more than loreject/hireject
+    standard deviations from the mode are rejected, up to nreject times.
+
+    @return: msky, stdev, nsky, nsrej, sier
+    """
+    outer = annulus + dannulus
+    stamps, columns, rows = _stamps(data, x, y, int(numpy.ceil(outer)))
+    radius = numpy.hypot(columns[:, None, :] - x[:, None, None], rows[:, :, None] - y[:, None, None])
+    edge = numpy.isnan(stamps) & (radius <= outer)
+    use = (radius >= annulus) & (radius <= outer) & numpy.isfinite(stamps) & (stamps >= datamin)
+    if datamax is not None:
+        use &= stamps <= datamax
+    pixels = numpy.sort(numpy.where(use, stamps, numpy.nan).reshape(len(x), -1), axis=1)
+    npix = use.reshape(len(x), -1).sum(axis=1)
+
+    # cumulative sums give the statistics of any [lo, hi) slice of the sorted pixels.
+    zeros = numpy.zeros((len(x), 1))
+    sums = numpy.hstack([zeros, numpy.nancumsum(pixels, axis=1)])
+    squares = numpy.hstack([zeros, numpy.nancumsum(pixels ** 2, axis=1)])
+    index = numpy.arange(len(x))
+    lo = numpy.floor(npix * loclip / 100.0).astype(int)
+    hi = npix - numpy.floor(npix * hiclip / 100.0).astype(int)
+    hi = numpy.maximum(hi, numpy.minimum(lo + 1, npix))
+    clipped = hi - lo
+
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        for iteration in range(nreject + 1):
+            count = hi - lo
+            mean = (sums[index, hi] - sums[index, lo]) / count
+            stdev = numpy.sqrt(numpy.clip((squares[index, hi] - squares[index, lo]) / count - mean ** 2, 0, None))
+            median = pixels[index, numpy.clip((lo + hi - 1) // 2, 0, pixels.shape[1] - 1)]
+            msky = numpy.where(mean < median, mean, 3.0 * median - 2.0 * mean)
+            if iteration == nreject:
+                break
+            new_lo = numpy.maximum(lo, (pixels < (msky - loreject * stdev)[:, None]).sum(axis=1))
+            new_hi = numpy.minimum(hi, (pixels <= (msky + hireject * stdev)[:, None]).sum(axis=1))
+            new_hi = numpy.maximum(new_hi, new_lo)
+            if numpy.all((new_lo == lo) | (count <= 0)) and numpy.all((new_hi == hi) | (count <= 0)):
+                break
+            lo, hi = numpy.where(count > 0, new_lo, lo), numpy.where(count > 0, new_hi, hi)
+
+    nsky = hi - lo
+    sier = numpy.where(edge.any(axis=(1, 2)), SKY_EDGE_IMAGE, SKY_NOERROR)
+    sier[nsky <= 0] = SKY_NO_PIXELS
+    msky[nsky <= 0] = numpy.nan
+    stdev[nsky <= 0] = numpy.nan
+    return msky, stdev, nsky, clipped - nsky, sier
+
+
+def aperture_sum(data, x, y, aperture, datamin=DATAMIN, datamax=None):
+    """
+    Sum the pixels inside a circular aperture, pixels on the edge are weighted by the fraction inside.
+
+    @return: sum, area, pier (PHOT_EDGE_IMAGE, PHOT_OFF_IMAGE or PHOT_BAD_PIXELS)
+    """
+    stamps, columns, rows = _stamps(data, x, y, int(numpy.ceil(aperture + 0.5)))
+    radius = numpy.hypot(columns[:, None, :] - x[:, None, None], rows[:, :, None] - y[:, None, None])
+    weights = numpy.clip(aperture - radius + 0.5, 0.0, 1.0)
+    inside = weights > 0
+    on_image = numpy.isfinite(stamps)
+    bad = inside & on_image & (stamps < datamin)
+    if datamax is not None:
+        bad |= inside & on_image & (stamps > datamax)
+    weights = numpy.where(on_image, weights, 0.0)
+    total = (weights * numpy.nan_to_num(stamps)).sum(axis=(1, 2))
+    area = weights.sum(axis=(1, 2))
+    pier = numpy.where((inside & ~on_image).any(axis=(1, 2)), PHOT_EDGE_IMAGE, PHOT_NOERROR)
+    pier[bad.any(axis=(1, 2))] = PHOT_BAD_PIXELS
+    pier[area <= 0] = PHOT_OFF_IMAGE
+    return total, area, pier
+
+
+def photometry(data, x_in, y_in, aperture=15, sky=20, swidth=10, apcor=0.3,
+               maxcount=30000.0, exptime=1.0, zmag=26.0, centroid=True):
+    """
+    Measure centroids, sky and aperture magnitudes of many sources on an image array.
+
+    The measurement follows the IRAF phot setup of this module (centroid algorithm, mode sky with 5%
+    clipping, datamin of -100 and datamax of maxcount) and returns a Table with the same columns.
+
+    @param data: the image, indexed [row, column]
+    @param x_in: column positions, the first pixel is centred on 1.0 as in IRAF
+    @param y_in: row positions
+    @rtype: astropy.table.Table
+    """
+    x_in = numpy.atleast_1d(numpy.asarray(x_in, dtype=numpy.float64))
+    y_in = numpy.atleast_1d(numpy.asarray(y_in, dtype=numpy.float64))
+    columns = dict((name, []) for name in ['XCENTER', 'YCENTER', 'CIER', 'MSKY', 'STDEV', 'NSKY',
+                                           'NSREJ', 'SIER', 'SUM', 'AREA', 'PIER'])
+    for start in range(0, len(x_in), CHUNK_SIZE):
+        x = x_in[start:start + CHUNK_SIZE]
+        y = y_in[start:start + CHUNK_SIZE]
+        if centroid:
+            x, y, cier = center(data, x, y)
+        else:
+            cier = numpy.zeros(len(x), dtype=int)
+        msky, stdev, nsky, nsrej, sier = sky_mode(data, x, y, sky, swidth, datamax=maxcount)
+        total, area, pier = aperture_sum(data, x, y, aperture, datamax=maxcount)
+        for name, value in (('XCENTER', x), ('YCENTER', y), ('CIER', cier), ('MSKY', msky),
+                            ('STDEV', stdev), ('NSKY', nsky), ('NSREJ', nsrej), ('SIER', sier),
+                            ('SUM', total), ('AREA', area), ('PIER', pier)):
+            columns[name].append(value)
+    columns = dict((name, numpy.concatenate(value)) for name, value in columns.items())
+
+    no_sky = columns['NSKY'] <= 0
+    flux = columns['SUM'] - columns['AREA'] * numpy.where(no_sky, 0.0, columns['MSKY'])
+    pier = columns['PIER']
+    pier[(pier == PHOT_NOERROR) & no_sky] = PHOT_NO_SKY
+    pier[(pier == PHOT_NOERROR) & (flux <= 0)] = PHOT_NO_FLUX
+    undefined = (flux <= 0) | no_sky | (pier == PHOT_OFF_IMAGE) | (pier == PHOT_BAD_PIXELS)
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        variance = flux / EPADU + columns['AREA'] * columns['STDEV'] ** 2 * (1 + columns['AREA'] / columns['NSKY'])
+        mag = zmag - 2.5 * numpy.log10(flux) + 2.5 * numpy.log10(exptime) - apcor
+        merr = 1.0857 * numpy.sqrt(variance) / flux
+
+    table = Table(masked=True)
+    table['ID'] = numpy.arange(1, len(x_in) + 1)
+    table['XINIT'] = x_in
+    table['YINIT'] = y_in
+    table['XCENTER'] = columns['XCENTER']
+    table['YCENTER'] = columns['YCENTER']
+    table['XSHIFT'] = columns['XCENTER'] - x_in
+    table['YSHIFT'] = columns['YCENTER'] - y_in
+    table['CIER'] = columns['CIER']
+    table['MSKY'] = MaskedColumn(numpy.nan_to_num(columns['MSKY']), mask=no_sky)
+    table['STDEV'] = MaskedColumn(numpy.nan_to_num(columns['STDEV']), mask=no_sky)
+    table['NSKY'] = columns['NSKY']
+    table['NSREJ'] = columns['NSREJ']
+    table['SIER'] = columns['SIER']
+    table['ITIME'] = numpy.full(len(x_in), float(exptime))
+    table['RAPERT'] = numpy.full(len(x_in), float(aperture))
+    table['SUM'] = columns['SUM']
+    table['AREA'] = columns['AREA']
+    table['FLUX'] = flux
+    table['MAG'] = MaskedColumn(numpy.nan_to_num(mag), mask=undefined)
+    table['MERR'] = MaskedColumn(numpy.nan_to_num(merr), mask=undefined)
+    table['PIER'] = pier
+    return table
+
+
 def phot(fits_filename, x_in, y_in, aperture=15, sky=20, swidth=10, apcor=0.3,
          maxcount=30000.0, exptime=1.0, zmag=None, extno=0, centroid=True):
     """
     Compute the centroids and magnitudes of a bunch sources  on fits image.
 
+    The measurement is done in-process, see photometry, with the parameters phot_iraf gives IRAF.
+
+    :rtype : astropy.table.Table
+    :param fits_filename: Name of fits image to measure source photometry on.
+    :type fits_filename: str
+    :param x_in: x location of source to measure
+    :type x_in: float, numpy.array
+    :param y_in: y location of source to measure
+    :type y_in: float, numpy.array
+    :param aperture: radius of circular aperture to use.
+    :type aperture: float
+    :param sky: radius of inner sky annulus
+    :type sky: float
+    :param swidth: width of the sky annulus
+    :type swidth: float
+    :param apcor: Aperture correction to take aperture flux to full flux.
+    :type apcor: float
+    :param maxcount: maximum linearity in the image.
+    :type maxcount: float
+    :param exptime: exposure time, relative to zmag supplied
+    :type exptime: float
+    :param zmag: zeropoint magnitude
+    :param extno: extension of fits_filename the x/y location refers to.
+    """
+    fits_filename, input_hdulist = _open(fits_filename)
+    with input_hdulist:
+        zmag = _zeropoint(input_hdulist, fits_filename, zmag=zmag, extno=extno)
+        pdump_out = photometry(input_hdulist[extno].data, x_in, y_in, aperture=aperture, sky=sky,
+                               swidth=swidth, apcor=apcor, maxcount=maxcount, exptime=exptime,
+                               zmag=zmag, centroid=centroid)
+    logging.debug("PHOT TABLE:\n" + str(pdump_out))
+    if not len(pdump_out) > 0:
+        raise TaskError("photometry failed, no positions given.")
+    logger.debug("Computed aperture photometry on {} objects in {}".format(len(pdump_out), fits_filename))
+    return pdump_out
+
+
+def phot_iraf(fits_filename, x_in, y_in, aperture=15, sky=20, swidth=10, apcor=0.3,
+              maxcount=30000.0, exptime=1.0, zmag=None, extno=0, centroid=True):
+    """
+    Compute the centroids and magnitudes of a bunch sources  on fits image using IRAF phot.
+
+    Kept as the reference the in-process engine is checked against, needs pyraf.
+
     :rtype : astropy.table.Table
     :param fits_filename: Name of fits image to measure source photometry on.
     :type fits_filename: str
@@ -43,53 +396,15 @@ def phot(fits_filename, x_in, y_in, aperture=15, sky=20, swidth=10, apcor=0.3,
     :param zmag: zeropoint magnitude
     :param extno: extension of fits_filename the x/y location refers to.
     """
+    from pyraf import iraf
+
     if not hasattr(x_in, '__iter__'):
         x_in = [x_in, ]
     if not hasattr(y_in, '__iter__'):
         y_in = [y_in, ]
 
-    if (not os.path.exists(fits_filename) and
-            not fits_filename.endswith(".fits")):
-        # For convenience, see if we just forgot to provide the extension
-        fits_filename += ".fits"
-
-    try:
-        input_hdulist = fits.open(fits_filename)
-    except Exception as err:
-        logger.error(f'Failed trying to open {fits_filename}')
-        logger.error(str(err))
-        raise FileNotFoundError(fits_filename)
-
-    # get the filter for this image
-    filter_name = input_hdulist[extno].header.get('FILTER',
-                                                  input_hdulist[0].header.get('FILTER',
-                                                                              'DEFAULT'))
-
-    # Some nominal CFHT zeropoints that might be useful
-    zeropoints = {"I": 25.77,
-                  "R": 26.07,
-                  "V": 26.07,
-                  "B": 25.92,
-                  "r2": 27.3,
-                  "DEFAULT": 26.0,
-                  "g.MP9401": 32.0,
-                  'r.MP9601': 31.9,
-                  'gri.MP9603': 33.520}
-    if zmag is None:
-        logger.warning("No zmag supplied to daophot, looking for header or default values.")
-        zmag = input_hdulist[extno].header.get('PHOTZP', zeropoints[filter_name])
-        logger.warning("Setting zmag to: {}".format(zmag))
-        # check for magic 'zeropoint.used' files
-        for zpu_file in ["{}.zeropoint.used".format(os.path.splitext(fits_filename)[0]), "zeropoint.used"]:
-            if os.access(zpu_file, os.R_OK):
-                with open(zpu_file) as zpu_fh:
-                    zmag = float(zpu_fh.read())
-                    logger.warning("Using file {} to set zmag to: {}".format(zpu_file, zmag))
-                    break
-    photzp = input_hdulist[extno].header.get('PHOTZP', zeropoints.get(filter_name, zeropoints["DEFAULT"]))
-    if zmag != photzp:
-        logger.warning(("zmag sent to daophot: ({}) "
-                        "doesn't match PHOTZP value in image header: ({})".format(zmag, photzp)))
+    fits_filename, input_hdulist = _open(fits_filename)
+    zmag = _zeropoint(input_hdulist, fits_filename, zmag=zmag, extno=extno)
 
     # setup IRAF to do the magnitude/centroid measurements
     iraf.set(uparm="./")
@@ -1,10 +1,38 @@
 __author__ = "David Rusk <drusk@uvic.ca>"
-import queue
+import asyncio
+import collections
+import functools
+import heapq
+import itertools
 import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from .cutouts.downloader import cutout_key
 from ..gui import logger
 from ..gui import config
 
 MAX_THREADS = config.read('APP.MAX_THREADS')
+MAX_PER_HOST = config.read('APP.MAX_PER_HOST')
+MAX_CUTOUTS_PER_REQUEST = config.read('APP.MAX_CUTOUTS_PER_REQUEST')
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """
+    The download engine shared by all the download managers, so that a cutout wanted by both the singlet and the
+    triplet views is only downloaded once.
+
+    @rtype: DownloadEngine
+    """
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = DownloadEngine(max_workers=int(MAX_THREADS), max_per_host=int(MAX_PER_HOST),
+                                     max_batch=int(MAX_CUTOUTS_PER_REQUEST))
+        return _engine
 
 
 class AsynchronousDownloadManager(object):
@@ -13,7 +41,7 @@ class AsynchronousDownloadManager(object):
     the application.
     """
 
-    def __init__(self, downloader, error_handler):
+    def __init__(self, downloader, error_handler, engine=None):
         """
         Constructor.
 
@@ -22,59 +50,57 @@ class AsynchronousDownloadManager(object):
             Downloads images.
           error_handler:
             Handles errors that occur when trying to download resources.
+          engine: DownloadEngine
+            Schedules the downloads, defaults to the engine shared by all
+            managers.
         """
         self.downloader = downloader
         self.error_handler = error_handler
+        self.engine = get_engine() if engine is None else engine
 
-        self._work_queue = queue.PriorityQueue()
+    def submit_request(self, request, priority=100):
+        """
+        Queue a request, lower priorities are downloaded first and requests of
+        equal priority in the order they were submitted.
+        """
+        self.engine.submit(request, priority, self)
 
-        self._workers = []
-        self._maximize_workers()
+    def submit_requests(self, requests, priority=100):
+        """
+        Queue several requests at once, so that the cutouts they want from
+        the same image can be fetched together.
+        """
+        self.engine.submit_many(requests, priority, self)
 
-    def submit_request(self, request, priority=100):
-        self._work_queue.put((priority, request))
-        self._maximize_workers()
+    def cancel(self, readings):
+        """
+        Drop the requests for the given readings that have not been delivered
+        yet, their callbacks are not called.
+        """
+        readings = set(readings)
+        self.engine.cancel(self, lambda request: request.reading in readings)
 
     def stop_download(self):
-        for worker in self._workers:
-            worker.stop()
+        """
+        Stop starting downloads for this manager, queued requests are kept
+        and resume with the next submitted request.
+        """
+        self.engine.pause(self)
 
     def wait_for_downloads_to_stop(self):
-        while not self._all_workers_stopped():
-            pass
+        self.engine.wait_for_idle(self)
 
     def refresh_vos_client(self):
         self.downloader.refresh_vos_client()
 
-    def _maximize_workers(self):
-        self._prune_dead_workers()
-
-        while len(self._workers) < MAX_THREADS:
-            worker = DownloadThread(self._work_queue, self.downloader,
-                                    self.error_handler)
-            worker.daemon = True  # Thread quits when application does
-            self._workers.append(worker)
-            worker.start()
-
-            logger.debug("Created download worker thread (total=%d)" %
-                         len(self._workers))
-
-    def _prune_dead_workers(self):
-        self._workers = [thread for thread in self._workers if thread.is_alive()]
-
-    def _all_workers_stopped(self):
-        for worker in self._workers:
-            if not worker.is_stopped():
-                return False
-
-        return True
-
 
 class DownloadRequest(object):
     """
     Specifies an item (image and potentially related files) to be downloaded.
     """
 
+    _sequence = itertools.count()
+
     def __init__(self,
                  reading,
                  focus=None,
@@ -103,55 +129,263 @@ class DownloadRequest(object):
         self.reading = reading
         self.needs_apcor = needs_apcor
         self.callback = callback
+        self.sequence = next(self._sequence)
 
         if focus is None:
             self.focus = reading.source_point
         else:
             self.focus = focus
 
+    @property
+    def key(self):
+        """
+        Requests with equal keys are satisfied by the same cutout.
+        """
+        return cutout_key(self.reading)
+
+    @property
+    def image_uri(self):
+        """
+        The image the cutout of the request is taken from.
+        """
+        try:
+            return self.reading.get_image_uri()
+        except Exception:
+            return ''
+
+    @property
+    def host(self):
+        """
+        The host serving the image of the request.
+        """
+        return urlparse(self.image_uri).netloc
+
     def __lt__(self, other):
-        self.reading.get_exposure_number() < other.reading.get_exposure_number()
+        return self.sequence < other.sequence
 
-    def execute(self, downloader):
+    def download(self, downloader):
         cutout = downloader.download_cutout(self.reading,
                                             focus=self.focus,
                                             needs_apcor=self.needs_apcor)
         logger.debug("Got cutout: {}".format(cutout))
+        return cutout
+
+    def deliver(self, cutout):
         if self.callback is not None:
             self.callback(cutout)
 
+    def execute(self, downloader):
+        self.deliver(self.download(downloader))
+
 
-class DownloadThread(threading.Thread):
-    def __init__(self, work_queue, downloader, error_handler):
-        super(DownloadThread, self).__init__()
+class _Download(object):
+    """
+    A cutout to be downloaded once for all the requests with the same key.
+    """
 
-        self.work_queue = work_queue
+    def __init__(self, key, image_uri, request, downloader):
+        self.key = key
+        self.image_uri = image_uri
+        # vos: uris do not name the host that serves the data, those downloads only count against max_workers.
+        self.host = urlparse(image_uri).netloc or None
+        self.request = request
         self.downloader = downloader
-        self.error_handler = error_handler
+        self.waiting = []
+        self.entry = None
+        self.running = False
+        # cleared when a multi-cutout request did not return this cutout.
+        self.batchable = hasattr(downloader, 'download_cutouts')
+
+    @property
+    def managers(self):
+        return set(manager for _, manager in self.waiting)
+
+
+class DownloadEngine(object):
+    """
+    Downloads cutouts from an asyncio event loop running in a background
+    thread.
+
+    Requests for the same cutout (exposure, ccd, sky position and radius)
+    that arrive while it is queued or downloading are merged, every callback
+    gets the one cutout.  Downloads start in order of priority, at most
+    max_workers at a time and at most max_per_host from any one host named
+    in the image uri.  The downloads themselves are blocking calls, they run
+    in a thread pool.
+
+    When a download starts, up to max_batch queued cutouts of the same image
+    go along with it in a single multi-region request.
+    """
+
+    def __init__(self, max_workers=10, max_per_host=6, max_batch=20):
+        self.max_workers = max_workers
+        self.max_per_host = max_per_host
+        self.max_batch = max_batch
+
+        self._downloads = {}
+        self._heap = []
+        self._running = set()
+        self._tasks = 0
+        self._running_per_host = collections.Counter()
+        self._paused = set()
 
-        self._should_stop = False
-        self._idle = True
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="download")
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="download-engine")
+        self._thread.daemon = True  # Thread quits when application does
+        self._thread.start()
+        # before python 3.10 a Condition binds to the loop current where it is made, so make it on our loop.
+        self._changed = asyncio.run_coroutine_threadsafe(self._new_condition(), self._loop).result()
 
-    def run(self):
-        while not self._should_stop:
-            download_request = self.work_queue.get()
-            self._idle = False
+    def submit(self, request, priority, manager):
+        self.submit_many([request], priority, manager)
 
-            try:
-                self.do_download(download_request)
-            except Exception as error:
-                self.error_handler.handle_error(error, download_request)
-            finally:
-                # It is up to the error handler to requeue the downloadable
-                # item if needed.
-                self.work_queue.task_done()
-                self._idle = True
+    def submit_many(self, requests, priority, manager):
+        items = [(request, request.key, request.image_uri) for request in requests]
+        self._loop.call_soon_threadsafe(self._submit, items, priority, manager)
 
-    def do_download(self, download_request):
-        download_request[1].execute(self.downloader)
+    def cancel(self, manager, predicate):
+        self._loop.call_soon_threadsafe(self._cancel, manager, predicate)
+
+    def pause(self, manager):
+        self._loop.call_soon_threadsafe(self._paused.add, manager)
+
+    def wait_for_idle(self, manager):
+        """
+        Block until none of the downloads of manager are running.
+        """
+        asyncio.run_coroutine_threadsafe(self._wait_for(lambda: not any(
+            manager in download.managers for download in self._running)), self._loop).result()
 
-    def stop(self):
-        self._should_stop = True
+    def join(self):
+        """
+        Block until every request submitted so far has been delivered or cancelled.
+        """
+        asyncio.run_coroutine_threadsafe(self._wait_for(
+            lambda: not self._downloads and not self._tasks), self._loop).result()
 
-    def is_stopped(self):
-        return self._should_stop and self._idle
+    def shutdown(self):
+        """
+        Stop the event loop and the download threads, requests not yet delivered are dropped.
+        """
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._executor.shutdown(wait=True)
+
+    def _submit(self, items, priority, manager):
+        self._paused.discard(manager)
+        for request, key, image_uri in items:
+            download = self._downloads.get(key)
+            if download is None:
+                download = _Download(key, image_uri, request, manager.downloader)
+                self._downloads[key] = download
+            else:
+                logger.debug("Merging request for {} with one in flight".format(key))
+            download.waiting.append((request, manager))
+            entry = (priority, request.sequence, key)
+            if not download.running and (download.entry is None or entry < download.entry):
+                # the old entry stays on the heap and is skipped when popped.
+                download.entry = entry
+                heapq.heappush(self._heap, entry)
+        self._dispatch()
+
+    def _cancel(self, manager, predicate):
+        for key, download in list(self._downloads.items()):
+            download.waiting = [(request, owner) for request, owner in download.waiting
+                                if owner is not manager or not predicate(request)]
+            if not download.waiting and not download.running:
+                logger.debug("Cancelled download of {}".format(key))
+                del self._downloads[key]
+
+    def _dispatch(self):
+        skipped = []
+        while self._heap and self._tasks < self.max_workers:
+            entry = heapq.heappop(self._heap)
+            download = self._downloads.get(entry[2])
+            if download is None or download.running or download.entry != entry:
+                continue
+            if ((download.host is not None and self._running_per_host[download.host] >= self.max_per_host) or
+                    download.managers <= self._paused):
+                skipped.append(entry)
+                continue
+            batch = [download] + self._batch_with(download)
+            for member in batch:
+                member.running = True
+                self._running.add(member)
+            self._tasks += 1
+            self._running_per_host[download.host] += 1
+            self._loop.create_task(self._download(batch))
+        for entry in skipped:
+            heapq.heappush(self._heap, entry)
+
+    def _batch_with(self, download):
+        """
+        The queued downloads that can share a multi-cutout request with download, best priority first.
+        """
+        if not download.batchable or self.max_batch <= 1:
+            return []
+        others = [other for other in self._downloads.values()
+                  if other is not download and not other.running and other.batchable and
+                  other.image_uri == download.image_uri and other.downloader is download.downloader and
+                  not other.managers <= self._paused]
+        return sorted(others, key=lambda other: other.entry)[:self.max_batch - 1]
+
+    async def _download(self, batch):
+        try:
+            if len(batch) == 1:
+                cutouts = [await self._loop.run_in_executor(
+                    self._executor, batch[0].request.download, batch[0].downloader)]
+            else:
+                logger.debug("Fetching {} cutouts of {} in one request".format(len(batch), batch[0].image_uri))
+                cutouts = await self._loop.run_in_executor(
+                    self._executor, functools.partial(batch[0].downloader.download_cutouts,
+                                                      [download.request.reading for download in batch],
+                                                      needs_apcor=any(download.request.needs_apcor
+                                                                      for download in batch)))
+            error = None
+        except Exception as ex:
+            cutouts, error = [None] * len(batch), ex
+        finished = []
+        for download, cutout in zip(batch, cutouts):
+            if len(batch) > 1 and cutout is None:
+                # not in the multi-cutout response, retried as a download of its own.
+                logger.debug("Requeueing {} after multi-cutout request: {}".format(download.key, error))
+                download.running = False
+                download.batchable = False
+                self._running.discard(download)
+                if download.waiting:
+                    heapq.heappush(self._heap, download.entry)
+                else:
+                    del self._downloads[download.key]
+                continue
+            # later requests for the same cutout start a new download.
+            del self._downloads[download.key]
+            finished.append((download.waiting, cutout, error))
+        await self._loop.run_in_executor(self._executor, functools.partial(self._deliver, finished))
+        self._running.difference_update(batch)
+        self._tasks -= 1
+        self._running_per_host[batch[0].host] -= 1
+        self._dispatch()
+        async with self._changed:
+            self._changed.notify_all()
+
+    @staticmethod
+    def _deliver(finished):
+        # It is up to the error handler to requeue the request if needed.
+        for waiting, cutout, error in finished:
+            for request, manager in waiting:
+                if error is not None:
+                    manager.error_handler.handle_error(error, request)
+                    continue
+                try:
+                    request.deliver(cutout)
+                except Exception as ex:
+                    manager.error_handler.handle_error(ex, request)
+
+    @staticmethod
+    async def _new_condition():
+        return asyncio.Condition()
+
+    async def _wait_for(self, predicate):
+        async with self._changed:
+            await self._changed.wait_for(predicate)
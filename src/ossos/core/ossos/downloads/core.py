@@ -107,6 +107,9 @@ class ApcorData(object):
             raise ex
         return cls(*args)
 
+    def __str__(self):
+        return "{} {} {} {}".format(self.ap_in, self.ap_out, self.apcor, self.apcor_err)
+
     @property
     def valid(self):
         return self.apcor_err < 1.0
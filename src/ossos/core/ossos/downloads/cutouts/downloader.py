@@ -1,13 +1,100 @@
+import collections
+import os
+
 from astropy import units
 from astropy.units import Quantity
 from ossos.gui import config
 
 from ..core import Downloader, ApcorData
 from ..cutouts.source import SourceCutout
+from ... import cutout_cache
 from ... import storage
 from ...astrom import SourceReading
 from ...gui import logger
 
+_cutout_cache = None
+
+
+def offline_mode():
+    """
+    Are cutouts to be served from the cutout cache only? (STORAGE.CACHE.CUTOUT_OFFLINE)
+
+    @rtype: bool
+    """
+    return str(config.read("STORAGE.CACHE.CUTOUT_OFFLINE")).lower() in ['true', '1', 'yes']
+
+
+def get_cutout_cache():
+    """
+    The on-disk cache of cutouts shared by the validation sessions on this host.
+
+    @return: the cache or None if the cache is turned off (STORAGE.CACHE.CUTOUT_CACHE_SIZE of 0).
+    @rtype: cutout_cache.CutoutCache
+    """
+    global _cutout_cache
+    size = float(config.read("STORAGE.CACHE.CUTOUT_CACHE_SIZE"))
+    if _cutout_cache is None and size > 0:
+        _cutout_cache = cutout_cache.CutoutCache(os.path.join(storage.CACHE_DIRECTORY, "cutouts"),
+                                                 max_size=size * 1024 ** 3,
+                                                 offline=offline_mode())
+    return _cutout_cache
+
+
+def cached_cutout(reading):
+    """
+    The cutout of a reading from the cutout cache, without touching the network.  This reads the cutout from disk
+    so it is called by the download workers, not the GUI thread.
+
+    @param reading: ossos.astrom.SourceReading
+    @return: SourceCutout or None if the cutout is not cached.
+    @raise IOError: in offline mode when the cutout is not cached.
+    """
+    cache = get_cutout_cache()
+    if cache is None:
+        return None
+    radius = cutout_radius(reading)
+    try:
+        cached = cache.get(cutout_cache.cache_key(reading.obs, reading.reference_sky_coord, radius))
+    finally:
+        logger.debug("Cutout cache lookup for {}: {}".format(reading.obs.rawname, cache))
+    if cached is None:
+        return None
+    hdulist, apcor, zmag = cached
+    if apcor is not None:
+        apcor = ApcorData.from_string(apcor)
+    return SourceCutout(reading, hdulist, radius=radius, apcor=apcor, zmag=zmag)
+
+
+def cutout_radius(reading):
+    """
+    The radius of the cutout needed to examine a reading: the configured minimum plus a margin for the
+    uncertainty ellipse of the source.
+
+    @param reading: ossos.astrom.SourceReading
+    @rtype: Quantity
+    """
+    min_radius = config.read('CUTOUTS.SINGLETS.RADIUS')
+    if not isinstance(min_radius, Quantity):
+        min_radius = min_radius * units.arcsec
+
+    return max(reading.uncertainty_ellipse.a,
+               reading.uncertainty_ellipse.b) * 2.5 + min_radius
+
+
+def cutout_key(reading):
+    """
+    Identifies the cutout download_cutout makes for a reading, readings with the same key get the same pixels.
+
+    @param reading: ossos.astrom.SourceReading
+    @return: (exposure number, ccd, ra, dec, radius) with the sky position in degrees and radius in arc seconds.
+    """
+    sky_coord = reading.reference_sky_coord
+    return (reading.get_exposure_number(),
+            reading.get_ccd_num(),
+            round(sky_coord.ra.to(units.degree).value, 6),
+            round(sky_coord.dec.to(units.degree).value, 6),
+            round(cutout_radius(reading).to(units.arcsec).value, 3))
+
 
 class ImageDownloader(Downloader):
 
@@ -69,12 +156,13 @@ class ImageCutoutDownloader(Downloader):
                                                                                                     needs_apcor))
         assert isinstance(reading, SourceReading)
 
-        min_radius = config.read('CUTOUTS.SINGLETS.RADIUS')
-        if not isinstance(min_radius, Quantity):
-            min_radius = min_radius * units.arcsec
+        source = cached_cutout(reading)
+        if source is not None:
+            return source
 
-        radius = max(reading.uncertainty_ellipse.a,
-                     reading.uncertainty_ellipse.b) * 2.5 + min_radius
+        radius = cutout_radius(reading)
+        # the key is taken before SourceCutout can fill in the ccd of the reading.
+        key = cutout_cache.cache_key(reading.obs, reading.reference_sky_coord, radius)
 
         logger.debug("got radius for cutout: {}".format(radius))
         image_uri = reading.get_image_uri()
@@ -83,7 +171,67 @@ class ImageCutoutDownloader(Downloader):
                                          reading.reference_sky_coord, radius)
         # hdulist = storage.ra_dec_cutout(image_uri, reading.reference_sky_coord, radius)
         logger.debug("Getting the aperture correction.")
-        source = SourceCutout(reading, hdulist, radius=radius)
+        try:
+            apcor_data = self.download_apcor(reading.get_apcor_uri())
+        except Exception as ex:
+            logger.debug("No aperture correction for {}: {}".format(image_uri, ex))
+            apcor_data = None
+        return self._build_cutout(reading, hdulist, radius, key, apcor_data, needs_apcor)
+
+    def download_cutouts(self, readings, needs_apcor=False):
+        """
+        Downloads the cutouts of several source readings, with one multi-region
+        request for all the readings of the same image.
+
+        Args:
+          readings: list(ossos.astrom.SourceReading)
+            The readings which will be the focus of the downloaded images.
+          needs_apcor: bool
+            If True, the apcor file with data needed for photometry
+            calculations is downloaded in addition to the images.
+
+        Returns:
+          cutouts: list(ossos.downloads.data.SourceCutout)
+            In the order of readings, None for a reading whose cutout was
+            not part of the response.
+        """
+        cutouts = [cached_cutout(reading) for reading in readings]
+        pending = collections.OrderedDict()
+        for idx, reading in enumerate(readings):
+            assert isinstance(reading, SourceReading)
+            if cutouts[idx] is None:
+                pending.setdefault(reading.get_image_uri(), []).append(idx)
+
+        apcors = {}
+        for image_uri, indices in pending.items():
+            radii = [cutout_radius(readings[idx]) for idx in indices]
+            keys = [cutout_cache.cache_key(readings[idx].obs, readings[idx].reference_sky_coord, radius)
+                    for idx, radius in zip(indices, radii)]
+            logger.debug("Getting {} cutouts of {}".format(len(indices), image_uri))
+            hdulists = storage.cutout_expnum_batch(readings[indices[0]].obs,
+                                                   [(readings[idx].reference_sky_coord, radius)
+                                                    for idx, radius in zip(indices, radii)])
+            for idx, radius, key, hdulist in zip(indices, radii, keys, hdulists):
+                if hdulist is None:
+                    logger.warning("No cutout of {} at {}".format(image_uri, readings[idx].reference_sky_coord))
+                    continue
+                apcor_uri = readings[idx].get_apcor_uri()
+                if apcor_uri not in apcors:
+                    try:
+                        apcors[apcor_uri] = self.download_apcor(apcor_uri)
+                    except Exception as ex:
+                        logger.debug("No aperture correction for {}: {}".format(image_uri, ex))
+                        apcors[apcor_uri] = None
+                cutouts[idx] = self._build_cutout(readings[idx], hdulist, radius, key, apcors[apcor_uri],
+                                                  needs_apcor)
+        return cutouts
+
+    @staticmethod
+    def _build_cutout(reading, hdulist, radius, key, apcor_data, needs_apcor):
+        """
+        Wrap a downloaded cutout as the SourceCutout of reading and put it in the cutout cache.
+        """
+        source = SourceCutout(reading, hdulist, radius=radius, apcor=apcor_data)
         # Accessing the attribute here to trigger the download.
         try:
             apcor = source.apcor
@@ -96,5 +244,11 @@ class ImageCutoutDownloader(Downloader):
                                  "Raising error, see logs for more details")
                 sys.stderr.write(traceback.print_exc())
             pass
+        cache = get_cutout_cache()
+        if cache is not None:
+            try:
+                cache.put(key, hdulist, apcor=apcor_data, zmag=source.zmag)
+            except Exception as ex:
+                logger.warning("Failed to cache the cutout of {}: {}".format(reading.get_image_uri(), ex))
         logger.debug("Sending back the source reading.")
         return source
@@ -15,7 +15,7 @@ from astropy.time import Time
 from astropy.units import Quantity
 
 from ossos.gui import config
-from .downloader import Downloader, ApcorData
+from ..core import Downloader, ApcorData
 from ... import storage
 from ...astrom import SourceReading, Observation
 from ...gui import logger
@@ -28,10 +28,12 @@ class SourceCutout(object):
     A cutout around a source.
     """
 
-    def __init__(self, reading, hdulist, radius=None):
+    def __init__(self, reading, hdulist, radius=None, apcor=None, zmag=None):
         """
         :param reading: A source reading giving the measurement of the object associated with this cutout.
         :param hdulist: the HDUList containing the cutout.
+        :param apcor: the ApcorData of the reading, downloaded when first needed if not given.
+        :param zmag: the photometric zero point of the reading, taken from the cutout header if not given.
         :return:
         """
         logger.debug("building a SourceCutout.")
@@ -42,8 +44,8 @@ class SourceCutout(object):
         self.reading = reading
         self.hdulist = hdulist
         self._adjusted = False
-        self._apcor = None
-        self._zmag = None
+        self._apcor = apcor
+        self._zmag = zmag
         self.init_skycoord = reading.sky_coord
 
         if self.reading.x is None or self.reading.y is None or (self.reading.x == -9999 and self.reading.y == -9999):
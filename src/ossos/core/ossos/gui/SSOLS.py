@@ -3,11 +3,12 @@
 
 from astroquery import cadc
 import pyds9
-import requests
 from astropy.io import fits
 from io import BytesIO
 import numpy as np
 
+from ossos import http_client
+
 client = cadc.Cadc()
 query = client.query("""select publisherID, target_name, time_bounds_lower from caom2.Observation o JOIN caom2.Plane p on o.obsID=p.obsID where proposal_id = '15648' AND calibrationLevel = 2""")
 
@@ -22,7 +23,7 @@ for target_name in target_names:
     print("Downloading and display {} images for target {}".format(len(urls), target_name))
     ds9.set('frame delete all')
     for url in urls:
-        response = requests.get(url)
+        response = http_client.get(url)
         stream = BytesIO(response.content)
         hdulist = fits.open(stream)
         ds9.set('frame new')
@@ -5,8 +5,7 @@ __author__ = "David Rusk <drusk@uvic.ca>"
 import errno
 import os
 
-import requests
-
+from ossos import http_client
 from ossos.gui import logger
 
 
@@ -68,7 +67,7 @@ class DownloadErrorHandler(object):
 
 def download_certificate(username, password):
     url = "http://www.cadc-ccda.hia-iha.nrc-cnrc.gc.ca/cred/proxyCert?daysValid=7"
-    response = requests.get(url, auth=(username, password))
+    response = http_client.get(url, auth=(username, password), raise_for_status=False)
 
     certfile = os.path.join(os.getenv("HOME"), ".ssl/cadcproxy.pem")
     with open(certfile, "wb") as filehandle:
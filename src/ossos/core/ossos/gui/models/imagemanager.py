@@ -1,5 +1,8 @@
 __author__ = "David Rusk <drusk@uvic.ca>"
 
+import threading
+import time
+
 from ...gui import events, logger
 from ...downloads.async_download import DownloadRequest
 from ...downloads.cutouts.focus import (SingletFocusCalculator,
@@ -8,6 +11,65 @@ from ...downloads.cutouts.grid import CutoutGrid
 from ...gui.models.exceptions import ImageNotLoadedException
 
 
+class ImageStatistics(object):
+    """
+    How long singlet cutouts take to arrive once requested and how long the
+    user is left waiting for one that is not loaded yet.
+    """
+
+    def __init__(self, smoothing=0.2):
+        """
+        @param smoothing: weight of the newest sample in the running mean of the download latency.
+        """
+        self.smoothing = smoothing
+        self.download_latency = None
+        self.downloads = 0
+        self.image_wait = 0.0
+        self.image_waits = 0
+        self._requested = {}
+        self._waiting = {}
+        self._lock = threading.Lock()
+
+    def requested(self, reading):
+        with self._lock:
+            self._requested.setdefault(reading, time.time())
+
+    def wanted(self, reading):
+        """
+        The cutout of reading was needed for display before it was loaded.
+        """
+        with self._lock:
+            self._waiting.setdefault(reading, time.time())
+
+    def cancelled(self, reading):
+        with self._lock:
+            self._requested.pop(reading, None)
+            self._waiting.pop(reading, None)
+
+    def loaded(self, reading):
+        now = time.time()
+        with self._lock:
+            requested = self._requested.pop(reading, None)
+            if requested is not None:
+                latency = now - requested
+                if self.download_latency is None:
+                    self.download_latency = latency
+                else:
+                    self.download_latency = self.smoothing * latency + (1 - self.smoothing) * self.download_latency
+                self.downloads += 1
+            waiting = self._waiting.pop(reading, None)
+            if waiting is not None:
+                self.image_wait += now - waiting
+                self.image_waits += 1
+
+    def __str__(self):
+        latency = "unknown"
+        if self.download_latency is not None:
+            latency = "{:.1f}s".format(self.download_latency)
+        return "{} downloads, {} latency, {} waits for images totalling {:.1f}s".format(
+            self.downloads, latency, self.image_waits, self.image_wait)
+
+
 class ImageManager(object):
     """
     TODO: refactor duplication.
@@ -23,6 +85,11 @@ class ImageManager(object):
         self._workunits_downloaded_for_singlets = set()
         self._workunits_downloaded_for_triplets = set()
 
+        self._cancelled_readings = {}
+        self._cancelled_grids = set()
+
+        self.statistics = ImageStatistics()
+
     def submit_singlet_download_request(self, download_request):
         self._singlet_download_manager.submit_request(download_request)
 
@@ -39,27 +106,40 @@ class ImageManager(object):
         self._workunits_downloaded_for_singlets.add(workunit)
 
         needs_apcor = workunit.is_apcor_needed()
+        requests = []
         for source in workunit.get_unprocessed_sources():
-            self.download_singlets_for_source(source, needs_apcor=needs_apcor)
+            requests.extend(self._singlet_requests(source, needs_apcor=needs_apcor))
+        # submitted together so the cutouts of one exposure are fetched in one request.
+        self._singlet_download_manager.submit_requests(requests)
 
     def download_singlets_for_source(self, source, needs_apcor=False, priority=100):
+        self._singlet_download_manager.submit_requests(
+            self._singlet_requests(source, needs_apcor=needs_apcor), priority=priority)
+
+    def _singlet_requests(self, source, needs_apcor=False):
+        """
+        The download requests for the singlet cutouts of source that are not loaded yet, the download workers serve
+        the ones in the cutout cache without touching the network.
+        """
         focus_calculator = SingletFocusCalculator(source)
         logger.debug("Got focus calculator {} for source {}".format(focus_calculator, source))
 
+        requests = []
         for reading in source.get_readings():
             # Check to see if we should only be downloading the discovery images
             if source.discovery_only and not reading.discovery:
                 continue
+            if reading in self._cutouts:
+                continue
             logger.debug("Getting focus location for {}".format(reading))
             focus = focus_calculator.calculate_focus(reading)
             logger.debug("Focus is {}".format(focus))
-            self._singlet_download_manager.submit_request(
-                DownloadRequest(reading,
-                                needs_apcor=needs_apcor,
-                                focus=focus,
-                                callback=self.on_singlet_image_loaded),
-                priority=priority
-            )
+            self.statistics.requested(reading)
+            requests.append(DownloadRequest(reading,
+                                            needs_apcor=needs_apcor,
+                                            focus=focus,
+                                            callback=self.on_singlet_image_loaded))
+        return requests
 
     def download_singlet_for_reading(self, reading, focus, needs_apcor=False):
         self._singlet_download_manager.submit_request(
@@ -75,6 +155,10 @@ class ImageManager(object):
             return self._cutouts[reading]
         except KeyError as err:
             logger.info(str(err)+str(reading))
+            source = self._cancelled_readings.get(reading)
+            if source is not None:
+                self._request_cancelled_singlets(source)
+            self.statistics.wanted(reading)
             raise ImageNotLoadedException(reading)
 
     def download_triplets_for_workunit(self, workunit):
@@ -120,8 +204,32 @@ class ImageManager(object):
         try:
             return self._cutout_grids[source]
         except KeyError:
+            if source in self._cancelled_grids:
+                self._cancelled_grids.discard(source)
+                self.download_triplets_for_source(source)
             raise ImageNotLoadedException(source)
 
+    def cancel_downloads_for_source(self, source):
+        """
+        Drops the downloads not yet delivered for a source the user has moved
+        past.  They are requested again if the source is revisited.
+        """
+        readings = source.get_readings()
+        self._singlet_download_manager.cancel(readings)
+        self._triplet_download_manager.cancel(readings)
+
+        for reading in readings:
+            if reading not in self._cutouts:
+                self._cancelled_readings[reading] = source
+                self.statistics.cancelled(reading)
+        if source not in self._cutout_grids:
+            self._cancelled_grids.add(source)
+
+    def _request_cancelled_singlets(self, source):
+        for reading in source.get_readings():
+            self._cancelled_readings.pop(reading, None)
+        self.download_singlets_for_source(source, priority=0)
+
     def stop_downloads(self):
         self.stop_singlet_downloads()
         self.stop_triplet_downloads()
@@ -143,4 +251,5 @@ class ImageManager(object):
     def on_singlet_image_loaded(self, cutout):
         reading = cutout.reading
         self._cutouts[reading] = cutout
+        self.statistics.loaded(reading)
         events.send(events.IMG_LOADED, reading)
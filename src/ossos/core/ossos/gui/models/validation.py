@@ -9,6 +9,7 @@ from ...gui.models.exceptions import (ImageNotLoadedException,
 from ...gui.models.workload import (CandidatesWorkUnit, RealsWorkUnit,
                                     TracksWorkUnit)
 from ...astrom import SourceReading
+from ...downloads.cutouts.downloader import get_cutout_cache
 from ...downloads.cutouts.source import SourceCutout
 from ...mpc import Time
 __author__ = "David Rusk <drusk@uvic.ca>"
@@ -40,11 +41,15 @@ class ValidationModel(object):
         self.next_workunit()
 
     def next_source(self):
+        source = self._find_current_source()
         self.get_current_workunit().next_source()
+        self._moved_past(source)
         self.expect_source_transition()
 
     def previous_source(self):
+        source = self._find_current_source()
         self.get_current_workunit().previous_source()
+        self._moved_past(source)
         self.expect_source_transition()
 
     def next_obs(self):
@@ -56,16 +61,31 @@ class ValidationModel(object):
         self.expect_observation_transition()
 
     def next_item(self):
+        source = self._find_current_source()
         if self.get_current_workunit().is_finished():
             self.next_workunit()
         else:
             self.get_current_workunit().next_item()
+        self._moved_past(source)
 
         if self.is_processing_candidates():
             self.expect_source_transition()
         elif self.is_processing_reals() or self.is_processing_tracks():
             self.expect_observation_transition()
 
+    def _find_current_source(self):
+        try:
+            return self.get_current_source()
+        except (NoWorkUnitException, AssertionError):
+            return None
+
+    def _moved_past(self, source):
+        """
+        The images of a source the user has moved on from are no longer urgent, drop its pending downloads.
+        """
+        if source is not None and self._find_current_source() is not source:
+            self.image_manager.cancel_downloads_for_source(source)
+
     def accept_current_item(self):
         self.sources_discovered.add(self.get_current_source())
         self._process_current_item()
@@ -363,6 +383,10 @@ class ValidationModel(object):
     def _on_finished_workunit(self, results_file_paths):
         events.send(events.FINISHED_WORKUNIT, results_file_paths)
 
+        cache = get_cutout_cache()
+        if cache is not None:
+            logger.info("Cutout cache: {}".format(cache))
+
         if self.synchronization_manager:
             for path in results_file_paths:
                 self.synchronization_manager.add_syncable_file(path)
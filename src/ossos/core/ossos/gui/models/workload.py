@@ -1,11 +1,16 @@
+import collections
+import math
 import os
 import random
 import re
 import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from glob import glob
 
 from .collections import StatefulCollection
 from .exceptions import (NoAvailableWorkException, SourceNotNamedException)
+from .. import config
 from .. import events
 from .. import logger
 from .. import tasks
@@ -597,6 +602,8 @@ class WorkUnitProvider(object):
             ignore_list = []
 
         potential_files = self.get_potential_files(ignore_list)
+        # one listing for the whole directory rather than a status request per file.
+        statuses = self.progress_manager.get_status(self.taskid)
 
         while len(potential_files) > 0:
             potential_file = self.select_potential_file(potential_files)
@@ -604,10 +611,14 @@ class WorkUnitProvider(object):
             if self._filter(potential_file):
                 continue
 
+            status = statuses.get(potential_file, None)
+            if status is not None and status.lock_holder not in (None, self.progress_manager.userid):
+                continue
+
             if self.directory_context.get_file_size(potential_file) == 0:
                 continue
 
-            if self.progress_manager.is_done(potential_file):
+            if status.done if status is not None else self.progress_manager.is_done(potential_file):
                 self._done.append(potential_file)
                 continue
             else:
@@ -616,6 +627,12 @@ class WorkUnitProvider(object):
                 except FileLockedException:
                     continue
 
+                # the listing can predate someone else finishing the file, check again now that the lock is ours.
+                if self.progress_manager.is_done(potential_file, force=True):
+                    self.progress_manager.unlock(potential_file)
+                    self._done.append(potential_file)
+                    continue
+
                 self._already_fetched.append(potential_file)
                 return self.builder.build_workunit(
                     self.directory_context.get_full_path(potential_file))
@@ -678,17 +695,51 @@ class WorkUnitProvider(object):
 
 
 class PreFetchingWorkUnitProvider(object):
-    def __init__(self, workunit_provider, prefetch_quantity, image_manager):
+    """
+    Hands out workunits while a pool of workers fetches the next ones, and
+    starts the downloads of their singlet cutouts.
+
+    The number of workunits kept ready adapts to the reviewer: enough for
+    the sources they get through, at their measured rate, in the time a
+    cutout takes to arrive, times a safety margin.  It stays between 1 and
+    max_quantity so a fast reviewer on a slow link does not pile up
+    workunits in memory.  Until the rate and latency have been measured
+    prefetch_quantity workunits are kept ready, a prefetch_quantity of 0
+    turns prefetching off.
+    """
+
+    def __init__(self, workunit_provider, prefetch_quantity, image_manager=None,
+                 max_workers=None, max_quantity=None, margin=None, smoothing=0.3):
+        """
+        @param workunit_provider: WorkUnitProvider the workunits come from.
+        @param prefetch_quantity: workunits kept ready before the reviewer's rate is known (PREFETCH.NUMBER).
+        @param image_manager: ImageManager downloading the singlets of the prefetched workunits.
+        @param max_workers: number of workunits fetched at once (PREFETCH.WORKERS).
+        @param max_quantity: most workunits ever kept ready (PREFETCH.MAX_NUMBER).
+        @param margin: factor applied to the sources needed to cover the download latency (PREFETCH.MARGIN).
+        @param smoothing: weight of the newest sample in the running mean of the reviewer's rate.
+        """
         self.workunit_provider = workunit_provider
-        self.prefetch_quantity = prefetch_quantity
+        self.prefetch_quantity = int(prefetch_quantity)
         self.image_manager = image_manager
+        self.max_quantity = int(config.read("PREFETCH.MAX_NUMBER") if max_quantity is None else max_quantity)
+        self.margin = float(config.read("PREFETCH.MARGIN") if margin is None else margin)
+        self.smoothing = smoothing
 
         self.fetched_files = []
-        self.workunits = []
+        self.workunits = collections.deque()
 
-        self._threads = []
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._executor = ThreadPoolExecutor(
+            max_workers=int(config.read("PREFETCH.WORKERS") if max_workers is None else max_workers),
+            thread_name_prefix="prefetch")
         self._all_fetched = False
 
+        self.sources_per_minute = None
+        self.sources_per_workunit = None
+        self._handed_out = None
+
     @property
     def directory(self):
         """
@@ -700,23 +751,62 @@ class PreFetchingWorkUnitProvider(object):
         if self._all_fetched and len(self.workunits) == 0:
             raise NoAvailableWorkException()
 
-        if len(self.workunits) > 0:
-            workunit = self.workunits.pop(0)
-        else:
+        try:
+            workunit = self.workunits.popleft()
+        except IndexError:
             logger.debug(f"No workunits available, getting some using {self.workunit_provider}")
             workunit = self.workunit_provider.get_workunit(
-                ignore_list=self.fetched_files)
-            self.fetched_files.append(workunit.get_filename())
+                ignore_list=self._ignore_list())
+            with self._lock:
+                self.fetched_files.append(workunit.get_filename())
 
+        self._record_hand_out(workunit)
         self.trigger_prefetching()
         logger.debug("Returning {}".format(workunit))
+        logger.info("Prefetch: {}".format(self.metrics()))
         return workunit
 
+    def prefetch_depth(self):
+        """
+        The number of workunits to keep ready or being fetched.
+        """
+        if self.prefetch_quantity <= 0:
+            return 0
+        latency = None
+        if self.image_manager is not None:
+            latency = self.image_manager.statistics.download_latency
+        with self._lock:
+            rate = self.sources_per_minute
+            sources_per_workunit = self.sources_per_workunit
+        if latency is None or not rate or not sources_per_workunit:
+            return min(self.prefetch_quantity, self.max_quantity)
+        sources_needed = self.margin * rate * latency / 60.0
+        return max(1, min(self.max_quantity, int(math.ceil(sources_needed / sources_per_workunit))))
+
+    def metrics(self):
+        """
+        @return: dict of the reviewer's rate (sources per minute), the cutout download latency (s), the time
+        spent waiting on images (s) and the state of the prefetch.
+        """
+        metrics = {'download_latency': None, 'image_wait': 0.0, 'image_waits': 0}
+        if self.image_manager is not None:
+            statistics = self.image_manager.statistics
+            metrics.update(download_latency=statistics.download_latency,
+                           image_wait=statistics.image_wait,
+                           image_waits=statistics.image_waits)
+        with self._lock:
+            metrics.update(sources_per_minute=self.sources_per_minute,
+                           ready=len(self.workunits),
+                           in_flight=self._in_flight)
+        return metrics
+
     def trigger_prefetching(self):
         if self._all_fetched:
             return
 
-        num_to_fetch = self.prefetch_quantity - len(self.workunits)
+        depth = self.prefetch_depth()
+        with self._lock:
+            num_to_fetch = depth - len(self.workunits) - self._in_flight
         logger.info(f"Fetching {num_to_fetch} files.")
         if num_to_fetch < 0:
             # Prefetch quantity can be 0
@@ -730,37 +820,69 @@ class PreFetchingWorkUnitProvider(object):
             num_to_fetch -= 1
 
     def prefetch_workunit(self):
-        thread = threading.Thread(target=self._do_prefetch_workunit)
-        self._threads.append(thread)
-        logger.debug(f"Starting prefetch thread.")
-        thread.start()
-        logger.debug(f"Prefetch started.")
+        with self._lock:
+            self._in_flight += 1
+        logger.debug(f"Queueing prefetch.")
+        self._executor.submit(self._do_prefetch_workunit).add_done_callback(self._prefetch_done)
+
+    def _prefetch_done(self, future):
+        with self._lock:
+            self._in_flight -= 1
+        if future.exception() is not None:
+            logger.error("Prefetch failed: {}".format(future.exception()))
 
     def _do_prefetch_workunit(self):
         try:
             workunit = self.workunit_provider.get_workunit(
-                ignore_list=self.fetched_files)
+                ignore_list=self._ignore_list())
             filename = workunit.get_filename()
 
-            # 2 or more threads created back to back could end up
+            # 2 or more workers running back to back could end up
             # retrieving the same workunit.  Only keep one of them.
-            if filename not in self.fetched_files:
-                self.fetched_files.append(filename)
+            with self._lock:
+                duplicate = filename in self.fetched_files
+                if not duplicate:
+                    self.fetched_files.append(filename)
+            if not duplicate:
                 self.workunits.append(workunit)
-                self.image_manager.download_singlets_for_workunit(workunit)
+                if self.image_manager is not None:
+                    self.image_manager.download_singlets_for_workunit(workunit)
 
                 logger.info("%s was prefetched." % filename)
 
         except NoAvailableWorkException:
             self._all_fetched = True
 
+    def _ignore_list(self):
+        with self._lock:
+            return list(self.fetched_files)
+
+    def _record_hand_out(self, workunit):
+        """
+        Update the reviewer's rate with the sources of the previous workunit and the time it took them.
+        """
+        now = time.time()
+        sources = len(workunit.get_unprocessed_sources())
+        with self._lock:
+            if self._handed_out is not None:
+                handed_out, previous_sources = self._handed_out
+                if now > handed_out:
+                    self.sources_per_minute = self._smooth(self.sources_per_minute,
+                                                           60.0 * previous_sources / (now - handed_out))
+            self._handed_out = (now, sources)
+            self.sources_per_workunit = self._smooth(self.sources_per_workunit, sources)
+
+    def _smooth(self, mean, sample):
+        if mean is None:
+            return float(sample)
+        return self.smoothing * sample + (1 - self.smoothing) * mean
+
     def shutdown(self):
-        # Make sure all threads are finished so that no more locks are
+        # Make sure all workers are finished so that no more locks are
         # acquired
-        for thread in self._threads:
-            thread.join()
+        self._executor.shutdown(wait=True)
 
-        for workunit in self.workunits:
+        for workunit in list(self.workunits):
             workunit.unlock()
 
 
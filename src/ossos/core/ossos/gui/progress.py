@@ -2,10 +2,11 @@ __author__ = "David Rusk <drusk@uvic.ca>"
 
 import collections
 import threading
+import time
 
 from .. import storage
 from .. import auth
-from . import tasks, logger
+from . import config, tasks, logger
 
 CANDS = "CANDS"
 REALS = "REALS"
@@ -24,6 +25,9 @@ LOCK_PROPERTY = "lock_holder"
 INDEX_SEP = "\n"
 VO_INDEX_SEP = ","
 
+# The progress of one file: is it done, who holds its lock (None if no one) and the indices processed so far.
+FileStatus = collections.namedtuple('FileStatus', ['done', 'lock_holder', 'processed_indices'])
+
 
 def requires_lock(function):
     """
@@ -84,7 +88,24 @@ class AbstractProgressManager(object):
         """
         raise NotImplementedError()
 
-    def is_done(self, filename):
+    def get_status(self, task):
+        """
+        Gets the progress made on every file for a task.
+
+        Args:
+          task: str
+            The task to find files for.
+
+        Returns:
+          statuses: dict(str, FileStatus)
+            The status of each file of the task, by filename.  A lock
+            holder given here may be out of date, lock still has to be
+            called to get the file.
+        """
+        return {filename: FileStatus(self.is_done(filename), None, self.get_processed_indices(filename))
+                for filename in self.working_context.get_listing(task)}
+
+    def is_done(self, filename, force=False):
         """
         Checks if a file has been completely processed.
 
@@ -92,6 +113,9 @@ class AbstractProgressManager(object):
           filename: str
             A file in the working directory to check for completion.
             No lock is required for this operation.
+          force: bool
+            If set to True, checks the stored progress rather than a
+            value cached from an earlier lookup or listing.
 
         Returns:
           is_done: bool
@@ -189,17 +213,82 @@ class VOSpaceProgressManager(AbstractProgressManager):
         By default partial results are not tracked when working in VOSpace.
         get_processed_indices returns an empty list and record_index is a
         no-op.
+
+        The status of the files comes from listings of the whole directory
+        with the properties of each file.  After the first one, listings
+        only go back to the files changed since the previous listing
+        (STORAGE.LISTING.POLL_INTERVAL), with a complete listing every
+        STORAGE.LISTING.FULL_INTERVAL seconds to drop deleted files.
         """
         super(VOSpaceProgressManager, self).__init__(working_context, userid=userid)
 
         self.track_partial_results = track_partial_progress
+        self.poll_interval = float(config.read("STORAGE.LISTING.POLL_INTERVAL"))
+        self.full_interval = float(config.read("STORAGE.LISTING.FULL_INTERVAL"))
+
+        self._statuses = {}
+        self._newest = None
+        self._polled = None
+        self._listed = None
+        self._poll_lock = threading.Lock()
+        self._status_lock = threading.Lock()
 
     def get_done(self, task):
-        return [filename for filename in self.working_context.get_listing(task)
-                if self.is_done(filename)]
+        return [filename for filename, status in self.get_status(task).items() if status.done]
+
+    def get_status(self, task):
+        self._poll()
+        with self._status_lock:
+            return {filename: status for filename, status in self._statuses.items()
+                    if filename.endswith(task)}
+
+    def _poll(self):
+        """
+        Bring the status of the files up to date if the last listing is older than the poll interval.
+        """
+        with self._poll_lock:
+            now = time.time()
+            if self._polled is not None and now - self._polled < self.poll_interval:
+                return
+            full = self._listed is None or now - self._listed >= self.full_interval
+            directory = self.working_context.directory
+            if full:
+                children = storage.prefetch_properties(directory)
+            else:
+                children = storage.poll_properties(directory, self._newest)
+            logger.debug("Listed {} files of {}".format(len(children), directory))
+
+            statuses = dict((name, self._file_status(props)) for name, props in children.items())
+            with self._status_lock:
+                if full:
+                    self._statuses = statuses
+                    self._listed = now
+                else:
+                    self._statuses.update(statuses)
+            dates = [props.get('date', '') for props in children.values()]
+            self._newest = max(dates + [self._newest or ''])
+            self._polled = now
+
+    def _file_status(self, props):
+        done = props.get(storage.tag_uri(DONE_PROPERTY), None) is not None
+        lock_holder = props.get(storage.tag_uri(LOCK_PROPERTY), None)
+        processed_indices = props.get(storage.tag_uri(PROCESSED_INDICES_PROPERTY), None)
+        if not self.track_partial_results or not processed_indices:
+            processed_indices = []
+        else:
+            processed_indices = list(map(int, processed_indices.split(VO_INDEX_SEP)))
+        return FileStatus(done, lock_holder, processed_indices)
+
+    def _update_status(self, filename, **changes):
+        """
+        Keep the listed status of a file in step with a change made by this manager.
+        """
+        with self._status_lock:
+            if filename in self._statuses:
+                self._statuses[filename] = self._statuses[filename]._replace(**changes)
 
-    def is_done(self, filename):
-        return storage.has_property(self._get_uri(filename), DONE_PROPERTY)
+    def is_done(self, filename, force=False):
+        return storage.has_property(self._get_uri(filename), DONE_PROPERTY, force=force)
 
     def get_processed_indices(self, filename):
         if not self.track_partial_results:
@@ -215,6 +304,7 @@ class VOSpaceProgressManager(AbstractProgressManager):
     def _record_done(self, filename):
         storage.set_property(self._get_uri(filename), DONE_PROPERTY,
                              self.userid)
+        self._update_status(filename, done=True)
 
     def _record_index(self, filename, index):
         if not self.track_partial_results:
@@ -227,11 +317,12 @@ class VOSpaceProgressManager(AbstractProgressManager):
         storage.set_property(self._get_uri(filename),
                              PROCESSED_INDICES_PROPERTY,
                              VO_INDEX_SEP.join(processed_indices))
+        self._update_status(filename, processed_indices=list(map(int, processed_indices)))
 
     def lock(self, filename):
         uri = self._get_uri(filename)
         logger.debug(f"Locking {uri}")
-        lock_holder = storage.get_property(uri, LOCK_PROPERTY)
+        lock_holder = storage.get_property(uri, LOCK_PROPERTY, force=True)
         logger.debug(f"Lock holder {lock_holder}")
         if lock_holder is None:
             storage.set_property(uri, LOCK_PROPERTY, self.userid)
@@ -240,7 +331,9 @@ class VOSpaceProgressManager(AbstractProgressManager):
             # We already had the lock
             pass
         else:
+            self._update_status(filename, lock_holder=lock_holder)
             raise FileLockedException(filename, lock_holder)
+        self._update_status(filename, lock_holder=self.userid)
 
 
     def unlock(self, filename, do_async=False):
@@ -252,13 +345,14 @@ class VOSpaceProgressManager(AbstractProgressManager):
     def _do_unlock(self, filename):
         uri = self._get_uri(filename)
 
-        lock_holder = storage.get_property(uri, LOCK_PROPERTY)
+        lock_holder = storage.get_property(uri, LOCK_PROPERTY, force=True)
         if lock_holder is None:
             # The file isn't actually locked.  Probably already cleaned up.
             pass
         elif lock_holder == self.userid:
             # It was us who locked it
             storage.set_property(uri, LOCK_PROPERTY, None)
+            self._update_status(filename, lock_holder=None)
         else:
             # Can't remove someone else's lock!
             raise FileLockedException(filename, lock_holder)
@@ -268,7 +362,7 @@ class VOSpaceProgressManager(AbstractProgressManager):
 
     def owns_lock(self, filename):
         lock_holder = storage.get_property(self._get_uri(filename),
-                                           LOCK_PROPERTY)
+                                           LOCK_PROPERTY, force=True)
         return lock_holder == self.userid
 
     def _get_uri(self, filename):
@@ -287,7 +381,7 @@ class LocalProgressManager(AbstractProgressManager):
         listing = self.working_context.get_listing(self._get_done_suffix(task))
         return [done_file[:-len(DONE_SUFFIX)] for done_file in listing]
 
-    def is_done(self, filename):
+    def is_done(self, filename, force=False):
         return self.working_context.exists(filename + DONE_SUFFIX)
 
     def get_processed_indices(self, filename):
@@ -415,7 +509,7 @@ class InMemoryProgressManager(AbstractProgressManager):
         listing = self.working_context.get_listing(self._get_done_suffix(task))
         return [done_file[:-len(DONE_SUFFIX)] for done_file in listing]
 
-    def is_done(self, filename):
+    def is_done(self, filename, force=False):
         return filename in self.done
 
     def get_processed_indices(self, filename):
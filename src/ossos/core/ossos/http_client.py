@@ -0,0 +1,170 @@
+"""
+Shared HTTP client for the CADC web services (SSOIS, TAP and the data web service).
+
+Calls made with requests.get/requests.post each open a new TCP (and TLS) connection.  The HttpClient here keeps
+one requests.Session with a pool of keep-alive connections per host, bounds the number of requests in flight to
+any one host, retries connection failures and 429/5xx replies with exponential backoff and keeps a count of the
+requests made and the time they took.
+
+Modules get the process wide client with get_client(), its settings come from the STORAGE.HTTP section of the
+configuration.
+"""
+import collections
+import logging
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_MAX_PER_HOST = 4
+DEFAULT_RETRIES = 5
+DEFAULT_BACKOFF = 0.5
+DEFAULT_TIMEOUT = (10.0, 300.0)
+
+# replies that are worth trying again, the services send these when they are overloaded.
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+USER_AGENT = 'OSSOS'
+
+_client = None
+_client_lock = threading.Lock()
+
+
+class RequestStatistics(object):
+    """
+    Number, failures and timing of the requests made to each host.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = collections.Counter()
+        self.errors = collections.Counter()
+        self.elapsed = collections.defaultdict(float)
+        self.slowest = collections.defaultdict(float)
+
+    def record(self, host, elapsed, status=None):
+        """
+        @param host: the host the request was sent to.
+        @param elapsed: seconds from sending the request to getting the reply (including retries).
+        @param status: HTTP status of the reply, None if no reply was received.
+        """
+        with self._lock:
+            self.counts[host] += 1
+            if status is None or status >= 400:
+                self.errors[host] += 1
+            self.elapsed[host] += elapsed
+            self.slowest[host] = max(self.slowest[host], elapsed)
+
+    def __str__(self):
+        lines = []
+        with self._lock:
+            for host in sorted(self.counts):
+                lines.append("{:40s} {:6d} requests {:4d} failed {:8.3f}s mean {:8.3f}s max".format(
+                    host, self.counts[host], self.errors[host], self.elapsed[host] / self.counts[host],
+                    self.slowest[host]))
+        return "\n".join(lines)
+
+
+class HttpClient(object):
+    """
+    A requests.Session with pooled keep-alive connections, a limit on concurrent requests per host and retries.
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, max_per_host=DEFAULT_MAX_PER_HOST, retries=DEFAULT_RETRIES,
+                 backoff=DEFAULT_BACKOFF, timeout=DEFAULT_TIMEOUT, user_agent=USER_AGENT):
+        """
+        @param pool_size: connections kept open to each host.
+        @param max_per_host: requests allowed in flight to one host at a time, others wait for a free slot.
+        @param retries: times a failed connection or a RETRY_STATUS reply is retried.
+        @param backoff: seconds before the first retry, doubled on each further retry.
+        @param timeout: (connect, read) timeout in seconds used when the caller does not give one.
+        """
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.statistics = RequestStatistics()
+        self._hosts = {}
+        self._hosts_lock = threading.Lock()
+
+        # SSOIS and TAP queries are sent by POST but are safe to repeat, so all methods are retried.
+        retry = Retry(total=retries, connect=retries, read=retries, status=retries, backoff_factor=backoff,
+                      status_forcelist=RETRY_STATUS, allowed_methods=None, raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = user_agent
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _host_slots(self, host):
+        with self._hosts_lock:
+            if host not in self._hosts:
+                self._hosts[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._hosts[host]
+
+    def request(self, method, url, raise_for_status=True, **kwargs):
+        """
+        Send a request through the pooled session, the arguments are those of requests.Session.request.
+
+        @param raise_for_status: raise requests.HTTPError if the final reply is an HTTP error.
+        @rtype: requests.Response
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        host = urlsplit(url).netloc
+        start = time.time()
+        with self._host_slots(host):
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.RequestException:
+                self.statistics.record(host, time.time() - start)
+                raise
+        elapsed = time.time() - start
+        self.statistics.record(host, elapsed, response.status_code)
+        logging.debug("{} {} -> {} in {:.3f}s".format(method, response.url, response.status_code, elapsed))
+        if raise_for_status:
+            response.raise_for_status()
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+def get_client():
+    """
+    The HttpClient shared by everything in this process, built from the STORAGE.HTTP configuration.
+
+    @rtype: HttpClient
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            from .gui import config
+            _client = HttpClient(pool_size=int(config.read("STORAGE.HTTP.POOL_SIZE")),
+                                 max_per_host=int(config.read("STORAGE.HTTP.MAX_PER_HOST")),
+                                 retries=int(config.read("STORAGE.HTTP.RETRIES")),
+                                 backoff=float(config.read("STORAGE.HTTP.BACKOFF")),
+                                 timeout=(float(config.read("STORAGE.HTTP.CONNECT_TIMEOUT")),
+                                          float(config.read("STORAGE.HTTP.READ_TIMEOUT"))))
+        return _client
+
+
+def get(url, **kwargs):
+    """
+    GET url with the shared client, see HttpClient.request.
+    """
+    return get_client().get(url, **kwargs)
+
+
+def post(url, **kwargs):
+    """
+    POST to url with the shared client, see HttpClient.request.
+    """
+    return get_client().post(url, **kwargs)
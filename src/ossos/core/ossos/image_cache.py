@@ -0,0 +1,251 @@
+"""
+Local, size bounded, cache of files retrieved from VOSpace.
+
+The pipeline steps run in a scratch directory that is removed after each CCD
+is processed, so the same images, flats and headers used to be retrieved by
+every step.  This cache keeps a copy of each retrieved file (or cutout) in a
+directory shared by all the processes on a host.
+
+Entries are keyed on the source node plus the cutout specification.  Each
+entry records the VOSpace MD5 of the source it was retrieved from and that
+record is trusted for a time-to-live, only once it expires (or on a miss) is
+VOSpace asked for the current MD5, a file that was replaced in VOSpace is then
+retrieved again.  Files are written to a temporary name and renamed into
+place, retrieval of a given entry is serialised with a lock file and the
+least recently used entries, with their lock and MD5 files, are removed once
+the cache grows past its size limit.
+"""
+import errno
+import fcntl
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+from .metadata_cache import cache_key as node_key
+
+DEFAULT_MAX_SIZE = 20 * 1024 ** 3
+DEFAULT_TTL = 300
+
+_SUFFIX = ".data"
+_LOCK_SUFFIX = ".lock"
+_VERSION_SUFFIX = ".md5"
+
+
+@contextmanager
+def file_lock(filename):
+    """
+    Hold an exclusive lock on filename (created if needed) for the duration of the context.
+
+    @param filename: the lock file.
+    """
+    with open(filename, 'a') as fobj:
+        fcntl.flock(fobj.fileno(), fcntl.LOCK_EX)
+        try:
+            yield fobj
+        finally:
+            fcntl.flock(fobj.fileno(), fcntl.LOCK_UN)
+
+
+def cache_key(uri, cutout=None):
+    """
+    Build the key of an entry, the same content requested through a different uri form shares an entry.
+
+    @param uri: the VOSpace uri of the source file.
+    @param cutout: the cutout specification (eg. '[1][1:100,1:100]') or None for the whole file.
+    @return: str
+    """
+    if cutout is None:
+        cutout = ""
+    text = "{}|{}".format(node_key(uri), cutout)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class ImageCache(object):
+    """
+    Directory of cached files with least recently used eviction.
+    """
+
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE, ttl=DEFAULT_TTL):
+        """
+        @param directory: where the cached files are kept, created if needed.
+        @param max_size: size, in bytes, the cache is trimmed to after each new entry.
+        @param ttl: seconds the recorded MD5 of an entry is trusted before it is checked against the source again.
+        """
+        self.directory = directory
+        self.max_size = int(max_size)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, key):
+        """
+        @param key: an entry key, see cache_key
+        @return: the filename of the entry.
+        """
+        return os.path.join(self.directory, key[:2], key + _SUFFIX)
+
+    def get(self, key, dest):
+        """
+        Copy a cached entry to dest.
+
+        @param key: an entry key, see cache_key
+        @param dest: local filename to write.
+        @return: True if the entry was found.
+        """
+        filename = self.path(key)
+        try:
+            # the modification time orders entries for eviction.
+            os.utime(filename, None)
+            shutil.copyfile(filename, dest)
+        except (IOError, OSError) as ex:
+            if ex.errno != errno.ENOENT:
+                logging.warning("Image cache read of {} failed: {}".format(filename, ex))
+            return False
+        return True
+
+    def _stored_md5(self, filename):
+        """
+        @param filename: the filename of an entry.
+        @return: the MD5 recorded for the entry or None if there is no record.
+        """
+        try:
+            with open(filename + _VERSION_SUFFIX) as fobj:
+                return fobj.read().strip()
+        except (IOError, OSError):
+            return None
+
+    def _fresh(self, filename):
+        """
+        @param filename: the filename of an entry.
+        @return: True if the MD5 of the entry was recorded or checked within the ttl.
+        """
+        try:
+            return time.time() - os.path.getmtime(filename + _VERSION_SUFFIX) < self.ttl
+        except OSError:
+            return False
+
+    def fetch(self, key, dest, retrieve, md5=None):
+        """
+        Copy the entry for key to dest, calling retrieve(filename) to fill the entry when it is not cached.
+
+        Only one process retrieves a given entry, others wait on the entry lock and then use the result.
+
+        @param key: an entry key, see cache_key
+        @param dest: local filename to write.
+        @param retrieve: function that writes the content to the filename it is given.
+        @param md5: function returning the current MD5 of the source (or None if that is not known), only called
+        on a miss or once the recorded MD5 of the entry is older than the ttl.  Without it entries never go stale.
+        @return: the size of dest
+        """
+        filename = self.path(key)
+        if (md5 is None or self._fresh(filename)) and self.get(key, dest):
+            self.hits += 1
+            return os.path.getsize(dest)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with file_lock(filename + _LOCK_SUFFIX):
+            current = None
+            if md5 is not None:
+                current = md5()
+            if md5 is None or (current is not None and current == self._stored_md5(filename)):
+                if self.get(key, dest):
+                    if current is not None:
+                        self._record_md5(filename, current)
+                    self.hits += 1
+                    return os.path.getsize(dest)
+            self.misses += 1
+            fd, partial = tempfile.mkstemp(dir=os.path.dirname(filename), suffix=".partial")
+            os.close(fd)
+            try:
+                retrieve(partial)
+                os.rename(partial, filename)
+            finally:
+                if os.access(partial, os.F_OK):
+                    os.unlink(partial)
+            if current is not None:
+                self._record_md5(filename, current)
+            else:
+                # nothing to check the entry against later, so it is never trusted without asking again.
+                self._unlink(filename + _VERSION_SUFFIX)
+            shutil.copyfile(filename, dest)
+        self.trim()
+        return os.path.getsize(dest)
+
+    @staticmethod
+    def _record_md5(filename, md5):
+        """
+        Record the source MD5 of an entry, this also restarts the ttl of the entry.
+        """
+        with open(filename + _VERSION_SUFFIX, 'w') as fobj:
+            fobj.write(md5)
+
+    @staticmethod
+    def _unlink(filename):
+        try:
+            os.unlink(filename)
+        except OSError:
+            pass
+
+    def entries(self):
+        """
+        @return: list of (mtime, size, filename) of the cached files, oldest first.
+        """
+        entries = []
+        for dirpath, dirnames, filenames in os.walk(self.directory):
+            for name in filenames:
+                if not name.endswith(_SUFFIX):
+                    continue
+                filename = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(filename)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, filename))
+        entries.sort()
+        return entries
+
+    def size(self):
+        """
+        @return: total size, in bytes, of the cached files.
+        """
+        return sum(entry[1] for entry in self.entries())
+
+    def trim(self):
+        """
+        Remove the least recently used entries until the cache is no larger than max_size.
+        """
+        with file_lock(os.path.join(self.directory, ".lock")):
+            entries = self.entries()
+            total = sum(entry[1] for entry in entries)
+            for mtime, size, filename in entries:
+                if total <= self.max_size:
+                    break
+                if self._discard(filename):
+                    total -= size
+
+    def _discard(self, filename):
+        """
+        Remove an entry along with its lock and MD5 files, unless it is being retrieved right now.
+
+        @param filename: the filename of an entry.
+        @return: True if the entry was removed.
+        """
+        with open(filename + _LOCK_SUFFIX, 'a') as fobj:
+            try:
+                fcntl.flock(fobj.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except (IOError, OSError):
+                return False
+            try:
+                self._unlink(filename)
+                self._unlink(filename + _VERSION_SUFFIX)
+                self._unlink(filename + _LOCK_SUFFIX)
+            finally:
+                fcntl.flock(fobj.fileno(), fcntl.LOCK_UN)
+        return True
+
+    def __str__(self):
+        return "{}: {} hits {} misses".format(self.directory, self.hits, self.misses)
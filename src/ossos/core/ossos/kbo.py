@@ -1,107 +1,196 @@
+"""
+Bernstein & Khushalani orbit fitting through the orbfit library, without touching the disk.
+
+The library only exchanges data through named files: fitradec reads the
+observations from one and writes the fitted orbit (the 'abg') to another and
+predict reads the abg back from its file on every call.  Here those files are
+anonymous in-memory files (memfd, reached by the library through their
+/proc/self/fd name) that live as long as the Orbfit: the observations are
+handed over from memory, the fitted abg stays in its buffer and every predict
+reuses that same buffer.  Where memfd is not available (not Linux) ordinary
+temporary files are used.
+"""
 import ctypes
+import glob
 import os
 import tempfile
+
+import mp_ephem
+import numpy
 from astropy import coordinates
 from astropy import units
-from ossos.mpc import Time, Observation
+from astropy.time import Time
+from mp_ephem.ephem import obscode_to_int
 
-LIBORBFIT='/usr/local/lib/liborbfit.so'
+from .orbfit import OrbfitError, Predictions, _julian_dates
 
 __author__ = 'jjk'
 
+_MP_EPHEM_DIR = os.path.dirname(mp_ephem.__file__)
+LIBORBFIT = os.getenv('LIBORBFIT', (glob.glob(os.path.join(_MP_EPHEM_DIR, 'orbfit*.so')) + [''])[0])
+
+# default plate uncertainty, in arc seconds, of observations that do not report one.
+DEFAULT_UNCERTAINTY = 0.2
+
+
+class MemoryFile(object):
+    """
+    An anonymous in-memory file that a C library can open by name.
+    """
+
+    def __init__(self, suffix=''):
+        self._tempfile = None
+        if hasattr(os, 'memfd_create'):
+            self.fd = os.memfd_create("orbfit" + suffix)
+            self.name = "/proc/self/fd/{}".format(self.fd)
+        else:
+            self._tempfile = tempfile.NamedTemporaryFile(suffix=suffix)
+            self.fd = self._tempfile.fileno()
+            self.name = self._tempfile.name
+
+    @property
+    def c_name(self):
+        return ctypes.c_char_p(bytes(self.name, 'utf-8'))
+
+    def write(self, text):
+        """
+        Replace the content of the file.
+        """
+        with open(self.name, 'w') as fobj:
+            fobj.write(text)
+
+    def read(self):
+        with open(self.name, 'r') as fobj:
+            return fobj.read()
+
+    def close(self):
+        if self._tempfile is not None:
+            self._tempfile.close()
+        elif self.fd is not None:
+            os.close(self.fd)
+        self.fd = None
+
+
 class Orbfit(object):
+    """
+    The orbit fit of a set of mpc.Observation, kept in memory for repeated predictions.
+    """
 
-    def __init__(self, observations=[], abg=[], residuals=[]):
+    def __init__(self, observations=(), obs_code=568):
+        """
+        @param observations: the mpc.Observation of the object, at least 3 that are not null observations.
+        @param obs_code: the default observatory code for predictions.
+        """
         self.orbfit = ctypes.CDLL(LIBORBFIT)
-        self.abg = abg
-        self.residuals = residuals
+        self.orbfit.fitradec.restype = ctypes.POINTER(ctypes.c_double * 2)
+        self.orbfit.fitradec.argtypes = [ctypes.c_char_p, ctypes.c_char_p]
+        self.orbfit.predict.restype = ctypes.POINTER(ctypes.c_double * 8)
+        self.orbfit.predict.argtypes = [ctypes.c_char_p, ctypes.c_double, ctypes.c_int]
+        bin_ephem = 'binEphem.405_64' if ctypes.sizeof(ctypes.c_voidp) == 8 else 'binEphem.405_32'
+        os.environ.setdefault('ORBIT_EPHEMERIS', os.path.join(_MP_EPHEM_DIR, 'data', bin_ephem))
+        os.environ.setdefault('ORBIT_OBSERVATORIES', os.path.join(_MP_EPHEM_DIR, 'data', 'observatories.dat'))
         self.observations = observations
+        self.obs_code = obs_code
+        self.abg = None
+        self.coordinate = self.dra = self.ddec = self.pa = self.distance = self.date = None
+        self._abg_file = None
         self._fit_radec()
 
     def _fit_radec(self):
         """
-        call fit_radec of BK passing in the observations.
-
+        Fit the orbit with fitradec, the observations and the fitted abg are exchanged through memory files.
         """
-
-        # call fitradec with mpcfile, abgfile, resfile
-        self.orbfit.fitradec.restype = ctypes.c_int
-        self.orbfit.fitradec.argtypes = [ ctypes.c_char_p, ctypes.c_char_p, ctypes.c_char_p ]
-
-        mpc_file = tempfile.NamedTemporaryFile(suffix='.mpc')
+        lines = []
         for observation in self.observations:
-            mpc_file.write("{}\n".format(str(observation)))
-        mpc_file.seek(0)
-
-        abg_file = tempfile.NamedTemporaryFile()
-        res_file = tempfile.NamedTemporaryFile()
+            if observation.null_observation:
+                continue
+            uncertainty = getattr(observation.comment, 'plate_uncertainty', DEFAULT_UNCERTAINTY)
+            # UTC JD, the library converts it to TT.  Space based observations give the observer location.
+            fields = [observation.date.utc.jd, observation.ra.replace(" ", ":"), observation.dec.replace(" ", ":"),
+                      uncertainty]
+            if observation.location is None:
+                fields.append(observation.observatory_code)
+            else:
+                fields.extend([observation.location.x, observation.location.y, observation.location.z])
+            lines.append(" ".join(str(field) for field in fields) + "\n")
+        if len(lines) < 3:
+            raise OrbfitError()
+
+        obs_file = MemoryFile(suffix='.mpc')
+        try:
+            obs_file.write("".join(lines))
+            self._abg_file = MemoryFile(suffix='.abg')
+            self.orbfit.fitradec(obs_file.c_name, self._abg_file.c_name)
+        finally:
+            obs_file.close()
+        self.abg = self._abg_file.read()
+
+    def _predict(self, jd, obs_code):
+        return self.orbfit.predict(self._abg_file.c_name, ctypes.c_double(jd),
+                                   ctypes.c_int(obscode_to_int(obs_code))).contents
+
+    def predict(self, date, obs_code=None):
+        """
+        Compute the location of the source on the given date, setting coordinate, dra, ddec (arc seconds),
+        pa (degrees), distance (AU) and date.
 
-        self.orbfit.fitradec(ctypes.c_char_p(mpc_file.name),
-                             ctypes.c_char_p(abg_file.name),
-                             ctypes.c_char_p(res_file.name))
+        @param date: an astropy Time or a julian date.
+        @param obs_code: the Minor Planet Center observatory code, defaults to that given when fitting.
+        """
+        time = date if isinstance(date, Time) else Time(date, format='jd', scale='utc', precision=6)
+        values = self._predict(time.utc.jd, self.obs_code if obs_code is None else obs_code)
+        self.coordinate = coordinates.SkyCoord(values[0], values[1], unit=(units.degree, units.degree))
+        self.dra = values[2] * units.arcsec
+        self.ddec = values[3] * units.arcsec
+        self.pa = values[4] * units.degree
+        self.distance = values[5] * units.AU
+        self.date = str(time)
 
-        self.abg = abg_file
-        self.abg.seek(0)
-        self.residuals = res_file
-        self.residuals.seek(0)
+    def predict_many(self, dates, obs_code=None):
+        """
+        Predict the location of the source on many dates, see orbfit.Orbfit.predict_many.
 
-    def predict(self, date, obs_code=568):
+        @param dates: an astropy Time (scalar or array) or a sequence of Time objects and/or julian dates.
+        @param obs_code: the Minor Planet Center observatory code, defaults to that given when fitting.
+        @rtype: Predictions
         """
-        use the bk predict method to compute the location of the source on the given date.
+        if obs_code is None:
+            obs_code = self.obs_code
+        jds = _julian_dates(dates)
+        values = numpy.zeros((len(jds), 8))
+        for idx, jd in enumerate(jds):
+            values[idx] = self._predict(jd, obs_code)[:]
+        return Predictions(coordinate=coordinates.SkyCoord(values[:, 0], values[:, 1],
+                                                           unit=(units.degree, units.degree)),
+                           dra=values[:, 2] * units.arcsec,
+                           ddec=values[:, 3] * units.arcsec,
+                           pa=values[:, 4] * units.degree)
+
+    def close(self):
         """
-        time = Time(date, scale='utc', precision=6)
-        jd = ctypes.c_double(time.jd)
-        # call predict with agbfile, jdate, obscode
-        self.orbfit.predict.restype = ctypes.POINTER(ctypes.c_double * 5)
-        self.orbfit.predict.argtypes = [ ctypes.c_char_p, ctypes.c_double, ctypes.c_int ]
-        predict = self.orbfit.predict(ctypes.c_char_p(self.abg.name),
-                       jd,
-                       ctypes.c_int(obs_code))
-        self.coordinate = coordinates.SkyCoord(predict.contents[0],
-                                               predict.contents[1],
-                                               unit=(units.degree, units.degree))
-        self.dra = predict.contents[2]
-        self.ddec = predict.contents[3]
-        self.pa = predict.contents[4]
-        self.date = str(time)
+        Release the memory holding the fitted orbit.
+        """
+        if self._abg_file is not None:
+            self._abg_file.close()
+            self._abg_file = None
 
+    def __del__(self):
+        self.close()
 
-if __name__ == '__main__':
 
-    mpc_lines=("     HL7j2    C2013 04 03.62926 17 12 01.16 +04 13 33.3          24.1 R      568",
-               "     HL7j2    C2013 04 04.58296 17 11 59.80 +04 14 05.5          24.0 R      568",
-               "     HL7j2    C2013 05 03.52252 17 10 38.28 +04 28 00.9          23.4 R      568",
-               "     HL7j2    C2013 05 08.56725 17 10 17.39 +04 29 47.8          23.4 R      568")
+if __name__ == '__main__':
+    from ossos.mpc import Observation
 
-    observations = []
-    for line in mpc_lines:
-        observations.append(Observation().from_string(line))
+    mpc_lines = ("     HL7j2    C2013 04 03.62926 17 12 01.16 +04 13 33.3          24.1 R      568",
+                 "     HL7j2    C2013 04 04.58296 17 11 59.80 +04 14 05.5          24.0 R      568",
+                 "     HL7j2    C2013 05 03.52252 17 10 38.28 +04 28 00.9          23.4 R      568",
+                 "     HL7j2    C2013 05 08.56725 17 10 17.39 +04 29 47.8          23.4 R      568")
 
-    os.environ['ORBIT_EPHEMERIS']='/Users/jjk/MOP/config/binEphem.405'
-    os.environ['ORBIT_OBSERVATORIES']='/Users/jjk/MOP/config/observatories.dat'
+    observations = [Observation.from_string(line) for line in mpc_lines]
     HL7j2 = Orbfit(observations=observations)
     for observation in observations:
         HL7j2.predict(observation.date)
-        dra = coordinates.Angle(HL7j2.coordinate.ra - observation.coordinate.ra)
-        if dra.degrees > 180 :
-            dra = dra - coordinates.Angle(360, unit=units.degree)
-        ddec = coordinates.Angle(HL7j2.coordinate.dec - observation.coordinate.dec)
-        if ddec.degrees > 180:
-            dra = ddec - coordinates.Angle(360, unit=units.degree)
-
-        print("Input  : {} {} {} [ {:+4.2f} {:+4.2f} ]".format(observation.date,
-                                               observation.ra,
-                                               observation.dec,
-                                               dra.degrees*3600.0,
-                                               ddec.degrees*3600.0))
-        #print "Predict: {} {} {}".format(HL7j2.date,
-        #                                 HL7j2.coordinate.ra.format(unit=units.hour,
-        #                                                           precision=3,
-        #                                                            pad=True,
-        #                                                            sep=" "),
-        #                                 HL7j2.coordinate.dec.format(unit=units.degree,
-        #                                                            decimal=False,
-        #                                                            precision=2,
-        #                                                            pad=True,
-        #                                                            sep=" ",
-        #                                                            alwayssign=True))
+        print("Input  : {} {} {} [ {:+4.2f} {:+4.2f} ]".format(
+            observation.date, observation.ra, observation.dec,
+            (HL7j2.coordinate.ra - observation.coordinate.ra).wrap_at(180 * units.degree).to(units.arcsec).value,
+            (HL7j2.coordinate.dec - observation.coordinate.dec).to(units.arcsec).value))
@@ -1,7 +1,6 @@
 from astropy.io import ascii
 from astropy.table import MaskedColumn, Table, Column
 import logging
-import math
 import numpy
 import os
 from .downloads.cutouts.downloader import ImageDownloader
@@ -88,6 +87,15 @@ def measure_mags(measures):
     return observations
 
 
+def _set_rows(column, rows, values):
+    """
+    Set rows of a MaskedColumn, masked values leave the row masked with a zero value (so it is not counted).
+    """
+    values = numpy.ma.asarray(values)
+    column[rows] = values.filled(0)
+    column.mask[rows] = numpy.ma.getmaskarray(values)
+
+
 def match_planted(fk_candidate_observations, match_filename, bright_limit=BRIGHT_LIMIT, object_planted=OBJECT_PLANTED,
                   minimum_bright_detections=MINIMUM_BRIGHT_DETECTIONS, bright_fraction=MINIMUM_BRIGHT_FRACTION):
     """
@@ -103,12 +111,10 @@ def match_planted(fk_candidate_observations, match_filename, bright_limit=BRIGHT
 
     """
 
-    found_pos = []
     detections = fk_candidate_observations.get_sources()
-    for detection in detections:
-        reading = detection.get_reading(0)
-        # create a list of positions, to be used later by match_lists
-        found_pos.append([reading.x, reading.y])
+    columns = fk_candidate_observations.to_columns()
+    # create a list of positions, to be used later by match_lists
+    found_pos = numpy.transpose([columns.readings[0]['x'], columns.readings[0]['y']])
 
     # Now get the Object.planted file, either from the local FS or from VOSpace.
     objects_planted_uri = object_planted
@@ -126,7 +132,7 @@ def match_planted(fk_candidate_observations, match_filename, bright_limit=BRIGHT
     planted_pos = numpy.transpose([planted_objects_table['x'].data, planted_objects_table['y'].data])
     # match_idx is an order list.  The list is in the order of the first list of positions and each entry
     # is the index of the matching position from the second list.
-    (match_idx, match_fnd) = util.match_lists(numpy.array(planted_pos), numpy.array(found_pos))
+    (match_idx, match_fnd) = util.match_lists(numpy.array(planted_pos), found_pos)
     assert isinstance(match_idx, numpy.ma.MaskedArray)
     assert isinstance(match_fnd, numpy.ma.MaskedArray)
     false_positives_table = Table()
@@ -161,36 +167,29 @@ def match_planted(fk_candidate_observations, match_filename, bright_limit=BRIGHT
     bright = planted_objects_table['mag'] < bright_limit
     n_bright_planted = numpy.count_nonzero(planted_objects_table['mag'][bright])
 
-    measures = []
-    idxs = []
-    for idx in range(len(match_idx)):
-        # The match_idx value is False if nothing was found.
-        if not match_idx.mask[idx]:
-            # Each 'source' has multiple 'readings'
-            measures.append(detections[match_idx[idx]].get_readings())
-            idxs.append(idx)
+    # The match_idx value is masked if nothing was found, each matched 'source' has multiple 'readings'.
+    idxs = numpy.flatnonzero(~numpy.ma.getmaskarray(match_idx))
+    found = match_idx.data[idxs]
+    measures = [detections[idx].get_readings() for idx in found]
 
     observations = measure_mags(measures)
 
-    for oidx in range(len(measures)):
-        idx = idxs[oidx]
-        readings = measures[oidx]
-        start_jd = Time(readings[0].obs.header['MJD_OBS_CENTER'], format='mpc', scale='utc').jd
-        end_jd = Time(readings[-1].obs.header['MJD_OBS_CENTER'], format='mpc', scale='utc').jd
-        rate = math.sqrt((readings[-1].x - readings[0].x) ** 2 + (readings[-1].y - readings[0].y) ** 2) / (
-            24 * (end_jd - start_jd))
-        rate = int(rate * 100) / 100.0
-        angle = math.degrees(math.atan2(readings[-1].y - readings[0].y, readings[-1].x - readings[0].x))
-        angle = int(angle * 100) / 100.0
-        planted_objects_table[idx]['measure_rate'] = rate
-        planted_objects_table[idx]['measure_angle'] = angle
-        planted_objects_table[idx]['measure_x'] = observations[readings[0].obs]['mags']["XCENTER"][oidx]
-        planted_objects_table[idx]['measure_y'] = observations[readings[0].obs]['mags']["YCENTER"][oidx]
-        for ridx in range(len(readings)):
-            reading = readings[ridx]
-            mags = observations[reading.obs]['mags']
-            planted_objects_table[idx]['measure_mag{}'.format(ridx+1)] = mags["MAG"][oidx]
-            planted_objects_table[idx]['measure_merr{}'.format(ridx+1)] = mags["MERR"][oidx]
+    if len(measures) > 0:
+        first = columns.readings[0][found]
+        last = columns.readings[-1][found]
+        start_jd = Time(columns.observations[0].header['MJD_OBS_CENTER'], format='mpc', scale='utc').jd
+        end_jd = Time(columns.observations[-1].header['MJD_OBS_CENTER'], format='mpc', scale='utc').jd
+        rate = numpy.hypot(last['x'] - first['x'], last['y'] - first['y']) / (24 * (end_jd - start_jd))
+        angle = numpy.degrees(numpy.arctan2(last['y'] - first['y'], last['x'] - first['x']))
+        planted_objects_table['measure_rate'][idxs] = numpy.trunc(rate * 100) / 100.0
+        planted_objects_table['measure_angle'][idxs] = numpy.trunc(angle * 100) / 100.0
+        mags = observations[columns.observations[0]]['mags']
+        _set_rows(planted_objects_table['measure_x'], idxs, mags["XCENTER"])
+        _set_rows(planted_objects_table['measure_y'], idxs, mags["YCENTER"])
+        for ridx, obs in enumerate(columns.observations):
+            mags = observations[obs]['mags']
+            _set_rows(planted_objects_table['measure_mag{}'.format(ridx+1)], idxs, mags["MAG"])
+            _set_rows(planted_objects_table['measure_merr{}'.format(ridx+1)], idxs, mags["MERR"])
 
     # for idx in range(len(match_fnd)):
     #     if match_fnd.mask[idx]:
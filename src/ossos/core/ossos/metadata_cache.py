@@ -0,0 +1,202 @@
+"""
+Persistent, process shared, cache of VOSpace node properties.
+
+VOSpace tags (processing status, fwhm, zeropoint, lock and done flags, ...) are
+stored as properties on nodes and every lookup otherwise costs a round trip to
+the service.  The cache keeps the property dictionary of each node in a small
+SQLite database so that all the pipeline steps (and the web status pages)
+running on one host share what has already been retrieved.
+
+Entries expire after a time-to-live and are updated in place (write-through)
+when the pipeline sets a property, so a process only goes back to VOSpace when
+its information is stale or missing.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+
+DEFAULT_TTL = 300.0
+
+_SCHEMA = ("CREATE TABLE IF NOT EXISTS node_props ("
+           " uri TEXT PRIMARY KEY,"
+           " props TEXT NOT NULL,"
+           " version TEXT,"
+           " fetched REAL NOT NULL)")
+
+# the IVOA core property that VOSpace updates whenever a node changes.
+VERSION_PROPERTY = 'date'
+
+
+def cache_key(uri):
+    """
+    Build the key used for a node, the same node can be referred to as vos:OSSOS/dbimages or
+    vos://cadc.nrc.ca!vospace/OSSOS/dbimages/ and those must share an entry.
+
+    @param uri: the VOSpace uri of the node.
+    @return: str
+    """
+    path = urlparse(uri).path
+    path = os.path.normpath("/" + path.lstrip("/"))
+    return "vos:" + path.lstrip("/")
+
+
+class MetadataCache(object):
+    """
+    SQLite backed store of node uri -> property dictionary.
+    """
+
+    def __init__(self, filename, ttl=DEFAULT_TTL):
+        """
+        @param filename: the SQLite database file, created if needed.  Use ':memory:' for a private cache.
+        @param ttl: seconds an entry remains valid, entries older than this are treated as missing.
+                    A ttl <= 0 disables lookups (writes are still recorded).
+        """
+        self.filename = filename
+        self.ttl = float(ttl)
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._shared_connection = None
+        self._lock = None
+        if filename == ':memory:':
+            self._lock = threading.Lock()
+        if filename != ':memory:':
+            dirname = os.path.dirname(os.path.abspath(filename))
+            if not os.access(dirname, os.F_OK):
+                os.makedirs(dirname, exist_ok=True)
+
+    @property
+    def connection(self):
+        """
+        SQLite connections can not be shared between threads so each thread gets its own.
+        An in-memory database only exists for a single connection so that one is shared, behind a lock.
+        @rtype: sqlite3.Connection
+        """
+        if self.filename == ':memory:':
+            if self._shared_connection is None:
+                self._shared_connection = sqlite3.connect(self.filename, check_same_thread=False)
+                self._shared_connection.execute(_SCHEMA)
+            return self._shared_connection
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.filename, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(_SCHEMA)
+            connection.commit()
+            self._local.connection = connection
+        return connection
+
+    def _execute(self, sql, parameters=(), many=False):
+        return self._transaction(lambda connection: (many and connection.executemany(sql, parameters)
+                                                     or connection.execute(sql, parameters)).fetchall())
+
+    def _transaction(self, function):
+        """
+        Run function(connection) inside a single write transaction, errors are logged and treated as a miss.
+        """
+        connection = self.connection
+        if self._lock is not None:
+            self._lock.acquire()
+        try:
+            with connection:
+                if self._lock is None:
+                    connection.execute("BEGIN IMMEDIATE")
+                return function(connection)
+        except sqlite3.Error as ex:
+            logging.warning("Metadata cache {} failed: {}".format(self.filename, ex))
+            return []
+        finally:
+            if self._lock is not None:
+                self._lock.release()
+
+    def get(self, uri):
+        """
+        Get the cached properties of a node.
+
+        @param uri: the VOSpace uri of the node.
+        @return: the property dictionary or None if the node is not cached or the entry has expired.
+        @rtype: dict
+        """
+        if self.ttl > 0:
+            rows = self._execute("SELECT props, fetched FROM node_props WHERE uri=?", (cache_key(uri),))
+            if len(rows) > 0 and time.time() - rows[0][1] < self.ttl:
+                self.hits += 1
+                return json.loads(rows[0][0])
+        self.misses += 1
+        return None
+
+    def put(self, uri, props):
+        """
+        Record the full property dictionary of a node, as just retrieved from VOSpace.
+
+        @param uri: the VOSpace uri of the node.
+        @param props: dict of property uri -> value
+        """
+        self.put_many([(uri, props)])
+
+    def put_many(self, nodes):
+        """
+        Record the properties of many nodes in one transaction.
+
+        @param nodes: iterable of (uri, props) pairs.
+        """
+        now = time.time()
+        rows = [(cache_key(uri), json.dumps(dict(props)), props.get(VERSION_PROPERTY, None), now)
+                for uri, props in nodes]
+        self._execute("INSERT OR REPLACE INTO node_props (uri, props, version, fetched) VALUES (?, ?, ?, ?)",
+                      rows, many=True)
+
+    def update(self, uri, props):
+        """
+        Write-through a change made to some of the properties of a node.
+
+        Only nodes already in the cache are updated, a partial dictionary is never stored as that would hide
+        the properties that were not part of the update.  A value of None removes the property, as it does in
+        VOSpace.
+
+        @param uri: the VOSpace uri of the node.
+        @param props: dict of property uri -> value
+        """
+        key = cache_key(uri)
+
+        def merge(connection):
+            rows = connection.execute("SELECT props FROM node_props WHERE uri=?", (key,)).fetchall()
+            if len(rows) == 0:
+                return
+            cached = json.loads(rows[0][0])
+            for prop, value in props.items():
+                if value is None:
+                    cached.pop(prop, None)
+                else:
+                    cached[prop] = value
+            connection.execute("UPDATE node_props SET props=? WHERE uri=?", (json.dumps(cached), key))
+
+        self._transaction(merge)
+
+    def invalidate(self, uri=None):
+        """
+        Forget a node, or all nodes if uri is None.
+
+        @param uri: the VOSpace uri of the node.
+        """
+        if uri is None:
+            self._execute("DELETE FROM node_props")
+        else:
+            self._execute("DELETE FROM node_props WHERE uri=?", (cache_key(uri),))
+
+    def version(self, uri):
+        """
+        @param uri: the VOSpace uri of the node.
+        @return: the modification date VOSpace reported for the node when it was cached.
+        """
+        rows = self._execute("SELECT version FROM node_props WHERE uri=?", (cache_key(uri),))
+        if len(rows) == 0:
+            return None
+        return rows[0][0]
+
+    def __str__(self):
+        return "{}: {} hits {} misses".format(self.filename, self.hits, self.misses)
@@ -1,5 +1,84 @@
 __author__ = 'jjk'
 
+import collections
+import ctypes
+import tempfile
+
 import mp_ephem
-Orbfit = mp_ephem.BKOrbit
-OrbfitError = mp_ephem.BKOrbitError
\ No newline at end of file
+import numpy
+from astropy import units
+from astropy.coordinates import SkyCoord
+from astropy.time import Time
+from mp_ephem.ephem import obscode_to_int
+
+OrbfitError = mp_ephem.BKOrbitError
+
+# predicted positions and uncertainty ellipses, arrays with one entry per date.
+Predictions = collections.namedtuple('Predictions', ['coordinate', 'dra', 'ddec', 'pa'])
+
+
+def _julian_dates(dates):
+    """
+    @param dates: an astropy Time (scalar or array) or a sequence of Time objects and/or julian dates.
+    @return: numpy array of UTC julian dates.
+    """
+    if isinstance(dates, Time):
+        return numpy.atleast_1d(dates.utc.jd)
+    return numpy.array([date.utc.jd if isinstance(date, Time) else float(date) for date in dates], dtype=float)
+
+
+class Orbfit(mp_ephem.BKOrbit):
+    """
+    The Bernstein & Khushalani orbit fit of a set of observations.
+    """
+
+    def predict_many(self, dates, obs_code=568):
+        """
+        Predict the location of the source on many dates in one call.
+
+        Unlike predict this does not change the current prediction (coordinate, dra, ddec, pa) of the orbit, the
+        orbit elements are written out for the library once and the coordinates are built as a single array.
+
+        @param dates: an astropy Time (scalar or array) or a sequence of Time objects and/or julian dates.
+        @param obs_code: the Minor Planet Center observatory code of the observer.
+        @rtype: Predictions
+        """
+        jds = _julian_dates(dates)
+        values = numpy.zeros((len(jds), 8))
+        self.orbfit.predict.restype = ctypes.POINTER(ctypes.c_double * 8)
+        self.orbfit.predict.argtypes = [ctypes.c_char_p, ctypes.c_double, ctypes.c_int]
+        with tempfile.NamedTemporaryFile(suffix='.abg') as abg_file:
+            abg_file.write(bytes(self.abg, 'utf-8'))
+            abg_file.flush()
+            abg_filename = ctypes.c_char_p(bytes(abg_file.name, 'utf-8'))
+            code = ctypes.c_int(obscode_to_int(obs_code))
+            for idx, jd in enumerate(jds):
+                values[idx] = self.orbfit.predict(abg_filename, ctypes.c_double(jd), code).contents[:]
+        return Predictions(coordinate=SkyCoord(values[:, 0], values[:, 1], unit=(units.degree, units.degree)),
+                           dra=values[:, 2] * units.arcsec,
+                           ddec=values[:, 3] * units.arcsec,
+                           pa=values[:, 4] * units.degree)
+
+
+def predict_many(orbit, dates):
+    """
+    Predict the location of a source on many dates with any orbit object, in a single call for an Orbfit and
+    one date at a time for the others (eg. an mp_ephem.horizons.Body).
+
+    @param orbit: an object with predict(Time) setting coordinate, dra, ddec and pa.
+    @param dates: an astropy Time (scalar or array) or a sequence of Time objects and/or julian dates.
+    @rtype: Predictions
+    """
+    if hasattr(orbit, 'predict_many'):
+        return orbit.predict_many(dates)
+    jds = _julian_dates(dates)
+    values = numpy.zeros((len(jds), 5))
+    for idx, jd in enumerate(jds):
+        orbit.predict(Time(jd, format='jd', scale='utc'))
+        values[idx] = (orbit.coordinate.ra.to(units.degree).value, orbit.coordinate.dec.to(units.degree).value,
+                       units.Quantity(orbit.dra, units.arcsec).value, units.Quantity(orbit.ddec, units.arcsec).value,
+                       units.Quantity(orbit.pa, units.degree).value)
+    return Predictions(coordinate=SkyCoord(values[:, 0], values[:, 1], unit=(units.degree, units.degree)),
+                       dra=values[:, 2] * units.arcsec,
+                       ddec=values[:, 3] * units.arcsec,
+                       pa=values[:, 4] * units.degree)
@@ -205,7 +205,7 @@ def align(expnums, ccd, version='s', prefix='', dry_run=False, force=True):
             logging.error(message)
 
         if not dry_run:
-            storage.set_status(task, prefix, expnum, version, ccd, status=message)
+            storage.set_status(task, prefix, expnums[0], version, ccd, status=message)
 
 
 def main():
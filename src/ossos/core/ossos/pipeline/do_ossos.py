@@ -10,20 +10,21 @@ params["QUERY"] = QUERY
 import argparse
 import smtplib
 from email.mime.text import MIMEText
-import requests
 from io import StringIO
 from astropy.table import Table
 from astropy.io import ascii
 import tempfile
 import vos
 
+from ossos import http_client
+
 parser = argparse.ArgumentParser()
 parser.add_argument('-o','--output', action="store_true", help="Store to file instead of mailing list")
 
 args = parser.parse_args()
 
 current_list = vos.Client().listdir('vos:OSSOS/dbimages')
-recon_exposures = Table.read(StringIO(requests.get(url, params=params).content), format='ascii.csv')
+recon_exposures = Table.read(StringIO(http_client.get(url, params=params).text), format='ascii.csv')
 print(recon_exposures)
 
 if args.output:
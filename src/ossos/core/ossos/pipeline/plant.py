@@ -28,41 +28,35 @@ import argparse
 import errno
 import json
 import logging
-import math
 import os
 import sys
-import tempfile
 
+import numpy
 from astropy import wcs
 from astropy.io import fits
-from numpy import radians, fabs, log10, rint, cos, sin, transpose
-from pyraf import iraf
+from numpy import radians, fabs, log10, rint, cos, sin
 
 from ossos import storage
 from ossos import util
-from ossos.plant import KBOGenerator
+from ossos.plant import KBOGenerator, DaophotPSF
 
 task = 'plant'
 dependency = 'mkpsf'
 
 
-def plant_kbos(filename, psf, kbos, shifts, prefix):
+def plant_kbos(filename, psf, kbos, shifts, prefix, seed=None, epadu=1.0):
     """
     Add KBOs to an image
     :param filename: name of the image to add KBOs to
-    :param psf: the Point Spread Function in IRAF/DAOPHOT format to be used by ADDSTAR
+    :param psf: the Point Spread Function in IRAF/DAOPHOT format, as written by mkpsf
     :param kbos: list of KBOs to add, has format as returned by KBOGenerator
     :param shifts: dictionary with shifts to transfer to coordinates to reference frame.
     :param prefix: an estimate FWHM of the image, used to determine trailing.
+    :param seed: seed of the Poisson noise added with the sources.
+    :param epadu: electrons per count, used to scale the Poisson noise.
     :return: None
     """
 
-    iraf.set(uparm="./")
-    iraf.digiphot()
-    iraf.apphot()
-    iraf.daophot(_doprint=0)
-    iraf.images()
-
     if shifts['nmag'] < 4:
         logging.warning("Mag shift based on fewer than 4 common stars.")
         fd = open("plant.WARNING", 'a')
@@ -75,51 +69,45 @@ def plant_kbos(filename, psf, kbos, shifts, prefix):
         fd.write("Mag shift hsa large uncertainty.")
         fd.close()
 
-    addstar = tempfile.NamedTemporaryFile(suffix=".add", mode='w')
-
     # transform KBO locations to this frame using the shifts provided.
     w = get_wcs(shifts)
 
-    header = fits.open(filename)[0].header
+    with fits.open(filename) as hdulist:
+        header = hdulist[0].header.copy()
+        image = numpy.array(hdulist[0].data, dtype=numpy.float64)
 
     # set the rate of motion in units of pixels/hour instead of ''/hour
     scale = header['PIXSCAL1']
-    rate = kbos['sky_rate']/scale
+    rate = numpy.array(kbos['sky_rate'])/scale
 
     # compute the location of the KBOs in the current frame.
 
     # offset magnitudes from the reference frame to the current one.
-    mag = kbos['mag'] - shifts['dmag']
-    angle = radians(kbos['angle'])
+    mag = numpy.array(kbos['mag']) - shifts['dmag']
+    angle = radians(numpy.array(kbos['angle']))
 
     # Move the x/y locations to account for the sky motion of the source.
-    x = kbos['x'] - rate*24.0*shifts['dmjd']*cos(angle)
-    y = kbos['y'] - rate*24.0*shifts['dmjd']*sin(angle)
+    x = numpy.array(kbos['x']) - rate*24.0*shifts['dmjd']*cos(angle)
+    y = numpy.array(kbos['y']) - rate*24.0*shifts['dmjd']*sin(angle)
     x, y = w.wcs_world2pix(x, y, 1)
 
     # Each source will be added as a series of PSFs so that a new PSF is added for each pixel the source moves.
     itime = float(header['EXPTIME'])/3600.0
-    npsf = fabs(rint(rate * itime)) + 1
+    npsf = (fabs(rint(rate * itime)) + 1).astype(int)
     mag += 2.5*log10(npsf)
     dt_per_psf = itime/npsf
 
-    # Build an addstar file to be used in the planting of source.
-    idx = 0
-    for record in transpose([x, y, mag, npsf, dt_per_psf, rate, angle]):
-        x = record[0]
-        y = record[1]
-        mag = record[2]
-        npsf = record[3]
-        dt = record[4]
-        rate = record[5]
-        angle = record[6]
-        for i in range(int(npsf)):
-            idx += 1
-            x += dt*rate*math.cos(angle)
-            y += dt*rate*math.sin(angle)
-            addstar.write("{} {} {} {}\n".format(x, y, mag, idx))
-
-    addstar.flush()
+    # the position of every PSF of every source, step k of a source is k*dt along its motion.
+    source = numpy.repeat(numpy.arange(len(npsf)), npsf)
+    step = numpy.arange(len(source)) - numpy.repeat(numpy.cumsum(npsf) - npsf, npsf) + 1
+    motion = step * dt_per_psf[source] * rate[source]
+    x = x[source] + motion*cos(angle[source])
+    y = y[source] + motion*sin(angle[source])
+
+    added = DaophotPSF(psf).render(image.shape, x, y, mag[source])
+    random_state = numpy.random.RandomState(seed)
+    image += random_state.poisson(numpy.clip(added, 0, None) * epadu) / epadu
+
     fk_image = prefix+filename
     try:
         os.unlink(fk_image)
@@ -129,13 +117,11 @@ def plant_kbos(filename, psf, kbos, shifts, prefix):
         else:
             raise
 
-    # add the sources to the image.
-    if os.access(f'{fk_image}.art', os.R_OK):
-        os.unlink(f'{fk_image}.art')
-    iraf.daophot.addstar(filename, addstar.name, psf, fk_image,
-                         simple=True, verify=False, verbose=False)
-    # convert the image to short integers.
-    iraf.images.chpix(fk_image, fk_image, 'ushort')
+    # write the image as short integers, in one pass.
+    for keyword in ('BSCALE', 'BZERO'):
+        header.remove(keyword, ignore_missing=True)
+    data = numpy.clip(rint(image), 0, 65535).astype(numpy.uint16)
+    fits.PrimaryHDU(data=data, header=header).writeto(fk_image)
 
 
 def get_wcs(shifts):
@@ -145,7 +131,7 @@ def get_wcs(shifts):
 
 
 def plant(expnums, ccd, rmin, rmax, ang, width, number=10, mmin=21.0, mmax=25.5, version='s', dry_run=False,
-          force=True):
+          force=True, seed=None):
     """Plant artificial sources into the list of images provided.
 
     @param dry_run: don't push results to VOSpace.
@@ -160,6 +146,7 @@ def plant(expnums, ccd, rmin, rmax, ang, width, number=10, mmin=21.0, mmax=25.5,
     @param mmin: Minimum magnitude to plant sources at
     @param number: number of sources to plant.
     @param force: Run, even if we already succeeded at making a fk image.
+    @param seed: seed for the artificial KBOs and the noise added with them, the same seed plants the same sources.
     """
     message = storage.SUCCESS
 
@@ -185,12 +172,15 @@ def plant(expnums, ccd, rmin, rmax, ang, width, number=10, mmin=21.0, mmax=25.5,
                                          mag=(mmin, mmax),
                                          x=(bounds[0][0], bounds[0][1]),
                                          y=(bounds[1][0], bounds[1][1]),
-                                         filename='Object.planted')
+                                         filename='Object.planted',
+                                         seed=seed)
 
-            for expnum in expnums:
+            # each image gets its own noise realisation, derived from the seed.
+            noise_seeds = numpy.random.RandomState(seed).randint(2**31, size=len(expnums))
+            for expnum, noise_seed in zip(expnums, noise_seeds):
                 filename = storage.get_image(expnum, ccd, version)
                 psf = storage.get_file(expnum, ccd, version, ext='psf.fits')
-                plant_kbos(filename, psf, kbos, get_shifts(expnum, ccd, version), "fk")
+                plant_kbos(filename, psf, kbos, get_shifts(expnum, ccd, version), "fk", seed=noise_seed)
 
             if dry_run:
                 return
@@ -259,6 +249,8 @@ def main():
                         type=float, help="angle opening")
     parser.add_argument("--ang", default=20,
                         type=float, help="angle of motion, 0 is West")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="seed of the random KBOs and noise, the default gives a different set each run")
     parser.add_argument("--force", action="store_true")
     parser.add_argument("--dry-run", action="store_true")
 
@@ -291,7 +283,8 @@ def main():
               args.rmin, args.rmax, args.ang, args.width,
               number=args.number, mmin=args.mmin, mmax=args.mmax,
               version=version,
-              dry_run=args.dry_run)
+              dry_run=args.dry_run,
+              seed=None if args.seed is None else args.seed + ccd)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,307 @@
+"""Run the per-CCD steps of the OSSOS pipeline (mk_mopheader, mkpsf, step1, slow) on many CCDs in parallel.
+
+Each step of each CCD runs in its own process, in a scratch directory for that CCD, so the driver never
+changes its own working directory.  CCDs move through the steps independently and a CCD stops at the first
+step that does not succeed.  Steps already recorded as successful in VOSpace are skipped unless --force is
+given.
+"""
+
+import argparse
+import collections
+import importlib
+import logging
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+
+from ossos import storage
+from ossos import util
+
+STAGES = ['mk_mopheader', 'mkpsf', 'step1', 'slow']
+
+DEFAULT_TIMEOUT = 3600
+
+# how long the scheduler waits between checks of the running steps.
+POLL_INTERVAL = 0.5
+
+
+def run_stage(stage, expnum, ccd, version='p', prefix='', dry_run=False, force=False):
+    """
+    Run one pipeline step on one CCD, in the current directory.
+
+    @param stage: name of the step, the module ossos.pipeline.<stage> provides the run function.
+    @return: True if the step succeeded
+    """
+    module = importlib.import_module("ossos.pipeline.{}".format(stage))
+    kwargs = dict(ccd=ccd, version=version, dry_run=dry_run, prefix=prefix, force=force)
+    if stage == 'mk_mopheader':
+        # the mopheader is always built from the unprefixed image.
+        kwargs['prefix'] = ''
+    module.run(expnum, **kwargs)
+    return dry_run or storage.get_status(stage, kwargs['prefix'], expnum, version=version, ccd=ccd)
+
+
+def stage_done(stage, expnum, ccd, version='p', prefix=''):
+    """
+    @return: True if VOSpace records that stage completed for this CCD.
+    """
+    if stage == 'mk_mopheader':
+        prefix = ''
+    return storage.get_status(stage, prefix, expnum, version=version, ccd=ccd)
+
+
+def _worker(function, workdir, log_level, dbimages, args, kwargs):
+    """
+    Entry point of the process that runs one step, the exit code reports success (0) or failure (1).
+
+    The process is spawned, it starts from a fresh import of storage so the dbimages container is passed in.
+    """
+    os.chdir(workdir)
+    storage.DBIMAGES = dbimages
+    util.config_logging(log_level)
+    try:
+        success = function(*args, **kwargs)
+    except Exception as ex:
+        logging.error("{}{}: {}".format(args, kwargs, ex))
+        success = False
+    sys.exit(0 if success else 1)
+
+
+class StageStatistics(object):
+    """
+    Counts and timing of one pipeline step across all the CCDs processed.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.counts = collections.Counter()
+        self.elapsed = 0.0
+        self.first_start = None
+        self.last_end = None
+
+    def record(self, outcome, start, end):
+        """
+        @param outcome: one of 'success', 'failed', 'timeout' or 'skipped'
+        @param start: time.time() the step started.
+        @param end: time.time() the step ended.
+        """
+        self.counts[outcome] += 1
+        if outcome == 'skipped':
+            return
+        self.elapsed += end - start
+        self.first_start = start if self.first_start is None else min(start, self.first_start)
+        self.last_end = end if self.last_end is None else max(end, self.last_end)
+
+    @property
+    def ran(self):
+        return sum(self.counts.values()) - self.counts['skipped']
+
+    def __str__(self):
+        per_ccd = 0.0
+        rate = 0.0
+        if self.ran > 0:
+            per_ccd = self.elapsed / self.ran
+            wall = self.last_end - self.first_start
+            if wall > 0:
+                rate = 3600.0 * self.ran / wall
+        return "{:14s} {:5d} ok {:5d} failed {:5d} timeout {:5d} skipped {:9.1f}s/CCD {:9.1f} CCD/hour".format(
+            self.name, self.counts['success'], self.counts['failed'], self.counts['timeout'],
+            self.counts['skipped'], per_ccd, rate)
+
+
+class Driver(object):
+    """
+    Schedule the pipeline steps of a list of CCDs on a fixed number of worker processes.
+    """
+
+    def __init__(self, workers=None, timeout=DEFAULT_TIMEOUT, scratch=None, stages=None,
+                 version='p', prefix='', dry_run=False, force=False, keep=False, dbimages=None,
+                 run_function=run_stage, done_function=stage_done, log_level=logging.INFO):
+        """
+        @param workers: number of steps run at the same time, defaults to the number of CPUs.
+        @param timeout: seconds a step may run before it is stopped and counted as failed.
+        @param scratch: directory that holds the per-CCD work directories, defaults to the current directory.
+        @param stages: names of the steps to run on each CCD, in order.
+        @param keep: keep the work directory of each CCD once it is finished.
+        @param dbimages: VOSpace dbimages containerNode the steps use, defaults to storage.DBIMAGES.
+        @param run_function: function(stage, expnum, ccd, version=, prefix=, dry_run=, force=) run in the worker.
+        @param done_function: function(stage, expnum, ccd, version=, prefix=) True if the step can be skipped.
+        """
+        self.workers = workers or multiprocessing.cpu_count()
+        self.timeout = timeout
+        self.scratch = os.path.abspath(scratch or os.getcwd())
+        self.stages = stages or STAGES
+        self.version = version
+        self.prefix = prefix
+        self.dry_run = dry_run
+        self.force = force
+        self.keep = keep
+        self.dbimages = storage.DBIMAGES if dbimages is None else dbimages
+        self.run_function = run_function
+        self.done_function = done_function
+        self.log_level = log_level
+        self.statistics = collections.OrderedDict((stage, StageStatistics(stage)) for stage in self.stages)
+        self.failed = []
+        self.elapsed = 0.0
+        self._context = multiprocessing.get_context('spawn')
+
+    def workdir(self, expnum, ccd):
+        return os.path.join(self.scratch, str(expnum), str(ccd))
+
+    def _skip(self, stage, expnum, ccd):
+        if self.force or self.dry_run:
+            return False
+        try:
+            return self.done_function(stage, expnum, ccd, version=self.version, prefix=self.prefix)
+        except Exception as ex:
+            logging.warning("Status check of {} for {} {} failed: {}".format(stage, expnum, ccd, ex))
+            return False
+
+    def _start(self, expnum, ccd, stage):
+        workdir = self.workdir(expnum, ccd)
+        os.makedirs(workdir, exist_ok=True)
+        process = self._context.Process(target=_worker,
+                                        args=(self.run_function, workdir, self.log_level, self.dbimages,
+                                              (stage, expnum, ccd),
+                                              dict(version=self.version, prefix=self.prefix,
+                                                   dry_run=self.dry_run, force=self.force)),
+                                        name="{}-{}-{}".format(stage, expnum, ccd))
+        process.start()
+        logging.info("Started {} on {} {}".format(stage, expnum, ccd))
+        return process
+
+    def _finish(self, expnum, ccd):
+        if not self.keep:
+            shutil.rmtree(self.workdir(expnum, ccd), ignore_errors=True)
+
+    def run(self, jobs):
+        """
+        Process the CCDs.
+
+        @param jobs: iterable of (expnum, ccd)
+        @return: list of (expnum, ccd, stage) that did not succeed.
+        """
+        start = time.time()
+        # (expnum, ccd, index of the next stage), a CCD that finished a step goes to the front so work in
+        # progress completes (and its scratch space is released) before new CCDs are started.
+        pending = collections.deque((expnum, ccd, 0) for expnum, ccd in jobs)
+        running = {}
+        while len(pending) > 0 or len(running) > 0:
+            while len(pending) > 0 and len(running) < self.workers:
+                expnum, ccd, index = pending.popleft()
+                if index == len(self.stages):
+                    self._finish(expnum, ccd)
+                    continue
+                stage = self.stages[index]
+                if self._skip(stage, expnum, ccd):
+                    now = time.time()
+                    self.statistics[stage].record('skipped', now, now)
+                    pending.appendleft((expnum, ccd, index + 1))
+                    continue
+                running[self._start(expnum, ccd, stage)] = (expnum, ccd, index, time.time())
+            time.sleep(POLL_INTERVAL)
+            for process in list(running.keys()):
+                expnum, ccd, index, started = running[process]
+                stage = self.stages[index]
+                now = time.time()
+                if process.is_alive():
+                    if self.timeout is None or now - started < self.timeout:
+                        continue
+                    logging.error("{} on {} {} did not finish in {}s, stopping it".format(
+                        stage, expnum, ccd, self.timeout))
+                    process.terminate()
+                    process.join()
+                    outcome = 'timeout'
+                else:
+                    process.join()
+                    outcome = 'success' if process.exitcode == 0 else 'failed'
+                del running[process]
+                self.statistics[stage].record(outcome, started, now)
+                logging.info("{} on {} {}: {} in {:.1f}s".format(stage, expnum, ccd, outcome, now - started))
+                if outcome == 'success':
+                    pending.appendleft((expnum, ccd, index + 1))
+                else:
+                    self.failed.append((expnum, ccd, stage))
+                    self._finish(expnum, ccd)
+        self.elapsed = time.time() - start
+        return self.failed
+
+    def summary(self):
+        """
+        @return: the per step throughput table, as a string.
+        """
+        lines = [str(statistics) for statistics in self.statistics.values()]
+        lines.append("{} CCD steps failed, total time {:.1f}s".format(len(self.failed), self.elapsed))
+        return "\n".join(lines)
+
+
+def read_expnums(values):
+    """
+    @param values: exposure numbers or names of files that list exposure numbers one per line.
+    @return: list of int
+    """
+    expnums = []
+    for value in values:
+        if os.access(value, os.R_OK):
+            with open(value) as fobj:
+                expnums.extend(int(line.strip()) for line in fobj if len(line.strip()) > 0)
+        else:
+            expnums.append(int(value))
+    return expnums
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("expnum", nargs='+',
+                        help="exposure numbers to process, or files listing one exposure number per line")
+    parser.add_argument("--ccd", "-c", type=int, nargs='*', default=None,
+                        help="which ccds to process, default is all")
+    parser.add_argument("--workers", "-j", type=int, default=None,
+                        help="number of steps to run at once, default is the number of CPUs")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT,
+                        help="seconds a step may take before it is stopped")
+    parser.add_argument("--stages", nargs='+', default=STAGES, choices=STAGES,
+                        help="steps to run on each CCD")
+    parser.add_argument("--scratch", default=None,
+                        help="directory for the per-CCD work areas, default is the current directory")
+    parser.add_argument("--keep", action="store_true", help="keep the per-CCD work areas")
+    parser.add_argument("--dbimages", action="store", default="vos:OSSOS/dbimages",
+                        help='vospace dbimages containerNode')
+    parser.add_argument("--type", "-t", choices=['o', 'p', 's'], default='p',
+                        help="which type of image: o-RAW, p-ELIXIR, s-SCRAMBLE")
+    parser.add_argument("--fk", action="store_true", help="Run fk images")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="DRY RUN, don't copy results to VOSpace, implies --force")
+    parser.add_argument("--force", action="store_true")
+    parser.add_argument("--verbose", "-v", action="store_true")
+    parser.add_argument("--debug", "-d", action="store_true")
+
+    args = parser.parse_args()
+    util.set_logger(args)
+    logging.info("Started {}".format(" ".join(sys.argv)))
+
+    storage.DBIMAGES = args.dbimages
+    jobs = []
+    for expnum in read_expnums(args.expnum):
+        ccds = storage.get_ccdlist(expnum) if args.ccd is None else args.ccd
+        if not args.force:
+            # load all the status tags of the exposure in one request.
+            try:
+                storage.prefetch_tags(expnum)
+            except Exception as ex:
+                logging.warning("Failed to prefetch the tags of {}: {}".format(expnum, ex))
+        jobs.extend((expnum, ccd) for ccd in ccds)
+
+    driver = Driver(workers=args.workers, timeout=args.timeout, scratch=args.scratch, stages=args.stages,
+                    version=args.type, prefix='fk' if args.fk else '', dry_run=args.dry_run,
+                    force=args.force, keep=args.keep, dbimages=args.dbimages,
+                    log_level=logging.getLogger('').level)
+    failed = driver.run(jobs)
+    print(driver.summary())
+    return 1 if len(failed) > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,347 @@
+"""Run the whole OSSOS pipeline on a triplet of exposures, as a dependency graph of tasks.
+
+The graph covers, for each CCD, the search (p), scramble (s) and planted (fk s) passes:
+
+    mk_mopheader -> mkpsf -> step1 (each exposure) -> step2 -> step3 -> combine
+    scramble -> [s pass] ;  step2 (s) -> align -> plant -> [fk s pass] -> astrom_mag_check
+
+The status of every task is read from the VOSpace tags of the exposures, fetched once for each exposure, and
+every task whose dependencies are finished is run, in its own work directory, by a pool of worker processes.
+As tasks finish, the tags of their exposure are read again and the tasks that became ready are started.
+"""
+
+import argparse
+import collections
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+from ossos import storage
+from ossos import util
+from ossos.pipeline.process import StageStatistics, DEFAULT_TIMEOUT, POLL_INTERVAL
+
+# (prefix, version) of the passes through the standard steps.
+SEARCH = ('', 'p')
+SCRAMBLE = ('', 's')
+PLANTED = ('fk', 's')
+
+TASKS = ['mk_mopheader', 'mkpsf', 'step1', 'step2', 'step3', 'combine', 'scramble', 'plant', 'align',
+         'astrom_mag_check']
+
+
+class PipelineTask(storage.Task):
+    """
+    One run of a pipeline program, on one CCD of one exposure or of a triplet of exposures.
+    """
+
+    def __init__(self, executable, target, arguments, dependency=None):
+        """
+        @param executable: the pipeline program, ossos.pipeline.<executable>, that does the task.
+        @param target: exposure (the lead exposure for a triplet), prefix, version and ccd the status is stored on.
+        @type target: storage.Target
+        @param arguments: command line arguments for the program.
+        @param dependency: the tasks that must finish first.
+        """
+        super(PipelineTask, self).__init__(executable, dependency)
+        self.target = target
+        self.arguments = [str(argument) for argument in arguments]
+        self.tags = {}
+        self.force = False
+        self.completed = False
+
+    @property
+    def label(self):
+        """
+        @return: the program and target, eg. mkpsf_1616681p22
+        """
+        return "{}_{}".format(self.name, self.target.name)
+
+    @property
+    def status(self):
+        """
+        @return: the status recorded in the VOSpace tags last fetched by the scheduler.
+        """
+        return self.tags.get(self.target.expnum, {}).get(storage.tag_uri(self.tag), None)
+
+    @property
+    def succeeded(self):
+        """
+        @return: True if the VOSpace status of the task is success.
+        """
+        return super(PipelineTask, self).finished
+
+    @property
+    def finished(self):
+        """
+        @return: True if the task succeeded in this run or, unless forced, in an earlier one.
+        """
+        return self.completed or (not self.force and self.succeeded)
+
+    def command(self, dbimages=None, dry_run=False, force=False, verbose=False):
+        """
+        @return: the command line that runs the task.
+        """
+        command = [sys.executable, "-m", "ossos.pipeline.{}".format(self.name)] + self.arguments
+        if dbimages is not None:
+            command += ["--dbimages", dbimages]
+        if dry_run:
+            command.append("--dry-run")
+        if force:
+            command.append("--force")
+        if verbose:
+            command.append("--verbose")
+        return command
+
+
+def build_graph(expnums, ccd, field, angle, rate_min=0.3, rate_max=15.0, search_width=20, plant_width=10,
+                number=30, measure3=None):
+    """
+    Build the tasks that process one CCD of a triplet.
+
+    @param expnums: the exposures of the triplet, the lowest number is the lead exposure.
+    @param ccd: the CCD to process
+    @param field: name of the field, used to name the combined candidate files.
+    @param angle: mean angle of motion, in degrees, searched for and planted.
+    @param rate_min: slowest rate of motion, "/hour, searched for and planted.
+    @param rate_max: fastest rate of motion, "/hour, searched for and planted.
+    @param search_width: width of the range of angles searched.
+    @param plant_width: width of the range of angles planted.
+    @param number: number of artificial sources planted.
+    @param measure3: VOSpace container for the combined candidate files.
+    @return: list of PipelineTask, in an order where every task comes after its dependencies.
+    """
+    expnums = sorted(expnums)
+    lead = expnums[0]
+    measure3 = measure3 or storage.MEASURE3
+    tasks = []
+
+    def add(executable, prefix, version, expnum, arguments, dependency=None):
+        task = PipelineTask(executable, storage.Target(prefix, expnum, version, ccd), arguments, dependency)
+        tasks.append(task)
+        return task
+
+    def standard_pass(prefix, version, dependency=None):
+        options = ["--ccd", ccd, "--type", version]
+        if prefix == 'fk':
+            options.append("--fk")
+        step1 = []
+        for expnum in expnums:
+            mopheader_options = [expnum] + options
+            if version != 'p':
+                mopheader_options.append("--ignore-update-headers")
+            mopheader = add('mk_mopheader', prefix, version, expnum, mopheader_options, dependency)
+            mkpsf = add('mkpsf', prefix, version, expnum, [expnum] + options, mopheader)
+            step1.append(add('step1', prefix, version, expnum, [expnum] + options, mkpsf))
+        step2 = add('step2', prefix, version, lead, expnums + options, step1)
+        step3 = add('step3', prefix, version, lead,
+                    expnums + options + ["--rate_min", rate_min, "--rate_max", rate_max,
+                                         "--angle", angle, "--width", search_width],
+                    step2)
+        combine = add('combine', prefix, version, lead,
+                      [lead] + options + ["--field", field, "--measure3", measure3], step3)
+        return step2, combine
+
+    standard_pass(*SEARCH)
+    scramble = add('scramble', SCRAMBLE[0], SCRAMBLE[1], lead, expnums + ["--ccd", ccd])
+    step2, combine = standard_pass(*SCRAMBLE, dependency=scramble)
+    align = add('align', SCRAMBLE[0], SCRAMBLE[1], lead, expnums + ["--ccd", ccd, "--type", SCRAMBLE[1]], step2)
+    plant = add('plant', SCRAMBLE[0], SCRAMBLE[1], lead,
+                expnums + ["--ccd", ccd, "--type", SCRAMBLE[1], "--rmin", rate_min, "--rmax", rate_max,
+                           "--ang", angle, "--width", plant_width, "--number", number],
+                align)
+    step2, combine = standard_pass(*PLANTED, dependency=plant)
+    # astrom_mag_check records its status without a version.
+    add('astrom_mag_check', PLANTED[0], '', lead,
+        [field, ccd, "--expnum", lead, "--type", PLANTED[1], "--fk", "--measure3", measure3], combine)
+    return tasks
+
+
+class Scheduler(object):
+    """
+    Run a graph of PipelineTasks, as many at a time as there are workers, each as soon as its dependencies
+    have finished.
+    """
+
+    def __init__(self, tasks, workers=None, timeout=DEFAULT_TIMEOUT, scratch=None, dbimages=None,
+                 dry_run=False, force=False, keep=False, verbose=False, only=None):
+        """
+        @param tasks: list of PipelineTask
+        @param workers: number of tasks run at the same time, defaults to the number of CPUs.
+        @param timeout: seconds a task may run before it is stopped and counted as failed.
+        @param scratch: directory that holds the work directories of the tasks.
+        @param dbimages: VOSpace dbimages container passed to the tasks.
+        @param force: run all the tasks, even those VOSpace records as finished.
+        @param keep: keep the work directory of tasks that succeed.
+        @param only: names of the programs to run, other tasks are only checked for being finished.
+        """
+        self.tasks = tasks
+        self.workers = workers or os.cpu_count()
+        self.timeout = timeout
+        self.scratch = os.path.abspath(scratch or os.getcwd())
+        self.dbimages = dbimages
+        self.dry_run = dry_run
+        self.force = force
+        self.keep = keep
+        self.verbose = verbose
+        self.only = None if only is None else set(only)
+        self.tags = {}
+        self.failed = []
+        self.elapsed = 0.0
+        self.statistics = collections.OrderedDict((name, StageStatistics(name)) for name in TASKS)
+        for task in self.tasks:
+            task.tags = self.tags
+            task.force = force
+
+    def refresh(self, expnums=None):
+        """
+        Fetch the tags of exposures from VOSpace, one request per exposure.
+
+        @param expnums: the exposures to refresh, default is all the exposures of the graph.
+        """
+        if expnums is None:
+            expnums = set(task.target.expnum for task in self.tasks)
+        for expnum in expnums:
+            self.tags[expnum] = storage.get_tags(expnum, force=True)
+
+    def runnable(self, task):
+        return self.only is None or task.name in self.only
+
+    def ready(self, started):
+        """
+        @param started: tasks already started (or failed) in this run.
+        @return: the tasks whose dependencies are finished and that have not been started yet.
+        """
+        return [task for task in self.tasks
+                if task not in started and not task.finished and self.runnable(task) and task.ready]
+
+    def workdir(self, task):
+        return os.path.join(self.scratch, "ccd{:02d}".format(int(task.target.ccd)), task.label)
+
+    def _start(self, task):
+        workdir = self.workdir(task)
+        os.makedirs(workdir, exist_ok=True)
+        logging.info("Starting {}".format(task.label))
+        return subprocess.Popen(task.command(dbimages=self.dbimages, dry_run=self.dry_run,
+                                             force=self.force, verbose=self.verbose),
+                                cwd=workdir)
+
+    def run(self):
+        """
+        Run the graph until no more tasks can be started.
+
+        @return: list of the tasks that failed.
+        """
+        start = time.time()
+        self.refresh()
+        started = set()
+        running = {}
+        while True:
+            for task in self.ready(started):
+                if len(running) >= self.workers:
+                    break
+                started.add(task)
+                running[task] = (self._start(task), time.time())
+            if len(running) == 0:
+                break
+            time.sleep(POLL_INTERVAL)
+            finished = []
+            for task, (popen, task_start) in list(running.items()):
+                now = time.time()
+                if popen.poll() is None:
+                    if self.timeout is None or now - task_start < self.timeout:
+                        continue
+                    logging.error("{} did not finish in {}s, stopping it".format(task.label, self.timeout))
+                    popen.kill()
+                    popen.wait()
+                    outcome = 'timeout'
+                else:
+                    outcome = 'success' if popen.returncode == 0 else 'failed'
+                del running[task]
+                finished.append((task, outcome, task_start, now))
+            if len(finished) == 0:
+                continue
+            self.refresh(set(task.target.expnum for task, outcome, task_start, now in finished
+                             if outcome == 'success' and not self.dry_run))
+            for task, outcome, task_start, now in finished:
+                if outcome == 'success' and not self.dry_run:
+                    # the programs record problems in their status tag, not their exit code.
+                    outcome = 'success' if task.succeeded else 'failed'
+                task.completed = outcome == 'success'
+                self.statistics[task.name].record(outcome, task_start, now)
+                logging.info("{}: {} in {:.1f}s".format(task.label, outcome, now - task_start))
+                if task.completed:
+                    if not self.keep:
+                        shutil.rmtree(self.workdir(task), ignore_errors=True)
+                else:
+                    self.failed.append(task)
+        self.elapsed = time.time() - start
+        return self.failed
+
+    def blocked(self):
+        """
+        @return: tasks that are not finished and could not be run.
+        """
+        return [task for task in self.tasks if not task.finished and task not in self.failed]
+
+    def summary(self):
+        lines = [str(statistics) for statistics in self.statistics.values() if statistics.ran > 0]
+        lines.append("{} tasks failed, {} not run, total time {:.1f}s".format(len(self.failed), len(self.blocked()),
+                                                                              self.elapsed))
+        return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("expnums", type=int, nargs=3, help="the triplet of exposures to process")
+    parser.add_argument("--field", required=True, help="name of the field, used to name the candidate files")
+    parser.add_argument("--ccd", "-c", type=int, nargs='*', default=None, help="which ccds to process, default is all")
+    parser.add_argument("--angle", type=float, required=True, help="mean angle of motion searched and planted")
+    parser.add_argument("--rate-min", type=float, default=0.3, help='slowest rate of motion ("/hour)')
+    parser.add_argument("--rate-max", type=float, default=15.0, help='fastest rate of motion ("/hour)')
+    parser.add_argument("--search-width", type=float, default=20, help="width of the angles searched")
+    parser.add_argument("--plant-width", type=float, default=10, help="width of the angles planted")
+    parser.add_argument("--number", type=int, default=30, help="number of artificial sources to plant")
+    parser.add_argument("--measure3", default=None, help="VOSpace container for the candidate files")
+    parser.add_argument("--dbimages", default=None, help="vospace dbimages containerNode")
+    parser.add_argument("--tasks", nargs='+', choices=TASKS, default=None,
+                        help="only run these programs, the others must already be finished")
+    parser.add_argument("--workers", "-j", type=int, default=None,
+                        help="number of tasks to run at once, default is the number of CPUs")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT,
+                        help="seconds a task may take before it is stopped")
+    parser.add_argument("--scratch", default=None, help="directory for the task work areas")
+    parser.add_argument("--keep", action="store_true", help="keep the work areas of tasks that succeed")
+    parser.add_argument("--dry-run", action="store_true", help="DRY RUN, don't copy results to VOSpace")
+    parser.add_argument("--force", action="store_true", help="run all tasks, even those already finished")
+    parser.add_argument("--verbose", "-v", action="store_true")
+    parser.add_argument("--debug", "-d", action="store_true")
+
+    args = parser.parse_args()
+    util.set_logger(args)
+    logging.info("Started {}".format(" ".join(sys.argv)))
+
+    if args.dbimages is not None:
+        storage.DBIMAGES = args.dbimages
+    if args.measure3 is not None:
+        storage.MEASURE3 = args.measure3
+
+    tasks = []
+    ccds = storage.get_ccdlist(min(args.expnums)) if args.ccd is None else args.ccd
+    for ccd in ccds:
+        tasks.extend(build_graph(args.expnums, ccd, args.field, args.angle, rate_min=args.rate_min,
+                                 rate_max=args.rate_max, search_width=args.search_width,
+                                 plant_width=args.plant_width, number=args.number, measure3=args.measure3))
+
+    scheduler = Scheduler(tasks, workers=args.workers, timeout=args.timeout, scratch=args.scratch,
+                          dbimages=args.dbimages, dry_run=args.dry_run, force=args.force, keep=args.keep,
+                          verbose=args.verbose, only=args.tasks)
+    failed = scheduler.run()
+    print(scheduler.summary())
+    return 1 if len(failed) > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -93,7 +93,7 @@ def scramble(expnums, ccd, version='p', dry_run=False, force=False, prefix=''):
             logging.error(message)
 
         if not dry_run:
-            storage.set_status(task, prefix, expnum, version, ccd, status=message)
+            storage.set_status(task, prefix, expnums[0], version='s', ccd=ccd, status=message)
 
     return
 
@@ -8,7 +8,6 @@ import math
 import sys
 import tempfile
 import time
-import requests
 from astropy.io.votable import parse
 import matplotlib
 
@@ -16,7 +15,7 @@ matplotlib.use('Agg')
 from matplotlib.pyplot import figure, close
 from matplotlib.patches import Rectangle
 from matplotlib.backends.backend_pdf import PdfPages
-from ossos import (storage, parameters)
+from ossos import (http_client, storage, parameters)
 
 
 def query_for_observations(mjd, observable, runid_list):
@@ -52,8 +51,7 @@ def query_for_observations(mjd, observable, runid_list):
             "LANG": "ADQL",
             "FORMAT": "votable"}
 
-    result = requests.get(storage.TAP_WEB_SERVICE, params=data, verify=True)
-    assert isinstance(result, requests.Response)
+    result = http_client.get(storage.TAP_WEB_SERVICE, params=data, verify=True)
     logging.debug("Doing TAP Query using url: %s" % (str(result.url)))
     temp_file = tempfile.NamedTemporaryFile()
     with open(temp_file.name, 'w') as outfile:
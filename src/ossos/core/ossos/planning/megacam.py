@@ -1,6 +1,8 @@
 #!/usr/bin/env python
 
-import urllib.request, urllib.parse, urllib.error
+from io import BytesIO
+
+from ossos import http_client
 
 def TAPQuery(RAdeg=180.0, DECdeg=0.0, width=1, height=1):
     """Do a query of the CADC Megacam table.  Get all observations insize the box.  Returns a file-like object"""
@@ -29,7 +31,7 @@ def TAPQuery(RAdeg=180.0, DECdeg=0.0, width=1, height=1):
 
     print(url, data)
 
-    return urllib.request.urlopen(url,urllib.parse.urlencode(data))
+    return BytesIO(http_client.post(url, data=data).content)
 
 
 def TAPQuery(RAdeg=180.0, DECdeg=0.0, width=1, height=1):
@@ -60,7 +62,7 @@ def TAPQuery(RAdeg=180.0, DECdeg=0.0, width=1, height=1):
 
     print(url, data)
 
-    return urllib.request.urlopen(url,urllib.parse.urlencode(data))
+    return BytesIO(http_client.post(url, data=data).content)
 
 
 
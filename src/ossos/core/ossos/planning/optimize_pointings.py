@@ -3,6 +3,7 @@ from astropy import units
 from astropy.coordinates import SkyCoord
 from astropy.time import TimeDelta, Time
 import numpy as np
+from scipy import sparse
 from ossos.cameras import Camera
 from ossos import mpc
 import mp_ephem
@@ -15,6 +16,9 @@ import math
 from copy import deepcopy
 import ephem
 
+# candidate pointings tested against all the objects at once, bounds the memory used.
+CHUNK_SIZE = 500
+
 cfht = ephem.Observer()
 cfht.lat = 0.344
 cfht.lon = -2.707
@@ -241,6 +245,160 @@ def optimize(orbits, required, locations, tokens, camera_name="MEGACAM_40"):
     return optimal_pointings
 
 
+def candidate_pointings(ra, dec, camera_name="MEGACAM_40"):
+    """
+    The pointings that put each object on each chip, as Camera.offset builds them.
+
+    @param ra: numpy.array of object RA in degrees
+    @param dec: numpy.array of object Dec in degrees
+    @return: object index, chip index, field centre RA and field centre Dec of each candidate.
+    """
+    geometry = Camera._geometry[camera_name]
+    chip_ra = np.array([geo["ra"] for geo in geometry])
+    chip_dec = np.array([geo["dec"] for geo in geometry])
+    target = np.repeat(np.arange(len(ra)), len(geometry))
+    chip = np.tile(np.arange(len(geometry)), len(ra))
+    # Camera centres the field 45'' north of the origin, offset() then moves the field to put the chip there.
+    centre_ra = (ra[target] - chip_ra[chip] / np.cos(np.radians(dec[target] + 45.0 / 3600.0))) % 360.0
+    centre_dec = dec[target] - chip_dec[chip] + 45.0 / 3600.0
+    return target, chip, centre_ra, centre_dec
+
+
+def coverage_matrix(ra, dec, centre_ra, centre_dec, camera_name="MEGACAM_40"):
+    """
+    Which objects fall on the chips of which pointings.
+
+    @param ra: numpy.array of object RA in degrees
+    @param dec: numpy.array of object Dec in degrees
+    @param centre_ra: numpy.array of field centre RA in degrees
+    @param centre_dec: numpy.array of field centre Dec in degrees
+    @return: pointing x object matrix, True where the object is on a chip of the pointing.
+    @rtype: scipy.sparse.csr_matrix
+    """
+    rows, columns = Camera.footprint(camera_name).coverage(centre_ra, centre_dec, ra, dec, chunk_size=CHUNK_SIZE)
+    return sparse.csr_matrix((np.ones(len(rows), dtype=bool), (rows, columns)), shape=(len(centre_ra), len(ra)))
+
+
+def greedy_set_cover(matrix, required):
+    """
+    Choose pointings until every required object is covered.
+
+    Each step takes the pointing that covers the most uncovered required objects, ties broken by the number of
+    uncovered secondary objects.  Pointings made redundant by later choices are then dropped.
+
+    @param matrix: pointing x object coverage matrix
+    @param required: boolean numpy.array, True for the objects that must be covered.
+    @return: list of the indices of the chosen pointings, in the order chosen.
+    """
+    matrix = matrix.astype(np.int64).tocsr()
+    # a secondary object is worth less than any required one.
+    weight = np.where(required, required.shape[0] + 1, 1)
+    uncovered = np.ones(matrix.shape[1], dtype=bool)
+    coverable = np.asarray(matrix.sum(axis=0)).ravel() > 0
+    chosen = []
+    while np.any(uncovered & required & coverable):
+        required_gain = matrix @ (uncovered & required)
+        gain = np.where(required_gain > 0, matrix @ (uncovered * weight), -1)
+        best = int(np.argmax(gain))
+        chosen.append(best)
+        uncovered[matrix[best].indices] = False
+
+    # reverse delete: drop pointings whose required objects are all covered by the other chosen pointings.
+    counts = np.asarray(matrix[chosen].sum(axis=0)).ravel() if len(chosen) > 0 else np.zeros(matrix.shape[1])
+    for pointing in reversed(list(chosen)):
+        objects = matrix[pointing].indices
+        objects = objects[required[objects]]
+        if np.all(counts[objects] > 1):
+            chosen.remove(pointing)
+            counts[matrix[pointing].indices] -= 1
+    return chosen
+
+
+def ilp_set_cover(matrix, required, time_limit=60.0):
+    """
+    The smallest set of pointings that covers every required object, from an integer program.
+
+    @param matrix: pointing x object coverage matrix
+    @param required: boolean numpy.array, True for the objects that must be covered.
+    @param time_limit: seconds the solver may take.
+    @return: list of the indices of the chosen pointings, or None if the solver did not find a solution.
+    """
+    from scipy.optimize import milp, LinearConstraint, Bounds
+    matrix = matrix.tocsc()
+    objects = np.nonzero(required & (np.asarray(matrix.sum(axis=0)).ravel() > 0))[0]
+    if len(objects) == 0:
+        return []
+    constraints = LinearConstraint(matrix[:, objects].T.astype(float), lb=1, ub=np.inf)
+    # each pointing costs one, less a small reward for the secondary objects it covers.
+    secondary = np.asarray(matrix[:, ~required].sum(axis=1)).ravel()
+    cost = 1.0 - 0.5 * secondary / max(1.0, float(required.shape[0]))
+    result = milp(cost, constraints=constraints, integrality=np.ones(matrix.shape[0]), bounds=Bounds(0, 1),
+                  options={'time_limit': time_limit})
+    if result.x is None:
+        logging.warning("ILP set cover failed: {}".format(result.message))
+        return None
+    chosen = np.nonzero(result.x > 0.5)[0]
+    # put the pointings covering the most required objects first, they get the objects they share with others.
+    required_counts = matrix.astype(np.int64) @ required.astype(np.int64)
+    return [int(pointing) for pointing in chosen[np.argsort(-required_counts[chosen], kind='stable')]]
+
+
+def optimize_set_cover(orbits, required, locations, tokens, camera_name="MEGACAM_40", method="greedy",
+                       time_limit=60.0):
+    """
+    Cover all the required objects with the fewest pointings, taking in as many other objects as possible.
+
+    Every object is tried on every chip of the camera, the coverage of all those candidate pointings is computed
+    once and the pointings are then chosen by a set cover over that matrix.
+
+    @param orbits: a dictionary of orbits to optimize the point of.
+    @param required: list of objects that MUST be observed.
+    @param locations: SkyCoord array of the locations of the objects at the time of the pointings.
+    @param tokens: List of tokens (object names) that we will try and cover, in the order of locations.
+    @param method: 'greedy' or 'ilp' (falls back to greedy if the solver fails).
+    @return: dictionary of pointing name -> (Camera, list of the tokens covered by that pointing and no earlier one),
+             the name is the token the pointing is built on, with the chip number added when one token is used
+             for more than one pointing.
+    """
+    tokens = np.asarray(tokens)
+    ra = locations.ra.degree
+    dec = locations.dec.degree
+    for token in required:
+        if token not in orbits:
+            logging.error("No orbit available for: {}".format(token))
+    is_required = np.isin(tokens, list(required))
+    target, chip, centre_ra, centre_dec = candidate_pointings(ra, dec, camera_name=camera_name)
+    matrix = coverage_matrix(ra, dec, centre_ra, centre_dec, camera_name=camera_name)
+    logging.info("{} candidate pointings, {} object placements".format(matrix.shape[0], matrix.nnz))
+
+    chosen = None
+    if method == "ilp":
+        chosen = ilp_set_cover(matrix, is_required, time_limit=time_limit)
+    if chosen is None:
+        chosen = greedy_set_cover(matrix, is_required)
+
+    optimal_pointings = {}
+    covered = np.zeros(len(tokens), dtype=bool)
+    for pointing in chosen:
+        objects = matrix[pointing].indices
+        objects = np.sort(objects[~covered[objects]])
+        covered[objects] = True
+        token = tokens[target[pointing]]
+        name = token
+        if name in optimal_pointings:
+            # the same object on another chip, a different field.
+            name = "{}_{:02d}".format(token, int(chip[pointing]))
+        camera = Camera(SkyCoord(ra[target[pointing]], dec[target[pointing]], unit=('degree', 'degree')),
+                        camera=camera_name)
+        camera.offset(index=int(chip[pointing]))
+        optimal_pointings[name] = camera, list(tokens[objects])
+        logging.info("{} pointing covers: {}".format(name, " ".join(tokens[objects])))
+    logging.info("{} pointings cover {} of {} required and {} of {} other targets".format(
+        len(optimal_pointings), np.sum(covered & is_required), np.sum(is_required),
+        np.sum(covered & ~is_required), np.sum(~is_required)))
+    return optimal_pointings
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('date',
@@ -255,8 +413,14 @@ def main():
                         type=str,
                         help="name of file that contains a list of required objects")
     parser.add_argument('--nattempts', type=int,
-                        help="Number of random variations of pointings to try",
+                        help="Number of random variations of pointings to try with the random search",
                         default=2)
+    parser.add_argument('--method', default='greedy', choices=['greedy', 'ilp', 'random'],
+                        help="set cover over all chip offsets (greedy or ilp) or the randomized search")
+    parser.add_argument('--time-limit', type=float, default=60.0,
+                        help="seconds the ilp solver may take")
+    parser.add_argument('--compare', action='store_true',
+                        help="also run the randomized search and report the number of pointings of both")
     parser.add_argument('--camera', default="MEGACAM_40",
                         choices=list(Camera._geometry.keys()),
                         help="Name of camera")
@@ -299,18 +463,29 @@ def main():
     tokens = np.array(tokens)
     minimum_number_of_pointings = len(required_objects)
 
+    locations = []
+    for token in tokens:
+        orbits[token].predict(pointing_date)
+        locations.append([orbits[token].coordinate.ra.degree, orbits[token].coordinate.dec.degree])
+    locations = SkyCoord(locations, unit='degree')
+
     best_pointing_list = []
-    for attempt in range(args.nattempts):
-        locations = []
-        for token in tokens:
-            orbits[token].predict(pointing_date)
-            locations.append([orbits[token].coordinate.ra.degree, orbits[token].coordinate.dec.degree])
-        locations = SkyCoord(locations, unit='degree')
-        logging.info("Attempt : {} \n".format(attempt))
-        pointings = optimize(orbits, required_objects, locations, tokens)
-        if minimum_number_of_pointings >= len(pointings):
-            minimum_number_of_pointings = len(pointings)
-            best_pointing_list = deepcopy(pointings)
+    if args.method != 'random':
+        best_pointing_list = optimize_set_cover(orbits, required_objects, locations, tokens, camera_name=args.camera,
+                                                method=args.method, time_limit=args.time_limit)
+    if args.method == 'random' or args.compare:
+        random_pointing_list = []
+        for attempt in range(args.nattempts):
+            logging.info("Attempt : {} \n".format(attempt))
+            pointings = optimize(orbits, required_objects, locations, tokens, camera_name=args.camera)
+            if minimum_number_of_pointings >= len(pointings):
+                minimum_number_of_pointings = len(pointings)
+                random_pointing_list = deepcopy(pointings)
+        if args.method == 'random':
+            best_pointing_list = random_pointing_list
+        else:
+            logging.info("Pointings needed: {} by {} set cover, {} by the randomized search".format(
+                len(best_pointing_list), args.method, len(random_pointing_list)))
 
     with open(pointings_filename, 'w') as pobj:
         pobj.write("index {}\n".format(pointing_date))
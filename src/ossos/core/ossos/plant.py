@@ -1,10 +1,11 @@
 import fcntl
 import os
 from numpy import random
+from astropy.io import fits
 from astropy.table import Table
 import numpy
 from . import storage
-from scipy import interpolate
+from scipy import interpolate, ndimage, special
 
 
 class MatchFile(object):
@@ -38,8 +39,14 @@ class MatchFile(object):
 class Range(object):
     """A custom object that is initialized with a range and when called returns a random value in that range."""
 
-    def __init__(self, minimum, maximum=None, seed=None, func=None):
-        random.seed(seed)
+    def __init__(self, minimum, maximum=None, seed=None, func=None, random_state=None):
+        """
+        @param random_state: numpy.random.RandomState to draw from, by default the global state (seeded with seed).
+        """
+        if random_state is None:
+            random.seed(seed)
+            random_state = random
+        self.random_state = random_state
         if maximum is None:
             if len(minimum) == 2:
                 maximum = minimum[1]
@@ -59,15 +66,24 @@ class Range(object):
         How should the values in range be sampled, uniformly or via some function.
         :return:
         """
+        return self.sample()
+
+    def sample(self, size=None):
+        """
+        Draw values from the range.
+
+        @param size: number of values to draw, None for a single value.
+        @return: float or numpy.array
+        """
         if self.func is None:
-            return random.uniform(self.min, self.max)
+            return self.random_state.uniform(self.min, self.max, size)
         if self._dist is None:
             x = numpy.arange(self.min, self.max, (self.max-self.min)/1000.0)
             p = self.func(x).cumsum()
             p -= p.min()
             p /= p.max()
             self._dist = interpolate.interp1d(p, x)
-        return self._dist(random.random())
+        return self._dist(self.random_state.random_sample(size))
 
     def __call__(self, new=True):
         if new or self.value is None:
@@ -131,18 +147,25 @@ class KBOGenerator(object):
         return g[0]
 
     @classmethod
-    def get_kbos(cls, n, rate, angle, mag, x, y, filename=None):
+    def get_kbos(cls, n, rate, angle, mag, x, y, filename=None, seed=None):
+        """
+        Generate a set of artificial KBOs.
 
-        kbos = Table(names=('x', 'y', 'mag', 'sky_rate', 'angle', 'id'))
+        @param seed: seed of the random draws, the same seed and ranges give the same KBOs.
+        @return: Table with columns x, y, mag, sky_rate, angle and id.
+        """
+        random_state = numpy.random.RandomState(seed)
+        ranges = dict(x=Range(x, random_state=random_state),
+                      y=Range(y, random_state=random_state),
+                      mag=Range(mag, func=cls._step, random_state=random_state),
+                      sky_rate=Range(rate, func=lambda value: value**0.25, random_state=random_state),
+                      angle=Range(angle, random_state=random_state))
 
-        # generate the KBOs.
-        for kbo in cls(n,
-                       rate=Range(rate, func=lambda value: value**0.25),
-                       angle=Range(angle),
-                       mag=Range(mag, func=cls._step),
-                       x=Range(x),
-                       y=Range(y)):
-            kbos.add_row(kbo)
+        # generate the KBOs, all the values of one column at a time.
+        kbos = Table()
+        for name in ('x', 'y', 'mag', 'sky_rate', 'angle'):
+            kbos[name] = numpy.asarray(ranges[name].sample(n), dtype=float).reshape(n)
+        kbos['id'] = numpy.arange(1, n + 1, dtype=float)
 
         # Write to a local file if filename given.
         if filename is not None:
@@ -154,3 +177,107 @@ class KBOGenerator(object):
             fd.close()
 
         return kbos
+
+
+class DaophotPSF(object):
+    """
+    The point spread function written by IRAF/DAOPHOT psf, an analytic function plus a lookup table of residuals.
+
+    The model is evaluated the way DAOPHOT addstar does: a star of magnitude mag adds
+    10**(0.4*(PSFMAG-mag)) * PSFHEIGH * (function + lookup) counts to each pixel within PSFRAD of its centre.
+    """
+
+    def __init__(self, filename):
+        """
+        @param filename: the psf.fits image produced by mkpsf.
+        """
+        with fits.open(filename) as hdulist:
+            header = hdulist[0].header
+            lookup = hdulist[0].data
+        self.function = header.get('FUNCTION', 'gauss').strip().lower()
+        if self.function not in PSF_FUNCTIONS:
+            raise ValueError("PSF function {} of {} is not supported.".format(self.function, filename))
+        self.parameters = [header['PAR{}'.format(idx)] for idx in range(1, header.get('NPARS', 2) + 1)]
+        self.height = float(header['PSFHEIGH'])
+        self.psfmag = float(header['PSFMAG'])
+        self.radius = float(header['PSFRAD'])
+        self.xpsf = float(header.get('XPSF', 1.0))
+        self.ypsf = float(header.get('YPSF', 1.0))
+        self.lookup = None
+        if lookup is not None:
+            lookup = numpy.asarray(lookup, dtype=numpy.float64)
+            self.lookup = lookup.reshape((-1,) + lookup.shape[-2:])
+
+    def _variation(self, x, y):
+        """
+        @return: weight of each lookup table plane for sources at x, y, shape (planes, n)
+        """
+        xn = (x - self.xpsf) / self.xpsf
+        yn = (y - self.ypsf) / self.ypsf
+        terms = [numpy.ones_like(xn), xn, yn, xn ** 2, xn * yn, yn ** 2]
+        return numpy.array(terms[:len(self.lookup)])
+
+    def evaluate(self, dx, dy, x, y):
+        """
+        The model, relative to PSFHEIGH, at offsets dx, dy from sources centred on x, y.
+
+        @param dx: offsets in x, shape (n, ...)
+        @param dy: offsets in y, shape (n, ...)
+        @param x: the source x positions, shape (n,)
+        @param y: the source y positions, shape (n,)
+        """
+        value = PSF_FUNCTIONS[self.function](dx, dy, self.parameters)
+        if self.lookup is None:
+            return value
+        # the lookup table is sampled every half pixel.
+        middle = [(size - 1) / 2.0 for size in self.lookup.shape[1:]]
+        coordinates = [middle[0] + 2 * dy.ravel(), middle[1] + 2 * dx.ravel()]
+        for plane, weight in zip(self.lookup, self._variation(x, y)):
+            residual = ndimage.map_coordinates(plane, coordinates, order=3, mode='constant', cval=0.0)
+            value = value + residual.reshape(dx.shape) * weight.reshape((-1,) + (1,) * (dx.ndim - 1))
+        return value
+
+    def render(self, shape, x, y, mag, chunk_size=1000):
+        """
+        Draw sources into an image of zeros.
+
+        @param shape: the (rows, columns) shape of the image.
+        @param x: numpy.array of x positions, the first pixel is centred on 1.0 as in IRAF.
+        @param y: numpy.array of y positions
+        @param mag: numpy.array of magnitudes
+        @return: numpy.array of the counts added to each pixel.
+        """
+        image = numpy.zeros(shape)
+        half_width = int(numpy.ceil(self.radius))
+        offsets = numpy.arange(-half_width, half_width + 1)
+        for start in range(0, len(x), chunk_size):
+            xc = numpy.asarray(x[start:start + chunk_size], dtype=numpy.float64)
+            yc = numpy.asarray(y[start:start + chunk_size], dtype=numpy.float64)
+            scale = self.height * 10 ** (0.4 * (self.psfmag - numpy.asarray(mag[start:start + chunk_size])))
+            columns = numpy.rint(xc).astype(int)[:, None] - 1 + offsets
+            rows = numpy.rint(yc).astype(int)[:, None] - 1 + offsets
+            dx = numpy.broadcast_to((columns + 1 - xc[:, None])[:, None, :], (len(xc), len(offsets), len(offsets)))
+            dy = numpy.broadcast_to((rows + 1 - yc[:, None])[:, :, None], dx.shape)
+            value = scale[:, None, None] * self.evaluate(dx, dy, xc, yc)
+            use = ((dx ** 2 + dy ** 2 <= self.radius ** 2) &
+                   ((rows >= 0) & (rows < shape[0]))[:, :, None] &
+                   ((columns >= 0) & (columns < shape[1]))[:, None, :])
+            numpy.add.at(image,
+                         (numpy.broadcast_to(rows[:, :, None], dx.shape)[use],
+                          numpy.broadcast_to(columns[:, None, :], dx.shape)[use]),
+                         value[use])
+        return image
+
+
+def _gauss(dx, dy, parameters):
+    """
+    DAOPHOT gauss: the product of Gaussians, with half-width at half-maximum PAR1 and PAR2, integrated over
+    each pixel.
+    """
+    def integral(offset, hwhm):
+        k = numpy.sqrt(numpy.log(2.0)) / hwhm
+        return (special.erf(k * (offset + 0.5)) - special.erf(k * (offset - 0.5))) / (2 * k / numpy.sqrt(numpy.pi))
+    return integral(dx, parameters[0]) * integral(dy, parameters[1]) / (parameters[0] * parameters[1])
+
+
+PSF_FUNCTIONS = {'gauss': _gauss}
@@ -1,7 +1,11 @@
 
+import argparse
 import datetime
+import errno
 import os
 import pprint
+import sys
+from concurrent import futures
 import warnings
 import numpy
 import requests
@@ -12,8 +16,10 @@ from astropy.time import Time
 from . import astrom, mpc, parameters
 from .astrom import SourceReading
 from .gui import logger, config
-from .orbfit import Orbfit
+from .orbfit import Orbfit, predict_many
 from . import storage
+from . import http_client
+from . import ssos_cache
 
 
 requests.packages.urllib3.disable_warnings()
@@ -25,10 +31,60 @@ SSOS_URL = "http://www.cadc-ccda.hia-iha.nrc-cnrc.gc.ca/cadcbin/ssos/ssosclf.pl"
 RESPONSE_FORMAT = 'tsv'
 NEW_LINE = '\r\n'
 
+_result_cache = None
+_track_cache = None
+
+
+def get_result_cache():
+    """
+    The on-disk cache of SSOIS replies shared by all processes on this host.
+
+    @rtype: ssos_cache.ResultCache
+    """
+    global _result_cache
+    if _result_cache is None:
+        _result_cache = ssos_cache.ResultCache(os.path.join(storage.CACHE_DIRECTORY, "ssos.sqlite"),
+                                               ttl=float(config.read("STORAGE.CACHE.SSOS_TTL")),
+                                               settle=float(config.read("STORAGE.CACHE.SSOS_SETTLE")))
+    return _result_cache
+
+
+def get_track_cache():
+    """
+    The on-disk cache of parsed tracks (SSOSData) shared by all processes on this host.
+
+    @rtype: ssos_cache.TrackCache
+    """
+    global _track_cache
+    if _track_cache is None:
+        _track_cache = ssos_cache.TrackCache(os.path.join(storage.CACHE_DIRECTORY, "tracks"),
+                                             ttl=float(config.read("STORAGE.CACHE.TRACKS_TTL")))
+    return _track_cache
+
+
+def observation_times(observations):
+    """
+    The times of a list of astrom.Observation, as a single Time array.
+
+    @param observations: observations with their mjd set.
+    @rtype: Time
+    """
+    return Time([units.Quantity(observation.mjd, units.day).value for observation in observations],
+                format='mjd', scale='utc')
+
+
+def offline_mode():
+    """
+    Is SSOIS to be answered from the cache only? (STORAGE.CACHE.SSOS_OFFLINE, or MOP_STORAGE_CACHE_SSOS_OFFLINE)
+
+    @rtype: bool
+    """
+    return str(config.read("STORAGE.CACHE.SSOS_OFFLINE")).lower() in ['true', '1', 'yes']
+
 
 class TracksParser(object):
 
-    def __init__(self, inspect=True, skip_previous=False, lunation_count=0):
+    def __init__(self, inspect=True, skip_previous=False, lunation_count=0, use_cache=True, dbimage_list=None):
         logger.debug("Setting up TracksParser")
         self.orbit = None
         self._nights_per_darkrun = 18 * units.day
@@ -37,15 +93,55 @@ class TracksParser(object):
         self.skip_previous = skip_previous
         self.ssos_parser = None
         self.initial_lunation_count = lunation_count
+        self.use_cache = use_cache
+        self.dbimage_list = dbimage_list
+
+    @property
+    def cache_options(self):
+        """
+        The settings that change the result of parsing a track, part of the track cache key.
+        """
+        return {'inspect': self.inspect, 'skip_previous': self.skip_previous}
 
     def parse(self, filename, print_summary=True):
         logger.debug("Parsing SSOS Query.")
+        if self.use_cache:
+            tracks_data = get_track_cache().get(filename, self.cache_options)
+            if tracks_data is not None:
+                logger.debug("Using the cached tracks of {}".format(filename))
+                return tracks_data
+
+        mpc_observations = self.load(filename, print_summary=print_summary)
+        if mpc_observations is None:
+            return None
+
+        lunation_count = self.lunation_count(self.orbit.arc_length)
+
+        # loop over the query until some new observations are found, or raise assert error.
+        while True:
+            tracks_data = self.query_ssos(mpc_observations, lunation_count)
+            logger.debug("Got SSOS result: {}".format(tracks_data))
+            done, lunation_count = self.widen_search(tracks_data, mpc_observations, lunation_count)
+            if done:
+                if self.use_cache:
+                    get_track_cache().put(filename, tracks_data, self.cache_options)
+                return tracks_data
+
+    def load(self, filename, print_summary=True):
+        """
+        Read the track and fit its orbit.
+
+        :param filename: the .mpc file of the track.
+        :return: the observations of the track, or None if no orbit could be fit.
+        :rtype: list
+        """
         mpc_observations = mpc.MPCReader(filename).mpc_observations
 
         # pass down the provisional name so the table lines are linked to this TNO
         self.ssos_parser = SSOSParser(mpc_observations[0].provisional_name,
                                       input_observations=mpc_observations,
-                                      skip_previous=self.skip_previous)
+                                      skip_previous=self.skip_previous,
+                                      dbimage_list=self.dbimage_list)
 
         try:
             self.orbit = Orbfit(mpc_observations)
@@ -57,41 +153,63 @@ class TracksParser(object):
             logger.error("Failed to compute orbit with astrometry provided")
             logger.error("{}".format(mpc_observations))
             return None
+        return mpc_observations
 
-        lunation_count = self.initial_lunation_count
+    def widen_search(self, tracks_data, mpc_observations, lunation_count):
+        """
+        Decide if the search found new observations of the track or should look over more dark runs.
 
-        if self.orbit.arc_length < 1 * units.day:
-            # data from the same dark run.
-            lunation_count = 0
-        elif 1 * units.day < self.orbit.arc_length < self._nights_per_darkrun:
-            # data from neighbouring darkruns.
-            lunation_count = 1
-        else:
-            # data from the entire project.
+        :param tracks_data: the result of the search over lunation_count dark runs.
+        :param mpc_observations: the observations of the track.
+        :param lunation_count: the number of dark runs searched, None for the entire project.
+        :return: (done, lunation count of the next search)
+        :raise: AssertionError if no new observations are available and inspect is off.
+        """
+        if tracks_data.get_reading_count() > len(
+                mpc_observations) or tracks_data.get_arc_length() > self.orbit.arc_length + 2.0 * units.day:
+            return True, lunation_count
+        if not self.inspect:
+            assert lunation_count is not None, "No new observations available."
+        if lunation_count is None:
+            return True, lunation_count
+        lunation_count += 1
+        if lunation_count > 2:
             lunation_count = None
+        return False, lunation_count
 
-        # loop over the query until some new observations are found, or raise assert error.
-        while True:
-            tracks_data = self.query_ssos(mpc_observations, lunation_count)
-            logger.debug("Got SSOS result: {}".format(tracks_data))
-            if tracks_data.get_reading_count() > len(
-                    mpc_observations) or tracks_data.get_arc_length() > self.orbit.arc_length + 2.0 * units.day:
-                return tracks_data
-            if not self.inspect:
-                assert lunation_count is not None, "No new observations available."
-            if lunation_count is None:
-                return tracks_data
-            lunation_count += 1
-            if lunation_count > 2:
-                lunation_count = None
+    @staticmethod
+    def arc_length(mpc_observations):
+        """
+        The arc length of the track, as the orbit fit computes it, without fitting the orbit.
 
-    def query_ssos(self, mpc_observations, lunation_count=None):
-        """Send a query to the SSOS web service, looking for available observations using the given track.
+        :param mpc_observations: a list of mpc.Observations
+        :rtype: Quantity
+        """
+        dates = [observation.date.jd for observation in mpc_observations]
+        return (max(dates) - min(dates)) * units.day
+
+    def lunation_count(self, arc_length):
+        """
+        The number of dark runs either side of the track to search first.
+
+        :param arc_length: the arc length of the track.
+        :return: 0, 1 or None to search the entire project.
+        """
+        if arc_length < 1 * units.day:
+            # data from the same dark run.
+            return 0
+        elif 1 * units.day < arc_length < self._nights_per_darkrun:
+            # data from neighbouring darkruns.
+            return 1
+        # data from the entire project.
+        return None
+
+    def build_query(self, mpc_observations, lunation_count=None):
+        """Build the SSOS query that looks for observations of the given track.
 
         :param mpc_observations: a list of mpc.Observations
         :param lunation_count: how many dark runs (+ and -) to search into
-        :return: an SSOSData object
-        :rtype: SSOSData
+        :rtype: Query
         """
 
         # we observe ~ a week either side of new moon
@@ -112,11 +230,31 @@ class TracksParser(object):
                 lunation_count * self._nights_separating_darkruns)), format='jd', scale='utc')
 
         logger.info("Sending query to SSOS start_date: {} end_data: {}\n".format(search_start_date, search_end_date))
-        query = Query(mpc_observations,
-                      search_start_date=search_start_date,
-                      search_end_date=search_end_date)
+        return Query(mpc_observations,
+                     search_start_date=search_start_date,
+                     search_end_date=search_end_date)
+
+    def query_ssos(self, mpc_observations, lunation_count=None):
+        """Send a query to the SSOS web service, looking for available observations using the given track.
+
+        :param mpc_observations: a list of mpc.Observations
+        :param lunation_count: how many dark runs (+ and -) to search into
+        :return: an SSOSData object
+        :rtype: SSOSData
+        """
+
+        query = self.build_query(mpc_observations, lunation_count)
+        return self.build_tracks_data(mpc_observations, query.get())
+
+    def build_tracks_data(self, mpc_observations, ssos_lines):
+        """Parse the result of an SSOS query for the given track and attach the orbit predictions to the readings.
+
+        :param mpc_observations: a list of mpc.Observations
+        :param ssos_lines: the TSV result of the query.
+        :rtype: SSOSData
+        """
         logger.debug("Parsing query results...")
-        tracks_data = self.ssos_parser.parse(query.get(), mpc_observations=mpc_observations)
+        tracks_data = self.ssos_parser.parse(ssos_lines, mpc_observations=mpc_observations)
 
         tracks_data.mpc_observations = {}
 
@@ -138,35 +276,38 @@ class TracksParser(object):
         for source in tracks_data.get_sources():
             astrom_observations = tracks_data.observations
             source_readings = source.get_readings()
+            if len(source_readings) == 0:
+                continue
+            # one orbit prediction per reading, all computed in a single call.
+            predictions = predict_many(self.orbit, observation_times(astrom_observations[:len(source_readings)]))
             foci = []
             # Loop over all the sources to determine which ones go which which focus location.
             # this is helpful to for blinking.
             for idx in range(len(source_readings)):
                 source_reading = source_readings[idx]
-                astrom_observation = astrom_observations[idx]
-                self.orbit.predict(Time(astrom_observation.mjd, format='mjd', scale='utc'))
                 assert isinstance(source_reading, SourceReading)
                 if ref_sky_coord is None or source_reading.sky_coord.separation(ref_sky_coord) > min_radius * 0.8:
                     foci.append([])
                     ref_sky_coord = source_reading.sky_coord
-                foci[-1].append(source_reading)
+                foci[-1].append(idx)
             for focus in foci:
                 ra = numpy.zeros(len(focus))
                 dec = numpy.zeros(len(focus))
                 for idx in range(len(focus)):
-                    source_reading = focus[idx]
+                    source_reading = source_readings[focus[idx]]
                     ra[idx] = source_reading.sky_coord.ra.to('degree').value
                     dec[idx] = source_reading.sky_coord.dec.to('degree').value
                 ref_sky_coord = SkyCoord(ra.mean(), dec.mean(), unit='degree')
-                for source_reading in focus:
+                for idx in focus:
+                    source_reading = source_readings[idx]
                     source_reading.reference_sky_coord = ref_sky_coord
-                    source_reading.pa = self.orbit.pa
+                    source_reading.pa = predictions.pa[idx]
                     # why are these being recorded just in pixels?  Because the error ellipse is drawn in pixels.
                     # TODO: Modify error ellipse drawing routine to use WCS but be sure
                     # that this does not cause trouble with the use of dra/ddec for cutout computer
-                    source_reading.dx = self.orbit.dra
-                    source_reading.dy = self.orbit.ddec
-                    frame = astrom_observation.rawname
+                    source_reading.dx = predictions.dra[idx]
+                    source_reading.dy = predictions.ddec[idx]
+                    frame = astrom_observations[idx].rawname
                     if frame in tracks_data.mpc_observations:
                         source_reading.discovery = tracks_data.mpc_observations[frame].discovery
 
@@ -221,20 +362,21 @@ class TrackTarget(TracksParser):
         for source in tracks_data.get_sources():
             astrom_observations = tracks_data.observations
             source_readings = source.get_readings()
+            if len(source_readings) == 0:
+                continue
+            predictions = predict_many(self.orbit, observation_times(astrom_observations[:len(source_readings)]))
             for idx in range(len(source_readings)):
                 source_reading = source_readings[idx]
                 assert isinstance(source_reading, SourceReading)
                 if ref_sky_coord is None or source_reading.sky_coord.separation(ref_sky_coord) > 40 * units.arcsec:
                     ref_sky_coord = source_reading.sky_coord
                 source_reading.reference_sky_coord = ref_sky_coord
-                astrom_observation = astrom_observations[idx]
-                self.orbit.predict(Time(astrom_observation.mjd, format='mjd', scale='utc'))
-                source_reading.pa = self.orbit.pa
+                source_reading.pa = predictions.pa[idx]
                 # why are these being recorded just in pixels?  Because the error ellipse is drawn in pixels.
                 # TODO: Modify error ellipse drawing routine to use WCS but be sure
                 # that this does not cause trouble with the use of dra/ddec for cutout computer
-                source_reading.dx = self.orbit.dra
-                source_reading.dy = self.orbit.ddec
+                source_reading.dx = predictions.dra[idx]
+                source_reading.dy = predictions.ddec[idx]
         logger.debug("Sending back set of observations that might contain the target: {}".format(tracks_data))
         return tracks_data  # a SSOSData with .sources and .observations only
 
@@ -244,15 +386,17 @@ class SSOSParser(object):
     Parse the result of an SSOS query, which is stored in an astropy Table object
     """
 
-    def __init__(self, provisional_name, input_observations=None, skip_previous=False):
+    def __init__(self, provisional_name, input_observations=None, skip_previous=False, dbimage_list=None):
         """
         setup the parser.
         :param provisional_name: name of KBO to assign SSOS data to
         :param input_observations: input observations used in search
+        :param dbimage_list: the exposures in dbimages, listed from VOSpace at each parse if None.
         """
         if input_observations is None:
             input_observations = []
         self.provisional_name = provisional_name
+        self.dbimage_list = dbimage_list
         self.input_rawnames = []
         self.null_observations = []
         self.skip_previous = skip_previous
@@ -302,13 +446,15 @@ class SSOSParser(object):
         :param ssos_result_filename_or_lines:
         :param mpc_observations: a list of mpc.Observation objects used to retrieve the SSOS observations
         """
-        table_reader = ascii.get_reader(Reader=ascii.Basic)
+        table_reader = ascii.get_reader(ascii.Basic)
         table_reader.inconsistent_handler = self._skip_missing_data
         table_reader.header.splitter.delimiter = '\t'
         table_reader.data.splitter.delimiter = '\t'
         ssos_table = table_reader.read(ssos_result_filename_or_lines)
 
-        dbimage_list = storage.list_dbimages(dbimages=storage.DBIMAGES)
+        dbimage_list = self.dbimage_list
+        if dbimage_list is None:
+            dbimage_list = storage.list_dbimages(dbimages=storage.DBIMAGES)
         logger.debug("Comparing to {} observations in dbimages: {}".format(len(dbimage_list), storage.DBIMAGES))
         sources = []
         observations = []
@@ -325,7 +471,7 @@ class SSOSParser(object):
 
         warnings.filterwarnings('ignore')
         logger.info("Loading {} observations\n".format(len(ssos_table)))
-        expnums_examined = []
+        rows = []
         for row in ssos_table:
             # Trim down to OSSOS-specific images
 
@@ -336,12 +482,23 @@ class SSOSParser(object):
 
             # check if a dbimages object exists
             # For CFHT/MegaCam strip off the trailing character to get the exposure number.
-            ftype = row['Image'][-1]
             expnum = row['Image'][:-1]
             if str(expnum) not in dbimage_list:
                 logger.debug("Expnum: {} Failed dbimage list check".format(expnum))
                 continue
             logger.debug("Expnum: {} Passed dbimage list check".format(expnum))
+            rows.append(row)
+
+        # the orbit predictions for all the remaining rows, in one call.
+        if len(rows) > 0:
+            logger.info("Calling predict")
+            predictions = predict_many(orbit, Time([row['MJD'] for row in rows], format='mjd', scale='utc'))
+            logger.info("Done calling predict")
+
+        expnums_examined = []
+        for idx, row in enumerate(rows):
+            ftype = row['Image'][-1]
+            expnum = row['Image'][:-1]
             # The file extension is the ccd number + 1 , or the first extension.
             ccd = int(row['Ext'])-1
             if 39 < ccd < 0 or ccd < 0:
@@ -356,12 +513,10 @@ class SSOSParser(object):
             # if not 0 < x.value < 2060 or not 0 < y.value < 4700:
             #    continue
 
-            obs_date = Time(mjd, format='mjd', scale='utc')
-            logger.info("Calling predict")
-            orbit.predict(obs_date)
-            logger.info("Done calling predict")
-            if orbit.dra > 4 * units.arcminute or orbit.ddec > 4.0 * units.arcminute:
-                print("Skipping entry as orbit uncertainty at date {} is large.".format(obs_date))
+            coordinate = predictions.coordinate[idx]
+            if predictions.dra[idx] > 4 * units.arcminute or predictions.ddec[idx] > 4.0 * units.arcminute:
+                print("Skipping entry as orbit uncertainty at date {} is large.".format(
+                    Time(mjd, format='mjd', scale='utc')))
                 continue
             if expnum in expnums_examined:
                 logger.debug("Already checked this exposure.")
@@ -372,8 +527,8 @@ class SSOSParser(object):
                           "ra:{} dec:{} x:{} y:{}").format(expnum, ccd, ra, dec, x, y))
 
             logger.debug(("Orbfit Prediction: "
-                          "ra:{} dec:{} ").format(orbit.coordinate.ra.to(units.degree),
-                                                  orbit.coordinate.dec.to(units.degree)))
+                          "ra:{} dec:{} ").format(coordinate.ra.to(units.degree),
+                                                  coordinate.dec.to(units.degree)))
             logger.info("Building Observation")
             observation = SSOSParser.build_source_reading(expnum, ccd, ftype=ftype)
             observation.mjd = mjd
@@ -401,16 +556,16 @@ class SSOSParser(object):
             observations.append(observation)
             null_observation = observation.rawname in self.null_observations
 
-            ddec = orbit.ddec + abs(orbit.coordinate.dec - ssois_coordinate.dec)
-            dra = orbit.dra + abs(orbit.coordinate.ra - ssois_coordinate.ra)
+            ddec = predictions.ddec[idx] + abs(coordinate.dec - ssois_coordinate.dec)
+            dra = predictions.dra[idx] + abs(coordinate.ra - ssois_coordinate.ra)
 
             logger.info(" Building SourceReading .... \n")
             source_reading = astrom.SourceReading(x=x, y=y, x0=x, y0=y,
-                                                  ra=orbit.coordinate.ra.to(units.degree).value,
-                                                  dec=orbit.coordinate.dec.to(units.degree).value,
+                                                  ra=coordinate.ra.to(units.degree).value,
+                                                  dec=coordinate.dec.to(units.degree).value,
                                                   xref=x, yref=y, obs=observation,
                                                   ssos=True, from_input_file=from_input_file,
-                                                  dx=dra, dy=ddec, pa=orbit.pa,
+                                                  dx=dra, dy=ddec, pa=predictions.pa[idx],
                                                   null_observation=null_observation)
             source_reading.mpc_observation = mpc_observation
             source_readings.append(source_reading)
@@ -718,7 +873,13 @@ class Query(object):
                  observations=None,
                  search_start_date=Time(parameters.SURVEY_START, scale='utc'),
                  search_end_date=Time('2017-01-01', scale='utc'),
-                 error_ellipse='bern'):
+                 error_ellipse='bern',
+                 use_cache=True,
+                 offline=None):
+        """
+        :param use_cache: look for the result in the SSOIS result cache, and record it there.
+        :param offline: only answer from the cache, defaults to the STORAGE.CACHE.SSOS_OFFLINE setting.
+        """
 
         self.param_dict_builder = ParamDictBuilder(
             observations=observations,
@@ -726,6 +887,8 @@ class Query(object):
             search_end_date=search_end_date,
             error_ellipse=error_ellipse)
         self.headers = {'User-Agent': 'OSSOS'}
+        self.use_cache = use_cache
+        self.offline = offline_mode() if offline is None else offline
 
     def get(self):
         """
@@ -733,11 +896,34 @@ class Query(object):
         :rtype: str
         :raise: AssertionError
         """
-        params = self.param_dict_builder.params
+        lines = self.fetch(self.param_dict_builder.params)
+
+        if os.access("backdoor.tsv", os.R_OK):
+            lines += open("backdoor.tsv").read()
+        return lines
+
+    def fetch(self, params):
+        """
+        Get the SSOIS result for a set of query parameters, from the result cache when there.
+
+        :return: A string containing the TSV result from SSOS
+        :rtype: str
+        :raise: IOError when offline and the query is not in the cache.
+        """
+        cache = get_result_cache() if self.use_cache else None
+        if cache is not None:
+            lines = cache.get(params, offline=self.offline)
+            if lines is not None:
+                logger.debug("SSOS result from cache {}".format(cache.filename))
+                return lines
+        if self.offline:
+            raise IOError(errno.ENOENT, "SSOIS query not in the cache and working offline")
+
         logger.debug(pprint.pformat(format(params)))
-        response = requests.post(SSOS_URL,
-                                 data=params,
-                                 headers=self.headers)
+        response = http_client.post(SSOS_URL,
+                                    data=params,
+                                    headers=self.headers,
+                                    raise_for_status=False)
         logger.debug(response.url)
         assert isinstance(response, requests.Response)
         assert (response.status_code == requests.codes.ok)
@@ -747,11 +933,11 @@ class Query(object):
         if len(lines) < 2 or "An error occured getting the ephemeris" in lines:
             print(lines)
             print(response.url)
-            raise IOError(os.errno.EACCES,
+            raise IOError(errno.EACCES,
                           "call to SSOIS failed on format error")
 
-        if os.access("backdoor.tsv", os.R_OK):
-            lines += open("backdoor.tsv").read()
+        if cache is not None:
+            cache.put(params, lines)
         return lines
 
 TELINST = [
@@ -803,3 +989,67 @@ TELINST = [
     'WIYN/MiniMo',
     'WIYN/ODI',
 ]
+
+
+def warm_cache(filenames, max_workers=4, depth=1):
+    """
+    Send the SSOIS queries the track workflow makes for a list of .mpc files and record the results in the
+    result cache, max_workers queries are in flight at a time.
+
+    :param filenames: the .mpc files of the tracks.
+    :param max_workers: number of queries sent to SSOIS at the same time.
+    :param depth: number of steps of the widening search (see TracksParser.parse) to send for each track.
+    :return: dictionary of filename -> exception for the tracks whose queries failed.
+    :rtype: dict
+    """
+    tracks_parser = TracksParser()
+    queries = []
+    failures = {}
+    for filename in filenames:
+        try:
+            mpc_observations = mpc.MPCReader(filename).mpc_observations
+            lunation_count = tracks_parser.lunation_count(tracks_parser.arc_length(mpc_observations))
+        except Exception as ex:
+            logger.error("{}: {}".format(filename, ex))
+            failures[filename] = ex
+            continue
+        for step in range(depth):
+            query = tracks_parser.build_query(mpc_observations, lunation_count)
+            query.offline = False
+            queries.append((filename, query))
+            if lunation_count is None:
+                break
+            lunation_count += 1
+            if lunation_count > 2:
+                lunation_count = None
+
+    with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = dict((executor.submit(query.fetch, query.param_dict_builder.params), filename)
+                       for filename, query in queries)
+        for future in futures.as_completed(pending):
+            filename = pending[future]
+            try:
+                future.result()
+            except Exception as ex:
+                logger.error("{}: {}".format(filename, ex))
+                failures[filename] = ex
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill the SSOIS result cache with the queries for a list of "
+                                                 ".mpc files, so they can be validated quickly or offline.")
+    parser.add_argument('mpc_files', nargs='+', help=".mpc files of the tracks to query")
+    parser.add_argument('--workers', type=int, default=int(config.read("STORAGE.HTTP.MAX_PER_HOST")),
+                        help="number of queries sent to SSOIS at the same time")
+    parser.add_argument('--depth', type=int, default=1,
+                        help="number of steps of the widening search to query for each track")
+    args = parser.parse_args()
+
+    failures = warm_cache(args.mpc_files, max_workers=args.workers, depth=args.depth)
+    print(get_result_cache())
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,270 @@
+"""
+Persistent cache of SSOIS query results.
+
+The track and target workflows send the same query to SSOIS each time an
+object is reopened and each reply is a large TSV table.  The cache keeps the
+reply text in a SQLite database keyed on the normalised query parameters.
+
+SSOIS only learns about new frames taken up to the end of the search window,
+so a reply to a query whose window ended long enough ago can not change and is
+kept for good while a reply to a query whose window reaches into the present
+expires after a time-to-live.  In offline mode expired entries are served too.
+
+The TrackCache keeps the fully processed result of a track (the SSOSData the
+validation GUI works on) keyed on the content of the .mpc file, so a batch
+refresh can prepare the tracks ahead of a validation session.
+"""
+import datetime
+import hashlib
+import json
+import logging
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+import time
+
+DEFAULT_TTL = 6 * 3600.0
+
+DEFAULT_TRACKS_TTL = 24 * 3600.0
+
+# days after the end of a search window before SSOIS is assumed to know of all the frames taken in the window.
+DEFAULT_SETTLE = 7.0
+
+_SCHEMA = ("CREATE TABLE IF NOT EXISTS ssos_results ("
+           " key TEXT PRIMARY KEY,"
+           " params TEXT NOT NULL,"
+           " result TEXT NOT NULL,"
+           " fetched REAL NOT NULL,"
+           " expires REAL)")
+
+# the parameters that hold one observation (or object name) per line.
+_LINE_PARAMS = ('obs', 'object')
+
+
+def normalize(params):
+    """
+    Put a query parameter dictionary in canonical form, values as stripped strings and the observation
+    lines without trailing blanks or empty lines, so equivalent queries share an entry.
+
+    @param params: the SSOIS query parameters, as built by ssos.ParamDictBuilder.
+    @return: dict
+    """
+    result = {}
+    for name, value in params.items():
+        value = str(value)
+        if name in _LINE_PARAMS:
+            value = "\n".join(line.rstrip() for line in value.splitlines() if len(line.strip()) > 0)
+        result[name] = value.strip()
+    return result
+
+
+def cache_key(params):
+    """
+    @param params: the SSOIS query parameters.
+    @return: str
+    """
+    text = json.dumps(normalize(params), sort_keys=True)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def expiry(params, ttl=DEFAULT_TTL, settle=DEFAULT_SETTLE, now=None):
+    """
+    When a reply to the query stops being valid.
+
+    @param params: the SSOIS query parameters, epoch2 is the end of the search window (YYYY-MM-DD).
+    @param ttl: seconds a reply to a query whose window is not yet settled remains valid.
+    @param settle: days after the end of the window before SSOIS is known to have all the frames.
+    @param now: the time of the query (seconds since the epoch), defaults to the present.
+    @return: the expiry time in seconds since the epoch, or None if the reply never expires.
+    """
+    now = time.time() if now is None else now
+    try:
+        end = datetime.datetime.strptime(str(params.get('epoch2', '')).strip()[:10], '%Y-%m-%d')
+    except ValueError:
+        return now + ttl
+    settled = end.replace(tzinfo=datetime.timezone.utc) + datetime.timedelta(days=settle)
+    if settled.timestamp() < now:
+        return None
+    return now + ttl
+
+
+class ResultCache(object):
+    """
+    SQLite backed store of SSOIS query parameters -> reply text.
+    """
+
+    def __init__(self, filename, ttl=DEFAULT_TTL, settle=DEFAULT_SETTLE):
+        """
+        @param filename: the SQLite database file, created if needed.
+        @param ttl: seconds a reply to a query whose search window is not yet settled remains valid.
+        @param settle: days after the end of the search window before a reply is kept for good.
+        """
+        self.filename = filename
+        self.ttl = float(ttl)
+        self.settle = float(settle)
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        dirname = os.path.dirname(os.path.abspath(filename))
+        if not os.access(dirname, os.F_OK):
+            os.makedirs(dirname, exist_ok=True)
+
+    @property
+    def connection(self):
+        """
+        SQLite connections can not be shared between threads so each thread gets its own.
+        @rtype: sqlite3.Connection
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.filename, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(_SCHEMA)
+            connection.commit()
+            self._local.connection = connection
+        return connection
+
+    def _execute(self, sql, parameters=()):
+        try:
+            with self.connection as connection:
+                return connection.execute(sql, parameters).fetchall()
+        except sqlite3.Error as ex:
+            logging.warning("SSOIS cache {} failed: {}".format(self.filename, ex))
+            return []
+
+    def get(self, params, offline=False):
+        """
+        Get the cached reply to a query.
+
+        @param params: the SSOIS query parameters.
+        @param offline: return the reply even if it has expired.
+        @return: the reply text or None if the query is not cached or the entry has expired.
+        @rtype: str
+        """
+        rows = self._execute("SELECT result, expires FROM ssos_results WHERE key=?", (cache_key(params),))
+        if len(rows) > 0 and (offline or rows[0][1] is None or time.time() < rows[0][1]):
+            self.hits += 1
+            return rows[0][0]
+        self.misses += 1
+        return None
+
+    def put(self, params, result):
+        """
+        Record the reply to a query.
+
+        @param params: the SSOIS query parameters.
+        @param result: the reply text.
+        """
+        now = time.time()
+        self._execute("INSERT OR REPLACE INTO ssos_results (key, params, result, fetched, expires) "
+                      "VALUES (?, ?, ?, ?, ?)",
+                      (cache_key(params), json.dumps(normalize(params), sort_keys=True), result, now,
+                       expiry(params, ttl=self.ttl, settle=self.settle, now=now)))
+
+    def invalidate(self, params=None):
+        """
+        Forget the reply to a query, or all replies if params is None.
+
+        @param params: the SSOIS query parameters.
+        """
+        if params is None:
+            self._execute("DELETE FROM ssos_results")
+        else:
+            self._execute("DELETE FROM ssos_results WHERE key=?", (cache_key(params),))
+
+    def __str__(self):
+        return "{}: {} hits {} misses".format(self.filename, self.hits, self.misses)
+
+
+class TrackCache(object):
+    """
+    Directory of pickled track results, keyed on the content of the .mpc file and the parser options.
+    """
+
+    def __init__(self, directory, ttl=DEFAULT_TRACKS_TTL):
+        """
+        @param directory: where the entries are kept, created if needed.
+        @param ttl: seconds an entry remains valid.
+        """
+        self.directory = directory
+        self.ttl = float(ttl)
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def cache_key(filename, options=None):
+        """
+        @param filename: the .mpc file of the track.
+        @param options: dictionary of the parser settings that change the result.
+        @return: str
+        """
+        digest = hashlib.sha256()
+        with open(filename, 'rb') as fobj:
+            digest.update(fobj.read())
+        digest.update(json.dumps(options or {}, sort_keys=True).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _path(self, filename, options):
+        return os.path.join(self.directory, self.cache_key(filename, options) + ".pickle")
+
+    def get(self, filename, options=None):
+        """
+        Get the cached result of a track.
+
+        @param filename: the .mpc file of the track.
+        @param options: dictionary of the parser settings that change the result.
+        @return: the result or None if the track is not cached, the entry has expired or can not be read.
+        """
+        path = self._path(filename, options)
+        try:
+            if time.time() - os.stat(path).st_mtime < self.ttl:
+                with open(path, 'rb') as fobj:
+                    result = pickle.load(fobj)
+                self.hits += 1
+                return result
+        except FileNotFoundError:
+            pass
+        except Exception as ex:
+            logging.warning("Track cache entry {} unreadable: {}".format(path, ex))
+        self.misses += 1
+        return None
+
+    def put(self, filename, result, options=None):
+        """
+        Record the result of a track, written to a temporary file and renamed so readers never see a partial entry.
+
+        @param filename: the .mpc file of the track.
+        @param result: the result, anything that can be pickled.
+        @param options: dictionary of the parser settings that change the result.
+        """
+        path = self._path(filename, options)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as fobj:
+                pickle.dump(result, fobj, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except Exception as ex:
+            logging.warning("Failed to cache track {}: {}".format(filename, ex))
+            if os.access(tmp_path, os.F_OK):
+                os.unlink(tmp_path)
+
+    def invalidate(self, filename=None, options=None):
+        """
+        Forget the result of a track, or all tracks if filename is None.
+
+        @param filename: the .mpc file of the track.
+        @param options: dictionary of the parser settings that change the result.
+        """
+        if filename is not None:
+            paths = [self._path(filename, options)]
+        else:
+            paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory)]
+        for path in paths:
+            if os.access(path, os.F_OK):
+                os.unlink(path)
+
+    def __str__(self):
+        return "{}: {} hits {} misses".format(self.directory, self.hits, self.misses)
@@ -9,10 +9,13 @@ import os
 import re
 import tempfile
 import logging
+import random
+import threading
+import time
 import warnings
 from glob import glob
 
-import requests as requests_module
+import numpy
 import vos
 from astropy import units
 from astropy.coordinates import SkyCoord
@@ -25,9 +28,12 @@ from astropy.units import Quantity
 from astropy.utils.exceptions import AstropyUserWarning
 from astropy.wcs import FITSFixedWarning
 from cadcutils import exceptions
+from vos.vos import SortNodeProperty
 from six import BytesIO
 
 from . import coding
+from . import http_client
+from . import image_cache, metadata_cache
 from . import util
 from .downloads.cutouts.calculator import CoordinateConverter
 from .gui import config
@@ -60,6 +66,18 @@ TAP_WEB_SERVICE = 'http://www.cadc-ccda.hia-iha.nrc-cnrc.gc.ca/tap/sync'
 OSSOS_TAG_URI_BASE = 'ivo://canfar.uvic.ca/ossos'
 OBJECT_COUNT = "object_count"
 
+CACHE_DIRECTORY = os.path.expanduser(config.read("STORAGE.CACHE.DIRECTORY"))
+METADATA_TTL = float(config.read("STORAGE.CACHE.METADATA_TTL"))
+# size, in GB, of the local copy of retrieved files, 0 turns the image cache off.
+IMAGE_CACHE_SIZE = float(config.read("STORAGE.CACHE.IMAGE_CACHE_SIZE"))
+
+# retry policy for VOSpace calls: exponential backoff from RETRY_DELAY up to RETRY_MAX_DELAY seconds.
+RETRY_ATTEMPTS = int(config.read("STORAGE.RETRY.ATTEMPTS"))
+RETRY_DELAY = float(config.read("STORAGE.RETRY.DELAY"))
+RETRY_MAX_DELAY = float(config.read("STORAGE.RETRY.MAX_DELAY"))
+
+LISTING_PAGE_SIZE = int(config.read("STORAGE.LISTING.PAGE_SIZE"))
+
 
 class Wrapper(object):
 
@@ -96,18 +114,248 @@ FITS_EXT = ".fits"
 
 
 class MyRequests(object):
-    def __init__(self):
+    """
+    The web service calls of this module, sent through the shared pooled HttpClient.
+    """
 
-        self.requests = requests_module
+    @property
+    def client(self):
+        return http_client.get_client()
 
     def get(self, *args, **kwargs):
-        resp = self.requests.get(*args, **kwargs)
-        resp.raise_for_status()
-        return resp
+        return self.client.get(*args, **kwargs)
+
+    def post(self, *args, **kwargs):
+        return self.client.post(*args, **kwargs)
 
 
 requests = MyRequests()
 
+_metadata = None
+_images = None
+
+
+def get_metadata_cache():
+    """
+    The on-disk cache of VOSpace node properties shared by all processes on this host.
+
+    @rtype: metadata_cache.MetadataCache
+    """
+    global _metadata
+    if _metadata is None:
+        _metadata = metadata_cache.MetadataCache(os.path.join(CACHE_DIRECTORY, "metadata.sqlite"),
+                                                 ttl=METADATA_TTL)
+    return _metadata
+
+
+def get_image_cache():
+    """
+    The local cache of files retrieved from VOSpace shared by all processes on this host.
+
+    @return: the cache or None if the cache is turned off.
+    @rtype: image_cache.ImageCache
+    """
+    global _images
+    if _images is None and IMAGE_CACHE_SIZE > 0:
+        _images = image_cache.ImageCache(os.path.join(CACHE_DIRECTORY, "images"),
+                                         max_size=IMAGE_CACHE_SIZE * 1024 ** 3,
+                                         ttl=METADATA_TTL)
+    return _images
+
+
+def get_node_properties(uri, force=False):
+    """
+    Get the properties of a VOSpace node, from the metadata cache if a fresh copy is there.
+
+    @param uri: the VOSpace node to get the properties of.
+    @param force: skip the cache and get the properties from VOSpace (the cache is then updated).
+    @return: dict of property uri -> value
+    @rtype: dict
+    """
+    cache = get_metadata_cache()
+    props = None
+    if not force:
+        props = cache.get(uri)
+    if props is None:
+        props = client.get_node(uri, force=True).props
+        cache.put(uri, props)
+    return props
+
+
+def prefetch_properties(uri, page_size=LISTING_PAGE_SIZE):
+    """
+    Load the properties of a container node and of all its children into the metadata cache, listing the
+    children in pages of page_size rather than with a request per child.
+
+    @param uri: the VOSpace container node.
+    @param page_size: number of children asked for in each listing request.
+    @return: dict of child name -> property dictionary
+    @rtype: dict
+    """
+    node = retry(client.get_node, uri, limit=0, force=True)
+    nodes = [(uri, node.props)]
+    children = {}
+    for child in node.get_children(client, None, None, limit=page_size):
+        nodes.append((child.uri, child.props))
+        children[child.name] = child.props
+    get_metadata_cache().put_many(nodes)
+    return children
+
+
+def poll_properties(uri, modified_since, page_size=LISTING_PAGE_SIZE):
+    """
+    Load the properties of the children of a container node changed since an earlier listing into the metadata
+    cache.  Children are listed newest first, in pages of page_size, and the listing stops at the first child
+    older than modified_since.
+
+    @param uri: the VOSpace container node.
+    @param modified_since: a 'date' property value, as sent back by VOSpace, from the earlier listing.
+    @param page_size: number of children asked for in each listing request.
+    @return: dict of child name -> property dictionary
+    @rtype: dict
+    """
+    node = retry(client.get_node, uri, limit=0, force=True)
+    nodes = []
+    children = {}
+    for child in node.get_children(client, SortNodeProperty.DATE, 'desc', limit=page_size):
+        if child.props.get('date', '') < modified_since:
+            break
+        nodes.append((child.uri, child.props))
+        children[child.name] = child.props
+    get_metadata_cache().put_many(nodes)
+    return children
+
+
+def prefetch_tags(expnum):
+    """
+    Load the tags of an exposure, and the properties of everything under dbimages/<expnum>, into the metadata
+    cache so that a following sweep of get_status/get_tag calls does not go back to VOSpace.
+
+    @param expnum: the CFHT exposure number.
+    @return: dict of child name -> property dictionary
+    """
+    return prefetch_properties(os.path.join(DBIMAGES, str(expnum)))
+
+
+def retry(function, *args, **kwargs):
+    """
+    Call function, retrying with exponential backoff when VOSpace sends back an HTTP error.
+
+    @param function: the VOSpace client call to make.
+    @return: whatever function returns.
+    """
+    delay = RETRY_DELAY
+    for attempt in range(1, RETRY_ATTEMPTS + 1):
+        try:
+            return function(*args, **kwargs)
+        except exceptions.HttpException as ex:
+            if attempt == RETRY_ATTEMPTS:
+                raise ex
+            # some jitter so that many pipeline jobs failing together do not retry together.
+            wait = delay * random.uniform(1.0, 1.5)
+            logger.warning("VOSpace call {} failed ({}), retry {} of {} in {:.1f}s".format(
+                getattr(function, '__name__', function), ex, attempt, RETRY_ATTEMPTS - 1, wait))
+            time.sleep(wait)
+            delay = min(2 * delay, RETRY_MAX_DELAY)
+
+
+def _write_props(uri, props):
+    """
+    Set a group of properties on a node with a single add_props call.
+
+    @param uri: the VOSpace node.
+    @param props: dict of property uri -> value, None values remove the property.
+    @return: the updated node
+    """
+    node = retry(client.get_node, uri)
+    for key, value in props.items():
+        node.props[key] = value
+    retry(client.add_props, node)
+    get_metadata_cache().update(uri, props)
+    return node
+
+
+_batches = threading.local()
+
+
+class TagBatch(object):
+    """
+    Collect the tag updates made while the batch is active and send them with one add_props per node when the
+    batch exits.
+
+    usage:
+
+    with storage.TagBatch():
+        storage.set_status('fwhm', ...)
+        storage.set_status('zeropoint', ...)
+        storage.set_status('mkpsf', ...)
+
+    Tags set while the batch is pending are returned by get_tag/get_tags in the same thread.  Batches nest, an
+    inner batch adds to the outermost one and only that one writes to VOSpace.  If the batch exits with an
+    exception the pending updates are dropped, so a task that crashes does not publish its partial results.
+    Properties set with set_property (eg. the lock and done flags of the validation tools) are never batched.
+    """
+
+    def __init__(self):
+        self.pending = {}
+        self._outer = None
+
+    def add(self, uri, props):
+        """
+        @param uri: the VOSpace node to set properties on.
+        @param props: dict of property uri -> value
+        """
+        self.pending.setdefault(uri, {}).update(props)
+
+    def apply(self, uri, props):
+        """
+        @return: a copy of props updated with the changes pending on uri.
+        """
+        if uri not in self.pending:
+            return props
+        props = dict(props)
+        for key, value in self.pending[uri].items():
+            if value is None:
+                props.pop(key, None)
+            else:
+                props[key] = value
+        return props
+
+    def flush(self):
+        """
+        Write all pending updates, one request per node.
+        """
+        while len(self.pending) > 0:
+            uri = next(iter(self.pending))
+            _write_props(uri, self.pending[uri])
+            del self.pending[uri]
+
+    def __enter__(self):
+        self._outer = get_tag_batch()
+        if self._outer is None:
+            _batches.active = self
+        return self._outer if self._outer is not None else self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._outer is None:
+            try:
+                if exc_type is None:
+                    self.flush()
+                elif len(self.pending) > 0:
+                    logger.warning("Not writing the tags {} after {}: {}".format(self.pending, exc_type.__name__,
+                                                                                  exc_value))
+                    self.pending = {}
+            finally:
+                _batches.active = None
+
+
+def get_tag_batch():
+    """
+    @return: the TagBatch active in this thread, if any.
+    @rtype: TagBatch
+    """
+    return getattr(_batches, 'active', None)
+
 
 def get_ccdlist(expnum):
     if int(expnum) < 1785619:
@@ -358,36 +606,32 @@ dbimages_uri = get_uri
 
 
 def set_tags_on_uri(uri, keys, values=None):
-    node = client.get_node(uri)
+    """
+    Set tags on a VOSpace node, deferred to the end of the active TagBatch if there is one.
+
+    @param uri: the node to tag.
+    @param keys: list of tag names
+    @param values: list of values, None clears the tag.
+    @return: the updated node, or None if the update was added to a TagBatch.
+    """
     if values is None:
         values = []
         for idx in range(len(keys)):
             values.append(None)
     assert (len(values) == len(keys))
+    props = {}
     for idx in range(len(keys)):
-        key = keys[idx]
-        value = values[idx]
-        tag = tag_uri(key)
-        node.props[tag] = value
-    client.add_props(node)
-    return client.get_node(uri, force=True)
+        props[tag_uri(keys[idx])] = values[idx]
+    batch = get_tag_batch()
+    if batch is not None:
+        batch.add(uri, props)
+        return None
+    return _write_props(uri, props)
 
 
 def _set_tags(expnum, keys, values=None):
     uri = os.path.join(DBIMAGES, str(expnum))
-    node = client.get_node(uri, force=True)
-    if values is None:
-        values = []
-        for idx in range(len(keys)):
-            values.append(None)
-    assert (len(values) == len(keys))
-    for idx in range(len(keys)):
-        key = keys[idx]
-        tag = tag_uri(key)
-        value = values[idx]
-        node.props[tag] = value
-    client.add_props(node)
-    return client.get_node(uri, force=True)
+    return set_tags_on_uri(uri, keys, values)
 
 
 def set_tags(expnum, props):
@@ -424,21 +668,39 @@ def tag_uri(key):
     return OSSOS_TAG_URI_BASE + "#" + key.strip()
 
 
-def get_tag(expnum, key):
+def get_tag(expnum, key, force=False):
     """given a key, return the vospace tag value.
 
     @param expnum: Number of the CFHT exposure that a tag value is needed for
     @param key: The process tag (such as mkpsf_00) that is being looked up.
+    @param force: get the tag from VOSpace rather than the metadata cache.
     @return: the value of the tag
     @rtype: str
     """
 
     uri = tag_uri(key)
-    force = uri not in get_tags(expnum)
+    if not force:
+        force = uri not in get_tags(expnum)
     value = get_tags(expnum, force=force).get(uri, None)
     return value
 
 
+def get_status_tag(expnum, key):
+    """
+    Get a processing status tag.  A cached success is used as is, it is final, any other cached value may have
+    been changed by another process since and is read again from VOSpace.
+
+    @param expnum: Number of the CFHT exposure that a status is needed for
+    @param key: The process tag (such as mkpsf_p00) that is being looked up.
+    @return: the value of the tag
+    @rtype: str
+    """
+    value = get_tag(expnum, key)
+    if value is not None and not value.startswith(SUCCESS):
+        value = get_tag(expnum, key, force=True)
+    return value
+
+
 def get_process_tag(program, ccd, version='p'):
     """
     make a process tag have a suffix indicating which ccd its for.
@@ -452,14 +714,19 @@ def get_process_tag(program, ccd, version='p'):
 
 def get_tags(expnum, force=False):
     """
+    Get all the tags on the given expnum, from the metadata cache unless they are stale or force is set.
 
     @param expnum:
-    @param force:
+    @param force: get the tags from VOSpace rather than the cache.
     @return: dict
     @rtype: dict
     """
     uri = os.path.join(DBIMAGES, str(expnum))
-    return client.get_node(uri, force=force).props
+    props = get_node_properties(uri, force=force)
+    batch = get_tag_batch()
+    if batch is not None:
+        props = batch.apply(uri, props)
+    return props
 
 
 class Task(object):
@@ -468,11 +735,15 @@ class Task(object):
     """
 
     def __init__(self, executable, dependency=None):
+        """
+        @param executable: the pipeline program that does this task.
+        @param dependency: the Task, or list of Tasks, that must be finished before this one can run.
+        """
         self.executable = executable
         self.name = os.path.splitext(self.executable)[0]
         self._target = None
         self._status = None
-        self._dependency = None
+        self.dependencies = []
         self.dependency = dependency
 
     def __str__(self):
@@ -500,22 +771,26 @@ class Task(object):
 
     @target.setter
     def target(self, target):
-        assert isinstance(Target, target)
+        assert isinstance(target, Target)
         self._target = target
 
     @property
     def dependency(self):
         """
+        @return: the first task this one depends on, see dependencies for the full list.
         @rtype: Task
         """
-        raise NotImplementedError()
+        return len(self.dependencies) > 0 and self.dependencies[0] or None
 
     @dependency.setter
     def dependency(self, dependency):
         if dependency is None:
-            self._dependency = dependency
-        else:
-            assert isinstance(Task, dependency)
+            dependency = []
+        elif isinstance(dependency, Task):
+            dependency = [dependency]
+        for task in dependency:
+            assert isinstance(task, Task)
+        self.dependencies = list(dependency)
 
     @property
     def status(self):
@@ -524,7 +799,7 @@ class Task(object):
         @return: The status of running this task on the given target.
         @rtype: str
         """
-        return get_tag(self.target.expnum, self.tag)
+        return get_status_tag(self.target.expnum, self.tag)
 
     @status.setter
     def status(self, status):
@@ -536,14 +811,15 @@ class Task(object):
         """
         @rtype: bool
         """
-        return self.status.startswith(SUCCESS)
+        status = self.status
+        return status is not None and status.startswith(SUCCESS)
 
     @property
     def ready(self):
-        if self.dependency is None:
-            return True
-        else:
-            return self.dependency.finished
+        for dependency in self.dependencies:
+            if not dependency.finished:
+                return False
+        return True
 
 
 class Target(object):
@@ -595,7 +871,7 @@ def get_status(task, prefix, expnum, version, ccd, return_message=False):
     @return: the status of the processing based on the annotation value.
     """
     key = get_process_tag(prefix+task, ccd, version)
-    status = get_tag(expnum, key)
+    status = get_status_tag(expnum, key)
     logger.debug('%s: %s' % (key, status))
     if return_message:
         return status
@@ -662,6 +938,89 @@ def _reset_datasec(header, cutout):
 
 
 
+def _scale_section(data, header):
+    """
+    Apply the BSCALE/BZERO of header to a section of raw (unscaled) image data.
+
+    Unscaled data is returned as is, so a section of a memory-mapped array stays a view on the file.
+
+    @param data: raw pixel values
+    @type data: numpy.ndarray
+    @param header: the header of the extension the data came from.
+    @return: numpy.ndarray
+    """
+    bscale = header.get('BSCALE', 1)
+    bzero = header.get('BZERO', 0)
+    if bscale == 1 and bzero == 0:
+        return data
+    if bscale == 1 and data.dtype.kind == 'i' and bzero == 2 ** (8 * data.dtype.itemsize - 1):
+        # unsigned integers stored with the FITS offset convention.
+        return (data.astype('i8') + int(bzero)).astype('u{}'.format(data.dtype.itemsize))
+    dtype = data.dtype.itemsize > 2 and numpy.float64 or numpy.float32
+    return data * dtype(bscale) + dtype(bzero)
+
+
+def _local_cutout(filename, sky_coord, radius):
+    """
+    Cut a box around sky_coord out of the extensions of a local MEF file that contain that location.
+
+    Only the headers are read to decide which extensions overlap the box, the image data is memory-mapped so
+    only the pixels in the cutouts are read from disk.
+
+    @param filename: the local MEF file.
+    @param sky_coord: centre of the cutout.
+    @type sky_coord: SkyCoord
+    @param radius: half width of the cutout.
+    @type radius: Quantity
+    @return: HDUList with an empty primary and one extension per overlapping CCD.
+    @rtype: fits.HDUList
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', FITSFixedWarning)
+        hdulist = fits.open(filename, memmap=True, do_not_scale_image_data=True)
+    phdu = fits.PrimaryHDU()
+    phdu.header['ORIGIN'] = "OSSOS"
+    hdulist_out = fits.HDUList(phdu)
+    for hdu in hdulist:
+        if hdu.header.get('NAXIS', 0) != 2:
+            continue
+        naxis1 = hdu.header['NAXIS1']
+        naxis2 = hdu.header['NAXIS2']
+        try:
+            w = WCS(hdu.header)
+            x, y = w.sky2xy(sky_coord.ra.degree, sky_coord.dec.degree)
+            size = math.fabs(radius.to('degree').value / w.cd[0][0]) * 2.0
+        except Exception as ex:
+            logger.debug("Skipping {}[{}]: {}".format(filename, hdu.header.get('EXTNAME', ''), ex))
+            continue
+        if not (-size / 2.0 < x < naxis1 + size / 2.0 and -size / 2.0 < y < naxis2 + size / 2.0):
+            continue
+        # Cutout2D on a zero-stride placeholder computes the cutout geometry without touching the pixels.
+        result = Cutout2D(numpy.broadcast_to(numpy.zeros((), dtype=numpy.uint8), (naxis2, naxis1)),
+                          (x, y), (size, size))
+        data = _scale_section(hdu.data[result.slices_original], hdu.header)
+        header = hdu.header.copy()
+        for keyword in ['BSCALE', 'BZERO']:
+            if keyword in header:
+                del header[keyword]
+        p1, p2 = result.to_cutout_position((header['CRPIX1'], header['CRPIX2']))
+        cutout_hdu = fits.ImageHDU(data=data, header=header)
+        cutout_hdu.header['CRPIX1'] = p1
+        cutout_hdu.header['CRPIX2'] = p2
+        cutout_hdu.header['XOFFSET'] = result.origin_cutout[0] - 1
+        cutout_hdu.header['YOFFSET'] = result.origin_cutout[1] - 1
+        cutout_hdu.converter = CoordinateConverter(cutout_hdu.header['XOFFSET'], cutout_hdu.header['YOFFSET'])
+        cutout_hdu.wcs = WCS(cutout_hdu.header)
+        bbox = result.bbox_original
+        # package the Cutout2D Bounding box to match cutout format from CADC
+        cutout = [0, bbox[1][0], bbox[1][1], bbox[0][0], bbox[0][1]]
+        _reset_datasec(cutout_hdu.header, cutout)
+        hdulist_out.append(cutout_hdu)
+    if len(hdulist_out) == 1:
+        raise ValueError("{} is not on any extension of {}".format(sky_coord, filename))
+    return hdulist_out
+
+
 def _cutout_expnum(observation, sky_coord, radius):
     """
     Get a cutout from an exposure based on the RA/DEC location.
@@ -676,49 +1035,61 @@ def _cutout_expnum(observation, sky_coord, radius):
     """
     filename = "{}.fits".format(observation.rawname)
     if os.access(filename, os.R_OK):
-      try:
-        hdulist = fits.open(filename)
-        phdu = fits.PrimaryHDU()
-        phdu.header['ORIGIN'] = "OSSOS"
-        hdulist_out = fits.HDUList(phdu)
-        for hdu in hdulist:
-            if hdu.data is None:
-                continue
-            w = WCS(hdu.header)
-            x, y  = w.sky2xy(sky_coord.ra.degree, sky_coord.dec.degree)
-            radius = math.fabs(radius.to('degree').value / w.cd[0][0]) * 2.0
-            result = Cutout2D(hdu.data, (x, y), (radius, radius))
-            p1, p2 = result.to_cutout_position((hdu.header['CRPIX1'], hdu.header['CRPIX2']))
-            hdu = fits.ImageHDU(data=result.data, header=hdu.header)
-            hdu.header['CRPIX1'] = p1
-            hdu.header['CRPIX2'] = p2
-            hdu.header['XOFFSET'] = result.origin_cutout[0] - 1
-            hdu.header['YOFFSET'] = result.origin_cutout[1] - 1
-            hdu.converter = CoordinateConverter(hdu.header['XOFFSET'], hdu.header['YOFFSET'])
-            hdu.wcs = WCS(hdu.header)
-            bbox = result.bbox_original
-            # package the Cutout2D Bounding box to match cutout format from CADC
-            cutout = [0,bbox[1][0], bbox[1][1], bbox[0][0], bbox[0][1]]
-            _reset_datasec(hdu.header, cutout)
-            # hdu.header.update(result.wcs.to_header())
-            hdulist_out.append(hdu)
-        return hdulist_out
-      except Exception as ex:
-        exc_type, exc_value, exc_traceback = sys.exc_info()
-        traceback.print_tb(exc_traceback, limit=100, file=sys.stdout)
-        print(ex)
-        raise(ex)
+        return _local_cutout(filename, sky_coord, radius)
+    return ra_dec_cutouts(observation.get_image_uri(), [(sky_coord, radius)])[0]
+
 
+def cutout_expnum_batch(observation, regions):
+    """
+    Get cutouts at several RA/DEC locations of an exposure with a single request to the cutout service.
+
+    @param observation: The Observation object that contains the exposure number information.
+    @type observation: Observation
+    @param regions: the (sky_coord, radius) of each cutout, as SkyCoord and Quantity.
+    @return: one HDUList per region, None for a region that no part of the exposure was returned for.
+    @rtype: list(HDUList)
+    """
+    filename = "{}.fits".format(observation.rawname)
+    if not os.access(filename, os.R_OK):
+        return ra_dec_cutouts(observation.get_image_uri(), regions)
+    hdulists = []
+    for sky_coord, radius in regions:
+        try:
+            hdulists.append(_local_cutout(filename, sky_coord, radius))
+        except ValueError as ex:
+            logger.warning(str(ex))
+            hdulists.append(None)
+    return hdulists
 
+
+def _retrieve_cutouts(uri, regions):
+    """
+    Retrieve circular cutouts of a VOSpace image, all in one request to the cutout service.
+
+    @param uri: The vospace location of the image to make the cutouts from
+    @param regions: the (sky_coord, radius) of each cutout, as SkyCoord and Quantity.
+    @return: the HDUList returned by the service and the cutout boundaries of each of its extensions.
+    @rtype: (HDUList, list)
+    """
+    circles = ["{},{},{}".format(sky_coord.ra.to('degree').value,
+                                 sky_coord.dec.to('degree').value,
+                                 radius.to('degree').value) for sky_coord, radius in regions]
+    cutout_filehandle = tempfile.NamedTemporaryFile()
+    if len(circles) == 1:
+        disposition_filename = client.copy(uri + "({})".format(circles[0]),
+                                           cutout_filehandle.name,
+                                           disposition=True)
     else:
-      uri = observation.get_image_uri()
-      cutout_filehandle = tempfile.NamedTemporaryFile()
-      disposition_filename = client.copy(uri + "({},{},{})".format(sky_coord.ra.to('degree').value,
-                                                                   sky_coord.dec.to('degree').value,
-                                                                   radius.to('degree').value),
-                                         cutout_filehandle.name,
-                                         disposition=True)
-      cutouts = decompose_content_decomposition(disposition_filename)
+        # vos.Client.copy sends a single CIRCLE, the SODA cutout service accepts the parameter repeated.
+        circles = [circle.replace(",", " ") for circle in circles]
+        url = client.get_node_url(uri, method='GET', cutout="CIRCLE=" + circles[0], view='cutout')
+        if isinstance(url, list):
+            url = url[0]
+        disposition_filename = client._get_si_client(uri).download_file(url=url,
+                                                                        dest=cutout_filehandle,
+                                                                        params={'CIRCLE': circles})[0]
+        cutout_filehandle.flush()
+    cutouts = decompose_content_decomposition(disposition_filename)
 
     cutout_filehandle.seek(0)
     with warnings.catch_warnings():
@@ -727,6 +1098,23 @@ def _cutout_expnum(observation, sky_coord, radius):
                             memmap=False)
 
         hdulist.verify('silentfix+ignore')
+    return hdulist, cutouts
+
+
+def ra_dec_cutouts(uri, regions, update_wcs=False):
+    """
+    Get cutouts at several RA/DEC locations of a VOSpace image with a single request to the cutout service.
+
+    The service answers with one MEF holding the extensions of all the cutouts, each extension is given to the
+    region whose centre is nearest to the centre of the extension.
+
+    @param uri: The vospace location of the image to make the cutouts from
+    @param regions: the (sky_coord, radius) of each cutout, as SkyCoord and Quantity.
+    @param update_wcs: replace the WCS of the cutouts with that of the astrometric (SG) header of the exposure.
+    @return: one HDUList per region, None for a region that no extension was returned for.
+    @rtype: list(HDUList)
+    """
+    hdulist, cutouts = _retrieve_cutouts(uri, regions)
     logger.debug("Initial Length of HDUList: {}".format(len(hdulist)))
 
     # Make sure here is a primaryHDU
@@ -742,8 +1130,10 @@ def _cutout_expnum(observation, sky_coord, radius):
 
     for hdu in hdulist[1:]:
         cutout = cutouts.pop(0)
+        if update_wcs:
+            _update_wcs_from_sghead(hdu, cutout)
         if 'ASTLEVEL' not in hdu.header:
-            logger.info(f"NO ASTLEVEL KEYWORD in {observation.get_image_uri}, setting to 0")
+            logger.info(f"NO ASTLEVEL KEYWORD in {uri}, setting to 0")
             hdu.header['ASTLEVEL'] = 0
         hdu.header['EXTNO'] = cutout[0]
         naxis1 = hdu.header['NAXIS1']
@@ -774,7 +1164,61 @@ def _cutout_expnum(observation, sky_coord, radius):
             logger.error("Failed trying to initialize the WCS for {}".format(uri))
             raise ex
     logger.debug("Sending back {}".format(hdulist))
-    return hdulist
+    return _split_cutouts(hdulist, regions)
+
+
+def _split_cutouts(hdulist, regions):
+    """
+    Split the MEF answering a multi-region cutout request into one HDUList per region.
+
+    @param hdulist: primary HDU followed by the cutout extensions, each with its wcs attribute set.
+    @param regions: the (sky_coord, radius) of each cutout.
+    @return: list of HDUList (or None when no extension belongs to the region), in the order of regions.
+    """
+    if len(regions) == 1:
+        return [hdulist]
+    members = [[] for _ in regions]
+    for hdu in hdulist[1:]:
+        try:
+            ra, dec = hdu.wcs.xy2sky([hdu.header['NAXIS1'] / 2.0 + 0.5], [hdu.header['NAXIS2'] / 2.0 + 0.5])
+            centre = SkyCoord(ra[0], dec[0], unit='degree')
+        except Exception as ex:
+            logger.warning("Dropping cutout extension {} without a usable WCS: {}".format(
+                hdu.header.get('EXTNO', ''), ex))
+            continue
+        separations = [centre.separation(sky_coord).degree for sky_coord, radius in regions]
+        members[separations.index(min(separations))].append(hdu)
+    return [len(hdus) > 0 and fits.HDUList([hdulist[0].copy()] + hdus) or None for hdus in members]
+
+
+def _update_wcs_from_sghead(hdu, cutout):
+    """
+    Pull the SG header from VOSpace and reset the CRPIX values based on cutout info from disposition matrix.
+
+    @param hdu: a cutout extension, updated in place.
+    @param cutout: the cutout boundaries of hdu from the Content-Disposition.
+    """
+    try:
+        sg_key = "{}{}".format(hdu.header['expnum'], 'p')
+        if sg_key not in sgheaders:
+            _get_sghead(hdu.header['expnum'])
+        if sg_key in sgheaders:
+            for astheader in sgheaders[sg_key]:
+                if astheader is None:
+                    continue
+                if astheader.get('EXTVER', -1) == hdu.header['EXTVER']:
+                    break
+        astheader['CRPIX1'] = astheader.get('CRPIX1', 1) - int(cutout[1]) + 1
+        astheader['CRPIX2'] = astheader.get('CRPIX2', 1) - int(cutout[3]) + 1
+        # pull some data structure keywords out of the astrometric headers
+        for key in ['NAXIS', 'XTENSION', 'PCOUNT', 'GCOUNT',
+                    'NAXIS1', 'NAXIS2', 'BITPIX', 'BZERO', 'BSCALE']:
+            if astheader.get(key, None) is not None:
+                del (astheader[key])
+        hdu.header.update(astheader)
+    except Exception as ex:
+        logging.error("Got error while updating WCS: {}".format(ex))
+        logging.error("Using existing WCS in image header")
 
 
 def ra_dec_cutout(uri, sky_coord, radius, update_wcs=False):
@@ -836,28 +1280,7 @@ def ra_dec_cutout(uri, sky_coord, radius, update_wcs=False):
 
         cutout = cutouts.pop(0)
         if update_wcs:
-            # Pull the SG header from VOSpace and reset the CRPIX values based on cutout info from disposition matrix
-            try:
-                sg_key = "{}{}".format(hdu.header['expnum'], 'p')
-                if sg_key not in sgheaders:
-                    _get_sghead(hdu.header['expnum'])
-                if sg_key in sgheaders:
-                    for astheader in sgheaders[sg_key]:
-                        if astheader is None:
-                            continue
-                        if astheader.get('EXTVER', -1) == hdu.header['EXTVER']:
-                            break
-                astheader['CRPIX1'] = astheader.get('CRPIX1', 1) - int(cutout[1]) + 1
-                astheader['CRPIX2'] = astheader.get('CRPIX2', 1) - int(cutout[3]) + 1
-                # pull some data structure keywords out of the astrometric headers
-                for key in ['NAXIS', 'XTENSION', 'PCOUNT', 'GCOUNT',
-                            'NAXIS1', 'NAXIS2', 'BITPIX', 'BZERO', 'BSCALE']:
-                    if astheader.get(key, None) is not None:
-                        del (astheader[key])
-                hdu.header.update(astheader)
-            except Exception as ex:
-                logging.error("Got error while updating WCS: {}".format(ex))
-                logging.error("Using existing WCS in image header")
+            _update_wcs_from_sghead(hdu, cutout)
         if 'ASTLEVEL' not in hdu.header:
             print(("******* NO ASTLEVEL ****************** for {0} ********".format(uri)))
             hdu.header['ASTLEVEL'] = 0
@@ -1002,26 +1425,26 @@ def get_image(expnum, ccd=None, version='p', ext=FITS_EXT,
         # locations.append((uri, cutout))
 
     err = errno.EFAULT
-    while len(locations) > 0:
-        (uri, cutout) = locations.pop(0)
-        try:
-            hdu_list = get_hdu(uri, cutout)
-            if return_file:
-                hdu_list.writeto(filename)
-                del hdu_list
-                return filename
-            else:
-                return hdu_list
-        except Exception as e:
-            err = getattr(e, 'errno', errno.EAGAIN)
-            logger.debug("{}".format(type(e)))
-            logger.debug("Failed to open {} cutout:{}".format(uri, cutout))
-            logger.debug("vos sent back error: {} code: {}".format(str(e), getattr(e, 'errno', 0)))
-
-    if err == errno.EAGAIN:
-        time.sleep(5)
-        return get_image(expnum, ccd=ccd, version=version, ext=ext,
-                         subdir=subdir, prefix=prefix, cutout=cutout, return_file=return_file, flip_image=flip_image)
+    delay = RETRY_DELAY
+    for attempt in range(1, RETRY_ATTEMPTS + 1):
+        for (uri, cutout) in locations:
+            try:
+                hdu_list = get_hdu(uri, cutout)
+                if return_file:
+                    hdu_list.writeto(filename)
+                    del hdu_list
+                    return filename
+                else:
+                    return hdu_list
+            except Exception as e:
+                err = getattr(e, 'errno', errno.EAGAIN)
+                logger.debug("{}".format(type(e)))
+                logger.debug("Failed to open {} cutout:{}".format(uri, cutout))
+                logger.debug("vos sent back error: {} code: {}".format(str(e), getattr(e, 'errno', 0)))
+        if err != errno.EAGAIN or attempt == RETRY_ATTEMPTS:
+            break
+        time.sleep(delay * random.uniform(1.0, 1.5))
+        delay = min(2 * delay, RETRY_MAX_DELAY)
     raise IOError(err, "Failed to get image at uri: {} using {} {} {} {}.".format(uri, expnum, version, ccd, cutout))
 
 
@@ -1349,7 +1772,28 @@ def copy(source, dest):
     """
     logger.info("copying {} -> {}".format(source, dest))
 
-    return client.copy(source, dest)
+    if source.startswith("vos:") and not dest.startswith("vos:"):
+        cache = get_image_cache()
+        if cache is not None:
+            # the cutout is not part of the node, split it off to look up the content MD5.
+            uri, cutout = re.match(r'([^\[]*)(.*)', source).groups()
+
+            def md5():
+                try:
+                    return get_node_properties(uri, force=True).get('MD5', None)
+                except Exception as ex:
+                    logger.debug("No properties for {}: {}".format(uri, ex))
+                    return None
+
+            size = cache.fetch(image_cache.cache_key(uri, cutout), dest,
+                               lambda filename: client.copy(source, filename), md5=md5)
+            logger.debug(str(cache))
+            return size
+
+    size = client.copy(source, dest)
+    if dest.startswith("vos:"):
+        get_metadata_cache().invalidate(dest)
+    return size
 
 
 def vlink(s_expnum, s_ccd, s_version, s_ext,
@@ -1442,49 +1886,49 @@ def delete_uri(uri):
     client.delete(uri)
 
 
-def has_property(node_uri, property_name, ossos_base=True):
+def has_property(node_uri, property_name, ossos_base=True, force=False):
     """
     Checks if a node in VOSpace has the specified property.
 
     @param node_uri:
     @param property_name:
     @param ossos_base:
+    @param force: skip the metadata cache and check in VOSpace.
     @return:
     """
-    if get_property(node_uri, property_name, ossos_base) is None:
+    if get_property(node_uri, property_name, ossos_base, force=force) is None:
         return False
     else:
         return True
 
 
-def get_property(node_uri, property_name, ossos_base=True):
+def get_property(node_uri, property_name, ossos_base=True, force=False):
     """
     Retrieves the value associated with a property on a node in VOSpace.
 
     @param node_uri:
     @param property_name:
     @param ossos_base:
+    @param force: skip the metadata cache, use this when the value may have just been changed by someone else
+                  (eg. checking a lock).
     @return:
     """
-    # Must use force or we could have a cached copy of the node from before
-    # properties of interest were set/updated.
     try:
-        node = client.get_node(node_uri, force=True)
+        props = get_node_properties(node_uri, force=force)
         property_uri = tag_uri(property_name) if ossos_base else property_name
     except exceptions.HttpException as ex:
         logger.error(f'{ex}')
         return None
 
-    if property_uri not in node.props:
-        return None
-
-    return node.props[property_uri]
+    return props.get(property_uri, None)
 
 
 def set_property(node_uri, property_name, property_value, ossos_base=True):
     """
     Sets the value of a property on a node in VOSpace.  If the property
-    already has a value then it is first cleared and then set.
+    already has a different value then it is first cleared and then set.
+
+    VOSpace errors are retried with exponential backoff, see retry.
 
     @param node_uri:
     @param property_name:
@@ -1492,39 +1936,24 @@ def set_property(node_uri, property_name, property_value, ossos_base=True):
     @param ossos_base:
     @return:
     """
-    while True:
-        try:
-            logger.info(f"Getting Node Property")
-            node = client.get_node(node_uri)
-            logger.info(f"{node}")
-            property_uri = tag_uri(property_name) if ossos_base else property_name
-            logger.info(f"{property_uri}")
-            break
-        except exceptions.HttpException:
-            print(f'Waiting to retry VOSpace')
-            time.sleep(3)
+    property_uri = tag_uri(property_name) if ossos_base else property_name
+    node = retry(client.get_node, node_uri)
+
+    if node.props.get(property_uri, None) == property_value:
+        logger.debug(f"{node_uri} {property_uri} already set to {property_value}")
+        get_metadata_cache().update(node_uri, {property_uri: property_value})
+        return
 
     # If there is an existing value, clear it first
     if property_uri in node.props:
-        while True:
-            try:
-                    node.props[property_uri] = None
-                    logger.info(f"Clearing Node Property")
-                    client.add_props(node)
-                    break
-            except exceptions.HttpException:
-                print(f'Waiting to retry VOSpace')
-                time.sleep(3)
+        logger.info(f"Clearing Node Property {property_uri}")
+        node.props[property_uri] = None
+        retry(client.add_props, node)
 
-    while True:
-        try:
-            node.props[property_uri] = property_value
-            logger.info(f"Adding Node Property {property_uri}: {property_value}")
-            client.add_props(node)
-            break
-        except exceptions.HttpException:
-            print(f'Waiting to retry VOSpace')
-            time.sleep(3)
+    node.props[property_uri] = property_value
+    logger.info(f"Adding Node Property {property_uri}: {property_value}")
+    retry(client.add_props, node)
+    get_metadata_cache().update(node_uri, {property_uri: property_value})
 
 
 def build_counter_tag(epoch_field, dry_run=False):
@@ -1544,17 +1973,18 @@ def build_counter_tag(epoch_field, dry_run=False):
     return tag
 
 
-def read_object_counter(node_uri, epoch_field, dry_run=False):
+def read_object_counter(node_uri, epoch_field, dry_run=False, force=False):
     """
     Reads the object counter for the given epoch/field on the specified node.
 
     @param node_uri:
     @param epoch_field:
     @param dry_run:
+    @param force: read the counter from VOSpace rather than the metadata cache.
     @return: the current object count.
     """
     return get_property(node_uri, build_counter_tag(epoch_field, dry_run),
-                        ossos_base=True)
+                        ossos_base=True, force=force)
 
 
 def increment_object_counter(node_uri, epoch_field, dry_run=False):
@@ -1567,7 +1997,8 @@ def increment_object_counter(node_uri, epoch_field, dry_run=False):
     @return: The object count AFTER incrementing.
 
     """
-    current_count = read_object_counter(node_uri, epoch_field, dry_run=dry_run)
+    # the counter must come from VOSpace, not from a cached copy, or the same identifier could be handed out twice.
+    current_count = read_object_counter(node_uri, epoch_field, dry_run=dry_run, force=True)
 
     if current_count is None:
         new_count = "01"
@@ -1737,6 +2168,11 @@ def log_location(expnum, ccd):
 class LoggingManager(object):
 
     def __init__(self, task, prefix, expnum, ccd, version, dry_run=False):
+        self.task = task
+        self.prefix = prefix
+        self.expnum = expnum
+        self.ccd = ccd
+        self.version = version
         self.logger = logging.getLogger('')
         self.log_format = logging.Formatter('%(asctime)s - %(module)s.%(funcName)s %(lineno)d: %(message)s')
         self.filename = log_filename(prefix, task, ccd=ccd, version=version)
@@ -1744,6 +2180,9 @@ class LoggingManager(object):
         self.dry_run = dry_run
 
     def __enter__(self):
+        # tags (status, fwhm, zeropoint, ...) set during the task are sent together if it finishes without an error.
+        self.tag_batch = TagBatch()
+        self.tag_batch.__enter__()
         if not self.dry_run:
             self.vo_handler = util.VOFileHandler("/".join([self.location, self.filename]))
             self.vo_handler.setFormatter(self.log_format)
@@ -1753,7 +2192,20 @@ class LoggingManager(object):
         self.logger.addHandler(self.file_handler)
         return self
 
-    def __exit__(self, *args):
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self.tag_batch.__exit__(exc_type, exc_value, traceback)
+            if exc_type is not None and not self.dry_run:
+                # the tags of the task were dropped, record why it stopped in its status.
+                set_status(self.task, self.prefix, self.expnum, self.version, self.ccd,
+                           "{}: {}".format(exc_type.__name__, exc_value))
+        except Exception as ex:
+            self.logger.error("Failed to write tags to VOSpace: {}".format(ex))
+            raise ex
+        finally:
+            self._close_handlers()
+
+    def _close_handlers(self):
         if not self.dry_run:
             self.logger.removeHandler(self.vo_handler)
             self.vo_handler.close()
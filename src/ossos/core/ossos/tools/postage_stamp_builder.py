@@ -13,6 +13,7 @@ ivo://ivoa.net/vospace/core%23httpget&view=cutout&cutout=CIRCLE+ICRS+242.1318+-1
 """
 
 import argparse
+import collections
 import logging
 import os
 import sys
@@ -27,6 +28,7 @@ storage.FITS_EXT = ".fits"
 def cutout(obj, obj_dir, radius):
 
     cutout_listing = storage.listdir(obj_dir, force=True)
+    pending = collections.OrderedDict()
     for obs in obj.mpc_observations:
         if obs.null_observation:
             logging.debug('skipping: {}'.format(obs))
@@ -49,21 +51,33 @@ def cutout(obj, obj_dir, radius):
                # skipping existing cutouts
                 continue 
 
-            # ast_header = storage._get_sghead(parts['expnum'])
-            while True:
-              try:
-                hdulist = storage.ra_dec_cutout(uri, sky_coord, radius, update_wcs=True)
-
-                with open(postage_stamp_filename, 'w') as tmp_file:
-                    hdulist.writeto(tmp_file, overwrite=True, output_verify='fix+ignore')
-                    storage.copy(postage_stamp_filename, obj_dir + "/" + postage_stamp_filename)
-                os.unlink(postage_stamp_filename)  # easier not to have them hanging around
-              except OSError as e:  # occasionally the node is not found: report and move on for later cleanup
-                logging.error("OSError: ->"+str(e))
-              except Exception as e:
-                logging.error("Exception: ->"+str(e))
-                continue
-              break
+            # the stamps of one exposure are cut out in a single request.
+            pending.setdefault(uri, []).append((sky_coord, postage_stamp_filename))
+
+    for uri, stamps in pending.items():
+        # ast_header = storage._get_sghead(parts['expnum'])
+        while stamps:
+          try:
+            hdulists = storage.ra_dec_cutouts(uri, [(sky_coord, radius) for sky_coord, _ in stamps], update_wcs=True)
+
+            for (sky_coord, postage_stamp_filename), hdulist in zip(list(stamps), hdulists):
+                if hdulist is None:
+                    logging.error("No cutout of {} at {}".format(uri, sky_coord))
+                else:
+                    try:
+                        with open(postage_stamp_filename, 'w') as tmp_file:
+                            hdulist.writeto(tmp_file, overwrite=True, output_verify='fix+ignore')
+                            storage.copy(postage_stamp_filename, obj_dir + "/" + postage_stamp_filename)
+                        os.unlink(postage_stamp_filename)  # easier not to have them hanging around
+                    except OSError as e:  # skip this stamp only, the rest of the exposure is already cut out
+                        logging.error("OSError: {} ->{}".format(postage_stamp_filename, str(e)))
+                stamps.pop(0)
+          except OSError as e:  # occasionally the node is not found: report and move on for later cleanup
+            logging.error("OSError: ->"+str(e))
+          except Exception as e:
+            logging.error("Exception: ->"+str(e))
+            continue
+          break
 
 
 def main():
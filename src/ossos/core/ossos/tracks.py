@@ -0,0 +1,150 @@
+"""
+Refresh the tracks of many objects at once, ahead of a validation session.
+
+Each .mpc file goes through the stages of ssos.TracksParser.parse: an SSOIS
+query over the dark runs around the track, parsing of the reply with orbit
+predictions for each reading and, when nothing new was found, a query over a
+wider window.  The SSOIS queries are sent from a pool of threads and the
+parsing and orbit work runs in a pool of processes, so the tracks are worked
+on side by side.  The results are written to the track cache that
+TracksParser.parse reads, so the validation GUI loads them without waiting
+on SSOIS.
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import sys
+from concurrent import futures
+
+from . import mpc, ssos, storage
+from .gui import config
+
+_QUERY = 'query'
+_PROCESS = 'process'
+
+# the dbimages listing, handed to each worker process once instead of being listed from VOSpace for every track.
+_dbimage_list = None
+
+
+def _init_worker(dbimage_list):
+    global _dbimage_list
+    _dbimage_list = dbimage_list
+
+
+def process_track(filename, ssos_lines, lunation_count, inspect=True, skip_previous=False):
+    """
+    Fit the orbit of a track, parse the SSOIS reply and predict the position of each reading.
+
+    This is the CPU bound stage, run in a worker process.
+
+    :param filename: the .mpc file of the track.
+    :param ssos_lines: the SSOIS reply to the query over lunation_count dark runs.
+    :param lunation_count: the number of dark runs searched, None for the entire project.
+    :return: (tracks_data, done, lunation count of the next search)
+    """
+    tracks_parser = ssos.TracksParser(inspect=inspect, skip_previous=skip_previous, use_cache=False,
+                                      dbimage_list=_dbimage_list)
+    mpc_observations = tracks_parser.load(filename, print_summary=False)
+    if mpc_observations is None:
+        raise ValueError("Failed to compute an orbit for {}".format(filename))
+    tracks_data = tracks_parser.build_tracks_data(mpc_observations, ssos_lines)
+    done, lunation_count = tracks_parser.widen_search(tracks_data, mpc_observations, lunation_count)
+    return tracks_data, done, lunation_count
+
+
+def refresh(filenames, query_workers=4, process_workers=None, inspect=True, skip_previous=False, cache=None):
+    """
+    Run a list of tracks through the SSOIS query, parse and orbit prediction stages concurrently and record
+    the results in the track cache.
+
+    :param filenames: the .mpc files of the tracks.
+    :param query_workers: number of SSOIS queries in flight at a time.
+    :param process_workers: number of processes parsing results, defaults to the number of CPUs.
+    :param inspect: as for TracksParser.
+    :param skip_previous: as for TracksParser.
+    :param cache: the ssos_cache.TrackCache to fill, defaults to the shared track cache.
+    :return: (filenames of the refreshed tracks, dictionary of filename -> exception for the failed ones)
+    """
+    if cache is None:
+        cache = ssos.get_track_cache()
+    tracks_parser = ssos.TracksParser(inspect=inspect, skip_previous=skip_previous, use_cache=False)
+    refreshed = []
+    failures = {}
+    pending = {}
+    dbimage_list = set(storage.list_dbimages(dbimages=storage.DBIMAGES))
+
+    # worker processes are started fresh (not forked) as the query threads may hold locks.
+    with futures.ThreadPoolExecutor(max_workers=query_workers) as queries, \
+            futures.ProcessPoolExecutor(max_workers=process_workers,
+                                        mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=_init_worker, initargs=(dbimage_list,)) as workers:
+
+        def send_query(filename, mpc_observations, lunation_count):
+            query = tracks_parser.build_query(mpc_observations, lunation_count)
+            pending[queries.submit(query.get)] = (_QUERY, filename, mpc_observations, lunation_count)
+
+        for filename in filenames:
+            try:
+                mpc_observations = mpc.MPCReader(filename).mpc_observations
+                send_query(filename, mpc_observations,
+                           tracks_parser.lunation_count(tracks_parser.arc_length(mpc_observations)))
+            except Exception as ex:
+                logging.error("{}: {}".format(filename, ex))
+                failures[filename] = ex
+
+        while len(pending) > 0:
+            finished, not_done = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+            for future in finished:
+                stage, filename, mpc_observations, lunation_count = pending.pop(future)
+                try:
+                    if stage == _QUERY:
+                        pending[workers.submit(process_track, filename, future.result(), lunation_count,
+                                               inspect=inspect, skip_previous=skip_previous)] = \
+                            (_PROCESS, filename, mpc_observations, lunation_count)
+                        continue
+                    tracks_data, done, lunation_count = future.result()
+                    if done:
+                        cache.put(filename, tracks_data, tracks_parser.cache_options)
+                        refreshed.append(filename)
+                        logging.info("{}: {} readings".format(filename, tracks_data.get_reading_count()))
+                    else:
+                        send_query(filename, mpc_observations, lunation_count)
+                except Exception as ex:
+                    logging.error("{}: {}".format(filename, ex))
+                    failures[filename] = ex
+    return refreshed, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query SSOIS for a set of tracks and prepare them for the "
+                                                 "validation GUI.")
+    parser.add_argument('tracks', nargs='+', help=".mpc files, or directories of .mpc files")
+    parser.add_argument('--query-workers', type=int, default=int(config.read("STORAGE.HTTP.MAX_PER_HOST")),
+                        help="number of queries sent to SSOIS at the same time")
+    parser.add_argument('--process-workers', type=int, default=None,
+                        help="number of processes working on the SSOIS results (default: number of CPUs)")
+    parser.add_argument('--skip-previous', action='store_true',
+                        help="leave out the observations already measured, as the GUI option of that name")
+    parser.add_argument('--debug', action='store_true')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO)
+
+    filenames = []
+    for path in args.tracks:
+        if os.path.isdir(path):
+            filenames.extend(sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(".mpc")))
+        else:
+            filenames.append(path)
+
+    refreshed, failures = refresh(filenames, query_workers=args.query_workers,
+                                  process_workers=args.process_workers, skip_previous=args.skip_previous)
+    print("{} of {} tracks refreshed".format(len(refreshed), len(filenames)))
+    for filename in sorted(failures):
+        print("{}: {}".format(filename, failures[filename]))
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
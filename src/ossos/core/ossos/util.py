@@ -21,6 +21,7 @@ except:
         from astropy.time.sofa_time import jd_dtf as d2dtf
 
 from astropy.time import TimeString
+from scipy import spatial
 
 MATCH_TOLERANCE = 100.0
 
@@ -153,73 +154,83 @@ def match_lists(pos1, pos2, tolerance=MATCH_TOLERANCE, spherical=False):
     :param pos1: list of x/y positions.
     :param pos2: list of x/y positions.
     :param tolerance: float distance, in pixels, to consider a match
+    :param spherical: positions are RA/DEC (degrees) and tolerance is an angular separation in degrees.
 
     Algorithm:
-        - Find all the members of pos2 that are within tolerance of pos1[idx1].
-                These pos2 members are match_group_1
-        - Find all the members of pos1 that are within tolerance of match_group_1[idx2].
-                These pos1 members are match_group_2
-        - If pos1[idx] is in match_group_2 then pos1[idx] is a match of object at match_group_1[idx2]
+        - Find the member of pos2 that is nearest to, and within tolerance of, pos1[idx1], call it pos2[idx2].
+        - Find the distance from pos2[idx2] to its nearest neighbour in pos1.
+        - If pos1[idx1] is at that distance (ie. is the nearest member of pos1) then pos1[idx1] and pos2[idx2]
+          are a match.
 
+    The nearest neighbour searches are done with a KD-tree built on each list, so matching two lists of N
+    and M sources costs O((N+M) log(N+M)) rather than O(N*M).
     """
 
     assert isinstance(pos1, numpy.ndarray)
     assert isinstance(pos2, numpy.ndarray)
 
-    # build some arrays to hold the index of things that matched between lists.
-    npts2 = npts1 = 0
+    npts1 = len(pos1)
+    npts2 = len(pos2)
 
-    if len(pos1) > 0:
-        npts1 = len(pos1[:, 0])
-    pos1_idx_array = numpy.arange(npts1, dtype=numpy.int16)
-
-    if len(pos2) > 0:
-        npts2 = len(pos2[:, 0])
-    pos2_idx_array = numpy.arange(npts2, dtype=numpy.int16)
-
-    # this is the array of final matched index, -1 indicates no match found.
-    match1 = numpy.ma.zeros(npts1, dtype=numpy.int16)
+    # this is the array of final matched index, masked entries indicate no match found.
+    match1 = numpy.ma.zeros(npts1, dtype=numpy.int64)
     match1.mask = True
 
-    # this is the array of matches in pos2, -1 indicates no match found.
-    match2 = numpy.ma.zeros(npts2, dtype=numpy.int16)
+    # this is the array of matches in pos2, masked entries indicate no match found.
+    match2 = numpy.ma.zeros(npts2, dtype=numpy.int64)
     match2.mask = True
 
     # if one of the two input arrays are zero length then there is no matching to do.
     if npts1 * npts2 == 0:
         return match1, match2
 
-    for idx1 in range(npts1):
+    if spherical:
+        points1 = _unit_vectors(pos1)
+        points2 = _unit_vectors(pos2)
+        # chord length on the unit sphere that subtends an angle of tolerance degrees.
+        max_distance = 2.0 * numpy.sin(numpy.radians(min(tolerance, 180.0)) / 2.0)
+    else:
+        points1 = numpy.asarray(pos1[:, 0:2], dtype=numpy.float64)
+        points2 = numpy.asarray(pos2[:, 0:2], dtype=numpy.float64)
+        max_distance = tolerance
+
+    # nearest neighbour in pos2 of each pos1, and in pos1 of each pos2. Entries with nothing inside the
+    # tolerance come back with an infinite distance and an index equal to the length of the searched list.
+    sep12, idx12 = spatial.cKDTree(points2).query(points1, k=1, distance_upper_bound=_next_up(max_distance))
+    sep21, idx21 = spatial.cKDTree(points1).query(points2, k=1, distance_upper_bound=_next_up(max_distance))
 
-        # compute the distance source idx1 to each member of pos2
-        if not spherical :
-           sep = numpy.sqrt((pos2[:, 0] - pos1[idx1, 0]) ** 2 + (pos2[:, 1] - pos1[idx1, 1]) ** 2)
-        else:
-           sep = numpy.sqrt((numpy.cos(numpy.radians(pos1[idx1,1]))*(pos2[:, 0] - pos1[idx1, 0])) ** 2 + (pos2[:, 1] - pos1[idx1, 1]) ** 2)
+    idx1 = numpy.flatnonzero(sep12 <= max_distance)
+    idx2 = idx12[idx1]
+    # pos1[idx1] is a match if it is (one of) the closest members of pos1 to pos2[idx2].
+    mutual = sep12[idx1] <= sep21[idx2]
+    idx1 = idx1[mutual]
+    idx2 = idx2[mutual]
+
+    match1[idx1] = idx2
+    match2[idx2] = idx1
 
-        # considered a match if sep is below tolerance and is the closest match available.
-        match_condition = numpy.all((sep <= tolerance, sep == sep.min()), axis=0)
+    return match1, match2
 
-        # match_group_1 is list of the indexes of pos2 entries that qualified as possible matches to pos1[idx1]
-        match_group_1 = pos2_idx_array[match_condition]
 
-        # For each of those pos2 objects that could be a match to pos1[idx] find the best match in all of pos1
-        for idx2 in match_group_1:
-            # compute the distance from this pos2 object that is a possible match to pos1[idx1] to all members of pos1
-            sep = numpy.sqrt((pos1[:, 0] - pos2[idx2, 0]) ** 2 + (pos1[:, 1] - pos2[idx2, 1]) ** 2)
+def _unit_vectors(pos):
+    """
+    Convert an array of RA/DEC (degrees) positions to cartesian unit vectors.
 
-            # considered a match if sep is below tolerance and is the closest match available.
-            match_condition = numpy.all((sep <= tolerance, sep == sep.min()), axis=0)
-            match_group_2 = pos1_idx_array[match_condition]
+    :param pos: numpy.ndarray of shape (N, 2)
+    :return: numpy.ndarray of shape (N, 3)
+    """
+    ra = numpy.radians(numpy.asarray(pos[:, 0], dtype=numpy.float64))
+    dec = numpy.radians(numpy.asarray(pos[:, 1], dtype=numpy.float64))
+    cos_dec = numpy.cos(dec)
+    return numpy.transpose([cos_dec * numpy.cos(ra), cos_dec * numpy.sin(ra), numpy.sin(dec)])
 
-            # Are any of the pos1 members that were matches to the matched pos2 member the pos1[idx] entry?
-            if idx1 in match_group_2:
-                match1[idx1] = idx2
-                match2[idx2] = idx1
-                # this BREAK is in here since once we have a match we're done.
-                break
 
-    return match1, match2
+def _next_up(value):
+    """
+    cKDTree treats distance_upper_bound as a strict limit, nudge it so that separations equal to the tolerance
+    are still returned.
+    """
+    return numpy.nextafter(value, numpy.inf)
 
 
 class TimeMPC(TimeString):
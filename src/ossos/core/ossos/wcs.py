@@ -88,6 +88,9 @@ class WCS(astropy_wcs.WCS):
         return self.header['NORDFIT']
 
     def xy2sky(self, x, y, usepv=True):
+        """
+        Convert pixel x/y to RA/DEC, x/y may be scalars or arrays of positions.
+        """
         if usepv:
             try:
                 return xy2skypv(x=numpy.array(x), y=numpy.array(y),
@@ -106,6 +109,12 @@ class WCS(astropy_wcs.WCS):
         return pos[0] * units.degree, pos[1] * units.degree
 
     def sky2xy(self, ra, dec, usepv=True):
+        """
+        Convert RA/DEC to pixel x/y, ra/dec may be scalars or arrays of positions.
+
+        The PV inversion is carried out on the whole array in one call so callers
+        should pass all the positions they need rather than looping.
+        """
         if isinstance(ra, Quantity):
             ra = ra.to(units.degree).value
         if isinstance(dec, Quantity):
@@ -124,8 +133,10 @@ class WCS(astropy_wcs.WCS):
         except Exception as ex:
             logger.warning("sky2xy raised exception: {0}".format(ex))
             logger.warning("Reverted to CD-Matrix WCS to convert: {0} {1} ".format(ra, dec))
-        pos = self.wcs_world2pix([[ra, dec], ], 1)
-        return pos[0][0], pos[0][1]
+        if numpy.ndim(ra) == 0 and numpy.ndim(dec) == 0:
+            pos = self.wcs_world2pix([[ra, dec], ], 1)
+            return pos[0][0], pos[0][1]
+        return self.wcs_world2pix(numpy.asarray(ra), numpy.asarray(dec), 1)
 
 
 def sky2xypv(ra, dec, crpix1, crpix2, crval1, crval2, dc, pv, nord, maxiter=300):
@@ -134,15 +145,20 @@ def sky2xypv(ra, dec, crpix1, crpix2, crval1, crval2, dc, pv, nord, maxiter=300)
     non-linear distortion into account with the World Coordinate System
     FITS keywords as used in MegaPipe.
 
+    The Newton inversion of the PV polynomial is carried out on whole arrays
+    at once, each element is iterated until it individually converges (or
+    maxiter is reached), so passing many positions in a single call is much
+    faster than calling this function once per position.
+
     For the inverse operation see xy2sky.
 
     Reference material:
     http://www.cadc-ccda.hia-iha.nrc-cnrc.gc.ca/megapipe/docs/CD_PV_keywords.pdf
 
     Args:
-      ra: float
+      ra: float or array
         Right ascension
-      dec: float
+      dec: float or array
         Declination
       crpix1: float
         Tangent point x, pixels
@@ -158,10 +174,81 @@ def sky2xypv(ra, dec, crpix1, crpix2, crval1, crval2, dc, pv, nord, maxiter=300)
       pv: 2d array
       nord: int
         order of the fit
+      maxiter: int
+        maximum number of Newton iterations for any one element.
 
     Returns:
-      x, y: float
-        Pixel coordinates
+      x, y: float or array
+        Pixel coordinates, scalars if ra/dec were scalars.
+    """
+    if numpy.ndim(ra) == 0 and numpy.ndim(dec) == 0:
+        return _sky2xypv_scalar(float(ra), float(dec), crpix1, crpix2, crval1, crval2, dc, pv, nord,
+                                maxiter=maxiter)
+
+    ra, dec = numpy.broadcast_arrays(numpy.asarray(ra, dtype=float),
+                                     numpy.asarray(dec, dtype=float))
+    ra = ra.copy()
+
+    wrap = numpy.fabs(ra - crval1) > 100
+    if crval1 < 180:
+        ra[wrap] -= 360
+    else:
+        ra[wrap] += 360
+
+    ra = ra / PI180
+    dec = dec / PI180
+
+    tdec = numpy.tan(dec)
+    ra0 = crval1 / PI180
+    dec0 = crval2 / PI180
+    ctan = math.tan(dec0)
+    ccos = math.cos(dec0)
+
+    traoff = numpy.tan(ra - ra0)
+    craoff = numpy.cos(ra - ra0)
+    etar = (1 - ctan * craoff / tdec) / (ctan + craoff / tdec)
+    xir = traoff * ccos * (1 - etar * ctan)
+    xi = xir * PI180
+    eta = etar * PI180
+
+    # Initial guess
+    x = xi.copy()
+    y = eta.copy()
+
+    if nord >= 0:
+        # Reverse by Newton's method, only elements that have not yet
+        # converged are carried into the next iteration.
+        tolerance = 0.001 / 3600
+        active = numpy.arange(x.size)
+        iteration = 0
+        while active.size > 0 and iteration <= maxiter:
+            xa = x.flat[active]
+            ya = y.flat[active]
+            f, g, fx, fy, gx, gy = _pv_with_derivatives(xa, ya, pv, nord)
+            f -= xi.flat[active]
+            g -= eta.flat[active]
+            det = fx * gy - fy * gx
+            dx = (-f * gy + g * fy) / det
+            dy = (-g * fx + f * gx) / det
+            x.flat[active] = xa + dx
+            y.flat[active] = ya + dy
+            converged = (numpy.fabs(dx) < tolerance) & (numpy.fabs(dy) < tolerance)
+            active = active[~converged]
+            iteration += 1
+
+    xp = dc[0][0] * x + dc[0][1] * y
+    yp = dc[1][0] * x + dc[1][1] * y
+
+    x = xp + crpix1
+    y = yp + crpix2
+
+    return x, y
+
+
+def _sky2xypv_scalar(ra, dec, crpix1, crpix2, crval1, crval2, dc, pv, nord, maxiter=300):
+    """
+    Scalar form of sky2xypv, used when a single position is requested as the
+    numpy overhead of the array form dominates for one point.
     """
     if math.fabs(ra - crval1) > 100:
         if crval1 < 180:
@@ -270,6 +357,65 @@ def sky2xypv(ra, dec, crpix1, crpix2, crval1, crval2, dc, pv, nord, maxiter=300)
     return x, y
 
 
+def _pv_with_derivatives(x, y, pv, nord):
+    """
+    Evaluate the PV distortion polynomial, and its partial derivatives, at arrays of x/y.
+
+    Args:
+      x, y: array
+        Tangent plane coordinates, degrees.
+      pv: 2d array
+      nord: int
+        order of the fit
+
+    Returns:
+      f, g, fx, fy, gx, gy: array
+        The polynomial in xi (f) and eta (g) and their partial derivatives wrt x and y.
+    """
+    f = numpy.zeros_like(x) + pv[0][0]
+    g = numpy.zeros_like(x) + pv[1][0]
+    fx = numpy.zeros_like(x)
+    fy = numpy.zeros_like(x)
+    gx = numpy.zeros_like(x)
+    gy = numpy.zeros_like(x)
+
+    if nord >= 1:
+        r = numpy.sqrt(x ** 2 + y ** 2)
+        f += pv[0][1] * x + pv[0][2] * y + pv[0][3] * r
+        g += pv[1][1] * y + pv[1][2] * x + pv[1][3] * r
+        fx += pv[0][1] + pv[0][3] * x / r
+        fy += pv[0][2] + pv[0][3] * y / r
+        gx += pv[1][2] + pv[1][3] * x / r
+        gy += pv[1][1] + pv[1][3] * y / r
+
+        if nord >= 2:
+            x2 = x ** 2
+            xy = x * y
+            y2 = y ** 2
+
+            f += pv[0][4] * x2 + pv[0][5] * xy + pv[0][6] * y2
+            g += pv[1][4] * y2 + pv[1][5] * xy + pv[1][6] * x2
+            fx += pv[0][4] * 2 * x + pv[0][5] * y
+            fy += pv[0][5] * x + pv[0][6] * 2 * y
+            gx += pv[1][5] * y + pv[1][6] * 2 * x
+            gy += pv[1][4] * 2 * y + pv[1][5] * x
+
+            if nord >= 3:
+                x3 = x ** 3
+                x2y = x2 * y
+                xy2 = x * y2
+                y3 = y ** 3
+
+                f += pv[0][7] * x3 + pv[0][8] * x2y + pv[0][9] * xy2 + pv[0][10] * y3
+                g += pv[1][7] * y3 + pv[1][8] * xy2 + pv[1][9] * x2y + pv[1][10] * x3
+                fx += pv[0][7] * 3 * x2 + pv[0][8] * 2 * xy + pv[0][9] * y2
+                fy += pv[0][8] * x2 + pv[0][9] * 2 * xy + pv[0][10] * 3 * y2
+                gx += pv[1][8] * y2 + pv[1][9] * 2 * xy + pv[1][10] * 3 * x2
+                gy += pv[1][7] * 3 * y2 + pv[1][8] * 2 * xy + pv[1][9] * x2
+
+    return f, g, fx, fy, gx, gy
+
+
 def xy2skypv(x, y, crpix1, crpix2, crval1, crval2, cd, pv, nord):
     """
     Transforms from pixel coordinates to celestial coordinates taking
@@ -0,0 +1,81 @@
+#!python
+"""
+Time daophot.phot on a full CCD sized image with a star list the size step1 produces.
+
+The image is synthetic (Gaussian stars on a Poisson sky) so the recovered magnitudes can be checked against
+the input ones.  When pyraf is installed the IRAF path, daophot.phot_iraf, is timed on the same list.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy
+from astropy.io import fits
+
+from ossos import daophot
+
+NAXIS1 = 2112
+NAXIS2 = 4644
+SKY = 1000.0
+SIGMA = 1.8
+ZMAG = 30.0
+
+
+def make_image(nstars, seed):
+    rng = numpy.random.RandomState(seed)
+    x = rng.uniform(20, NAXIS1 - 20, nstars)
+    y = rng.uniform(20, NAXIS2 - 20, nstars)
+    flux = 10 ** rng.uniform(3, 5, nstars)
+    image = numpy.full((NAXIS2, NAXIS1), SKY)
+    half_width = int(6 * SIGMA)
+    offsets = numpy.arange(-half_width, half_width + 1)
+    for idx in range(nstars):
+        columns = numpy.rint(x[idx]).astype(int) - 1 + offsets
+        rows = numpy.rint(y[idx]).astype(int) - 1 + offsets
+        profile = numpy.exp(-((columns[None, :] + 1 - x[idx]) ** 2 + (rows[:, None] + 1 - y[idx]) ** 2) /
+                            (2 * SIGMA ** 2))
+        image[rows[0]:rows[-1] + 1, columns[0]:columns[-1] + 1] += flux[idx] * profile / (2 * numpy.pi * SIGMA ** 2)
+    return rng.poisson(image).astype(numpy.float32), x, y, flux
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--nstars', type=int, default=5000,
+                        help="number of stars on the CCD")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    image, x, y, flux = make_image(args.nstars, args.seed)
+    fd, filename = tempfile.mkstemp(suffix=".fits")
+    os.close(fd)
+    try:
+        fits.PrimaryHDU(data=image).writeto(filename, overwrite=True)
+        kwargs = dict(aperture=4, sky=11, swidth=4, apcor=0.0, maxcount=1e9, zmag=ZMAG)
+
+        start = time.time()
+        table = daophot.phot(filename, x, y, **kwargs)
+        engine_time = time.time() - start
+        residual = table['MAG'] - (ZMAG - 2.5 * numpy.log10(flux))
+        print("{} stars on a {}x{} image".format(args.nstars, NAXIS1, NAXIS2))
+        print("in-process: {:8.3f} s  {:10.0f} stars/s".format(engine_time, args.nstars / engine_time))
+        print("aperture residual, median {:.3f} mag, {} measurements undefined".format(
+            numpy.ma.median(residual), numpy.sum(table['MAG'].mask)))
+
+        try:
+            import pyraf
+        except ImportError:
+            print("pyraf is not installed, IRAF not timed")
+            return
+        start = time.time()
+        reference = daophot.phot_iraf(filename, x, y, **kwargs)
+        iraf_time = time.time() - start
+        print("IRAF:       {:8.3f} s  {:10.0f} stars/s".format(iraf_time, args.nstars / iraf_time))
+        print("speed-up:   {:8.1f}x".format(iraf_time / engine_time))
+        print("max |MAG - IRAF MAG|: {:.4f}".format(numpy.ma.max(numpy.abs(table['MAG'] - reference['MAG']))))
+    finally:
+        os.unlink(filename)
+
+
+if __name__ == '__main__':
+    main()
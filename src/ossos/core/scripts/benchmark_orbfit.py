@@ -0,0 +1,68 @@
+#!python
+"""
+Time orbit fitting and prediction for the release catalogue with the file based orbfit.Orbfit and the in-memory
+kbo.Orbfit.
+
+Each object of parsers.ossos_discoveries is fit with both and its position predicted on a set of dates spanning
+the survey, the predictions of the two are compared.
+"""
+import argparse
+import time
+
+import numpy
+from astropy import units
+from astropy.time import Time
+
+from ossos import kbo, orbfit, parameters, parsers
+
+
+def run(orbit_class, observations, dates):
+    start = time.time()
+    orbit = orbit_class(observations)
+    fit_time = time.time() - start
+    start = time.time()
+    ra = numpy.zeros(len(dates))
+    dec = numpy.zeros(len(dates))
+    for idx in range(len(dates)):
+        orbit.predict(dates[idx])
+        ra[idx] = orbit.coordinate.ra.to(units.degree).value
+        dec[idx] = orbit.coordinate.dec.to(units.degree).value
+    return fit_time, time.time() - start, ra, dec
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--directory', default=parameters.REAL_KBO_AST_DIR,
+                        help="directory holding the .ast/.mpc files of the release")
+    parser.add_argument('--npredict', type=int, default=50,
+                        help="number of dates each orbit is predicted at")
+    args = parser.parse_args()
+
+    dates = Time(numpy.linspace(Time(parameters.SURVEY_START).mjd, Time('2018-01-01').mjd, args.npredict),
+                 format='mjd', scale='utc')
+    totals = {orbfit.Orbfit: [0.0, 0.0], kbo.Orbfit: [0.0, 0.0]}
+    max_difference = 0.0
+    count = 0
+    for tno in parsers.ossos_discoveries(directory=args.directory):
+        observations = tno.orbit.observations
+        results = {}
+        for orbit_class in totals:
+            fit_time, predict_time, ra, dec = run(orbit_class, observations, dates)
+            totals[orbit_class][0] += fit_time
+            totals[orbit_class][1] += predict_time
+            results[orbit_class] = ra, dec
+        max_difference = max(max_difference,
+                             numpy.abs(results[orbfit.Orbfit][0] - results[kbo.Orbfit][0]).max(),
+                             numpy.abs(results[orbfit.Orbfit][1] - results[kbo.Orbfit][1]).max())
+        count += 1
+
+    print("{} objects, {} predictions each".format(count, args.npredict))
+    for orbit_class, label in ((orbfit.Orbfit, "temp files"), (kbo.Orbfit, "in memory ")):
+        print("{}: fit {:8.3f} s  predict {:8.3f} s".format(label, *totals[orbit_class]))
+    print("speed-up:   fit {:8.1f}x predict {:8.1f}x".format(totals[orbfit.Orbfit][0] / totals[kbo.Orbfit][0],
+                                                           totals[orbfit.Orbfit][1] / totals[kbo.Orbfit][1]))
+    print("max |difference| in position: {:.2e} deg".format(max_difference))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+#!python
+"""
+Time the array sky2xy PV inversion against converting the same positions one at a time.
+
+Uses the MegaPipe solution for 821543p that the wcs unit tests are based on.
+"""
+import argparse
+import time
+
+import numpy
+
+from ossos import wcs
+
+CRPIX1 = -7535.57493517
+CRPIX2 = 9808.40914361
+CRVAL1 = 176.486157083
+CRVAL2 = 8.03697351091
+CD = [[5.115244026718E-05, 7.064503033578E-07],
+      [-1.280229655229E-07, -5.123112374523E-05]]
+PV = [[-7.030338745606E-03, 1.01755337222, 8.262429361142E-03,
+       0.00000000000, -5.910145454849E-04, -7.494178330178E-04,
+       -3.470178516657E-04, -2.331150605755E-02, -8.187062772669E-06,
+       -2.325429510806E-02, 1.135299506292E-04],
+      [-6.146513090656E-03, 1.01552885426, 8.259666421752E-03,
+       0.00000000000, -4.567030382243E-04, -6.978676921999E-04,
+       -3.732572951216E-04, -2.332572754467E-02, -2.354317291723E-05,
+       -2.329623852891E-02, 1.196394469003E-04]]
+NORD = 3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--npoints', type=int, default=100000,
+                        help="number of positions to convert")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    dc = numpy.linalg.inv(CD)
+    rng = numpy.random.RandomState(args.seed)
+    x = rng.uniform(1, 20000, args.npoints)
+    y = rng.uniform(1, 20000, args.npoints)
+    ra, dec = wcs.xy2skypv(x, y, CRPIX1, CRPIX2, CRVAL1, CRVAL2, CD, PV, NORD)
+    ra = ra.to('degree').value
+    dec = dec.to('degree').value
+
+    start = time.time()
+    xs = numpy.zeros(args.npoints)
+    ys = numpy.zeros(args.npoints)
+    for idx in range(args.npoints):
+        xs[idx], ys[idx] = wcs.sky2xypv(ra[idx], dec[idx], CRPIX1, CRPIX2, CRVAL1, CRVAL2, dc, PV, NORD)
+    scalar_time = time.time() - start
+
+    start = time.time()
+    xv, yv = wcs.sky2xypv(ra, dec, CRPIX1, CRPIX2, CRVAL1, CRVAL2, dc, PV, NORD)
+    vector_time = time.time() - start
+
+    print("{} positions".format(args.npoints))
+    print("scalar loop: {:8.3f} s".format(scalar_time))
+    print("array call:  {:8.3f} s".format(vector_time))
+    print("speed-up:    {:8.1f}x".format(scalar_time / vector_time))
+    print("max |dx|, |dy| vs scalar: {:.3g} {:.3g} pixels".format(numpy.fabs(xv - xs).max(),
+                                                                   numpy.fabs(yv - ys).max()))
+    print("max |dx|, |dy| vs input:  {:.3g} {:.3g} pixels".format(numpy.fabs(xv - x).max(),
+                                                                   numpy.fabs(yv - y).max()))
+
+
+if __name__ == '__main__':
+    main()
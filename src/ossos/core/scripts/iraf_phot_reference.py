@@ -0,0 +1,51 @@
+#!python
+"""
+Store the IRAF phot measurements of a list of stars, the reference tests/test_ossos/test_tools/test_daophot.py
+checks daophot.phot against.  Needs pyraf and an IRAF installation.
+
+The output is an ECSV table with the input positions (X_IN, Y_IN), the IRAF XCENTER, YCENTER, MSKY, MAG and
+MERR and the phot parameters in its meta data, so the test repeats the measurement IRAF made.
+"""
+import argparse
+import os
+
+from astropy.table import Table
+
+from ossos import daophot
+
+TEST_DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests', 'data')
+COLUMNS = ['XCENTER', 'YCENTER', 'MSKY', 'MAG', 'MERR']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--image', default=os.path.join(TEST_DATA, 'cutout_1200_2400_1350_2300-1616681p.fits'),
+                        help="image to measure")
+    parser.add_argument('--output', default=os.path.join(TEST_DATA, 'cutout_1200_2400_1350_2300-1616681p.phot.ecsv'),
+                        help="ECSV file to write the IRAF measurements to")
+    parser.add_argument('--x', type=float, nargs='+', default=[60.0, 105.3, 20.7],
+                        help="x positions of the stars")
+    parser.add_argument('--y', type=float, nargs='+', default=[12.0, 55.1, 80.4],
+                        help="y positions of the stars")
+    parser.add_argument('--aperture', type=float, default=4)
+    parser.add_argument('--sky', type=float, default=11)
+    parser.add_argument('--swidth', type=float, default=4)
+    parser.add_argument('--apcor', type=float, default=0.3)
+    parser.add_argument('--zmag', type=float, default=26.0)
+    args = parser.parse_args()
+
+    if len(args.x) != len(args.y):
+        parser.error("--x and --y need the same number of positions")
+
+    kwargs = dict(aperture=args.aperture, sky=args.sky, swidth=args.swidth, apcor=args.apcor, zmag=args.zmag)
+    result = daophot.phot_iraf(args.image, args.x, args.y, **kwargs)
+
+    reference = Table([args.x, args.y], names=['X_IN', 'Y_IN'])
+    for column in COLUMNS:
+        reference[column] = result[column]
+    reference.meta['phot'] = kwargs
+    reference.write(args.output, format='ascii.ecsv', overwrite=True)
+
+
+if __name__ == '__main__':
+    main()
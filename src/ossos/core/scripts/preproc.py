@@ -43,7 +43,6 @@
 
 
 """Create a MEGAPRIME bias frame given a list of input bias exposure numbers"""
-import requests
 
 __Version__ = "2.0"
 import re, os, string, sys
@@ -52,6 +51,8 @@ import numpy as np
 import logging
 from astropy.io import fits
 
+from ossos import http_client
+
 version = __Version__
 
 elixir_header = {'PHOT_C': ( 30.0000, "Fake Elixir zero point" ),
@@ -175,9 +176,10 @@ def get_from_dbimages(file_id, ext='o.fits.fz', calibrator=False):
             vos_client.copy(uri, filename)
         except:
             with open(filename, 'wb') as handle:
-                r = requests.get('https://www.cadc-ccda.hia-iha.nrc-cnrc.gc.ca/data/pub/CFHT/{}'.format(filename),
-                                 cert=vos_client.conn.certfile,
-                                 stream=True)
+                r = http_client.get('https://www.cadc-ccda.hia-iha.nrc-cnrc.gc.ca/data/pub/CFHT/{}'.format(filename),
+                                    cert=vos_client.conn.certfile,
+                                    stream=True,
+                                    raise_for_status=False)
                 if not r.ok:
                     raise OSError(2)
 
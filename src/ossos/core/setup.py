@@ -10,7 +10,8 @@ if mo:
 else:
     raise RuntimeError("Unable to find version string in %s." % (VERSION_FILENAME,))
 
-dependencies = ['requests >= 2.7',
+dependencies = ['requests >= 2.25',
+                'urllib3 >= 1.26',
                 'astropy >= 4.0',
                 'vos >= 3.0',
                 'numpy >= 1.6.1',
@@ -34,7 +35,9 @@ console_scripts = ['mkpsf = ossos.pipeline.mkpsf:main', 'step3 = ossos.pipeline.
                    'align = ossos.pipeline.align:main',
                    'plant = ossos.pipeline.plant:main',
                    'astrom_mag_check = ossos.pipeline.astrom_mag_check:main',
-                   'scramble = ossos.pipeline.scramble:main']
+                   'scramble = ossos.pipeline.scramble:main',
+                   'ssos_warm_cache = ossos.ssos:main',
+                   'refresh_tracks = ossos.tracks:main']
 
 gui_scripts = ['validate.py = ossos.tools.validate:main']
 
@@ -227,9 +227,8 @@ class AbstractRealsModelTest(GeneralModelTest):
         image2 = Mock()
         loaded_reading2 = image2.reading
 
-        assert_that(
-            self.image_manager._singlet_download_manager.submit_request.call_count,
-            equal_to(9))
+        requests = self.image_manager._singlet_download_manager.submit_requests.call_args[0][0]
+        assert_that(len(requests), equal_to(9))
 
         # Simulate receiving callback
         self.image_manager.on_singlet_image_loaded(image1)
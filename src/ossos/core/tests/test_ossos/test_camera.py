@@ -1,5 +1,8 @@
 from unittest import TestCase
+
+import numpy
 from astropy import units
+from astropy.coordinates import SkyCoord
 
 from ossos import cameras
 
@@ -44,3 +47,50 @@ class TestCamera(TestCase):
 
     def test_separation(self):
         self.fail()
+
+
+class TestCameraFootprint(TestCase):
+
+    def setUp(self):
+        self.camera = cameras.Camera(SkyCoord(150.0, 20.0, unit=('degree', 'degree')))
+
+    def chip_centres(self):
+        """RA/Dec of the centre of each chip of the camera."""
+        ra0 = self.camera.ra.degree
+        dec0 = numpy.radians(self.camera.dec.degree)
+        xi = numpy.radians([geo["ra"] for geo in cameras.Camera._geometry["MEGACAM_40"]])
+        eta = numpy.radians([geo["dec"] for geo in cameras.Camera._geometry["MEGACAM_40"]])
+        # inverse gnomonic projection
+        denominator = numpy.cos(dec0) - eta * numpy.sin(dec0)
+        ra = ra0 + numpy.degrees(numpy.arctan2(xi, denominator))
+        dec = numpy.degrees(numpy.arctan2(numpy.sin(dec0) + eta * numpy.cos(dec0), numpy.hypot(xi, denominator)))
+        return ra, dec
+
+    def test_which_ccd_chip_centres(self):
+        ra, dec = self.chip_centres()
+        self.assertEqual(list(self.camera.which_ccd(ra, dec)), list(range(len(ra))))
+
+    def test_contains_off_field(self):
+        ra = numpy.array([self.camera.ra.degree, self.camera.ra.degree + 2.0, self.camera.ra.degree + 180.0])
+        dec = numpy.array([self.camera.dec.degree + 0.392, self.camera.dec.degree, -self.camera.dec.degree])
+        self.assertEqual(list(self.camera.contains(ra, dec)), [True, False, False])
+
+    def test_matches_brute_force(self):
+        rng = numpy.random.RandomState(1)
+        ra = self.camera.ra.degree + rng.uniform(-0.8, 0.8, 20000)
+        dec = self.camera.dec.degree + rng.uniform(-0.7, 0.7, 20000)
+        footprint = cameras.Camera.footprint()
+        xi, eta = cameras.tangent_plane(self.camera.ra.degree, self.camera.dec.degree, ra, dec)
+        inside = ((xi[:, None] >= footprint.lower[:, 0]) & (xi[:, None] <= footprint.upper[:, 0]) &
+                  (eta[:, None] >= footprint.lower[:, 1]) & (eta[:, None] <= footprint.upper[:, 1]))
+        expected = numpy.where(inside.any(axis=1), inside.argmax(axis=1), -1)
+        self.assertEqual(list(self.camera.which_ccd(ra, dec)), list(expected))
+
+    def test_ra_wrap(self):
+        camera = cameras.Camera(SkyCoord(0.05, 0.0, unit=('degree', 'degree')))
+        self.assertEqual(list(camera.contains([359.95, 0.15], [camera.dec.degree + 0.13, camera.dec.degree + 0.13])),
+                         [True, True])
+
+    def test_circular_camera(self):
+        camera = cameras.Camera(SkyCoord(10.0, 10.0, unit=('degree', 'degree')), camera="HSC")
+        self.assertEqual(list(camera.which_ccd([10.0, 10.5, 12.0], [10.0, 10.5, 10.0])), [0, 0, -1])
@@ -1,16 +1,34 @@
 __author__ = "David Rusk <drusk@uvic.ca>"
 
+import threading
 import unittest
 
+from astropy import units
+from astropy.coordinates import SkyCoord
+from hamcrest import assert_that, equal_to, less_than_or_equal_to
 from mock import Mock
 
 from ossos.astrom import SourceReading
+from ossos.downloads.async_download import AsynchronousDownloadManager
+from ossos.downloads.async_download import DownloadEngine
 from ossos.downloads.async_download import DownloadRequest
-from ossos.downloads.async_download import DownloadThread
-from ossos.downloads.cutouts import ImageCutoutDownloader
+from ossos.downloads.cutouts.downloader import ImageCutoutDownloader
 from ossos.downloads.cutouts.source import SourceCutout
 
 
+def mock_reading(expnum, ra=10.0, host="cadc.nrc.ca!vospace"):
+    reading = Mock(spec=SourceReading)
+    reading.get_exposure_number.return_value = expnum
+    reading.get_ccd_num.return_value = 22
+    if host is None:
+        reading.get_image_uri.return_value = "vos:OSSOS/dbimages/{}/{}p.fits".format(expnum, expnum)
+    else:
+        reading.get_image_uri.return_value = "vos://{}/OSSOS/dbimages/{}/{}p.fits".format(host, expnum, expnum)
+    reading.reference_sky_coord = SkyCoord(ra * units.degree, 5 * units.degree)
+    reading.uncertainty_ellipse = Mock(a=1 * units.arcsec, b=0.5 * units.arcsec)
+    return reading
+
+
 class DownloadRequestTest(unittest.TestCase):
     def test_execute_downloads_cutout_and_calls_callback(self):
         reading = Mock(spec=SourceReading)
@@ -31,20 +49,171 @@ class DownloadRequestTest(unittest.TestCase):
 
         callback.assert_called_once_with(cutout)
 
-
-class DownloadThreadTest(unittest.TestCase):
-    def test_do_download_executes_request(self):
-        work_queue = Mock()
-        downloader = Mock()
-        errorhandler = Mock()
-
-        thread = DownloadThread(work_queue, downloader, errorhandler)
-
-        request = Mock(spec=DownloadRequest)
-        thread.do_download(request)
-
-        request.execute.assert_called_once_with(downloader)
-
+    def test_requests_ordered_by_submission(self):
+        first = DownloadRequest(mock_reading(1616682))
+        second = DownloadRequest(mock_reading(1616681))
+
+        assert_that(first < second, equal_to(True))
+        assert_that(second < first, equal_to(False))
+
+    def test_key_ignores_focus(self):
+        reading = mock_reading(1616681)
+
+        assert_that(DownloadRequest(reading, focus=(10, 10)).key,
+                    equal_to(DownloadRequest(reading, focus=(50, 50)).key))
+        assert_that(DownloadRequest(reading).key,
+                    equal_to((1616681, 22, 10.0, 5.0, 12.5)))
+
+
+class DownloadEngineTest(unittest.TestCase):
+    def setUp(self):
+        self.release = threading.Event()
+        self.lock = threading.Lock()
+        self.downloaded = []
+        self.running = 0
+        self.max_running = 0
+
+        self.downloader = Mock(spec=ImageCutoutDownloader)
+        self.downloader.download_cutout.side_effect = self.download_cutout
+        self.error_handler = Mock()
+        self.engines = []
+
+    def tearDown(self):
+        self.release.set()
+        for engine in self.engines:
+            engine.shutdown()
+
+    def download_cutout(self, reading, focus=None, needs_apcor=False):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        self.release.wait(5)
+        with self.lock:
+            self.running -= 1
+            self.downloaded.append(reading)
+        return Mock(spec=SourceCutout, reading=reading)
+
+    def manager(self, max_workers=4, max_per_host=4):
+        engine = DownloadEngine(max_workers, max_per_host)
+        self.engines.append(engine)
+        return AsynchronousDownloadManager(self.downloader, self.error_handler, engine=engine)
+
+    def submit(self, manager, reading, priority=100):
+        callback = Mock()
+        manager.submit_request(DownloadRequest(reading, callback=callback), priority=priority)
+        return callback
+
+    def finish(self, manager):
+        self.release.set()
+        manager.engine.join()
+
+    def test_duplicate_requests_share_one_download(self):
+        singlets = self.manager()
+        triplets = AsynchronousDownloadManager(self.downloader, self.error_handler, engine=singlets.engine)
+        reading = mock_reading(1616681)
+
+        callbacks = [self.submit(singlets, reading), self.submit(triplets, reading)]
+        self.finish(singlets)
+
+        assert_that(self.downloaded, equal_to([reading]))
+        cutout = callbacks[0].call_args[0][0]
+        for callback in callbacks:
+            callback.assert_called_once_with(cutout)
+
+    def test_downloads_in_priority_order(self):
+        manager = self.manager(max_workers=1)
+        readings = [mock_reading(expnum) for expnum in range(1616681, 1616685)]
+
+        self.submit(manager, readings[0])
+        self.submit(manager, readings[1], priority=100)
+        self.submit(manager, readings[2], priority=100)
+        self.submit(manager, readings[3], priority=0)
+        self.finish(manager)
+
+        assert_that(self.downloaded, equal_to([readings[0], readings[3], readings[1], readings[2]]))
+
+    def test_concurrency_bounded_per_host(self):
+        manager = self.manager(max_workers=4, max_per_host=1)
+        callbacks = [self.submit(manager, mock_reading(1616681 + idx, host=host))
+                     for idx, host in enumerate(["cadc.nrc.ca!vospace"] * 3 + ["www.canfar.net"])]
+        self.finish(manager)
+
+        assert_that(self.max_running, less_than_or_equal_to(2))
+        for callback in callbacks:
+            assert_that(callback.call_count, equal_to(1))
+
+    def test_vos_uris_bounded_by_workers_only(self):
+        manager = self.manager(max_workers=3, max_per_host=1)
+        callbacks = [self.submit(manager, mock_reading(1616681 + idx, host=None)) for idx in range(4)]
+
+        for _ in range(50):
+            if self.running == 3:
+                break
+            self.release.wait(0.1)
+        assert_that(self.running, equal_to(3))
+        self.finish(manager)
+
+        assert_that(self.max_running, equal_to(3))
+        for callback in callbacks:
+            assert_that(callback.call_count, equal_to(1))
+
+    def test_cancelled_requests_are_not_downloaded(self):
+        manager = self.manager(max_workers=1)
+        running = mock_reading(1616681)
+        passed = mock_reading(1616682)
+
+        running_callback = self.submit(manager, running)
+        passed_callback = self.submit(manager, passed)
+        manager.cancel([running, passed])
+        self.finish(manager)
+
+        assert_that(self.downloaded, equal_to([running]))
+        assert_that(running_callback.call_count, equal_to(0))
+        assert_that(passed_callback.call_count, equal_to(0))
+
+    def test_errors_sent_to_error_handler(self):
+        manager = self.manager()
+        error = IOError("no cutout")
+        self.downloader.download_cutout.side_effect = error
+
+        callback = self.submit(manager, mock_reading(1616681))
+        self.finish(manager)
+
+        assert_that(callback.call_count, equal_to(0))
+        assert_that(self.error_handler.handle_error.call_args[0][0], equal_to(error))
+
+
+    def test_cutouts_of_one_image_fetched_together(self):
+        manager = self.manager(max_workers=1)
+        readings = [mock_reading(1616681, ra=10.0 + idx) for idx in range(3)] + [mock_reading(1616682)]
+        batches = []
+        self.downloader.download_cutouts.side_effect = lambda readings, needs_apcor=False: (
+            batches.append(readings) or [Mock(spec=SourceCutout, reading=reading) for reading in readings])
+
+        callbacks = [Mock() for _ in readings]
+        manager.submit_requests([DownloadRequest(reading, callback=callback)
+                                 for reading, callback in zip(readings, callbacks)])
+        self.finish(manager)
+
+        assert_that(batches, equal_to([readings[:3]]))
+        assert_that(self.downloaded, equal_to([readings[3]]))
+        for reading, callback in zip(readings, callbacks):
+            assert_that(callback.call_args[0][0].reading, equal_to(reading))
+
+    def test_cutouts_missing_from_batch_downloaded_alone(self):
+        manager = self.manager(max_workers=1)
+        readings = [mock_reading(1616681, ra=10.0 + idx) for idx in range(2)]
+        self.downloader.download_cutouts.side_effect = lambda readings, needs_apcor=False: (
+            [Mock(spec=SourceCutout, reading=readings[0]), None])
+
+        callbacks = [Mock() for _ in readings]
+        manager.submit_requests([DownloadRequest(reading, callback=callback)
+                                 for reading, callback in zip(readings, callbacks)])
+        self.finish(manager)
+
+        assert_that(self.downloaded, equal_to([readings[1]]))
+        for callback in callbacks:
+            assert_that(callback.call_count, equal_to(1))
 
 if __name__ == '__main__':
     unittest.main()
@@ -2,19 +2,22 @@ __author__ = "David Rusk <drusk@uvic.ca>"
 
 import unittest
 
-from mock import Mock
+from mock import Mock, patch
 from hamcrest import (assert_that, contains_inanyorder, has_length, contains,
                       equal_to)
 
 from tests.base_tests import FileReadingTestCase
+from ossos import storage
 from ossos.gui import tasks
-from ossos.gui.context import LocalDirectoryWorkingContext
+from ossos.gui.context import LocalDirectoryWorkingContext, VOSpaceWorkingContext
 from ossos.gui.progress import (LocalProgressManager, InMemoryProgressManager,
+                                   VOSpaceProgressManager, FileStatus,
                                    FileLockedException, RequiresLockException,
-                                   LOCK_SUFFIX)
+                                   LOCK_SUFFIX, DONE_PROPERTY, LOCK_PROPERTY)
 
 WD_HAS_PROGRESS = "data/persistence_has_progress"
 WD_NO_LOG = "data/persistence_no_log"
+CANDS = tasks.get_suffix(tasks.CANDS_TASK)
 
 
 class ProgressManagerLoadingTest(FileReadingTestCase):
@@ -280,5 +283,69 @@ class InMemoryProgressManagerTest(unittest.TestCase):
         assert_that(self.undertest.owns_lock(self.file2), equal_to(True))
 
 
+class VOSpaceProgressStatusTest(unittest.TestCase):
+    def setUp(self):
+        self.context = VOSpaceWorkingContext("vos:OSSOS/measure3")
+        self.undertest = VOSpaceProgressManager(self.context, userid="main_user")
+        self.listing = {
+            "xxx1.cands.astrom": {'date': "2015-01-01T00:00:00.000",
+                                  storage.tag_uri(DONE_PROPERTY): "other_user"},
+            "xxx2.cands.astrom": {'date': "2015-01-02T00:00:00.000",
+                                  storage.tag_uri(LOCK_PROPERTY): "other_user"},
+            "xxx3.cands.astrom": {'date': "2015-01-03T00:00:00.000"},
+            "xxx1.reals.astrom": {'date': "2015-01-01T00:00:00.000"},
+        }
+
+    @patch("ossos.gui.progress.storage.poll_properties")
+    @patch("ossos.gui.progress.storage.prefetch_properties")
+    def test_status_from_one_listing(self, prefetch_properties, poll_properties):
+        prefetch_properties.return_value = self.listing
+
+        assert_that(self.undertest.get_status(CANDS), equal_to({
+            "xxx1.cands.astrom": FileStatus(True, None, []),
+            "xxx2.cands.astrom": FileStatus(False, "other_user", []),
+            "xxx3.cands.astrom": FileStatus(False, None, [])}))
+        assert_that(self.undertest.get_done(CANDS), contains("xxx1.cands.astrom"))
+        assert_that(self.undertest.get_done(tasks.get_suffix(tasks.REALS_TASK)), has_length(0))
+
+        prefetch_properties.assert_called_once_with("vos:OSSOS/measure3")
+        assert_that(poll_properties.called, equal_to(False))
+
+    @patch("ossos.gui.progress.storage.poll_properties")
+    @patch("ossos.gui.progress.storage.prefetch_properties")
+    def test_later_listings_only_poll_changes(self, prefetch_properties, poll_properties):
+        prefetch_properties.return_value = self.listing
+        poll_properties.return_value = {
+            "xxx3.cands.astrom": {'date': "2015-01-04T00:00:00.000",
+                                  storage.tag_uri(DONE_PROPERTY): "other_user"}}
+        self.undertest.poll_interval = 0
+
+        self.undertest.get_status(CANDS)
+        statuses = self.undertest.get_status(CANDS)
+
+        poll_properties.assert_called_once_with("vos:OSSOS/measure3", "2015-01-03T00:00:00.000")
+        assert_that(statuses["xxx3.cands.astrom"].done, equal_to(True))
+        assert_that(statuses["xxx2.cands.astrom"].lock_holder, equal_to("other_user"))
+        assert_that(prefetch_properties.call_count, equal_to(1))
+
+    @patch("ossos.gui.progress.storage.set_property")
+    @patch("ossos.gui.progress.storage.get_property")
+    @patch("ossos.gui.progress.storage.prefetch_properties")
+    def test_own_changes_kept_in_status(self, prefetch_properties, get_property, set_property):
+        prefetch_properties.return_value = self.listing
+        get_property.return_value = None
+        self.undertest.get_status(CANDS)
+
+        self.undertest.lock("xxx3.cands.astrom")
+        assert_that(self.undertest.get_status(CANDS)["xxx3.cands.astrom"],
+                    equal_to(FileStatus(False, "main_user", [])))
+
+        get_property.return_value = "main_user"
+        self.undertest.record_done("xxx3.cands.astrom")
+        self.undertest.unlock("xxx3.cands.astrom")
+        assert_that(self.undertest.get_status(CANDS)["xxx3.cands.astrom"],
+                    equal_to(FileStatus(True, None, [])))
+
+
 if __name__ == '__main__':
     unittest.main()
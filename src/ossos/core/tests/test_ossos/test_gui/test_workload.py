@@ -1,11 +1,12 @@
 __author__ = "David Rusk <drusk@uvic.ca>"
 
 import os
+import threading
 import unittest
 
 from hamcrest import (assert_that, is_in, is_not, equal_to, is_, none,
                       contains_inanyorder, has_length, contains)
-from mock import Mock, call, MagicMock
+from mock import Mock, call, MagicMock, patch
 
 from tests.base_tests import FileReadingTestCase, DirectoryCleaningTestCase
 from tests.testutil import CopyingMock
@@ -17,8 +18,8 @@ from ossos.gui.models.validation import ValidationModel
 from ossos.astrom import (AstromParser, StreamingAstromWriter, SourceReading,
                           Source)
 from ossos.mpc import MPCWriter
-from ossos.gui.models.imagemanager import ImageManager
-from ossos.gui.progress import LocalProgressManager, InMemoryProgressManager
+from ossos.gui.models.imagemanager import ImageManager, ImageStatistics
+from ossos.gui.progress import LocalProgressManager, InMemoryProgressManager, FileStatus
 from ossos.gui.models.workload import (WorkUnitProvider, WorkUnit,
                                        RealsWorkUnit, CandidatesWorkUnit,
                                        RealsWorkUnitBuilder,
@@ -33,8 +34,9 @@ class TestDirectoryManager(object):
     def set_listing(self, suffix, listing):
         self.listings[suffix] = listing[:]
 
-    def get_listing(self, suffix):
-        return self.listings[suffix][:]
+    def get_listing(self, suffix, exclude_prefix=None):
+        return [filename for filename in self.listings[suffix]
+                if exclude_prefix is None or not filename.startswith(exclude_prefix)]
 
     def get_full_path(self, filename):
         return filename
@@ -653,6 +655,17 @@ class WorkUnitProviderTest(unittest.TestCase):
         assert_that(self.undertest.get_potential_files([]),
                     contains_inanyorder(self.file4))
 
+    def test_file_done_since_listing_not_handed_out(self):
+        self.progress_manager.get_status = Mock(return_value={
+            self.file1: FileStatus(False, None, []),
+            self.file2: FileStatus(False, None, [])})
+        # someone finished file1 after the listing was taken.
+        self.progress_manager.done.add(self.file1)
+
+        assert_that(self.undertest.get_workunit().get_filename(), equal_to(self.file2))
+        assert_that(self.progress_manager.owns_lock(self.file1), equal_to(False))
+        assert_that(self.undertest.get_potential_files([]), has_length(0))
+
 
 class PreFetchingWorkUnitProviderTest(unittest.TestCase):
     def setUp(self):
@@ -661,6 +674,10 @@ class PreFetchingWorkUnitProviderTest(unittest.TestCase):
         self.undertest = PreFetchingWorkUnitProvider(self.workunit_provider,
                                                      self.prefetch_quantity)
         self._workunit_number = 0
+        self.workunit_provider.get_workunit.return_value = self.create_workunit()
+
+    def tearDown(self):
+        self.undertest.shutdown()
 
     def create_workunit(self, num=None):
         if num is None:
@@ -668,6 +685,7 @@ class PreFetchingWorkUnitProviderTest(unittest.TestCase):
 
         workunit = Mock(spec=WorkUnit)
         workunit.get_filename.return_value = "Workunit%d" % num
+        workunit.get_unprocessed_sources.return_value = [Mock(), Mock()]
         self._workunit_number += 1
         return workunit
 
@@ -815,6 +833,94 @@ class PreFetchingWorkUnitProviderTest(unittest.TestCase):
 
         self.assertRaises(NoAvailableWorkException, self.undertest.get_workunit)
 
+    def test_depth_covers_download_latency(self):
+        image_manager = Mock(spec=ImageManager)
+        image_manager.statistics = ImageStatistics()
+        self.undertest = PreFetchingWorkUnitProvider(self.workunit_provider, self.prefetch_quantity,
+                                                     image_manager, max_quantity=10, margin=2)
+
+        assert_that(self.undertest.prefetch_depth(), equal_to(self.prefetch_quantity))
+
+        # 12 sources a minute with 30s to get a cutout: 12 sources, in 6 workunits, are needed.
+        image_manager.statistics.download_latency = 30.0
+        self.undertest.sources_per_minute = 12.0
+        self.undertest.sources_per_workunit = 2.0
+        assert_that(self.undertest.prefetch_depth(), equal_to(6))
+
+        self.undertest.sources_per_minute = 120.0
+        assert_that(self.undertest.prefetch_depth(), equal_to(10))
+
+        self.undertest.sources_per_minute = 0.1
+        assert_that(self.undertest.prefetch_depth(), equal_to(1))
+
+    def test_reviewer_rate_measured_between_workunits(self):
+        self.mock_prefetch_workunit()
+        self.undertest.get_workunit()
+        self.undertest._handed_out = (self.undertest._handed_out[0] - 30, 2)
+
+        self.undertest.get_workunit()
+
+        assert_that(round(self.undertest.sources_per_minute), equal_to(4))
+        assert_that(self.undertest.sources_per_workunit, equal_to(2))
+
+    def test_workunit_without_unprocessed_sources(self):
+        workunit = self.create_workunit()
+        workunit.get_unprocessed_sources.return_value = []
+
+        self.undertest._record_hand_out(workunit)
+        self.undertest._handed_out = (self.undertest._handed_out[0] - 30, 0)
+        self.undertest._record_hand_out(workunit)
+
+        assert_that(self.undertest.sources_per_workunit, equal_to(0))
+        assert_that(self.undertest.sources_per_minute, equal_to(0))
+        assert_that(self.undertest.prefetch_depth(), equal_to(self.prefetch_quantity))
+
+    def test_prefetch_workers_bounded(self):
+        release = threading.Event()
+        lock = threading.Lock()
+        counts = {'running': 0, 'most': 0}
+        self.undertest = PreFetchingWorkUnitProvider(self.workunit_provider, 5, max_workers=2)
+
+        def get_workunit(ignore_list=None):
+            with lock:
+                counts['running'] += 1
+                counts['most'] = max(counts['most'], counts['running'])
+            release.wait(5)
+            with lock:
+                counts['running'] -= 1
+            return self.create_workunit()
+
+        self.workunit_provider.get_workunit.side_effect = get_workunit
+        self.undertest.trigger_prefetching()
+        assert_that(self.undertest.metrics()['in_flight'], equal_to(5))
+        release.set()
+        self.undertest.shutdown()
+
+        assert_that(counts['most'], equal_to(2))
+        assert_that(len(self.undertest.workunits), equal_to(5))
+        assert_that(self.undertest.metrics()['in_flight'], equal_to(0))
+
+
+class ImageStatisticsTest(unittest.TestCase):
+    @patch("ossos.gui.models.imagemanager.time.time")
+    def test_latency_and_waits(self, now):
+        statistics = ImageStatistics(smoothing=0.5)
+        first, second = Mock(), Mock()
+
+        now.return_value = 100.0
+        statistics.requested(first)
+        statistics.requested(second)
+        now.return_value = 104.0
+        statistics.wanted(second)
+        statistics.loaded(first)
+        now.return_value = 110.0
+        statistics.loaded(second)
+
+        assert_that(statistics.download_latency, equal_to(7.0))
+        assert_that(statistics.downloads, equal_to(2))
+        assert_that(statistics.image_wait, equal_to(6.0))
+        assert_that(statistics.image_waits, equal_to(1))
+
 
 class WorkUnitProviderRealFilesTest(FileReadingTestCase, DirectoryCleaningTestCase):
     def setUp(self):
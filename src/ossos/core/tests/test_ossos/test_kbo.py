@@ -0,0 +1,59 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+from astropy import units
+from astropy.time import Time
+from hamcrest import assert_that, equal_to
+
+from ossos import kbo, mpc, orbfit
+
+MPC_LINES = ("     HL7j2    C2013 04 03.62926 17 12 01.16 +04 13 33.3          24.1 R      568",
+             "     HL7j2    C2013 04 04.58296 17 11 59.80 +04 14 05.5          24.0 R      568",
+             "     HL7j2    C2013 05 03.52252 17 10 38.28 +04 28 00.9          23.4 R      568",
+             "     HL7j2    C2013 05 08.56725 17 10 17.39 +04 29 47.8          23.4 R      568")
+
+
+class InMemoryOrbfitTest(unittest.TestCase):
+    def setUp(self):
+        self.observations = [mpc.Observation.from_string(line) for line in MPC_LINES]
+        self.directory = tempfile.mkdtemp()
+        self.tempdir = tempfile.tempdir
+        tempfile.tempdir = self.directory
+
+    def tearDown(self):
+        tempfile.tempdir = self.tempdir
+        shutil.rmtree(self.directory)
+
+    def test_same_orbit_as_file_based_fit(self):
+        orbit = kbo.Orbfit(self.observations)
+        reference = orbfit.Orbfit(self.observations)
+
+        assert_that(orbit.abg, equal_to(reference.abg))
+        for observation in self.observations:
+            orbit.predict(observation.date)
+            reference.predict(observation.date)
+            assert_that(orbit.coordinate.separation(reference.coordinate).to(units.arcsec).value, equal_to(0.0))
+            assert_that(orbit.dra, equal_to(reference.dra))
+            assert_that(orbit.pa, equal_to(reference.pa))
+            # the fit goes through the observations.
+            self.assertLess(orbit.coordinate.separation(observation.coordinate).to(units.arcsec).value, 0.3)
+
+    def test_no_files_written(self):
+        if not hasattr(os, 'memfd_create'):
+            self.skipTest("in-memory files need memfd_create")
+        orbit = kbo.Orbfit(self.observations)
+        predictions = orbit.predict_many(Time(numpy.linspace(56380.0, 56500.0, 5), format='mjd', scale='utc'))
+        orbit.predict(2456390.5)
+
+        assert_that(len(predictions.coordinate), equal_to(5))
+        assert_that(os.listdir(self.directory), equal_to([]))
+
+    def test_too_few_observations(self):
+        self.assertRaises(orbfit.OrbfitError, kbo.Orbfit, self.observations[:2])
+
+
+if __name__ == '__main__':
+    unittest.main()
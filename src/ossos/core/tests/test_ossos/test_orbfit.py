@@ -4,13 +4,17 @@ import sys
 
 from hamcrest import assert_that, equal_to, has_length, contains
 
+import numpy
 from astropy import coordinates
 from astropy import units
+from astropy.time import Time
 
 from ossos import mpc
 from ossos import orbfit
 import os
 
+from mock import Mock
+
 
 class OrbfitTest(unittest.TestCase):
 
@@ -44,6 +48,36 @@ class OrbfitTest(unittest.TestCase):
         HL7j2 = orbfit.Orbfit(observations)
         self.assertAlmostEqual(HL7j2.a, 135.75, 1)
 
+    def test_predict_many(self):
+        mpc_lines=("     HL7j2    C2013 04 03.62926 17 12 01.16 +04 13 33.3          24.1 R      568",
+                   "     HL7j2    C2013 04 04.58296 17 11 59.80 +04 14 05.5          24.0 R      568",
+                   "     HL7j2    C2013 05 03.52252 17 10 38.28 +04 28 00.9          23.4 R      568",
+                   "     HL7j2    C2013 05 08.56725 17 10 17.39 +04 29 47.8          23.4 R      568")
+
+        HL7j2 = orbfit.Orbfit([mpc.Observation.from_string(line) for line in mpc_lines])
+        dates = Time(numpy.linspace(56380.0, 57000.0, 7), format='mjd', scale='utc')
+
+        predictions = HL7j2.predict_many(dates)
+        assert_that(predictions.coordinate, has_length(7))
+        for idx in range(len(dates)):
+            HL7j2.predict(dates[idx])
+            self.assertAlmostEqual(predictions.coordinate[idx].separation(HL7j2.coordinate).to(units.arcsec).value,
+                                   0.0, 6)
+            self.assertAlmostEqual(predictions.dra[idx].to(units.arcsec).value, HL7j2.dra.to(units.arcsec).value)
+            self.assertAlmostEqual(predictions.ddec[idx].to(units.arcsec).value, HL7j2.ddec.to(units.arcsec).value)
+            self.assertAlmostEqual(predictions.pa[idx].to(units.degree).value, HL7j2.pa.to(units.degree).value)
+
+        # the generic form gives the same result one date at a time for orbits without predict_many.
+        body = Mock(spec=['predict', 'coordinate', 'dra', 'ddec', 'pa'])
+        body.predict.side_effect = lambda date: HL7j2.predict(date)
+        type(body).coordinate = property(lambda self: HL7j2.coordinate)
+        type(body).dra = property(lambda self: HL7j2.dra)
+        type(body).ddec = property(lambda self: HL7j2.ddec)
+        type(body).pa = property(lambda self: HL7j2.pa)
+        one_at_a_time = orbfit.predict_many(body, [date for date in dates])
+        assert_that(body.predict.call_count, equal_to(7))
+        self.assertAlmostEqual(numpy.abs(one_at_a_time.dra - predictions.dra).max().to(units.arcsec).value, 0.0)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,138 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+from astropy.io import fits
+from hamcrest import assert_that, equal_to, close_to
+
+from ossos.pipeline import plant as plant_task
+from ossos.plant import KBOGenerator, DaophotPSF
+
+PSFRAD = 8.0
+HWHM = 1.5
+PSFHEIGH = 1000.0
+PSFMAG = 20.0
+
+
+def write_psf(filename, lookup=None):
+    header = fits.Header()
+    header['FUNCTION'] = 'gauss'
+    header['NPARS'] = 2
+    header['PAR1'] = HWHM
+    header['PAR2'] = HWHM
+    header['PSFHEIGH'] = PSFHEIGH
+    header['PSFMAG'] = PSFMAG
+    header['PSFRAD'] = PSFRAD
+    header['XPSF'] = 100.0
+    header['YPSF'] = 100.0
+    fits.PrimaryHDU(data=lookup, header=header).writeto(filename)
+
+
+class KBOGeneratorTest(unittest.TestCase):
+    KWARGS = dict(n=50, rate=(0.5, 15), angle=(-10, 50), mag=(21.0, 25.5), x=(33, 2080), y=(1, 4612))
+
+    def test_seed_reproduces_kbos(self):
+        first = KBOGenerator.get_kbos(seed=12, **self.KWARGS)
+        second = KBOGenerator.get_kbos(seed=12, **self.KWARGS)
+        other = KBOGenerator.get_kbos(seed=13, **self.KWARGS)
+
+        for name in first.colnames:
+            assert_that(list(first[name]), equal_to(list(second[name])))
+        assert_that(list(first['x']) == list(other['x']), equal_to(False))
+
+    def test_values_in_range(self):
+        kbos = KBOGenerator.get_kbos(seed=1, **self.KWARGS)
+
+        assert_that(len(kbos), equal_to(50))
+        assert_that(list(kbos['id']), equal_to(list(range(1, 51))))
+        for name, (low, high) in (('x', (33, 2080)), ('y', (1, 4612)), ('mag', (21.0, 25.5)),
+                                  ('sky_rate', (0.5, 15)), ('angle', (-10, 50))):
+            assert_that(bool(numpy.all((kbos[name] >= low) & (kbos[name] <= high))), equal_to(True))
+
+
+class DaophotPSFTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.psf_filename = os.path.join(self.directory, "psf.fits")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_flux_and_position(self):
+        write_psf(self.psf_filename)
+        psf = DaophotPSF(self.psf_filename)
+        image = psf.render((60, 50), numpy.array([20.3]), numpy.array([30.6]), numpy.array([PSFMAG + 2.5]))
+
+        # the pixel integrated gauss has a volume of pi/ln(2) times its height
+        assert_that(image.sum(), close_to(0.1 * PSFHEIGH * numpy.pi / numpy.log(2), 1.0))
+        rows, columns = numpy.mgrid[1:61, 1:51]
+        assert_that((image * columns).sum() / image.sum(), close_to(20.3, 0.01))
+        assert_that((image * rows).sum() / image.sum(), close_to(30.6, 0.01))
+
+    def test_lookup_table_added(self):
+        size = 2 * int(2 * PSFRAD) + 1
+        lookup = numpy.zeros((size, size), dtype=numpy.float32)
+        lookup[size // 2, size // 2] = 0.5
+        write_psf(self.psf_filename, lookup=lookup)
+        with_lookup = DaophotPSF(self.psf_filename).render((40, 40), numpy.array([20.0]), numpy.array([20.0]),
+                                                           numpy.array([PSFMAG]))
+        os.unlink(self.psf_filename)
+        write_psf(self.psf_filename)
+        without = DaophotPSF(self.psf_filename).render((40, 40), numpy.array([20.0]), numpy.array([20.0]),
+                                                       numpy.array([PSFMAG]))
+
+        assert_that((with_lookup - without)[19, 19], close_to(0.5 * PSFHEIGH, 1e-6))
+
+    def test_unsupported_function(self):
+        write_psf(self.psf_filename)
+        with fits.open(self.psf_filename, mode='update') as hdulist:
+            hdulist[0].header['FUNCTION'] = 'penny2'
+        self.assertRaises(ValueError, DaophotPSF, self.psf_filename)
+
+
+class PlantKBOsTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.directory)
+        write_psf("psf.fits")
+        header = fits.Header()
+        header['PIXSCAL1'] = 0.185
+        header['EXPTIME'] = 3600.0
+        fits.PrimaryHDU(data=numpy.full((200, 150), 1000, dtype=numpy.uint16), header=header).writeto("image.fits")
+        self.shifts = {'nmag': 10, 'emag': 0.01, 'dmag': 0.0, 'dmjd': 0.0}
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+
+    def test_trailed_source(self):
+        # 0.925''/hour is 5 pixels in the one hour exposure, along x.
+        kbos = {'x': numpy.array([50.0]), 'y': numpy.array([100.0]), 'mag': numpy.array([PSFMAG]),
+                'sky_rate': numpy.array([0.925]), 'angle': numpy.array([0.0])}
+        plant_task.plant_kbos("image.fits", "psf.fits", kbos, self.shifts, "fk", seed=3)
+
+        with fits.open("fkimage.fits") as hdulist:
+            data = hdulist[0].data.astype(float) - 1000
+            assert_that(hdulist[0].data.dtype.kind, equal_to('u'))
+        columns = numpy.arange(1, 151)
+        total = data.sum()
+        assert_that(total, close_to(PSFHEIGH * numpy.pi / numpy.log(2), 5 * numpy.sqrt(total) + 200))
+        # the trail is made of 6 PSFs, stepped 5/6 of a pixel apart starting one step from x=50.
+        assert_that((data.sum(axis=0) * columns).sum() / total, close_to(50 + 3.5 * 5 / 6.0, 0.1))
+
+    def test_seeded_noise_reproducible(self):
+        kbos = KBOGenerator.get_kbos(5, rate=(0.5, 5), angle=(0, 10), mag=(19, 20), x=(20, 130), y=(20, 180),
+                                     seed=7)
+        images = []
+        for idx in range(2):
+            plant_task.plant_kbos("image.fits", "psf.fits", kbos, self.shifts, "fk", seed=11)
+            images.append(fits.getdata("fkimage.fits"))
+        assert_that(bool(numpy.all(images[0] == images[1])), equal_to(True))
+        assert_that(bool(numpy.all(images[0] == 1000)), equal_to(False))
+
+
+if __name__ == '__main__':
+    unittest.main()
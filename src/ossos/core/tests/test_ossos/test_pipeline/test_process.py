@@ -0,0 +1,99 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from ossos import storage
+from ossos.pipeline import process
+
+
+def record_stage(stage, expnum, ccd, version='p', prefix='', dry_run=False, force=False):
+    """Stand in for a pipeline step: leave a marker in the work directory and succeed unless ccd is 13."""
+    with open(os.path.join(os.path.dirname(os.getcwd()), "{}.{}".format(ccd, stage)), 'w') as fobj:
+        fobj.write(os.getcwd())
+    if stage == 'sleep':
+        time.sleep(10)
+    return ccd != 13
+
+
+def record_dbimages(stage, expnum, ccd, version='p', prefix='', dry_run=False, force=False):
+    """Stand in for a pipeline step: leave a marker holding the dbimages container the step would use."""
+    with open(os.path.join(os.path.dirname(os.getcwd()), "{}.{}".format(ccd, stage)), 'w') as fobj:
+        fobj.write(storage.DBIMAGES)
+    return True
+
+
+def nothing_done(stage, expnum, ccd, version='p', prefix=''):
+    return False
+
+
+def mkpsf_done(stage, expnum, ccd, version='p', prefix=''):
+    return stage == 'mkpsf'
+
+
+class DriverTest(unittest.TestCase):
+    def setUp(self):
+        self.scratch = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+
+    def tearDown(self):
+        shutil.rmtree(self.scratch)
+
+    def driver(self, **kwargs):
+        return process.Driver(workers=4, scratch=self.scratch, run_function=record_stage, **kwargs)
+
+    def markers(self):
+        return sorted(name for name in os.listdir(os.path.join(self.scratch, "1616681")) if "." in name)
+
+    def test_stages_run_in_own_directories(self):
+        driver = self.driver(stages=['mkpsf', 'step1'], done_function=nothing_done)
+
+        failed = driver.run([(1616681, ccd) for ccd in range(3)])
+
+        self.assertEqual(failed, [])
+        self.assertEqual(self.markers(), ['0.mkpsf', '0.step1', '1.mkpsf', '1.step1', '2.mkpsf', '2.step1'])
+        with open(os.path.join(self.scratch, "1616681", "2.step1")) as fobj:
+            self.assertEqual(fobj.read(), os.path.join(self.scratch, "1616681", "2"))
+        self.assertEqual(os.getcwd(), self.cwd)
+        self.assertFalse(os.access(os.path.join(self.scratch, "1616681", "2"), os.F_OK))
+        self.assertEqual(driver.statistics['step1'].counts['success'], 3)
+
+    def test_failed_stage_stops_ccd(self):
+        driver = self.driver(stages=['mkpsf', 'step1'], done_function=nothing_done)
+
+        failed = driver.run([(1616681, 12), (1616681, 13)])
+
+        self.assertEqual(failed, [(1616681, 13, 'mkpsf')])
+        self.assertEqual(self.markers(), ['12.mkpsf', '12.step1', '13.mkpsf'])
+
+    def test_done_stages_skipped(self):
+        driver = self.driver(stages=['mkpsf', 'step1'], done_function=mkpsf_done)
+
+        driver.run([(1616681, 1)])
+
+        self.assertEqual(self.markers(), ['1.step1'])
+        self.assertEqual(driver.statistics['mkpsf'].counts['skipped'], 1)
+
+    def test_timeout(self):
+        driver = self.driver(stages=['sleep', 'step1'], done_function=nothing_done, timeout=1)
+
+        failed = driver.run([(1616681, 1)])
+
+        self.assertEqual(failed, [(1616681, 1, 'sleep')])
+        self.assertEqual(driver.statistics['sleep'].counts['timeout'], 1)
+        self.assertIn("sleep", driver.summary())
+
+    def test_workers_use_dbimages(self):
+        driver = process.Driver(workers=2, scratch=self.scratch, run_function=record_dbimages,
+                                stages=['mkpsf'], done_function=nothing_done, dbimages="vos:OSSOS/test/dbimages")
+
+        driver.run([(1616681, 1)])
+
+        with open(os.path.join(self.scratch, "1616681", "1.mkpsf")) as fobj:
+            self.assertEqual(fobj.read(), "vos:OSSOS/test/dbimages")
+        self.assertNotEqual(storage.DBIMAGES, "vos:OSSOS/test/dbimages")
+
+
+if __name__ == '__main__':
+    unittest.main()
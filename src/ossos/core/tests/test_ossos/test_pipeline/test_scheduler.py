@@ -0,0 +1,117 @@
+import shutil
+import sys
+import tempfile
+import unittest
+
+from mock import patch
+
+from ossos import storage
+from ossos.pipeline import scheduler
+
+EXPNUMS = [1616692, 1616681, 1616704]
+
+
+class QuickTask(scheduler.PipelineTask):
+    """A task whose program exits at once, with a failure for the arguments ['fail']."""
+
+    def command(self, dbimages=None, dry_run=False, force=False, verbose=False):
+        return [sys.executable, "-c", "import sys; sys.exit({})".format(self.arguments == ['fail'] and 1 or 0)]
+
+
+def success(task):
+    return {storage.tag_uri(task.tag): storage.SUCCESS}
+
+
+class BuildGraphTest(unittest.TestCase):
+    def setUp(self):
+        self.tasks = scheduler.build_graph(EXPNUMS, 22, "O13AE", angle=12, measure3="vos:OSSOS/measure3/test")
+
+    def test_graph_covers_all_passes(self):
+        self.assertEqual(len(self.tasks), 40)
+        self.assertEqual(len(set(task.label for task in self.tasks)), 40)
+        self.assertEqual(set(task.name for task in self.tasks), set(scheduler.TASKS))
+
+    def test_dependencies_come_first(self):
+        for idx, task in enumerate(self.tasks):
+            for dependency in task.dependencies:
+                self.assertLess(self.tasks.index(dependency), idx)
+
+    def test_triplet_tasks_use_lead_exposure(self):
+        step2 = [task for task in self.tasks if task.name == 'step2']
+        self.assertEqual([task.target.expnum for task in step2], [1616681] * 3)
+        self.assertEqual(len(step2[0].dependencies), 3)
+        self.assertEqual(step2[2].tag, "fkstep2_s22")
+        self.assertEqual(step2[0].command()[3:6], ['1616681', '1616692', '1616704'])
+
+    def test_ready_set_from_tags(self):
+        tags = dict((expnum, {}) for expnum in EXPNUMS)
+        for task in self.tasks:
+            if task.name in ['mk_mopheader', 'mkpsf', 'step1'] and task.target.version == 'p':
+                tags[task.target.expnum].update(success(task))
+        with patch("ossos.storage.get_tags", side_effect=lambda expnum, force=False: tags[expnum]) as get_tags:
+            runner = scheduler.Scheduler(self.tasks)
+            runner.refresh()
+            ready = runner.ready(set())
+
+        self.assertEqual(get_tags.call_count, 3)
+        self.assertEqual(sorted(task.label for task in ready), ['scramble_1616681s22', 'step2_1616681p22'])
+
+
+class SchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.scratch = tempfile.mkdtemp()
+        patcher = patch("ossos.storage.get_tags", return_value={})
+        self.get_tags = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.scratch)
+
+    def graph(self, fail=False):
+        target = storage.Target('', 1616681, 'p', 22)
+        first = QuickTask('mkpsf', target, [])
+        second = QuickTask('step1', target, fail and ['fail'] or [], first)
+        third = QuickTask('step2', target, [], second)
+        other = QuickTask('mkpsf', storage.Target('', 1616692, 'p', 22), [])
+        return [first, second, third, other]
+
+    def test_runs_graph_in_order(self):
+        tasks = self.graph()
+        runner = scheduler.Scheduler(tasks, workers=2, scratch=self.scratch, dry_run=True)
+
+        failed = runner.run()
+
+        self.assertEqual(failed, [])
+        self.assertTrue(all(task.completed for task in tasks))
+        self.assertEqual(runner.statistics['mkpsf'].counts['success'], 2)
+
+    def test_failure_blocks_dependents(self):
+        tasks = self.graph(fail=True)
+        runner = scheduler.Scheduler(tasks, workers=2, scratch=self.scratch, dry_run=True)
+
+        failed = runner.run()
+
+        self.assertEqual(failed, [tasks[1]])
+        self.assertEqual(runner.blocked(), [tasks[2]])
+        self.assertIn("1 tasks failed, 1 not run", runner.summary())
+
+    def test_status_decides_success(self):
+        tasks = self.graph()
+        runner = scheduler.Scheduler(tasks[:1], scratch=self.scratch)
+
+        failed = runner.run()
+
+        # the program exited normally but did not record success in VOSpace.
+        self.assertEqual(failed, tasks[:1])
+
+    def test_finished_tasks_not_run(self):
+        tasks = self.graph()
+        self.get_tags.return_value = success(tasks[0])
+        runner = scheduler.Scheduler(tasks[:1], scratch=self.scratch)
+
+        self.assertEqual(runner.run(), [])
+        self.assertEqual(runner.statistics['mkpsf'].ran, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
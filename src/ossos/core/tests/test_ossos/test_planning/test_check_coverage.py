@@ -0,0 +1,101 @@
+import unittest
+
+import numpy
+from astropy.coordinates import SkyCoord
+from mock import patch
+
+from ossos.cameras import Camera
+from ossos.planning import check_coverage
+
+
+class LinearOrbit(object):
+    """Moves at a constant rate on the sky, counting the predictions made."""
+
+    def __init__(self, ra, dec, rate=0.0, epoch=58000.0):
+        self.ra = ra
+        self.dec = dec
+        self.rate = rate
+        self.epoch = epoch
+        self.predictions = 0
+        self.coordinate = None
+
+    def position(self, mjd):
+        return self.ra + self.rate * (mjd - self.epoch), self.dec
+
+    def predict(self, time):
+        self.predictions += 1
+        self.coordinate = SkyCoord(*self.position(time.mjd), unit=('degree', 'degree'))
+
+
+def location(ra, dec, mjd, name):
+    return {"RA__J2000.0_": ra, "Dec.__J2000.0_": dec, "Start_Date": mjd, "Target_Name": name}
+
+
+class PredictPositionsTest(unittest.TestCase):
+
+    def test_each_epoch_predicted_once(self):
+        orbits = [LinearOrbit(150.0, 20.0, rate=0.1), LinearOrbit(151.0, 21.0, rate=-0.1)]
+        epochs = numpy.array([58000.0, 58001.0, 58000.0, 58002.0])
+
+        ra, dec = check_coverage.predict_positions(orbits, epochs)
+
+        self.assertEqual(ra.shape, (2, 4))
+        self.assertEqual([orbit.predictions for orbit in orbits], [3, 3])
+        for idx, orbit in enumerate(orbits):
+            for jdx, mjd in enumerate(epochs):
+                self.assertAlmostEqual(ra[idx, jdx], orbit.position(mjd)[0], places=9)
+                self.assertAlmostEqual(dec[idx, jdx], orbit.position(mjd)[1], places=9)
+
+    def test_grid_interpolation_across_ra_zero(self):
+        orbit = LinearOrbit(359.9, 5.0, rate=0.02)
+        epochs = 58000.0 + numpy.linspace(0.0, 10.0, 50)
+
+        ra, dec = check_coverage.predict_positions([orbit], epochs, step=1.0)
+
+        self.assertEqual(orbit.predictions, 11)
+        expected = (359.9 + 0.02 * (epochs - 58000.0)) % 360.0
+        self.assertTrue(numpy.allclose(ra[0], expected, atol=1e-9))
+
+
+class CoverageTest(unittest.TestCase):
+
+    def setUp(self):
+        # a field of slow movers and pointings scattered over the nights they move through it.
+        rng = numpy.random.RandomState(5)
+        self.orbits = dict(("o{:02d}".format(idx),
+                            LinearOrbit(150.0 + rng.uniform(-1.0, 1.0), 20.0 + rng.uniform(-1.0, 1.0),
+                                        rate=rng.uniform(-0.05, 0.05)))
+                           for idx in range(40))
+        self.locations = [location(150.0 + rng.uniform(-1.0, 1.0), 20.0 + rng.uniform(-1.0, 1.0),
+                                   58000.0 + rng.randint(0, 5), "field{}".format(idx))
+                          for idx in range(12)]
+
+    def covered(self, location):
+        """The objects on a chip of the pointing, as the Camera places them."""
+        camera = Camera(location["RA__J2000.0_"], location["Dec.__J2000.0_"])
+        positions = [orbit.position(location["Start_Date"]) for orbit in self.orbits.values()]
+        return camera.contains(numpy.array([position[0] for position in positions]),
+                               numpy.array([position[1] for position in positions]))
+
+    def test_matches_camera(self):
+        matrix = check_coverage.coverage(self.orbits, self.locations, step=None)
+
+        self.assertEqual(matrix.shape, (len(self.locations), len(self.orbits)))
+        self.assertGreater(matrix.nnz, 0)
+        for row, location in enumerate(self.locations):
+            self.assertEqual(list(matrix[row].toarray().ravel()), list(self.covered(location)))
+
+    def test_chunks_do_not_change_result(self):
+        matrix = check_coverage.coverage(self.orbits, self.locations, step=None)
+        with patch("ossos.planning.check_coverage.CHUNK_SIZE", 5):
+            chunked = check_coverage.coverage(self.orbits, self.locations, step=None)
+
+        self.assertEqual((matrix != chunked).nnz, 0)
+
+    def test_empty(self):
+        self.assertEqual(check_coverage.coverage(self.orbits, []).shape, (0, len(self.orbits)))
+        self.assertEqual(check_coverage.coverage({}, self.locations).shape, (len(self.locations), 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+
+import numpy
+from astropy.coordinates import SkyCoord
+from mock import patch
+
+from ossos.cameras import Camera
+from ossos.planning import optimize_pointings
+
+
+class SetCoverTest(unittest.TestCase):
+
+    def setUp(self):
+        # a small field of objects, two thirds of them must be covered.
+        rng = numpy.random.RandomState(3)
+        self.ra = 150.0 + rng.uniform(-1.5, 1.5, 30)
+        self.dec = 20.0 + rng.uniform(-1.0, 1.0, 30)
+        self.required = numpy.arange(30) % 3 != 0
+        self.target, self.chip, self.centre_ra, self.centre_dec = optimize_pointings.candidate_pointings(
+            self.ra, self.dec)
+        self.matrix = optimize_pointings.coverage_matrix(self.ra, self.dec, self.centre_ra, self.centre_dec)
+
+    def covered(self, chosen):
+        """The objects on a chip of the chosen pointings, as the Camera places them."""
+        covered = numpy.zeros(len(self.ra), dtype=bool)
+        for pointing in chosen:
+            camera = Camera(SkyCoord(self.ra[self.target[pointing]], self.dec[self.target[pointing]],
+                                     unit=('degree', 'degree')))
+            camera.offset(index=int(self.chip[pointing]))
+            covered |= camera.contains(self.ra, self.dec)
+        return covered
+
+    def test_candidates_match_camera_offset(self):
+        nchips = len(Camera._geometry["MEGACAM_40"])
+        self.assertEqual(len(self.target), len(self.ra) * nchips)
+        for pointing in [0, 17, 39, 40, len(self.target) - 1]:
+            camera = Camera(SkyCoord(self.ra[self.target[pointing]], self.dec[self.target[pointing]],
+                                     unit=('degree', 'degree')))
+            camera.offset(index=int(self.chip[pointing]))
+            self.assertAlmostEqual(camera.ra.degree, self.centre_ra[pointing], places=9)
+            self.assertAlmostEqual(camera.dec.degree, self.centre_dec[pointing], places=9)
+
+    def test_coverage_matrix_matches_camera(self):
+        self.assertEqual(self.matrix.shape, (len(self.target), len(self.ra)))
+        # every candidate pointing has its own object on a chip.
+        self.assertTrue(numpy.all(self.matrix[numpy.arange(len(self.target)), self.target]))
+        for pointing in [5, 123, 400]:
+            self.assertEqual(list(self.matrix[pointing].toarray().ravel()), list(self.covered([pointing])))
+
+    def test_greedy_cover_is_complete(self):
+        chosen = optimize_pointings.greedy_set_cover(self.matrix, self.required)
+
+        self.assertTrue(numpy.all(self.covered(chosen)[self.required]))
+        # no pointing can be dropped without losing a required object.
+        for pointing in chosen:
+            others = [other for other in chosen if other != pointing]
+            self.assertFalse(numpy.all(self.covered(others)[self.required]))
+
+    def test_ilp_cover_is_complete(self):
+        chosen = optimize_pointings.ilp_set_cover(self.matrix, self.required)
+
+        self.assertTrue(numpy.all(self.covered(chosen)[self.required]))
+        self.assertLessEqual(len(chosen), len(optimize_pointings.greedy_set_cover(self.matrix, self.required)))
+
+    def test_pointings_sharing_a_target_are_kept(self):
+        tokens = ["o{:02d}".format(idx) for idx in range(len(self.ra))]
+        locations = SkyCoord(self.ra, self.dec, unit=('degree', 'degree'))
+        # object 0 on two chips at opposite corners of the field.
+        pointings = [0, 39]
+        with patch("ossos.planning.optimize_pointings.greedy_set_cover", return_value=pointings):
+            result = optimize_pointings.optimize_set_cover(dict.fromkeys(tokens), [tokens[1]], locations, tokens)
+
+        self.assertEqual(sorted(result.keys()), ["o00", "o00_39"])
+        covered = [token for camera, objects in result.values() for token in objects]
+        self.assertEqual(sorted(covered),
+                         [tokens[idx] for idx in numpy.nonzero(self.covered(pointings))[0]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,8 +3,10 @@ __author__ = "David Rusk <drusk@uvic.ca>"
 import tempfile
 import unittest
 
+from astropy.coordinates import SkyCoord
 from hamcrest import (assert_that, equal_to, has_length, has_entries,
                       same_instance, contains, close_to)
+from mock import patch
 
 from tests.base_tests import FileReadingTestCase
 from ossos import astrom
@@ -408,6 +410,116 @@ class AstromDataTest(FileReadingTestCase):
         assert_that(astrom_data.get_reading_count(), equal_to(9))
 
 
+@patch("ossos.storage.get_mopheader", side_effect=lambda *args: {})
+class StreamingParserTest(FileReadingTestCase):
+    def test_stream_matches_parse(self, get_mopheader):
+        astrom_data = AstromParser().parse(self.get_abs_path(FK_FILE))
+        with AstromParser().stream(self.get_abs_path(FK_FILE)) as reader:
+            assert_that([obs.rawname for obs in reader.observations],
+                        equal_to([obs.rawname for obs in astrom_data.observations]))
+            assert_that(reader.sys_header, equal_to(astrom_data.sys_header))
+            sources = list(reader)
+
+        assert_that(sources, has_length(21))
+        for streamed, parsed in zip(sources, astrom_data.get_sources()):
+            for reading, expected in zip(streamed.get_readings(), parsed.get_readings()):
+                assert_that((reading.x, reading.y, reading.x0, reading.y0, reading.ra, reading.dec),
+                            equal_to((expected.x, expected.y, expected.x0, expected.y0, expected.ra, expected.dec)))
+
+    def test_stream_from_file_handle(self, get_mopheader):
+        with open(self.get_abs_path(TEST_FILE_2), 'rb') as filehandle:
+            # a small read size makes lines span the blocks read.
+            with patch("ossos.astrom.READ_SIZE", 7):
+                sources = list(astrom.stream_sources(filehandle))
+            assert_that(filehandle.closed, equal_to(False))
+
+        assert_that(sources, has_length(1))
+        assert_that(sources[0].get_reading(2).dec, close_to(-12.7548961, 1e-9))
+
+    def test_sky_coordinates_built_on_use(self, get_mopheader):
+        with patch("ossos.astrom.SkyCoord", wraps=SkyCoord) as sky_coord:
+            source = AstromParser().parse(self.get_abs_path(TEST_FILE_2)).get_sources()[0]
+            reading = source.get_reading(0)
+            assert_that((reading.ra, reading.x, reading.uncertainty_ellipse.a.value),
+                        equal_to((213.897324, 560.06, reading.uncertainty_ellipse.b.value)))
+            assert_that(sky_coord.call_count, equal_to(0))
+
+            # the reference is the middle reading of the source.
+            reference = reading.reference_sky_coord
+            assert_that(reference.dec.degree, close_to(-12.7548161, 1e-9))
+            assert_that(reading.reference_sky_coord, same_instance(reference))
+            assert_that(sky_coord.call_count, equal_to(1))
+
+    def test_reference_fixed_when_reference_reading_moves(self, get_mopheader):
+        source = AstromParser().parse(self.get_abs_path(TEST_FILE_2)).get_sources()[0]
+        reference = source.get_reading(1).reference_position
+
+        source.get_reading(1).sky_coord = SkyCoord(11.0, 11.0, unit="degree")
+
+        for reading in source.get_readings():
+            assert_that(reading.reference_position, equal_to(reference))
+            assert_that(reading.reference_sky_coord.ra.degree, close_to(reference[0], 1e-9))
+
+    def test_moved_reading_keeps_reference(self, get_mopheader):
+        reading = SourceReading(10, 10, 10, 10, 20.0, 10.0, 10, 10, Observation("1584431", "p", "15"))
+        reading.sky_coord = SkyCoord(21.0, 11.0, unit="degree")
+
+        assert_that(reading.ra, close_to(21.0, 1e-9))
+        assert_that(reading.reference_sky_coord.ra.degree, close_to(20.0, 1e-9))
+
+
+@patch("ossos.storage.get_mopheader", side_effect=lambda *args: {})
+class AstromColumnsTest(FileReadingTestCase):
+    def test_round_trip(self, get_mopheader):
+        astrom_data = AstromParser().parse(self.get_abs_path(FK_FILE))
+        astrom_data.get_sources()[3].set_provisional_name("o3e01")
+        astrom_data.get_sources()[4].get_reading(1).discovery = True
+
+        columns = astrom_data.to_columns()
+        assert_that(len(columns), equal_to(21))
+        assert_that(columns.column('x').shape, equal_to((21, 3)))
+        rebuilt = columns.to_astrom_data()
+
+        assert_that(rebuilt.get_sources()[3].get_provisional_name(), equal_to("o3e01"))
+        for source, expected in zip(rebuilt.get_sources(), astrom_data.get_sources()):
+            for reading, original in zip(source.get_readings(), expected.get_readings()):
+                assert_that((reading.x, reading.y, reading.x0, reading.y0, reading.ra, reading.dec,
+                             reading.xref, reading.yref, reading.discovery, reading.reference_position,
+                             reading.uncertainty),
+                            equal_to((original.x, original.y, original.x0, original.y0, original.ra, original.dec,
+                                      original.xref, original.yref, original.discovery,
+                                      original.reference_position, original.uncertainty)))
+
+    def test_read_matches_objects(self, get_mopheader):
+        expected = AstromParser().parse(self.get_abs_path(FK_FILE)).to_columns()
+        columns = astrom.AstromColumns.read(self.get_abs_path(FK_FILE))
+
+        for name in ('x', 'y', 'x0', 'y0', 'ra', 'dec', 'xref', 'yref', 'ref_ra', 'ref_dec'):
+            assert_that(columns.column(name).tolist(), equal_to(expected.column(name).tolist()))
+        assert_that(abs(columns.column('a') - expected.column('a')).max() < 1e-9, equal_to(True))
+
+    def test_read_file_without_sources(self, get_mopheader):
+        with open(self.get_abs_path(FK_FILE)) as filehandle:
+            header = filehandle.readlines()[:24]
+        with tempfile.NamedTemporaryFile(mode='w', suffix=".astrom") as empty:
+            empty.writelines(header)
+            empty.flush()
+            columns = astrom.AstromColumns.read(empty.name)
+
+        assert_that(len(columns), equal_to(0))
+        assert_that(columns.readings, has_length(3))
+        assert_that(columns.column('x').shape, equal_to((0, 3)))
+        assert_that(columns.to_astrom_data().get_sources(), has_length(0))
+
+    def test_select(self, get_mopheader):
+        columns = astrom.AstromColumns.read(self.get_abs_path(FK_FILE))
+        selected = columns.select(columns.readings[0]['x'] > 1000)
+
+        assert_that(len(selected), equal_to(int((columns.readings[0]['x'] > 1000).sum())))
+        assert_that(selected.readings[2]['x'].tolist(),
+                    equal_to(columns.readings[2]['x'][columns.readings[0]['x'] > 1000].tolist()))
+
+
 class URIResolvingTest(unittest.TestCase):
     def test_resolve_image_uri(self):
         observation = Observation("1584431", "p", "15")
@@ -0,0 +1,118 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+from astropy import units
+from astropy.coordinates import SkyCoord
+from astropy.io import fits
+from hamcrest import assert_that, equal_to, is_not, none
+from mock import patch, Mock
+
+from ossos import cutout_cache
+from ossos.astrom import Observation, SourceReading
+from ossos.downloads.core import ApcorData
+from ossos.downloads.cutouts import downloader
+
+SKY_COORD = SkyCoord(10.0 * units.degree, 5.0 * units.degree)
+RADIUS = 12.5 * units.arcsec
+
+
+def cutout(value=1.0):
+    hdulist = fits.HDUList([fits.PrimaryHDU(), fits.ImageHDU(numpy.full((20, 20), value, dtype=numpy.float32))])
+    hdulist[1].header['EXTVER'] = 22
+    hdulist[1].header['PHOTZP'] = 26.5
+    return hdulist
+
+
+class CutoutCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = cutout_cache.CutoutCache(os.path.join(self.directory, "cutouts"), max_size=10 ** 6)
+        self.observation = Observation("1616681", "p", "22")
+        self.key = cutout_cache.cache_key(self.observation, SKY_COORD, RADIUS)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_miss_then_hit(self):
+        assert_that(self.cache.get(self.key), none())
+
+        self.cache.put(self.key, cutout(), apcor=ApcorData(4, 20, 0.3, 0.01), zmag=26.5)
+        hdulist, apcor, zmag = self.cache.get(self.key)
+
+        assert_that(hdulist[1].data.sum(), equal_to(400))
+        assert_that(cutout_cache.APCOR_KEYWORD in hdulist[0].header, equal_to(False))
+        assert_that(ApcorData.from_string(apcor).apcor, equal_to(0.3))
+        assert_that(zmag, equal_to(26.5))
+        assert_that((self.cache.hits, self.cache.misses), equal_to((1, 1)))
+        assert_that(str(self.cache), equal_to("{}: 1 hits 1 misses (50% hit rate)".format(
+            os.path.join(self.directory, "cutouts"))))
+
+    def test_hit_rate_without_lookups(self):
+        assert_that(self.cache.hit_rate, equal_to(0.0))
+
+    def test_key_depends_on_position_and_radius(self):
+        assert_that(cutout_cache.cache_key(self.observation, SKY_COORD, 2 * RADIUS), is_not(equal_to(self.key)))
+        moved = SkyCoord(10.001 * units.degree, 5.0 * units.degree)
+        assert_that(cutout_cache.cache_key(self.observation, moved, RADIUS), is_not(equal_to(self.key)))
+
+    def test_least_recently_used_evicted(self):
+        self.cache.put(self.key, cutout())
+        size = os.path.getsize(self.cache.files.path(self.key))
+        cache = cutout_cache.CutoutCache(os.path.join(self.directory, "small"), max_size=2.5 * size)
+        keys = [cutout_cache.cache_key(Observation(str(1616681 + idx), "p", "22"), SKY_COORD, RADIUS)
+                for idx in range(3)]
+        for idx, key in enumerate(keys):
+            cache.put(key, cutout(idx))
+            os.utime(cache.files.path(key), (idx, idx))
+
+        cache.put(keys[0], cutout())
+
+        assert_that(cache.get(keys[1]), none())
+        assert_that(cache.get(keys[2]), is_not(none()))
+
+    def test_offline_miss_raises(self):
+        cache = cutout_cache.CutoutCache(os.path.join(self.directory, "cutouts"), offline=True)
+        self.assertRaises(IOError, cache.get, self.key)
+
+
+class CachedDownloadTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = cutout_cache.CutoutCache(os.path.join(self.directory, "cutouts"))
+        patcher = patch("ossos.downloads.cutouts.downloader.get_cutout_cache", return_value=self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.reading = Mock(spec=SourceReading)
+        self.reading.obs = Observation("1616681", "p", "22")
+        self.reading.reference_sky_coord = SKY_COORD
+        self.reading.uncertainty_ellipse = Mock(a=1 * units.arcsec, b=0.5 * units.arcsec)
+        self.reading.get_ccd_num.return_value = 22
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    @patch("ossos.downloads.cutouts.downloader.SourceCutout")
+    @patch("ossos.downloads.cutouts.downloader.storage._cutout_expnum")
+    def test_second_download_served_from_cache(self, cutout_expnum, source_cutout):
+        cutout_expnum.return_value = cutout()
+        source_cutout.return_value.zmag = 26.5
+        image_downloader = downloader.ImageCutoutDownloader()
+        image_downloader.download_apcor = Mock(return_value=ApcorData(4, 20, 0.3, 0.01))
+
+        image_downloader.download_cutout(self.reading)
+        image_downloader.download_cutout(self.reading)
+
+        assert_that(cutout_expnum.call_count, equal_to(1))
+        assert_that(image_downloader.download_apcor.call_count, equal_to(1))
+        kwargs = source_cutout.call_args[1]
+        assert_that(str(kwargs['apcor']), equal_to("4.0 20.0 0.3 0.01"))
+        assert_that(kwargs['zmag'], equal_to(26.5))
+        assert_that((self.cache.hits, self.cache.misses), equal_to((1, 1)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,20 @@
 __author__ = "David Rusk <drusk@uvic.ca>"
 
+import os
 import unittest
 
+import numpy
+from astropy.table import Table
+from hamcrest import assert_that, close_to, equal_to
+
 from tests.base_tests import FileReadingTestCase
 from ossos import daophot
 
+try:
+    import pyraf
+except ImportError:
+    pyraf = None
+
 DELTA = 0.0001
 
 
@@ -58,11 +68,13 @@ class DaophotTest(FileReadingTestCase):
         swidth = outsky - insky
         apcor = 0.0
 
-        x, y, mag, magerr = daophot.phot_mag(fits_filename, x_in, y_in,
-                                             aperture=ap, sky=insky,
-                                             swidth=swidth, apcor=apcor,
-                                             maxcount=maxcount,
-                                             exptime=exptime)
+        table = daophot.phot_mag(fits_filename, x_in, y_in,
+                                 aperture=ap, sky=insky,
+                                 swidth=swidth, apcor=apcor,
+                                 maxcount=maxcount,
+                                 exptime=exptime)
+        self.assertEqual(len(table), 1)
+        x, y, mag, magerr = [table[column][0] for column in ['XCENTER', 'YCENTER', 'MAG', 'MERR']]
 
         assert_that(x, close_to(560.000, DELTA))
         assert_that(y, close_to(406.600, DELTA))
@@ -71,5 +83,134 @@ class DaophotTest(FileReadingTestCase):
         assert_that(magerr, close_to(0.290, 0.0011))
 
 
+class PhotometryEngineTest(unittest.TestCase):
+    """
+    Gaussian sources of known flux and position on a flat Poisson sky.
+    """
+    SKY = 1000.0
+    SIGMA = 1.5
+    SOURCES = [(50.3, 60.7, 20000.0), (150.0, 200.2, 5000.0), (250.6, 320.4, 50000.0)]
+
+    def setUp(self):
+        rows, columns = numpy.mgrid[1:401, 1:301]
+        image = numpy.full(rows.shape, self.SKY)
+        for x, y, flux in self.SOURCES:
+            image += flux / (2 * numpy.pi * self.SIGMA ** 2) * numpy.exp(
+                -((columns - x) ** 2 + (rows - y) ** 2) / (2 * self.SIGMA ** 2))
+        self.image = numpy.random.RandomState(42).poisson(image).astype(numpy.float64)
+
+    def measure(self, x, y, **kwargs):
+        parameters = dict(aperture=8, sky=12, swidth=6, apcor=0.0, zmag=30.0, maxcount=1e9)
+        parameters.update(kwargs)
+        return daophot.photometry(self.image, x, y, **parameters)
+
+    def test_centroid_and_magnitude(self):
+        x = numpy.array([source[0] for source in self.SOURCES])
+        y = numpy.array([source[1] for source in self.SOURCES])
+        table = self.measure(x + 0.8, y - 0.6)
+
+        for idx, (x, y, flux) in enumerate(self.SOURCES):
+            assert_that(table['CIER'][idx], equal_to(0))
+            assert_that(table['PIER'][idx], equal_to(0))
+            assert_that(table['XCENTER'][idx], close_to(x, 0.2))
+            assert_that(table['YCENTER'][idx], close_to(y, 0.2))
+            assert_that(table['MSKY'][idx], close_to(self.SKY, 5.0))
+            # the measured magnitude is consistent with the input flux, given the reported error.
+            assert_that(table['MAG'][idx], close_to(30.0 - 2.5 * numpy.log10(flux), 3 * table['MERR'][idx]))
+
+    def test_vector_matches_single_positions(self):
+        x = numpy.array([source[0] for source in self.SOURCES])
+        y = numpy.array([source[1] for source in self.SOURCES])
+        table = self.measure(x, y)
+        for idx in range(len(x)):
+            single = self.measure(x[idx], y[idx])
+            for column in ['XCENTER', 'YCENTER', 'MSKY', 'MAG', 'MERR']:
+                assert_that(single[column][0], close_to(table[column][idx], 1e-9))
+
+    def test_apcor_and_exptime(self):
+        reference = self.measure(50.3, 60.7)
+        table = self.measure(50.3, 60.7, apcor=0.3, exptime=10.0)
+        assert_that(table['MAG'][0], close_to(reference['MAG'][0] - 0.3 + 2.5, 1e-9))
+
+    def test_no_centroid_keeps_position(self):
+        table = self.measure(51.0, 60.0, centroid=False)
+        assert_that(table['XCENTER'][0], equal_to(51.0))
+        assert_that(table['YCENTER'][0], equal_to(60.0))
+
+    def test_flags(self):
+        table = self.measure([5000.0, 2.0, 250.6], [5.0, 2.0, 320.4], maxcount=2000.0)
+
+        # off the image
+        assert_that(table['PIER'][0], equal_to(daophot.PHOT_OFF_IMAGE))
+        assert_that(table.mask[0]['MAG'], equal_to(True))
+        # the aperture runs off the image
+        assert_that(table['PIER'][1], equal_to(daophot.PHOT_EDGE_IMAGE))
+        assert_that(table['SIER'][1], equal_to(daophot.SKY_EDGE_IMAGE))
+        # saturated
+        assert_that(table['PIER'][2], equal_to(daophot.PHOT_BAD_PIXELS))
+        assert_that(table.mask[2]['MAG'], equal_to(True))
+
+    def test_sky_mode_rejects_outliers(self):
+        image = numpy.random.RandomState(1).normal(100.0, 5.0, (101, 101))
+        image[45:56, 30:40] = 5000.0
+        msky, stdev, nsky, nsrej, sier = daophot.sky_mode(image, numpy.array([51.0]), numpy.array([51.0]),
+                                                         15.0, 10.0, datamax=1e9)
+        assert_that(msky[0], close_to(100.0, 1.0))
+        # the 5% clipping at each end truncates the distribution
+        assert_that(stdev[0], close_to(4.5, 0.3))
+        assert_that(sier[0], equal_to(daophot.SKY_NOERROR))
+
+
+IRAF_CUTOUT = os.path.join(os.path.dirname(__file__), "..", "..", "data",
+                           "cutout_1200_2400_1350_2300-1616681p.fits")
+IRAF_REFERENCE = os.path.join(os.path.dirname(__file__), "..", "..", "data",
+                              "cutout_1200_2400_1350_2300-1616681p.phot.ecsv")
+
+
+def assert_matches_iraf(table, reference):
+    """
+    Compare the in-process engine with IRAF phot, star by star.
+
+    Tolerances: 0.01 pixel on the centre, 0.5 counts on the sky, 0.01 on MAG and 0.005 on MERR.
+    """
+    assert_that(len(table), equal_to(len(reference)))
+    for idx in range(len(reference)):
+        if numpy.ma.is_masked(reference['MAG'][idx]):
+            assert_that(table.mask[idx]['MAG'], equal_to(True))
+            continue
+        assert_that(table['XCENTER'][idx], close_to(reference['XCENTER'][idx], 0.01))
+        assert_that(table['YCENTER'][idx], close_to(reference['YCENTER'][idx], 0.01))
+        assert_that(table['MSKY'][idx], close_to(reference['MSKY'][idx], 0.5))
+        assert_that(table['MAG'][idx], close_to(reference['MAG'][idx], 0.01))
+        assert_that(table['MERR'][idx], close_to(reference['MERR'][idx], 0.005))
+
+
+class StoredIrafRegressionTest(unittest.TestCase):
+    """
+    The in-process engine against IRAF phot output stored in tests/data (scripts/iraf_phot_reference.py).
+    """
+
+    def test_matches_iraf(self):
+        self.assertTrue(os.access(IRAF_REFERENCE, os.R_OK),
+                        "{} is missing, write it with scripts/iraf_phot_reference.py".format(IRAF_REFERENCE))
+        reference = Table.read(IRAF_REFERENCE, format='ascii.ecsv')
+        table = daophot.phot(IRAF_CUTOUT, numpy.array(reference['X_IN']), numpy.array(reference['Y_IN']),
+                             **reference.meta['phot'])
+        assert_matches_iraf(table, reference)
+
+
+@unittest.skipIf(pyraf is None, "pyraf is not installed")
+class IrafRegressionTest(unittest.TestCase):
+    """
+    The in-process engine against IRAF phot run through pyraf.
+    """
+
+    def test_matches_iraf(self):
+        x = numpy.array([60.0, 105.3, 20.7])
+        y = numpy.array([12.0, 55.1, 80.4])
+        kwargs = dict(aperture=4, sky=11, swidth=4, apcor=0.3, zmag=26.0)
+        assert_matches_iraf(daophot.phot(IRAF_CUTOUT, x, y, **kwargs), daophot.phot_iraf(IRAF_CUTOUT, x, y, **kwargs))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,116 @@
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from hamcrest import assert_that, equal_to, less_than_or_equal_to
+
+from ossos import http_client
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Replies to /ok, /flaky (503 until the server's failures run out), /slow and /missing.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, body=b"ok"):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            server.connections.add(self.client_address)
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length)
+            if self.path == "/flaky" and server.failures > 0:
+                server.failures -= 1
+                self._reply(503)
+            elif self.path == "/slow":
+                time.sleep(0.1)
+                self._reply(200)
+            elif self.path == "/missing":
+                self._reply(404)
+            else:
+                self._reply(200, body or b"ok")
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    do_GET = _handle
+    do_POST = _handle
+
+
+class HttpClientTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        self.server.lock = threading.Lock()
+        self.server.requests = 0
+        self.server.connections = set()
+        self.server.in_flight = 0
+        self.server.max_in_flight = 0
+        self.server.failures = 0
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = "http://127.0.0.1:{}".format(self.server.server_address[1])
+        self.client = http_client.HttpClient(pool_size=4, max_per_host=2, retries=3, backoff=0)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connection_reused(self):
+        for _ in range(5):
+            assert_that(self.client.get(self.url + "/ok").text, equal_to("ok"))
+
+        assert_that(self.server.requests, equal_to(5))
+        assert_that(len(self.server.connections), equal_to(1))
+
+    def test_retry_on_unavailable(self):
+        self.server.failures = 2
+        response = self.client.post(self.url + "/flaky", data={"a": "1"})
+
+        assert_that(response.status_code, equal_to(200))
+        assert_that(response.text, equal_to("a=1"))
+        assert_that(self.server.requests, equal_to(3))
+
+    def test_retries_exhausted(self):
+        self.server.failures = 10
+        self.assertRaises(requests.HTTPError, self.client.get, self.url + "/flaky")
+        assert_that(self.server.requests, equal_to(4))
+
+    def test_error_status(self):
+        self.assertRaises(requests.HTTPError, self.client.get, self.url + "/missing")
+        response = self.client.get(self.url + "/missing", raise_for_status=False)
+
+        assert_that(response.status_code, equal_to(404))
+        host = "127.0.0.1:{}".format(self.server.server_address[1])
+        assert_that(self.client.statistics.counts[host], equal_to(2))
+        assert_that(self.client.statistics.errors[host], equal_to(2))
+
+    def test_requests_per_host_bounded(self):
+        threads = [threading.Thread(target=self.client.get, args=(self.url + "/slow",)) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert_that(self.server.requests, equal_to(6))
+        assert_that(self.server.max_in_flight, less_than_or_equal_to(2))
+
+
+if __name__ == '__main__':
+    unittest.main()
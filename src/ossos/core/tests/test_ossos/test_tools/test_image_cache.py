@@ -0,0 +1,181 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from hamcrest import assert_that, equal_to, is_not
+from mock import patch
+
+from ossos import image_cache, metadata_cache, storage
+
+URI = "vos:OSSOS/dbimages/1616681/1616681p.fits"
+
+
+class ImageCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = image_cache.ImageCache(os.path.join(self.directory, "images"), max_size=1000)
+        self.retrieved = []
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def retrieve(self, content):
+        def write(filename):
+            self.retrieved.append(filename)
+            with open(filename, 'w') as fobj:
+                fobj.write(content)
+        return write
+
+    def dest(self, name):
+        return os.path.join(self.directory, name)
+
+    def read(self, name):
+        with open(self.dest(name)) as fobj:
+            return fobj.read()
+
+    def test_miss_then_hit(self):
+        key = image_cache.cache_key(URI)
+        self.cache.fetch(key, self.dest("first.fits"), self.retrieve("image"))
+        self.cache.fetch(key, self.dest("second.fits"), self.retrieve("other"))
+
+        assert_that(self.read("second.fits"), equal_to("image"))
+        assert_that(len(self.retrieved), equal_to(1))
+        assert_that(self.cache.hits, equal_to(1))
+        assert_that(self.cache.misses, equal_to(1))
+
+    def test_key_depends_on_cutout(self):
+        key = image_cache.cache_key(URI)
+        assert_that(image_cache.cache_key("vos://cadc.nrc.ca!vospace/OSSOS/dbimages/1616681/1616681p.fits"),
+                    equal_to(key))
+        assert_that(image_cache.cache_key(URI, cutout="[1][1:10,1:10]"), is_not(equal_to(key)))
+
+    def test_md5_checked_only_on_miss(self):
+        key = image_cache.cache_key(URI)
+        checks = []
+
+        def md5():
+            checks.append(1)
+            return "abc"
+        for name in ("first.fits", "second.fits"):
+            self.cache.fetch(key, self.dest(name), self.retrieve("image"), md5=md5)
+
+        assert_that(len(checks), equal_to(1))
+        assert_that(len(self.retrieved), equal_to(1))
+        assert_that(self.cache.hits, equal_to(1))
+
+    def test_stale_entry_revalidated(self):
+        self.cache.ttl = 0
+        key = image_cache.cache_key(URI)
+        self.cache.fetch(key, self.dest("out.fits"), self.retrieve("image"), md5=lambda: "abc")
+        self.cache.fetch(key, self.dest("out.fits"), self.retrieve("other"), md5=lambda: "abc")
+        assert_that(len(self.retrieved), equal_to(1))
+
+        self.cache.fetch(key, self.dest("out.fits"), self.retrieve("replaced"), md5=lambda: "def")
+        assert_that(self.read("out.fits"), equal_to("replaced"))
+        assert_that(len(self.retrieved), equal_to(2))
+
+    def test_least_recently_used_evicted(self):
+        keys = [image_cache.cache_key(URI, cutout="[{}]".format(idx)) for idx in range(3)]
+        for idx, key in enumerate(keys):
+            self.cache.fetch(key, self.dest("out.fits"), self.retrieve("x" * 400))
+            # make the access order unambiguous on filesystems with coarse timestamps.
+            os.utime(self.cache.path(key), (time.time() - 100 + idx, time.time() - 100 + idx))
+            if idx == 1:
+                self.cache.get(keys[0], self.dest("out.fits"))
+        self.cache.trim()
+
+        assert_that(os.access(self.cache.path(keys[0]), os.F_OK), equal_to(True))
+        assert_that(os.access(self.cache.path(keys[1]), os.F_OK), equal_to(False))
+        assert_that(self.cache.size() <= 1000, equal_to(True))
+
+    def test_trim_removes_lock_and_md5_files(self):
+        keys = [image_cache.cache_key(URI, cutout="[{}]".format(idx)) for idx in range(3)]
+        for idx, key in enumerate(keys):
+            self.cache.fetch(key, self.dest("out.fits"), self.retrieve("x" * 400), md5=lambda: "abc")
+            os.utime(self.cache.path(key), (time.time() - 100 + idx, time.time() - 100 + idx))
+        self.cache.trim()
+
+        for suffix in ("", ".lock", ".md5"):
+            assert_that(os.access(self.cache.path(keys[0]) + suffix, os.F_OK), equal_to(False))
+            assert_that(os.access(self.cache.path(keys[2]) + suffix, os.F_OK), equal_to(True))
+
+    def test_failed_retrieval_leaves_no_entry(self):
+        key = image_cache.cache_key(URI)
+
+        def fail(filename):
+            with open(filename, 'w') as fobj:
+                fobj.write("partial")
+            raise IOError("transfer failed")
+
+        self.assertRaises(IOError, self.cache.fetch, key, self.dest("out.fits"), fail)
+        assert_that(os.access(self.cache.path(key), os.F_OK), equal_to(False))
+        assert_that(os.listdir(os.path.dirname(self.cache.path(key))), equal_to([os.path.basename(
+            self.cache.path(key)) + ".lock"]))
+
+    def test_concurrent_fetch_retrieves_once(self):
+        key = image_cache.cache_key(URI)
+
+        def slow(filename):
+            self.retrieved.append(filename)
+            time.sleep(0.2)
+            with open(filename, 'w') as fobj:
+                fobj.write("image")
+
+        threads = [threading.Thread(target=self.cache.fetch, args=(key, self.dest("out{}.fits".format(idx)), slow))
+                   for idx in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert_that(len(self.retrieved), equal_to(1))
+        for idx in range(4):
+            assert_that(self.read("out{}.fits".format(idx)), equal_to("image"))
+
+
+class StorageCopyTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        for name, value in (("_metadata", metadata_cache.MetadataCache(':memory:')),
+                            ("_images", image_cache.ImageCache(os.path.join(self.directory, "images")))):
+            patcher = patch("ossos.storage." + name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    @patch("ossos.storage.client")
+    def test_copy_uses_cache(self, client):
+        client.get_node.return_value.props = {"MD5": "abc"}
+
+        def copy(source, dest):
+            with open(dest, 'w') as fobj:
+                fobj.write(source)
+            return len(source)
+        client.copy.side_effect = copy
+
+        cutout = "[1][1:10,1:10]"
+        for idx in range(2):
+            storage.copy(URI + cutout, os.path.join(self.directory, "cutout{}.fits".format(idx)))
+
+        assert_that(client.copy.call_count, equal_to(1))
+        with open(os.path.join(self.directory, "cutout1.fits")) as fobj:
+            assert_that(fobj.read(), equal_to(URI + cutout))
+        client.get_node.assert_called_once_with(URI, force=True)
+
+    @patch("ossos.storage.client")
+    def test_copy_without_md5_is_not_cached(self, client):
+        client.get_node.return_value.props = {}
+
+        storage.copy(URI, os.path.join(self.directory, "out.fits"))
+        storage.copy(URI, os.path.join(self.directory, "out.fits"))
+
+        assert_that(client.copy.call_count, equal_to(2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+
+import numpy
+from hamcrest import assert_that, equal_to
+
+from ossos import util
+
+
+class MatchListsTest(unittest.TestCase):
+    def test_mutual_nearest_neighbours(self):
+        pos1 = numpy.array([[10.0, 10.0], [50.0, 50.0], [100.0, 100.0]])
+        pos2 = numpy.array([[101.0, 100.0], [10.5, 10.0], [500.0, 500.0]])
+
+        match1, match2 = util.match_lists(pos1, pos2, tolerance=5)
+
+        assert_that(list(match1.filled(-1)), equal_to([1, -1, 0]))
+        assert_that(list(match2.filled(-1)), equal_to([2, 0, -1]))
+
+    def test_only_closest_of_competing_sources_matches(self):
+        pos1 = numpy.array([[0.0, 0.0], [3.0, 0.0]])
+        pos2 = numpy.array([[2.0, 0.0]])
+
+        match1, match2 = util.match_lists(pos1, pos2, tolerance=5)
+
+        assert_that(list(match1.filled(-1)), equal_to([-1, 0]))
+        assert_that(list(match2.filled(-1)), equal_to([1]))
+
+    def test_match_at_tolerance(self):
+        pos1 = numpy.array([[0.0, 0.0]])
+        pos2 = numpy.array([[3.0, 4.0]])
+
+        match1, match2 = util.match_lists(pos1, pos2, tolerance=5)
+
+        assert_that(list(match1.filled(-1)), equal_to([0]))
+
+    def test_empty_list(self):
+        match1, match2 = util.match_lists(numpy.array([]), numpy.array([[1.0, 1.0]]))
+
+        assert_that(len(match1), equal_to(0))
+        assert_that(bool(match2.mask[0]), equal_to(True))
+
+    def test_indices_beyond_int16(self):
+        npts = 40000
+        pos1 = numpy.transpose([numpy.arange(npts) * 10.0, numpy.zeros(npts)])
+        pos2 = pos1[::-1] + 0.5
+
+        match1, match2 = util.match_lists(pos1, pos2, tolerance=1)
+
+        assert_that(int(match1[npts - 1]), equal_to(0))
+        assert_that(int(match2[0]), equal_to(npts - 1))
+        assert_that(int(match1.count()), equal_to(npts))
+
+    def test_spherical_separation_uses_cos_dec(self):
+        # 1 arcsec apart on the sky, but 2 arcsec apart in RA at dec=60.
+        pos1 = numpy.array([[10.0, 60.0]])
+        pos2 = numpy.array([[10.0 + 2.0 / 3600.0, 60.0]])
+
+        match1, match2 = util.match_lists(pos1, pos2, tolerance=1.5 / 3600.0, spherical=True)
+
+        assert_that(list(match1.filled(-1)), equal_to([0]))
+
+        match1, match2 = util.match_lists(pos1, pos2, tolerance=0.5 / 3600.0, spherical=True)
+
+        assert_that(list(match1.filled(-1)), equal_to([-1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from hamcrest import assert_that, equal_to, none
+
+from ossos import metadata_cache
+
+NODE = "vos:OSSOS/dbimages/1616681"
+
+
+class MetadataCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "metadata.sqlite")
+        self.cache = metadata_cache.MetadataCache(self.filename, ttl=60)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_miss_then_hit(self):
+        assert_that(self.cache.get(NODE), none())
+        self.cache.put(NODE, {"ivo://canfar.uvic.ca/ossos#mkpsf_p22": "success"})
+
+        assert_that(self.cache.get(NODE), equal_to({"ivo://canfar.uvic.ca/ossos#mkpsf_p22": "success"}))
+        assert_that(self.cache.hits, equal_to(1))
+        assert_that(self.cache.misses, equal_to(1))
+
+    def test_uri_forms_share_entry(self):
+        self.cache.put("vos://cadc.nrc.ca!vospace/OSSOS/dbimages/1616681/", {"a": "1"})
+
+        assert_that(self.cache.get(NODE), equal_to({"a": "1"}))
+
+    def test_shared_between_instances(self):
+        self.cache.put(NODE, {"a": "1"})
+
+        other = metadata_cache.MetadataCache(self.filename, ttl=60)
+
+        assert_that(other.get(NODE), equal_to({"a": "1"}))
+
+    def test_expired_entries_are_misses(self):
+        cache = metadata_cache.MetadataCache(self.filename, ttl=0.01)
+        cache.put(NODE, {"a": "1"})
+        time.sleep(0.05)
+
+        assert_that(cache.get(NODE), none())
+
+    def test_update_merges_and_removes(self):
+        self.cache.put(NODE, {"a": "1", "b": "2"})
+        self.cache.update(NODE, {"a": None, "c": "3"})
+
+        assert_that(self.cache.get(NODE), equal_to({"b": "2", "c": "3"}))
+
+    def test_update_does_not_create_partial_entry(self):
+        self.cache.update(NODE, {"a": "1"})
+
+        assert_that(self.cache.get(NODE), none())
+
+    def test_invalidate(self):
+        self.cache.put(NODE, {"a": "1"})
+        self.cache.invalidate(NODE)
+
+        assert_that(self.cache.get(NODE), none())
+
+
+if __name__ == '__main__':
+    unittest.main()
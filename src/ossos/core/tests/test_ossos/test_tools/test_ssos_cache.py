@@ -0,0 +1,135 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from astropy.time import Time
+from hamcrest import assert_that, equal_to, none, less_than_or_equal_to
+from mock import patch, Mock
+
+from ossos import mpc, ssos, ssos_cache
+
+MPC_LINES = ("     HL7j2    C2013 04 03.62926 17 12 01.16 +04 13 33.3          24.1 R      568",
+             "     HL7j2    C2013 04 03.70345 17 12 00.92 +04 13 35.1          24.1 R      568")
+
+RESULT = "Image\tMJD\n1616681p\t56385.62926\n"
+
+
+def params(epoch2='2013-09-01', obs=MPC_LINES[0]):
+    return {'format': 'tsv', 'epoch1': '2013-02-08', 'epoch2': epoch2, 'search': 'bern', 'obs': obs}
+
+
+class ResultCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = ssos_cache.ResultCache(os.path.join(self.directory, "ssos.sqlite"), ttl=60)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_miss_then_hit(self):
+        assert_that(self.cache.get(params()), none())
+        self.cache.put(params(), RESULT)
+
+        assert_that(self.cache.get(params()), equal_to(RESULT))
+        assert_that(self.cache.hits, equal_to(1))
+        assert_that(self.cache.misses, equal_to(1))
+
+    def test_equivalent_queries_share_entry(self):
+        self.cache.put(params(obs=MPC_LINES[0] + "   \r\n\r\n"), RESULT)
+
+        assert_that(self.cache.get(params()), equal_to(RESULT))
+        assert_that(self.cache.get(params(epoch2='2013-09-02')), none())
+
+    def test_settled_window_never_expires(self):
+        assert_that(ssos_cache.expiry(params(), ttl=60), none())
+        today = time.strftime('%Y-%m-%d', time.gmtime())
+        assert_that(ssos_cache.expiry(params(epoch2=today), ttl=60, now=1e10), none())
+        now = time.time()
+        assert_that(ssos_cache.expiry(params(epoch2=today), ttl=60, now=now), equal_to(now + 60))
+
+    def test_open_window_expires_unless_offline(self):
+        cache = ssos_cache.ResultCache(self.cache.filename, ttl=0.01)
+        today = time.strftime('%Y-%m-%d', time.gmtime())
+        cache.put(params(epoch2=today), RESULT)
+        time.sleep(0.05)
+
+        assert_that(cache.get(params(epoch2=today)), none())
+        assert_that(cache.get(params(epoch2=today), offline=True), equal_to(RESULT))
+
+    def test_invalidate(self):
+        self.cache.put(params(), RESULT)
+        self.cache.invalidate(params())
+
+        assert_that(self.cache.get(params()), none())
+
+
+class CachedQueryTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = ssos_cache.ResultCache(os.path.join(self.directory, "ssos.sqlite"))
+        patcher = patch("ossos.ssos.get_result_cache", return_value=self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.observations = [mpc.Observation.from_string(line) for line in MPC_LINES]
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def post(self, *args, **kwargs):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(0.05)
+        with self.lock:
+            self.in_flight -= 1
+        return Mock(status_code=200, content=RESULT.encode('utf-8'), url=ssos.SSOS_URL,
+                    spec=ssos.requests.Response)
+
+    def query(self, **kwargs):
+        return ssos.Query(self.observations, search_start_date=Time('2013-02-08', scale='utc'),
+                          search_end_date=Time('2013-09-01', scale='utc'), **kwargs)
+
+    def test_second_query_served_from_cache(self):
+        with patch("ossos.ssos.http_client.post", side_effect=self.post) as post:
+            assert_that(self.query(offline=False).get(), equal_to(RESULT))
+            assert_that(self.query(offline=False).get(), equal_to(RESULT))
+
+        assert_that(post.call_count, equal_to(1))
+
+    def test_offline(self):
+        with patch("ossos.ssos.http_client.post", side_effect=self.post) as post:
+            self.assertRaises(IOError, self.query(offline=True).get)
+            self.query(offline=False).get()
+            assert_that(self.query(offline=True).get(), equal_to(RESULT))
+
+        assert_that(post.call_count, equal_to(1))
+
+    def test_warm_cache(self):
+        filenames = []
+        for idx in range(4):
+            filenames.append(os.path.join(self.directory, "track{}.mpc".format(idx)))
+            with open(filenames[-1], 'w') as fobj:
+                for line in MPC_LINES:
+                    fobj.write(line.replace("HL7j2", "HL7j{}".format(idx)) + "\n")
+
+        with patch("ossos.ssos.http_client.post", side_effect=self.post) as post:
+            failures = ssos.warm_cache(filenames + [os.path.join(self.directory, "missing.mpc")], max_workers=2)
+            assert_that(post.call_count, equal_to(4))
+            assert_that(list(failures.keys()), equal_to([os.path.join(self.directory, "missing.mpc")]))
+            assert_that(self.max_in_flight, less_than_or_equal_to(2))
+
+            tracks_parser = ssos.TracksParser()
+            mpc_observations = mpc.MPCReader(filenames[0]).mpc_observations
+            query = tracks_parser.build_query(mpc_observations, tracks_parser.lunation_count(0.1 * ssos.units.day))
+            query.offline = True
+            assert_that(query.get(), equal_to(RESULT))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,13 +3,18 @@ from astropy.io import fits
 
 __author__ = "David Rusk <drusk@uvic.ca>"
 
+import os
+import shutil
+import tempfile
 import unittest
+
+import numpy
 from astropy import units
-from mock import patch
+from mock import patch, Mock
 #from hamcrest import assert_that, equal_to
 from astropy import table
 
-from ossos import storage, mpc
+from ossos import storage, mpc, metadata_cache
 
 
 class ConeSearchTest(unittest.TestCase):
@@ -53,7 +58,7 @@ class ObjectCountTest(unittest.TestCase):
         expected_tag = storage.build_counter_tag(epoch_field)
         expected_count = "0A"
 
-        get_property.assert_called_once_with(node_uri, expected_tag, ossos_base=True)
+        get_property.assert_called_once_with(node_uri, expected_tag, ossos_base=True, force=True)
         assert_that(counter, equal_to(expected_count))
         set_property.assert_called_once_with(node_uri, expected_tag,
                                              expected_count, ossos_base=True)
@@ -71,7 +76,7 @@ class ObjectCountTest(unittest.TestCase):
         expected_tag = storage.build_counter_tag(epoch_field)
         expected_count = "01"
 
-        get_property.assert_called_once_with(node_uri, expected_tag, ossos_base=True)
+        get_property.assert_called_once_with(node_uri, expected_tag, ossos_base=True, force=True)
         assert_that(counter, equal_to(expected_count))
         set_property.assert_called_once_with(node_uri, expected_tag,
                                              expected_count, ossos_base=True)
@@ -100,12 +105,336 @@ class ObjectCountTest(unittest.TestCase):
         get_property.assert_called_once_with(
             node_uri,
             storage.build_counter_tag(epoch_field, dry_run=True),
-            ossos_base=True)
+            ossos_base=True, force=True)
         set_property.assert_called_once_with(node_uri,
                                              expected_tag,
                                              expected_count,
                                              ossos_base=True)
 
 
+class NodePropertiesCacheTest(unittest.TestCase):
+    def setUp(self):
+        patcher = patch("ossos.storage._metadata", metadata_cache.MetadataCache(':memory:'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch("ossos.storage.client")
+    def test_get_tags_uses_cache(self, client):
+        tag = storage.tag_uri("mkpsf_p22")
+        client.get_node.return_value.props = {tag: storage.SUCCESS}
+
+        self.assertEqual(storage.get_tag(1616681, "mkpsf_p22"), storage.SUCCESS)
+        self.assertEqual(storage.get_tags(1616681)[tag], storage.SUCCESS)
+
+        self.assertEqual(client.get_node.call_count, 1)
+
+    @patch("ossos.storage.client")
+    def test_unfinished_status_read_again(self, client):
+        tag = storage.tag_uri("mkpsf_p22")
+        client.get_node.return_value.props = {tag: "mkpsf failed"}
+        self.assertFalse(storage.get_status("mkpsf", "", 1616681, "p", 22))
+
+        # another process finished the step since.
+        client.get_node.return_value.props = {tag: storage.SUCCESS}
+        self.assertTrue(storage.get_status("mkpsf", "", 1616681, "p", 22))
+        self.assertTrue(storage.get_status("mkpsf", "", 1616681, "p", 22))
+
+        self.assertEqual(client.get_node.call_count, 3)
+
+    @patch("ossos.storage.client")
+    def test_set_property_writes_through(self, client):
+        node_uri = "vos:OSSOS/measure3/test.cands.astrom"
+        client.get_node.return_value.props = {}
+
+        self.assertIsNone(storage.get_property(node_uri, "done"))
+        storage.set_property(node_uri, "done", "someone")
+
+        self.assertEqual(storage.get_property(node_uri, "done"), "someone")
+        self.assertEqual(client.get_node.call_count, 2)
+
+    @patch("ossos.storage.client")
+    def test_prefetch_tags(self, client):
+        child = Mock()
+        child.uri = "vos://cadc.nrc.ca!vospace/OSSOS/dbimages/1616681/ccd22"
+        child.name = "ccd22"
+        child.props = {"length": "0"}
+        client.get_node.return_value.props = {storage.tag_uri("fwhm_p22"): "3.1"}
+        client.get_node.return_value.get_children.return_value = iter([child])
+
+        storage.prefetch_tags(1616681)
+
+        self.assertEqual(storage.get_tag(1616681, "fwhm_p22"), "3.1")
+        self.assertEqual(storage.get_property("vos:OSSOS/dbimages/1616681/ccd22", "length", ossos_base=False), "0")
+        self.assertEqual(client.get_node.call_count, 1)
+
+    @patch("ossos.storage.client")
+    def test_prefetch_properties_reads_every_page(self, client):
+        names = ["{}.astrom".format(idx) for idx in range(5)]
+
+        class FakeContainerNode(object):
+            props = {}
+            pages = []
+
+            def get_children(self, vos_client, sort, order, limit=None):
+                # one listing request for each page of limit children, as vos.Node.get_children does.
+                for start in range(0, len(names), limit):
+                    self.pages.append(names[start:start + limit])
+                    for name in names[start:start + limit]:
+                        child = Mock()
+                        child.uri = "vos://cadc.nrc.ca!vospace/OSSOS/measure3/" + name
+                        child.name = name
+                        child.props = {storage.OSSOS_TAG_URI_BASE + "#done": "someone"}
+                        yield child
+
+        node = FakeContainerNode()
+        client.get_node.return_value = node
+
+        children = storage.prefetch_properties("vos:OSSOS/measure3", page_size=2)
+
+        self.assertEqual(sorted(children.keys()), names)
+        self.assertEqual(len(node.pages), 3)
+        client.get_node.assert_called_once_with("vos:OSSOS/measure3", limit=0, force=True)
+        self.assertEqual(storage.get_property("vos:OSSOS/measure3/4.astrom", "done"), "someone")
+        self.assertEqual(client.get_node.call_count, 1)
+
+    @patch("ossos.storage.client")
+    def test_poll_properties_stops_at_older_children(self, client):
+        children = []
+        for name, date in [("b.astrom", "2015-06-02T00:00:00"),
+                           ("a.astrom", "2015-06-01T00:00:00"),
+                           ("old.astrom", "2015-05-01T00:00:00")]:
+            child = Mock()
+            child.uri = "vos://cadc.nrc.ca!vospace/OSSOS/measure3/" + name
+            child.name = name
+            child.props = {"date": date, storage.OSSOS_TAG_URI_BASE + "#done": "someone"}
+            children.append(child)
+
+        class FakeContainerNode(object):
+            listed = []
+
+            def get_children(self, vos_client, sort, order, limit=None):
+                self.listed.append((sort, order, limit))
+                return iter(children)
+
+        node = FakeContainerNode()
+        client.get_node.return_value = node
+
+        changed = storage.poll_properties("vos:OSSOS/measure3", "2015-06-01T00:00:00", page_size=2)
+
+        self.assertEqual(sorted(changed.keys()), ["a.astrom", "b.astrom"])
+        self.assertEqual(node.listed, [(storage.SortNodeProperty.DATE, 'desc', 2)])
+        self.assertEqual(storage.get_property("vos:OSSOS/measure3/b.astrom", "done"), "someone")
+        self.assertEqual(client.get_node.call_count, 1)
+
+
+class TagBatchTest(unittest.TestCase):
+    def setUp(self):
+        patcher = patch("ossos.storage._metadata", metadata_cache.MetadataCache(':memory:'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch("ossos.storage.client")
+    def test_batch_sends_one_update(self, client):
+        client.get_node.return_value.props = {}
+
+        with storage.TagBatch():
+            storage.set_status('fwhm', '', 1616681, 'p', 22, '3.1')
+            storage.set_status('zeropoint', '', 1616681, 'p', 22, '26.2')
+            storage.set_status('mkpsf', '', 1616681, 'p', 22, storage.SUCCESS)
+            self.assertEqual(client.add_props.call_count, 0)
+            self.assertEqual(storage.get_status('fwhm', '', 1616681, 'p', 22, return_message=True), '3.1')
+
+        self.assertEqual(client.add_props.call_count, 1)
+        props = client.add_props.call_args[0][0].props
+        self.assertEqual(props[storage.tag_uri('fwhm_p22')], '3.1')
+        self.assertEqual(props[storage.tag_uri('zeropoint_p22')], '26.2')
+        self.assertEqual(props[storage.tag_uri('mkpsf_p22')], storage.SUCCESS)
+
+    @patch("ossos.storage.client")
+    def test_nested_batch_joins_outer(self, client):
+        client.get_node.return_value.props = {}
+
+        with storage.TagBatch() as outer:
+            with storage.TagBatch() as inner:
+                storage.set_tag(1616681, 'fwhm_p22', '3.1')
+            self.assertIs(inner, outer)
+            self.assertEqual(client.add_props.call_count, 0)
+        self.assertEqual(client.add_props.call_count, 1)
+        self.assertIsNone(storage.get_tag_batch())
+
+    @patch("ossos.storage.client")
+    def test_batch_dropped_on_error(self, client):
+        client.get_node.return_value.props = {}
+
+        with self.assertRaises(ValueError):
+            with storage.TagBatch():
+                storage.set_status('mkpsf', '', 1616681, 'p', 22, storage.SUCCESS)
+                raise ValueError("crashed")
+
+        self.assertEqual(client.add_props.call_count, 0)
+        self.assertIsNone(storage.get_tag_batch())
+
+    @patch("ossos.storage.util.VOFileHandler")
+    @patch("ossos.storage.client")
+    def test_failed_task_records_failure(self, client, vo_file_handler):
+        client.get_node.return_value.props = {}
+        vo_file_handler.return_value.level = 100
+        cwd = os.getcwd()
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir)
+        self.addCleanup(os.chdir, cwd)
+        os.chdir(workdir)
+
+        with self.assertRaises(ValueError):
+            with storage.LoggingManager('mkpsf', '', 1616681, 22, 'p'):
+                storage.set_status('fwhm', '', 1616681, 'p', 22, '3.1')
+                storage.set_status('mkpsf', '', 1616681, 'p', 22, storage.SUCCESS)
+                raise ValueError("crashed")
+
+        self.assertEqual(client.add_props.call_count, 1)
+        props = client.add_props.call_args[0][0].props
+        self.assertEqual(props[storage.tag_uri('mkpsf_p22')], "ValueError: crashed")
+        self.assertNotIn(storage.tag_uri('fwhm_p22'), props)
+
+    @patch("ossos.storage.RETRY_ATTEMPTS", 8)
+    @patch("ossos.storage.RETRY_DELAY", 1.0)
+    @patch("ossos.storage.time.sleep")
+    @patch("ossos.storage.client")
+    def test_retry_backs_off(self, client, sleep):
+        client.get_node.return_value.props = {}
+        client.add_props.side_effect = [storage.exceptions.HttpException("busy"),
+                                        storage.exceptions.HttpException("busy"),
+                                        None]
+
+        storage.set_tag(1616681, 'fwhm_p22', '3.1')
+
+        self.assertEqual(client.add_props.call_count, 3)
+        delays = [call[0][0] for call in sleep.call_args_list]
+        self.assertEqual(len(delays), 2)
+        self.assertTrue(storage.RETRY_DELAY <= delays[0] <= 1.5 * storage.RETRY_DELAY)
+        self.assertTrue(2 * storage.RETRY_DELAY <= delays[1] <= 3 * storage.RETRY_DELAY)
+
+    @patch("ossos.storage.RETRY_ATTEMPTS", 3)
+    @patch("ossos.storage.time.sleep")
+    @patch("ossos.storage.client")
+    def test_retry_gives_up(self, client, sleep):
+        client.get_node.side_effect = storage.exceptions.HttpException("down")
+
+        self.assertRaises(storage.exceptions.HttpException, storage.set_tag, 1616681, 'fwhm_p22', '3.1')
+        self.assertEqual(client.get_node.call_count, 3)
+        self.assertEqual(sleep.call_count, 2)
+
+
+class LocalCutoutTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "1616681o.fits")
+        hdulist = fits.HDUList([fits.PrimaryHDU()])
+        for idx in range(3):
+            data = (numpy.arange(200 * 100) % 60000).reshape(200, 100)
+            hdu = fits.ImageHDU(data=data.astype(idx == 1 and 'f4' or 'u2'))
+            hdu.header['EXTNAME'] = 'ccd{:02d}'.format(idx)
+            hdu.header['CTYPE1'] = 'RA---TAN'
+            hdu.header['CTYPE2'] = 'DEC--TAN'
+            hdu.header['CRVAL1'] = 180.0 + 0.01 * idx
+            hdu.header['CRVAL2'] = 10.0
+            hdu.header['CRPIX1'] = 50.0
+            hdu.header['CRPIX2'] = 100.0
+            hdu.header['CD1_1'] = -0.5 / 3600.0
+            hdu.header['CD1_2'] = 0.0
+            hdu.header['CD2_1'] = 0.0
+            hdu.header['CD2_2'] = 0.5 / 3600.0
+            hdulist.append(hdu)
+        hdulist.writeto(self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_only_overlapping_extensions(self):
+        sky_coord = SkyCoord(180.01, 10.0, unit='degree')
+
+        hdulist = storage._local_cutout(self.filename, sky_coord, 5 * units.arcsec)
+
+        self.assertEqual(len(hdulist), 2)
+        self.assertEqual(hdulist[1].header['EXTNAME'], 'ccd01')
+        self.assertEqual(hdulist[1].data.shape, (20, 20))
+        # unscaled pixels are a view on the memory-mapped file, not a copy.
+        self.assertFalse(hdulist[1].data.flags['OWNDATA'])
+        x, y = hdulist[1].wcs.sky2xy(180.01, 10.0)
+        self.assertAlmostEqual(x, 10.0, 3)
+        self.assertAlmostEqual(y, 10.0, 3)
+
+    def test_unsigned_data_scaled(self):
+        sky_coord = SkyCoord(180.0, 10.0, unit='degree')
+
+        hdulist = storage._local_cutout(self.filename, sky_coord, 5 * units.arcsec)
+
+        self.assertEqual(hdulist[1].header['EXTNAME'], 'ccd00')
+        with fits.open(self.filename) as original:
+            expected = original[1].data[90:110, 40:60]
+        self.assertEqual(hdulist[1].data.dtype, expected.dtype)
+        self.assertTrue((hdulist[1].data == expected).all())
+
+    def test_no_overlap(self):
+        self.assertRaises(ValueError, storage._local_cutout, self.filename,
+                          SkyCoord(181.0, 10.0, unit='degree'), 5 * units.arcsec)
+
+
+class MultiCutoutTest(unittest.TestCase):
+    def setUp(self):
+        self.regions = [(SkyCoord(180.01, 10.0, unit='degree'), 5 * units.arcsec),
+                        (SkyCoord(180.0, 10.0, unit='degree'), 5 * units.arcsec),
+                        (SkyCoord(181.0, 10.0, unit='degree'), 5 * units.arcsec)]
+
+    @staticmethod
+    def response(crvals):
+        # what the service sends back: one 20x20 extension per region it could cut out.
+        hdulist = fits.HDUList([fits.PrimaryHDU()])
+        for crval1 in crvals:
+            hdu = fits.ImageHDU(data=numpy.zeros((20, 20), dtype='f4'))
+            hdu.header['CTYPE1'] = 'RA---TAN'
+            hdu.header['CTYPE2'] = 'DEC--TAN'
+            hdu.header['CRVAL1'] = crval1
+            hdu.header['CRVAL2'] = 10.0
+            hdu.header['CRPIX1'] = 10.5
+            hdu.header['CRPIX2'] = 10.5
+            hdu.header['CD1_1'] = -0.5 / 3600.0
+            hdu.header['CD1_2'] = 0.0
+            hdu.header['CD2_1'] = 0.0
+            hdu.header['CD2_2'] = 0.5 / 3600.0
+            hdulist.append(hdu)
+        return hdulist
+
+    @patch('ossos.storage._retrieve_cutouts')
+    def test_extensions_split_by_region(self, retrieve_cutouts):
+        retrieve_cutouts.return_value = (self.response([180.0, 180.01]),
+                                         [('1', '41', '60', '91', '110'), ('2', '41', '60', '91', '110')])
+
+        hdulists = storage.ra_dec_cutouts("vos:OSSOS/dbimages/1616681/1616681p.fits", self.regions)
+
+        retrieve_cutouts.assert_called_once_with("vos:OSSOS/dbimages/1616681/1616681p.fits", self.regions)
+        self.assertEqual(len(hdulists), 3)
+        self.assertEqual([len(hdulist) for hdulist in hdulists[:2]], [2, 2])
+        self.assertEqual(hdulists[0][1].header['EXTNO'], '2')
+        self.assertEqual(hdulists[1][1].header['EXTNO'], '1')
+        self.assertEqual(hdulists[1][1].header['XOFFSET'], 40)
+        self.assertIsNone(hdulists[2])
+
+    def test_batch_from_local_exposure(self):
+        directory = tempfile.mkdtemp()
+        cwd = os.getcwd()
+        try:
+            os.chdir(directory)
+            self.response([180.0, 180.01]).writeto("1616681p22.fits")
+            hdulists = storage.cutout_expnum_batch(Mock(rawname="1616681p22"), self.regions)
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(directory)
+
+        self.assertEqual(len(hdulists[0]), 2)
+        self.assertEqual(len(hdulists[1]), 2)
+        self.assertIsNone(hdulists[2])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from astropy.time import Time
+from hamcrest import assert_that, equal_to, none
+from mock import patch, Mock
+
+from ossos import mpc, ssos, ssos_cache, tracks
+from ossos.orbfit import Orbfit
+
+MPC_LINES = ("     HL7j{}    C2013 04 03.62926 17 12 01.16 +04 13 33.3          24.1 R      568",
+             "     HL7j{}    C2013 04 03.70345 17 12 00.92 +04 13 35.1          24.1 R      568",
+             "     HL7j{}    C2013 04 04.66926 17 11 58.16 +04 13 53.3          24.1 R      568")
+
+SSOS_COLUMNS = ("Image", "Ext", "X", "Y", "MJD", "Filter", "Image_target", "Object_RA", "Object_Dec")
+EXPNUMS = ("1616681", "1616682", "1616683", "1616690")
+MJDS = (56385.6, 56385.7, 56385.8, 56387.6)
+
+
+def ssos_reply():
+    orbit = Orbfit([mpc.Observation.from_string(line.format(0)) for line in MPC_LINES])
+    lines = ["\t".join(SSOS_COLUMNS)]
+    for expnum, mjd in zip(EXPNUMS, MJDS):
+        orbit.predict(Time(mjd, format='mjd', scale='utc'))
+        lines.append("\t".join([expnum + "p", "23", "1000.0", "2000.0", str(mjd), "R.MP9601", "O13AE",
+                                str(orbit.coordinate.ra.degree), str(orbit.coordinate.dec.degree)]))
+    return "\n".join(lines) + "\n"
+
+
+class RefreshTracksTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = ssos_cache.TrackCache(os.path.join(self.directory, "tracks"))
+        self.filenames = []
+        for idx in range(3):
+            self.filenames.append(os.path.join(self.directory, "HL7j{}.mpc".format(idx)))
+            with open(self.filenames[-1], 'w') as fobj:
+                fobj.write("\n".join(line.format(idx) for line in MPC_LINES) + "\n")
+        self.reply = ssos_reply()
+        for target, kwargs in (("ossos.ssos.http_client.post", {'side_effect': self.post}),
+                               ("ossos.ssos.offline_mode", {'return_value': False}),
+                               ("ossos.ssos.get_result_cache", {'return_value': None}),
+                               ("ossos.tracks.storage.list_dbimages", {'return_value': list(EXPNUMS)})):
+            patcher = patch(target, **kwargs)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def post(self, *args, **kwargs):
+        return Mock(status_code=200, content=self.reply.encode('utf-8'), url=ssos.SSOS_URL,
+                    spec=ssos.requests.Response)
+
+    def test_refresh_fills_track_cache(self):
+        missing = os.path.join(self.directory, "missing.mpc")
+        refreshed, failures = tracks.refresh(self.filenames + [missing], query_workers=2, process_workers=2,
+                                             cache=self.cache)
+
+        assert_that(sorted(refreshed), equal_to(self.filenames))
+        assert_that(list(failures.keys()), equal_to([missing]))
+
+        options = ssos.TracksParser().cache_options
+        tracks_data = self.cache.get(self.filenames[1], options)
+        assert_that(tracks_data.get_reading_count(), equal_to(len(EXPNUMS)))
+        assert_that([observation.rawname for observation in tracks_data.observations],
+                    equal_to([expnum + "p22" for expnum in EXPNUMS]))
+
+        with patch("ossos.ssos.get_track_cache", return_value=self.cache):
+            parsed = ssos.TracksParser().parse(self.filenames[1])
+        assert_that(parsed.get_reading_count(), equal_to(len(EXPNUMS)))
+
+    def test_cache_keyed_on_track_content(self):
+        self.cache.put(self.filenames[0], "result", {'skip_previous': False})
+        assert_that(self.cache.get(self.filenames[0], {'skip_previous': False}), equal_to("result"))
+        assert_that(self.cache.get(self.filenames[0], {'skip_previous': True}), none())
+
+        with open(self.filenames[0], 'a') as fobj:
+            fobj.write(MPC_LINES[0].format(0).replace("C2013", " 2013") + "\n")
+        assert_that(self.cache.get(self.filenames[0], {'skip_previous': False}), none())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,6 +2,8 @@ __author__ = "David Rusk <drusk@uvic.ca>"
 
 import unittest
 
+import numpy
+
 from hamcrest import assert_that, contains, has_length
 
 from astropy.io import fits
@@ -101,6 +103,39 @@ class WCSTest(unittest.TestCase):
         assert_that(x, almost_equal(15000.066582252624, SIGFIGS))
         assert_that(y, almost_equal(19999.992539886229, SIGFIGS))
 
+    def test_sky2xy_array_matches_scalar(self):
+        crpix1 = -7535.57493517
+        crpix2 = 9808.40914361
+        crval1 = 176.486157083
+        crval2 = 8.03697351091
+        cd = [[5.115244026718E-05, 7.064503033578E-07],
+              [-1.280229655229E-07, -5.123112374523E-05]]
+        dc = numpy.linalg.inv(cd)
+        pv = [[-7.030338745606E-03, 1.01755337222, 8.262429361142E-03,
+               0.00000000000, -5.910145454849E-04, -7.494178330178E-04,
+               -3.470178516657E-04, -2.331150605755E-02, -8.187062772669E-06,
+               -2.325429510806E-02, 1.135299506292E-04],
+              [-6.146513090656E-03, 1.01552885426, 8.259666421752E-03,
+               0.00000000000, -4.567030382243E-04, -6.978676921999E-04,
+               -3.732572951216E-04, -2.332572754467E-02, -2.354317291723E-05,
+               -2.329623852891E-02, 1.196394469003E-04]]
+        nord = 3
+        x_in = numpy.array([1.0, 2048.5, 15000.0, 19999.0])
+        y_in = numpy.array([1.0, 4096.0, 20000.0, 123.0])
+        ra, dec = wcs.xy2skypv(x_in, y_in, crpix1, crpix2, crval1, crval2, cd, pv, nord)
+        ra = ra.to('deg').value
+        dec = dec.to('deg').value
+
+        x, y = wcs.sky2xypv(ra, dec, crpix1, crpix2, crval1, crval2, dc, pv, nord)
+
+        assert_that(x, has_length(4))
+        for idx in range(len(x_in)):
+            xs, ys = wcs.sky2xypv(ra[idx], dec[idx], crpix1, crpix2, crval1, crval2, dc, pv, nord)
+            assert_that(x[idx], almost_equal(xs, 8))
+            assert_that(y[idx], almost_equal(ys, 8))
+            assert_that(x[idx], almost_equal(x_in[idx], 8))
+            assert_that(y[idx], almost_equal(y_in[idx], 8))
+
 
 class WCSParseTest(FileReadingTestCase):
     def setUp(self):